@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+CTP 交易/行情 API 的 asyncio 封装
+CTPTraderAPIReal 的 query_* 在调用线程上阻塞等待应答，界面每次下载都要另起一个线程。
+AsyncCTPTrader/AsyncCTPMarket 把同一套 API 包装为协程接口：
+
+- 查询：await trader.query_positions()，SPI 线程收到 bIsLast 后经 loop.call_soon_threadsafe
+  唤醒协程，不占用线程；多个查询可在同一个事件循环中并发等待，由查询调度统一限速
+- 行情：async for tick in market.ticks(['rb2505'])，每条行情推送只向事件循环投递一次
+- 委托/成交推送：async for kind, row in trader.updates()
+
+用法：
+    async def main():
+        trader = AsyncCTPTrader(trader_api)
+        positions, accounts = await asyncio.gather(trader.query_positions(),
+                                                   trader.query_accounts())
+        async with market.ticks(['rb2505']) as stream:
+            async for tick in stream:
+                ...
+
+数据库写入仍是同步接口，可用 loop.run_in_executor 交给线程池执行
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = object()
+
+
+def _chain(api, event: str, callback: Callable):
+    """在 API 已设置的回调之后追加一个回调，不覆盖界面等其他使用方"""
+    previous = api.callbacks.get(event)
+    if previous is None:
+        api.set_callback(event, callback)
+        return
+
+    def chained(*args):
+        previous(*args)
+        callback(*args)
+    api.set_callback(event, chained)
+
+
+class AsyncStream:
+    """
+    推送流：由 API 回调线程投递、在事件循环中逐条读取的异步迭代器
+
+    缓冲满时丢弃最旧的记录（行情只关心最新），丢弃条数见 dropped
+    """
+
+    def __init__(self, maxsize: int = 10000, on_close: Optional[Callable[['AsyncStream'], None]] = None):
+        self.maxsize = max(1, int(maxsize))
+        self.dropped = 0
+        self._items: Deque[Any] = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._closed = False
+        self._on_close = on_close
+
+    def put(self, item: Any):
+        """在事件循环线程内追加一条记录"""
+        if self._closed:
+            return
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.dropped += 1
+        self._items.append(item)
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def close(self):
+        """结束迭代（已缓冲的记录仍可读完），在事件循环线程内调用"""
+        if self._closed:
+            return
+        self._closed = True
+        self._items.append(_CLOSED)
+        self._wake()
+        if self._on_close is not None:
+            self._on_close(self)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._items:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        item = self._items.popleft()
+        if item is _CLOSED:
+            self._items.append(_CLOSED)
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+class _LoopBound:
+    """绑定事件循环，供 API 回调线程把通知投递到循环中"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        return self.loop
+
+    def _call_soon(self, callback: Callable, *args):
+        """在任意线程调用：投递到事件循环执行，循环已关闭时忽略"""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # 事件循环在投递前关闭
+            pass
+
+
+class AsyncCTPTrader(_LoopBound):
+    """
+    交易 API 的协程接口
+
+    真实 API（CTPTraderAPIReal）的查询经 submit_query 提交，完成时回调唤醒协程；
+    没有 submit_query 的实现（如模拟 API）在线程池中执行同步查询
+    """
+
+    def __init__(self, api, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Args:
+            api: CTPTraderAPIReal 或模拟 CTPTraderAPI 实例
+            loop: 事件循环，为空时取第一次调用时正在运行的循环
+        """
+        super().__init__(loop)
+        self.api = api
+        self._streams: Set[AsyncStream] = set()
+        self._login_waiters: List[asyncio.Future] = []
+        _chain(api, 'on_login', self._on_login)
+        book = getattr(api, 'order_book', None)
+        if book is not None:
+            book.add_listener(self._on_book_change)
+
+    # ------------------------------------------------------------------
+    # 登录
+    # ------------------------------------------------------------------
+    def _on_login(self, login_info=None, *_):
+        self._call_soon(self._resolve_login, login_info)
+
+    def _resolve_login(self, login_info):
+        waiters, self._login_waiters = self._login_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(login_info)
+
+    async def wait_login(self, timeout: float = 30.0):
+        """
+        等待登录完成（已登录时立即返回）
+
+        Returns:
+            登录回调的 login_info，已登录时为 None
+
+        Raises:
+            asyncio.TimeoutError: 超时未登录
+        """
+        loop = self._bind_loop()
+        if self.api.is_logged_in:
+            return None
+        waiter = loop.create_future()
+        self._login_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            if waiter in self._login_waiters:
+                self._login_waiters.remove(waiter)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    async def query(self, kind: str, **filters) -> List[Dict[str, Any]]:
+        """
+        异步查询
+
+        Args:
+            kind: 查询类别（orders/positions/instruments/trades/accounts）
+            **filters: 过滤条件，如 instrument_id、exchange_id
+
+        Returns:
+            结果列表；出错时为已收到的部分（错误经 API 的 on_error 回调报告）
+        """
+        loop = self._bind_loop()
+        api = self.api
+        sync_query = functools.partial(getattr(api, 'query_' + kind), **filters)
+        if not hasattr(api, 'submit_query'):
+            return await loop.run_in_executor(None, sync_query)
+        # 委托簿、持仓簿已初始化时同步查询直接读簿，不会阻塞
+        if getattr(api, '_is_booked', lambda k: False)(kind):
+            return sync_query()
+
+        future = api.submit_query(kind, **filters)
+        waiter = loop.create_future()
+
+        def resolve(f):
+            if not waiter.done():
+                waiter.set_result(list(f.rows))
+
+        future.add_done_callback(lambda f: self._call_soon(resolve, f))
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter),
+                                          api.queue_timeout + api.query_timeout)
+        except asyncio.TimeoutError:
+            api.abandon_query(future)
+            return list(future.rows)
+        except asyncio.CancelledError:
+            api.abandon_query(future)
+            raise
+
+    async def query_orders(self, instrument_id: str = "", exchange_id: str = "") -> list:
+        return await self.query('orders', instrument_id=instrument_id, exchange_id=exchange_id)
+
+    async def query_positions(self, instrument_id: str = "") -> list:
+        return await self.query('positions', instrument_id=instrument_id)
+
+    async def query_instruments(self, instrument_id: str = "", exchange_id: str = "") -> list:
+        return await self.query('instruments', instrument_id=instrument_id, exchange_id=exchange_id)
+
+    async def query_trades(self, instrument_id: str = "") -> list:
+        return await self.query('trades', instrument_id=instrument_id)
+
+    async def query_accounts(self) -> list:
+        return await self.query('accounts')
+
+    async def query_all(self, kinds: Iterable[str] = ('positions', 'accounts', 'orders', 'trades')
+                        ) -> Dict[str, list]:
+        """并发提交多类查询，返回 {查询类别: 结果列表}"""
+        kinds = list(kinds)
+        results = await asyncio.gather(*(self.query(kind) for kind in kinds))
+        return dict(zip(kinds, results))
+
+    # ------------------------------------------------------------------
+    # 委托/成交推送
+    # ------------------------------------------------------------------
+    def _on_book_change(self, kind: str, row: Dict[str, Any]):
+        if self._streams:
+            self._call_soon(self._dispatch, (kind, row))
+
+    def _dispatch(self, item):
+        for stream in list(self._streams):
+            stream.put(item)
+
+    def updates(self, maxsize: int = 10000) -> AsyncStream:
+        """
+        委托/成交变化流，逐条产生 (kind, row)，kind 为 order 或 trade
+
+        只有带委托簿的真实 API 会产生推送
+        """
+        self._bind_loop()
+        stream = AsyncStream(maxsize, on_close=self._streams.discard)
+        self._streams.add(stream)
+        return stream
+
+
+class AsyncCTPMarket(_LoopBound):
+    """
+    行情 API 的协程接口
+
+    每条行情推送只向事件循环投递一次，再分发给订阅了该合约的各个流；
+    同一合约被多个流订阅时只向前置订阅一次，最后一个流关闭时退订
+    """
+
+    def __init__(self, api, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Args:
+            api: CTPMarketAPIReal 或模拟 CTPMarketAPI 实例
+            loop: 事件循环，为空时取第一次调用时正在运行的循环
+        """
+        super().__init__(loop)
+        self.api = api
+        # 流 -> 合约集合（None 表示全部合约）
+        self._streams: Dict[AsyncStream, Optional[Set[str]]] = {}
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        _chain(api, 'on_market_data', self._on_tick)
+
+    def _on_tick(self, tick: Dict[str, Any]):
+        if self._streams:
+            self._call_soon(self._dispatch, tick)
+
+    def _dispatch(self, tick: Dict[str, Any]):
+        instrument_id = tick.get('instrument_id')
+        for stream, instruments in list(self._streams.items()):
+            if instruments is None or instrument_id in instruments:
+                stream.put(tick)
+
+    def subscribe(self, instrument_ids: Iterable[str]) -> bool:
+        """按引用计数订阅，只向前置发送尚未订阅的合约"""
+        with self._lock:
+            new = []
+            for instrument_id in instrument_ids:
+                self._refs[instrument_id] = self._refs.get(instrument_id, 0) + 1
+                if self._refs[instrument_id] == 1:
+                    new.append(instrument_id)
+        if not new or self.api.subscribe_market_data(new):
+            return True
+        # 订阅失败（如尚未登录）时撤销计数，下次再订阅时重新发送
+        with self._lock:
+            for instrument_id in new:
+                if self._refs.get(instrument_id) == 1:
+                    del self._refs[instrument_id]
+                else:
+                    self._refs[instrument_id] -= 1
+        return False
+
+    def unsubscribe(self, instrument_ids: Iterable[str]) -> bool:
+        """按引用计数退订，没有流再使用的合约向前置退订"""
+        with self._lock:
+            gone = []
+            for instrument_id in instrument_ids:
+                count = self._refs.get(instrument_id, 0) - 1
+                if count > 0:
+                    self._refs[instrument_id] = count
+                elif instrument_id in self._refs:
+                    del self._refs[instrument_id]
+                    gone.append(instrument_id)
+        if not gone or not self.api.is_logged_in:
+            return True
+        return self.api.unsubscribe_market_data(gone)
+
+    def ticks(self, instrument_ids: Optional[Iterable[str]] = None,
+              maxsize: int = 10000) -> AsyncStream:
+        """
+        行情流
+
+        Args:
+            instrument_ids: 订阅并只接收这些合约的行情；为空时接收已订阅的全部合约
+            maxsize: 缓冲条数，消费跟不上时丢弃最旧的行情
+
+        Returns:
+            AsyncStream，async for 逐条读取行情字典，close() 或退出 async with 时退订
+        """
+        self._bind_loop()
+        instruments = set(instrument_ids) if instrument_ids else None
+        stream = AsyncStream(maxsize, on_close=self._close_stream)
+        self._streams[stream] = instruments
+        if instruments and not self.subscribe(sorted(instruments)):
+            logger.warning(f"订阅行情失败: {sorted(instruments)}")
+            self._streams.pop(stream, None)
+            stream.close()
+        return stream
+
+    def _close_stream(self, stream: AsyncStream):
+        instruments = self._streams.pop(stream, None)
+        if instruments:
+            self.unsubscribe(sorted(instruments))
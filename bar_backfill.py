@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+历史K线回补工具
+对 market_data 中已有的交易日批量重建 kline 表：
+  - 每个交易日由独立进程通过服务端游标流式读取 tick，用 NumPy 向量化重采样
+  - 多个交易日并行计算，结果由主进程单线程写库
+  - 每完成一个交易日记录到进度文件，中断后重新运行只处理未完成的交易日
+
+重采样规则与 bar_engine.BarEngine 一致（累计量求差、夜盘按自然日期、收盘时刻归前一根、
+无新成交不开新K线），回补结果与实时合成的K线可以互相覆盖。
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pymysql
+from pymysql.cursors import SSCursor
+
+from bar_engine import PERIODS, SESSION_ENDS
+from database_manager import DatabaseManager, KLINE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# 价格在 SQL 中转为 DOUBLE，避免逐个构造 Decimal
+_TICK_SQL = (
+    "SELECT id, instrument_id, TIME_TO_SEC(update_time), last_price + 0E0, volume, "
+    "turnover + 0E0, open_interest, open_price + 0E0, highest_price + 0E0, lowest_price + 0E0 "
+    "FROM market_data WHERE trading_day = %s"
+)
+_TICK_FIELDS = ('id', 'instrument', 'sec', 'price', 'volume', 'turnover',
+                'open_interest', 'open', 'high', 'low')
+
+_NIGHT_START = 18 * 3600
+_NIGHT_END = 6 * 3600
+_SESSION_END_SECS = np.array(
+    [int(h) * 3600 + int(m) * 60 + int(s) for h, m, s in (t.split(':') for t in SESSION_ENDS)]
+)
+
+
+def _night_offset(trading_day: str) -> int:
+    """夜盘所在自然日相对交易日的天数（前一个工作日，周一交易日的夜盘在上周五）"""
+    day = datetime.strptime(trading_day, '%Y%m%d').date()
+    night = day - timedelta(days=1)
+    while night.weekday() >= 5:
+        night -= timedelta(days=1)
+    return (night - day).days
+
+
+def load_day_ticks(conn_kwargs: Dict[str, Any], day_param, fetch_size: int = 50000):
+    """
+    通过服务端游标分批读取一个交易日的 tick，转换为列数组
+
+    Returns:
+        (合约代码数组, {字段: ndarray})，合约列为整数编码
+    """
+    conn = pymysql.connect(cursorclass=SSCursor, **conn_kwargs)
+    names: Dict[str, int] = {}
+    parts: Dict[str, list] = {name: [] for name in _TICK_FIELDS}
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_TICK_SQL, (day_param,))
+            while True:
+                chunk = cursor.fetchmany(fetch_size)
+                if not chunk:
+                    break
+                columns = list(zip(*chunk))
+                # 合约代码按批去重后映射为整数编码
+                uniq, inverse = np.unique(np.asarray(columns[1], dtype=str), return_inverse=True)
+                codes = np.array([names.setdefault(str(u), len(names)) for u in uniq], dtype=np.int32)
+                parts['instrument'].append(codes[inverse])
+                for name, values in zip(_TICK_FIELDS, columns):
+                    if name != 'instrument':
+                        parts[name].append(np.asarray(values, dtype=np.float64))
+    finally:
+        conn.close()
+
+    instruments = np.array(sorted(names, key=names.get), dtype=object)
+    if not parts['id']:
+        return instruments, {name: np.empty(0) for name in _TICK_FIELDS}
+    return instruments, {name: np.concatenate(chunks) for name, chunks in parts.items()}
+
+
+def resample_day(trading_day: str, instruments: np.ndarray, ticks: Dict[str, np.ndarray],
+                 periods: Sequence[str] = ('1m', '5m', '15m', '1d')) -> Dict[str, list]:
+    """
+    把一个交易日的 tick 重采样为各周期K线
+
+    Args:
+        trading_day: 交易日 YYYYMMDD
+        instruments: 合约编码到合约代码的映射数组
+        ticks: load_day_ticks 返回的列数组
+        periods: 周期，取自 PERIODS
+
+    Returns:
+        按 KLINE_COLUMNS 组织的列表字典
+    """
+    out: Dict[str, list] = {c: [] for c in KLINE_COLUMNS}
+    price = ticks['price']
+    sec = ticks['sec']
+    valid = np.isfinite(price) & (np.abs(price) < 1e300) & np.isfinite(sec)
+    if not valid.any():
+        return out
+    t = {name: values[valid] for name, values in ticks.items()}
+    sec = t['sec'].astype(np.int64)
+
+    # 夜盘 tick 换算到自然日：18点后在夜盘日，6点前在夜盘次日，相对交易日零点的秒数
+    offset = _night_offset(trading_day)
+    days = np.where(sec >= _NIGHT_START, offset, np.where(sec < _NIGHT_END, offset + 1, 0))
+    ts = days * 86400 + sec
+
+    order = np.lexsort((t['id'], ts, t['instrument']))
+    inst = t['instrument'][order]
+    ts, sec, price = ts[order], sec[order], t['price'][order]
+    volume = np.nan_to_num(t['volume'][order])
+    turnover = np.nan_to_num(t['turnover'][order])
+    open_interest = t['open_interest'][order]
+
+    # 累计量求差，合约首笔取当日累计值，回退（重连）时增量记 0
+    first = np.ones(len(inst), dtype=bool)
+    first[1:] = inst[1:] != inst[:-1]
+    delta_volume = np.diff(volume, prepend=0.0)
+    delta_turnover = np.diff(turnover, prepend=0.0)
+    delta_volume[first] = volume[first]
+    delta_turnover[first] = turnover[first]
+    rollback = delta_volume < 0
+    delta_volume[rollback] = 0
+    delta_turnover[rollback] = 0
+    traded = delta_volume > 0
+
+    base = np.datetime64(datetime.strptime(trading_day, '%Y%m%d'), 's')
+
+    def emit(period, idx, starts, ends, bar_ts, o, h, l, c, vol, turn, oi):
+        n = len(starts)
+        out['instrument_id'].extend(instruments[inst[idx][starts]].tolist())
+        out['period'].extend([period] * n)
+        out['trading_day'].extend([trading_day] * n)
+        out['bar_time'].extend((base + bar_ts.astype('timedelta64[s]')).tolist())
+        out['open_price'].extend(o.tolist())
+        out['high_price'].extend(h.tolist())
+        out['low_price'].extend(l.tolist())
+        out['close_price'].extend(c.tolist())
+        out['volume'].extend(vol.astype(np.int64).tolist())
+        out['turnover'].extend(turn.tolist())
+        out['open_interest'].extend(oi.tolist())
+        out['tick_count'].extend((ends - starts).tolist())
+
+    for period in periods:
+        seconds = PERIODS[period]
+        if seconds is None:
+            # 日线：开高低优先取行情自带的当日统计，成交量取累计值
+            starts = np.flatnonzero(first)
+            ends = np.append(starts[1:], len(inst))
+            last = ends - 1
+            day_open = t['open'][order][last]
+            o = np.where(np.isfinite(day_open) & (day_open > 0) & (day_open < 1e300),
+                         day_open, price[starts])
+            high = t['high'][order][last]
+            low = t['low'][order][last]
+            h = np.maximum.reduceat(price, starts)
+            l = np.minimum.reduceat(price, starts)
+            h = np.where(np.isfinite(high) & (high > 0) & (high < 1e300), np.fmax(h, high), h)
+            l = np.where(np.isfinite(low) & (low > 0) & (low < 1e300), np.fmin(l, low), l)
+            emit(period, slice(None), starts, ends, np.zeros(len(starts), dtype=np.int64),
+                 o, h, l, price[last], volume[last], turnover[last], open_interest[last])
+            continue
+
+        bucket = ts - ts % seconds
+        at_end = np.isin(sec, _SESSION_END_SECS) & (sec % seconds == 0)
+        bucket[at_end] -= seconds
+        new_bar = first.copy()
+        new_bar[1:] |= bucket[1:] != bucket[:-1]
+
+        # 每根K线从第一笔有成交的 tick 开始，之前的无成交 tick 丢弃
+        group = np.cumsum(new_bar) - 1
+        traded_count = np.cumsum(traded)
+        before = (traded_count - traded)[new_bar]
+        keep = traded_count - before[group] > 0
+        idx = np.flatnonzero(keep)
+        if not len(idx):
+            continue
+        kept_group = group[idx]
+        starts = np.flatnonzero(np.append(True, kept_group[1:] != kept_group[:-1]))
+        ends = np.append(starts[1:], len(idx))
+        p = price[idx]
+        emit(period, idx, starts, ends, bucket[idx][starts],
+             p[starts], np.maximum.reduceat(p, starts), np.minimum.reduceat(p, starts),
+             p[ends - 1], np.add.reduceat(delta_volume[idx], starts),
+             np.add.reduceat(delta_turnover[idx], starts), open_interest[idx][ends - 1])
+    return out
+
+
+def _build_day(conn_kwargs: Dict[str, Any], trading_day: str, day_param,
+               periods: Sequence[str], fetch_size: int) -> Dict[str, list]:
+    """子进程入口：读取并重采样一个交易日"""
+    instruments, ticks = load_day_ticks(conn_kwargs, day_param, fetch_size)
+    return resample_day(trading_day, instruments, ticks, periods)
+
+
+class BarBackfill:
+    """
+    历史K线并行回补
+
+    用法：
+        backfill = BarBackfill(db_manager, workers=4)
+        backfill.run(start="20250101", end="20250131")
+    """
+
+    def __init__(self, db_manager: DatabaseManager,
+                 periods: Sequence[str] = ('1m', '5m', '15m', '1d'),
+                 workers: Optional[int] = None, fetch_size: int = 50000,
+                 batch_size: int = 20000, state_file: str = "./backfill/kline_state.json"):
+        """
+        初始化回补器
+
+        Args:
+            db_manager: 已 connect() 的数据库管理器，用于读取交易日和写入K线
+            periods: 回补的周期，取自 PERIODS
+            workers: 计算进程数，默认 CPU 核数
+            fetch_size: 服务端游标每批读取的 tick 数
+            batch_size: 单批写入的K线数
+            state_file: 进度文件，记录已完成的交易日
+        """
+        unknown = [p for p in periods if p not in PERIODS]
+        if unknown:
+            raise ValueError(f"未知的K线周期: {unknown}")
+
+        self.db = db_manager
+        self.periods = tuple(periods)
+        self.workers = workers or os.cpu_count() or 1
+        self.fetch_size = fetch_size
+        self.batch_size = batch_size
+        self.state_file = state_file
+        self._state = self._load_state()
+
+    # ------------------------------------------------------------------
+    # 进度
+    # ------------------------------------------------------------------
+    def _load_state(self) -> Dict[str, Any]:
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取回补进度失败，将重新回补: {e}")
+        return {'done': {}}
+
+    def _mark_done(self, trading_day: str, bars: int):
+        self._state['done'][trading_day] = {'bars': bars, 'periods': list(self.periods)}
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_file)
+
+    def _is_done(self, trading_day: str) -> bool:
+        done = self._state['done'].get(trading_day)
+        return bool(done) and set(self.periods) <= set(done.get('periods', ()))
+
+    def pending_days(self, start: Optional[str] = None, end: Optional[str] = None,
+                     force: bool = False) -> List[str]:
+        """
+        返回需要回补的交易日（升序）
+
+        Args:
+            start: 起始交易日（含）
+            end: 结束交易日（含）
+            force: 是否包含已完成的交易日
+        """
+        days = sorted(self.db.get_distinct_trading_days('market_data'))
+        return [
+            d for d in days
+            if (not start or d >= start) and (not end or d <= end)
+            and (force or not self._is_done(d))
+        ]
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+    def run(self, start: Optional[str] = None, end: Optional[str] = None,
+            force: bool = False) -> Dict[str, int]:
+        """
+        回补指定范围内的交易日
+
+        Returns:
+            {交易日: 写入的K线数}，失败的交易日为 -1
+        """
+        days = self.pending_days(start, end, force)
+        if not days:
+            logger.info("没有需要回补的交易日")
+            return {}
+
+        conn_kwargs = dict(host=self.db.host, port=self.db.port, user=self.db.user,
+                           password=self.db.password, database=self.db.database,
+                           charset="utf8mb4")
+        logger.info(f"开始回补 {len(days)} 个交易日，{self.workers} 个进程")
+        results: Dict[str, int] = {}
+        queue = list(days)
+        running = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while queue or running:
+                # 最多比进程数多排一个任务，避免计算结果在内存中堆积
+                while queue and len(running) <= self.workers:
+                    day = queue.pop(0)
+                    future = pool.submit(_build_day, conn_kwargs, day,
+                                         self.db._day_param('market_data', day),
+                                         self.periods, self.fetch_size)
+                    running[future] = day
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    day = running.pop(future)
+                    try:
+                        bars = future.result()
+                    except Exception as e:
+                        logger.error(f"交易日 {day} 重采样失败: {e}")
+                        results[day] = -1
+                        continue
+                    results[day] = self._write_day(day, bars)
+        return results
+
+    def _write_day(self, trading_day: str, bars: Dict[str, list]) -> int:
+        """单线程写入一个交易日的K线，全部成功后记录进度"""
+        count = len(bars['instrument_id'])
+        rows = [
+            {c: (None if v != v else v) for c, v in zip(KLINE_COLUMNS, values)}
+            for values in zip(*(bars[c] for c in KLINE_COLUMNS))
+        ]
+        for i in range(0, count, self.batch_size):
+            if not self.db.insert_bars(rows[i:i + self.batch_size]):
+                logger.error(f"交易日 {trading_day} K线写入失败，下次运行时重新回补")
+                return -1
+        self._mark_done(trading_day, count)
+        logger.info(f"交易日 {trading_day} 回补完成: {count} 根K线")
+        return count
+
+
+def main():
+    """命令行入口：读取 config.json 中的数据库配置回补K线"""
+    parser = argparse.ArgumentParser(description="由 market_data 历史行情回补K线")
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--start', help='起始交易日 YYYYMMDD')
+    parser.add_argument('--end', help='结束交易日 YYYYMMDD')
+    parser.add_argument('--periods', nargs='*', default=['1m', '5m', '15m', '1d'], help='K线周期')
+    parser.add_argument('--workers', type=int, help='计算进程数，默认CPU核数')
+    parser.add_argument('--fetch-size', type=int, default=50000, help='游标每批读取的tick数')
+    parser.add_argument('--state', default='./backfill/kline_state.json', help='进度文件')
+    parser.add_argument('--force', action='store_true', help='重新回补已完成的交易日')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.config):
+        print(f"配置文件不存在: {args.config}")
+        return
+    with open(args.config, 'r', encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+
+    db = DatabaseManager(
+        host=db_config['host'],
+        port=db_config.get('port', 3306),
+        user=db_config['user'],
+        password=db_config['password'],
+        database=db_config['database'],
+        bulk_load=db_config.get('bulk_load', False),
+    )
+    if not db.connect():
+        print("数据库连接失败")
+        return
+
+    backfill = BarBackfill(db, periods=args.periods, workers=args.workers,
+                           fetch_size=args.fetch_size, state_file=args.state)
+    started = time.monotonic()
+    results = backfill.run(args.start, args.end, force=args.force)
+    failed = [d for d, n in results.items() if n < 0]
+    print(f"回补 {len(results) - len(failed)} 个交易日，共 "
+          f"{sum(n for n in results.values() if n > 0)} 根K线，"
+          f"耗时 {time.monotonic() - started:.1f} 秒")
+    if failed:
+        print(f"失败的交易日（重新运行即可续补）: {', '.join(sorted(failed))}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
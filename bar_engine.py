@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+K线实时合成模块
+消费 CTPMdSpi.OnRtnDepthMarketData 推送的行情，按合约增量维护 1m/5m/15m/1d K线，
+每个 tick 只更新各周期当前K线，已收盘的K线由后台线程批量写入 kline 表
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from tick_writer import _clean_price
+
+logger = logging.getLogger(__name__)
+
+# 周期 -> 秒数，1d 按交易日聚合
+PERIODS = {'1m': 60, '5m': 300, '15m': 900, '1d': None}
+
+# 各交易时段的收盘时刻，恰好在该时刻的 tick 归入前一根K线
+SESSION_ENDS = ('10:15:00', '11:30:00', '15:00:00', '23:00:00', '01:00:00', '02:30:00')
+
+_HALF_DAY = 12 * 3600
+
+
+def _tick_datetime(update_time, now: datetime) -> Optional[datetime]:
+    """
+    把 tick 的 HH:MM:SS 补全为自然日时间
+
+    夜盘跨零点时交易日与自然日不一致，CTP 的 ActionDay 各交易所口径也不同，
+    这里以本地时钟的日期为准；tick 时间与本地时间相差超过半天时视为跨零点。
+    """
+    try:
+        h, m, s = (int(x) for x in str(update_time).split(':'))
+    except ValueError:
+        return None
+    day = now.date()
+    diff = h * 3600 + m * 60 + s - (now.hour * 3600 + now.minute * 60 + now.second)
+    if diff > _HALF_DAY:
+        day -= timedelta(days=1)
+    elif diff < -_HALF_DAY:
+        day += timedelta(days=1)
+    return datetime(day.year, day.month, day.day, h, m, s)
+
+
+def _bar_start(tick_dt: datetime, seconds: int) -> datetime:
+    """tick 所属K线的起始时间"""
+    offset = (tick_dt.hour * 3600 + tick_dt.minute * 60 + tick_dt.second) % seconds
+    return tick_dt - timedelta(seconds=offset)
+
+
+class BarEngine:
+    """
+    K线增量合成器
+
+    用法：
+        engine = BarEngine(db_manager)
+        engine.start()
+        market_api.set_callback('on_market_data', engine.on_market_data)
+        ...
+        engine.stop()
+    """
+
+    def __init__(self, db_manager=None, periods: Sequence[str] = ('1m', '5m', '15m', '1d'),
+                 batch_size: int = 500, flush_interval: float = 1.0, close_delay: float = 3.0,
+                 max_pending: int = 100000,
+                 on_bar: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        初始化合成器
+
+        Args:
+            db_manager: DatabaseManager 实例，为 None 时只合成不落库
+            periods: 合成的周期，取自 PERIODS
+            batch_size: 单批最大写入K线数
+            flush_interval: 后台线程检查间隔（秒）
+            close_delay: K线结束后超过该秒数仍无新 tick 时按时间收盘
+            max_pending: 写库失败时最多保留的待写K线数
+            on_bar: K线收盘回调，在后台线程中调用；迟到的 tick 修正已收盘K线后会再次回调
+        """
+        unknown = [p for p in periods if p not in PERIODS]
+        if unknown:
+            raise ValueError(f"未知的K线周期: {unknown}")
+
+        self.db = db_manager
+        self.periods = [(p, PERIODS[p]) for p in periods]
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.close_delay = close_delay
+        self.max_pending = max_pending
+        self.on_bar = on_bar
+
+        self._lock = threading.Lock()
+        # (instrument_id, period) -> 当前未收盘K线
+        self._bars: Dict[tuple, Dict[str, Any]] = {}
+        # (instrument_id, period) -> 最近一根已收盘K线，迟到的 tick 用来修正它
+        self._last_closed: Dict[tuple, Dict[str, Any]] = {}
+        # instrument_id -> (交易日, 累计成交量, 累计成交额)
+        self._last: Dict[str, tuple] = {}
+        self._closed: List[Dict[str, Any]] = []
+        self._retry: List[Dict[str, Any]] = []
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._stats = {'ticks': 0, 'late': 0, 'revised': 0, 'closed': 0, 'written': 0,
+                       'failed': 0, 'dropped': 0}
+
+    # ------------------------------------------------------------------
+    # 生产端（CTP 回调线程）
+    # ------------------------------------------------------------------
+    def on_market_data(self, tick: Dict[str, Any]):
+        """可直接注册为 on_market_data 回调"""
+        self.update(tick)
+
+    def update(self, tick: Dict[str, Any], now: Optional[datetime] = None):
+        """
+        用一条 tick 更新各周期当前K线
+
+        Args:
+            tick: on_market_data 回调的行情字典
+            now: 接收时刻，用于补全自然日，默认取本地时间
+        """
+        inst = tick.get('instrument_id')
+        price = _clean_price(tick.get('last_price'))
+        if not inst or price is None:
+            return
+        tick_dt = _tick_datetime(tick.get('update_time'), now or datetime.now())
+        if tick_dt is None:
+            return
+        day = str(tick.get('trading_day') or '')
+        volume = tick.get('volume') or 0
+        turnover = _clean_price(tick.get('turnover')) or 0.0
+        open_interest = tick.get('open_interest')
+
+        with self._lock:
+            self._stats['ticks'] += 1
+            prev = self._last.get(inst)
+            if prev is None:
+                # 中途启动时不知道此前的成交，增量从下一条 tick 开始计算
+                delta_volume, delta_turnover = 0, 0.0
+            elif prev[0] != day:
+                # 换交易日后累计量重新从零开始
+                delta_volume, delta_turnover = volume, turnover
+            else:
+                delta_volume, delta_turnover = volume - prev[1], turnover - prev[2]
+                if delta_volume < 0:
+                    # 行情重连后累计量回退，丢弃这段增量
+                    delta_volume, delta_turnover = 0, 0.0
+            self._last[inst] = (day, volume, turnover)
+
+            for period, seconds in self.periods:
+                if seconds is None:
+                    self._update_daily(inst, day, tick, price, volume, turnover, open_interest)
+                    continue
+
+                start = _bar_start(tick_dt, seconds)
+                if start == tick_dt and tick.get('update_time') in SESSION_ENDS:
+                    start -= timedelta(seconds=seconds)
+                key = (inst, period)
+                bar = self._bars.get(key)
+                if bar is not None and start > bar['bar_time']:
+                    self._close_locked(key)
+                    bar = None
+                closed = self._last_closed.get(key)
+                if (bar is not None and start < bar['bar_time']) or \
+                        (closed is not None and start <= closed['bar_time']):
+                    # 迟到的 tick 不重开已收盘的K线（按时间收盘后重开会以残缺的K线覆盖库中记录）：
+                    # 属于刚收盘的K线时修正该K线并重新写库，否则并入当前K线，没有当前K线时丢弃
+                    self._stats['late'] += 1
+                    if closed is not None and start == closed['bar_time']:
+                        self._merge(closed, price, delta_volume, delta_turnover, open_interest)
+                        self._revise_locked(closed)
+                        continue
+                    if bar is None:
+                        continue
+
+                if bar is None:
+                    # 没有新成交的 tick（收盘后的结算推送等）不开新K线
+                    if delta_volume <= 0:
+                        continue
+                    self._bars[key] = self._new_bar(inst, period, day, start, price,
+                                                     delta_volume, delta_turnover, open_interest)
+                else:
+                    self._merge(bar, price, delta_volume, delta_turnover, open_interest)
+
+        if len(self._closed) >= self.batch_size:
+            self._wake.set()
+
+    def _update_daily(self, inst: str, day: str, tick: Dict[str, Any], price: float,
+                      volume: int, turnover: float, open_interest):
+        """日线直接使用行情自带的开高低和累计量，中途启动也能得到完整日线"""
+        if not day.isdigit():
+            return
+        key = (inst, '1d')
+        bar = self._bars.get(key)
+        if bar is not None and bar['trading_day'] != day:
+            self._close_locked(key)
+            bar = None
+        if bar is None:
+            bar = self._new_bar(inst, '1d', day, datetime.strptime(day, '%Y%m%d'),
+                                price, volume, turnover, open_interest)
+            self._bars[key] = bar
+        else:
+            self._merge(bar, price, 0, 0.0, open_interest)
+            bar['volume'] = volume
+            bar['turnover'] = turnover
+        open_price = _clean_price(tick.get('open_price'))
+        high = _clean_price(tick.get('highest_price', tick.get('high_price')))
+        low = _clean_price(tick.get('lowest_price', tick.get('low_price')))
+        if open_price:
+            bar['open_price'] = open_price
+        if high:
+            bar['high_price'] = max(bar['high_price'], high)
+        if low:
+            bar['low_price'] = min(bar['low_price'], low)
+
+    @staticmethod
+    def _new_bar(inst: str, period: str, day: str, start: datetime, price: float,
+                 volume: int, turnover: float, open_interest) -> Dict[str, Any]:
+        return {
+            'instrument_id': inst,
+            'period': period,
+            'trading_day': day,
+            'bar_time': start,
+            'open_price': price,
+            'high_price': price,
+            'low_price': price,
+            'close_price': price,
+            'volume': volume,
+            'turnover': turnover,
+            'open_interest': open_interest,
+            'tick_count': 1,
+        }
+
+    @staticmethod
+    def _merge(bar: Dict[str, Any], price: float, volume: int, turnover: float, open_interest):
+        if price > bar['high_price']:
+            bar['high_price'] = price
+        if price < bar['low_price']:
+            bar['low_price'] = price
+        bar['close_price'] = price
+        bar['volume'] += volume
+        bar['turnover'] += turnover
+        if open_interest is not None:
+            bar['open_interest'] = open_interest
+        bar['tick_count'] += 1
+
+    def _close_locked(self, key: tuple):
+        """把当前K线移入待写列表（调用方持有 _lock）"""
+        bar = self._bars.pop(key, None)
+        if bar is None:
+            return
+        if bar['period'] != '1d':
+            self._last_closed[key] = bar
+        self._queue_locked(bar)
+        self._stats['closed'] += 1
+
+    def _queue_locked(self, bar: Dict[str, Any]):
+        if len(self._closed) >= self.max_pending:
+            self._closed.pop(0)
+            self._stats['dropped'] += 1
+        self._closed.append(bar)
+
+    def _revise_locked(self, bar: Dict[str, Any]):
+        """已收盘K线被迟到的 tick 修正：尚未写库的直接随本批写入，已写库的重新排队覆盖"""
+        self._stats['revised'] += 1
+        if not any(b is bar for b in self._closed) and not any(b is bar for b in self._retry):
+            self._queue_locked(bar)
+
+    def close_expired(self, now: Optional[datetime] = None) -> int:
+        """
+        按时间收盘：K线结束后 close_delay 秒内没有新 tick 时直接收盘
+
+        日线只在换交易日或 close_all 时收盘。
+
+        Returns:
+            收盘的K线数
+        """
+        now = now or datetime.now()
+        seconds = dict(self.periods)
+        with self._lock:
+            expired = [
+                key for key, bar in self._bars.items()
+                if seconds[key[1]] is not None
+                and bar['bar_time'] + timedelta(seconds=seconds[key[1]] + self.close_delay) <= now
+            ]
+            for key in expired:
+                self._close_locked(key)
+        return len(expired)
+
+    def close_all(self) -> int:
+        """收盘全部未完成K线（含日线），用于收盘后或停止前"""
+        with self._lock:
+            keys = list(self._bars)
+            for key in keys:
+                self._close_locked(key)
+        self._wake.set()
+        return len(keys)
+
+    def current_bar(self, instrument_id: str, period: str = '1m') -> Optional[Dict[str, Any]]:
+        """返回合约当前未收盘K线的副本"""
+        with self._lock:
+            bar = self._bars.get((instrument_id, period))
+            return dict(bar) if bar else None
+
+    # ------------------------------------------------------------------
+    # 消费端（写入线程）
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动后台收盘/写入线程"""
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="BarEngine", daemon=True)
+        self._thread.start()
+        logger.info(f"K线合成线程已启动，周期: {[p for p, _ in self.periods]}")
+
+    def stop(self, close_open: bool = True, timeout: float = 10.0):
+        """
+        停止后台线程
+
+        Args:
+            close_open: 是否先收盘全部未完成K线再写库
+            timeout: 等待线程退出的秒数
+        """
+        if close_open:
+            self.close_all()
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        logger.info(f"K线合成线程已停止: {self.stats()}")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.close_expired()
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        把已收盘K线分批写入 kline 表
+
+        Returns:
+            写入的K线数
+        """
+        with self._lock:
+            bars, self._closed = self._closed, []
+            retry, self._retry = self._retry, []
+
+        if self.on_bar:
+            for bar in bars:
+                try:
+                    self.on_bar(dict(bar))
+                except Exception as e:
+                    logger.error(f"K线回调异常: {e}")
+        bars = retry + bars
+        if not bars:
+            return 0
+        if self.db is None:
+            self._incr('written', len(bars))
+            return len(bars)
+
+        written = 0
+        for i in range(0, len(bars), self.batch_size):
+            batch = bars[i:i + self.batch_size]
+            if not self.db.insert_bars(batch):
+                # 写库失败的K线留待下次重试，回调不重复触发
+                self._keep_for_retry(bars[i:])
+                break
+            written += len(batch)
+        self._incr('written', written)
+        return written
+
+    def _keep_for_retry(self, bars: List[Dict[str, Any]]):
+        with self._lock:
+            pending = bars + self._retry
+            overflow = len(pending) - self.max_pending
+            if overflow > 0:
+                pending = pending[overflow:]
+                self._stats['dropped'] += overflow
+            self._retry = pending
+            self._stats['failed'] += len(bars)
+
+    # ------------------------------------------------------------------
+    # 指标
+    # ------------------------------------------------------------------
+    def _incr(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        """返回 tick/收盘/写入计数及未收盘K线数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open_bars'] = len(self._bars)
+            stats['pending'] = len(self._closed) + len(self._retry)
+        return stats
@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+变更检测层
+位于 CTP 查询结果与 DatabaseManager 之间：按键记录上次成功落库时各行内容的哈希，
+每次自动下载只把新增、变化和消失的记录交给数据库，内容未变的记录直接跳过
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from decimal import Decimal
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from database_manager import order_key, ORDER_UPDATE_COLUMNS, INSTRUMENT_UPDATE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# 各类数据的比对规则：
+#   key     —— 唯一键字段，与数据库唯一键一致
+#   content —— 参与哈希的字段，只取数据库实际会写入/更新的列，
+#              保证哈希变化时落库一定改动到行
+#   scope   —— 为 True 时键的第一个字段是交易日：只有与本次快照同一交易日内消失的键
+#              才算删除，其他交易日的键只从状态中移除；为 False 时整份快照即全集
+#   delete  —— 消失的键是否产生删除
+DATASETS = {
+    'orders': {
+        'key': None,  # 使用 order_key() 自然键
+        'content': ORDER_UPDATE_COLUMNS,
+        'scope': True,
+        'delete': False,  # 委托在交易日内不会消失
+    },
+    'positions': {
+        'key': ('trading_day', 'instrument_id', 'direction'),
+        'content': ('position_type', 'volume', 'available_volume', 'open_price',
+                    'position_price', 'close_profit', 'position_profit'),
+        'scope': True,
+        'delete': True,
+    },
+    'instruments': {
+        'key': ('instrument_id',),
+        'content': INSTRUMENT_UPDATE_COLUMNS,
+        'scope': False,
+        'delete': True,
+    },
+    'accounts': {
+        'key': ('account_id',),
+        'content': ('pre_balance', 'balance', 'available', 'withdraw', 'margin',
+                    'frozen_margin', 'frozen_cash', 'frozen_commission', 'commission',
+                    'close_profit', 'position_profit', 'trading_day'),
+        'scope': False,
+        'delete': True,
+    },
+}
+
+# 没有自然键的委托（如 CSV 导入）按以下字段加出现序号作为键；这些字段在委托的生命周期内
+# 不变（不含 ORDER_UPDATE_COLUMNS），状态变化或之后补上报单编号时键保持不变
+_ORDER_FALLBACK_KEY = ('trading_day', 'order_time', 'instrument_id', 'direction',
+                       'offset_flag', 'order_price', 'order_volume')
+
+
+def fallback_order_key(key: Tuple) -> str:
+    """
+    没有自然键的委托写库时使用的 order_key
+
+    数据库只能按 (trading_day, order_key) 更新委托，没有 order_key 的委托只能追加；
+    变更检测为这类委托生成由回退键派生的稳定 order_key，之后的状态变化按该键更新同一行
+
+    Args:
+        key: _ORDER_FALLBACK_KEY 各字段加出现序号
+
+    Returns:
+        'R:' 加 32 位十六进制哈希
+    """
+    payload = json.dumps(list(key), ensure_ascii=False, separators=(',', ':'))
+    return 'R:' + hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _normalize(value):
+    """把数值统一成稳定的文本，避免 float/Decimal/int 混用导致哈希不同"""
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        number = round(float(value), 6)
+        return int(number) if number.is_integer() else repr(number)
+    return str(value)
+
+
+def content_hash(row: Dict[str, Any], fields) -> str:
+    """
+    计算一行记录指定字段的内容哈希
+
+    Args:
+        row: 记录字典
+        fields: 参与哈希的字段
+
+    Returns:
+        32 位十六进制哈希
+    """
+    payload = json.dumps([_normalize(row.get(f)) for f in fields],
+                         ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ChangeSet:
+    """一次比对的结果"""
+
+    def __init__(self, dataset: str):
+        self.dataset = dataset
+        self.inserts = []  # type: List[Dict[str, Any]]
+        self.updates = []  # type: List[Dict[str, Any]]
+        self.deletes = []  # type: List[Dict[str, Any]]  只含键字段
+        self.skipped = 0
+        self.available = True  # 为 False 表示查询失败，未做比对
+        self._hashes = {}  # type: Dict[Any, str]
+        self._forget = []  # type: List[Any]
+
+    @property
+    def changed(self) -> List[Dict[str, Any]]:
+        """需要写入的记录（新增 + 变化）"""
+        return self.inserts + self.updates
+
+    def __bool__(self) -> bool:
+        return bool(self.inserts or self.updates or self.deletes)
+
+    def summary(self) -> str:
+        if not self.available:
+            return "查询失败，本轮未同步"
+        return (f"新增 {len(self.inserts)}，变化 {len(self.updates)}，"
+                f"删除 {len(self.deletes)}，未变跳过 {self.skipped}")
+
+
+class ChangeDetector:
+    """
+    自动下载的变更检测器
+
+    用法：
+        detector = ChangeDetector(db_manager)
+        changes = detector.sync_orders(trader_api.query_orders())
+        print(changes.summary())
+
+    哈希只在数据库写入成功后才更新，写入失败的记录下一轮会再次作为变化提交；
+    程序重启后第一轮会把全部记录写一遍（写入本身是幂等的 upsert）
+    """
+
+    def __init__(self, db_manager=None):
+        """
+        初始化变更检测器
+
+        Args:
+            db_manager: DatabaseManager 实例，为 None 时只做比对不落库
+        """
+        self.db_manager = db_manager
+        self._state = {name: {} for name in DATASETS}  # type: Dict[str, Dict[Any, str]]
+        # 已按回退键写库的委托，reset() 后仍保留，之后有了自然键也沿用回退键
+        self._fallback_orders = set()  # type: Set[Tuple]
+        self._locks = {name: threading.Lock() for name in DATASETS}
+        self._stats = {
+            name: {'cycles': 0, 'inserted': 0, 'updated': 0, 'deleted': 0, 'skipped': 0,
+                   'failed': 0}
+            for name in DATASETS
+        }
+
+    # ------------------------------------------------------------------
+    # 比对
+    # ------------------------------------------------------------------
+
+    def _keys(self, dataset: str, rows: List[Dict[str, Any]],
+              fallback_orders: Set[Tuple]) -> Tuple[List[Any], List[Dict[str, Any]]]:
+        """
+        计算每行的键，批内同键时后出现的覆盖先出现的
+
+        没有自然键的委托按回退键跟踪，并带上 fallback_order_key() 写库；
+        已按回退键跟踪的委托之后有了自然键（如补上报单编号）时仍沿用回退键，
+        保证数据库中更新的是同一行
+
+        Returns:
+            (键列表, 写库用的记录列表)
+        """
+        spec = DATASETS[dataset]
+        if spec['key'] is not None:
+            return [tuple(str(row.get(f) or '') for f in spec['key']) for row in rows], rows
+        keys, out = [], []
+        seen = {}  # type: Dict[Tuple, int]
+        for row in rows:
+            # 序号按全部委托计数，个别委托有了自然键时其他委托的回退键不变
+            base = tuple(str(row.get(f) or '') for f in _ORDER_FALLBACK_KEY)
+            seen[base] = seen.get(base, 0) + 1
+            fallback = base + (seen[base],)
+            natural = order_key(row)
+            if natural is not None and fallback not in fallback_orders:
+                keys.append((str(row.get('trading_day') or ''), natural))
+                out.append(row)
+                continue
+            keys.append(fallback)
+            out.append(dict(row, order_key=fallback_order_key(fallback)))
+        return keys, out
+
+    def diff(self, dataset: str, rows: Optional[List[Dict[str, Any]]],
+             trading_day: Optional[str] = None) -> ChangeSet:
+        """
+        比对本次快照与上次落库状态（不修改状态）
+
+        列表（包括空列表）是完整的查询结果，其中没有的键判定为消失：按交易日划分的数据
+        只删除本次快照所属交易日的键，交易日取 trading_day 和记录中的交易日，
+        都没有时（如最后一笔持仓平掉后的空快照）取状态中最近的交易日。
+        查询失败或超时（可能只收到部分记录）时调用方应传 None，不做任何比对，
+        不能以空列表代替
+
+        Args:
+            dataset: 数据类型（orders/positions/instruments/accounts）
+            rows: 本次查询到的完整快照，None 表示查询失败
+            trading_day: 快照所属交易日（通常取登录返回的交易日）
+
+        Returns:
+            ChangeSet
+        """
+        if dataset not in DATASETS:
+            raise ValueError(f"不支持的数据类型: {dataset}")
+        spec = DATASETS[dataset]
+        changes = ChangeSet(dataset)
+        if rows is None:
+            changes.available = False
+            return changes
+
+        with self._locks[dataset]:
+            previous = dict(self._state[dataset])
+            fallback_orders = set(self._fallback_orders) if dataset == 'orders' else set()
+
+        current = {}  # type: Dict[Any, Tuple[str, Dict[str, Any]]]
+        keys, rows = self._keys(dataset, rows, fallback_orders)
+        for key, row in zip(keys, rows):
+            current[key] = (content_hash(row, spec['content']), row)
+
+        for key, (digest, row) in current.items():
+            old = previous.get(key)
+            if old is None:
+                changes.inserts.append(row)
+            elif old != digest:
+                changes.updates.append(row)
+            else:
+                changes.skipped += 1
+            changes._hashes[key] = digest
+
+        days = {key[0] for key in current}
+        if trading_day:
+            days.add(str(trading_day))
+        elif not days and previous:
+            days.add(max(key[0] for key in previous))
+        for key in previous:
+            if key in current:
+                continue
+            # 其他交易日的键不会再出现在快照里，只从状态中移除，不删库
+            same_scope = not spec['scope'] or key[0] in days
+            if same_scope and spec['delete']:
+                changes.deletes.append(dict(zip(spec['key'], key)))
+            changes._forget.append(key)
+        return changes
+
+    def commit(self, changes: ChangeSet) -> None:
+        """
+        把比对结果记为已落库状态
+
+        Args:
+            changes: diff() 的返回值
+        """
+        dataset = changes.dataset
+        with self._locks[dataset]:
+            state = self._state[dataset]
+            state.update(changes._hashes)
+            for key in changes._forget:
+                state.pop(key, None)
+            if dataset == 'orders':
+                # 回退键比自然键 (交易日, order_key) 多出字段
+                self._fallback_orders.update(k for k in changes._hashes if len(k) > 2)
+                self._fallback_orders.difference_update(changes._forget)
+            stats = self._stats[dataset]
+            stats['cycles'] += 1
+            stats['inserted'] += len(changes.inserts)
+            stats['updated'] += len(changes.updates)
+            stats['deleted'] += len(changes.deletes)
+            stats['skipped'] += changes.skipped
+
+    def reset(self, dataset: Optional[str] = None) -> None:
+        """
+        清空记录的状态，下一轮全部重新写入（如切换数据库后）
+
+        Args:
+            dataset: 数据类型，为 None 时清空全部
+        """
+        for name in ([dataset] if dataset else list(DATASETS)):
+            with self._locks[name]:
+                self._state[name].clear()
+
+    # ------------------------------------------------------------------
+    # 比对并落库
+    # ------------------------------------------------------------------
+
+    def _apply(self, changes: ChangeSet, write, delete=None) -> ChangeSet:
+        """写入变化记录，全部成功后才提交状态"""
+        if not changes.available:
+            return changes
+        ok = True
+        if changes.changed and self.db_manager is not None:
+            ok = write(changes.changed) > 0
+        if ok and changes.deletes and delete is not None and self.db_manager is not None:
+            ok = delete(changes.deletes) > 0
+        if ok:
+            self.commit(changes)
+        else:
+            with self._locks[changes.dataset]:
+                self._stats[changes.dataset]['failed'] += 1
+            logger.warning(f"{changes.dataset} 变更写入失败，下一轮重试")
+        return changes
+
+    def sync_orders(self, orders: Optional[List[Dict[str, Any]]],
+                    trading_day: Optional[str] = None) -> ChangeSet:
+        """
+        比对委托快照并写入新增/变化的委托
+
+        委托在交易日内不会消失，不做删除判定
+
+        Args:
+            orders: query_orders() 的结果，None 表示查询失败（不做比对）
+            trading_day: 快照所属交易日
+
+        Returns:
+            ChangeSet
+        """
+        changes = self.diff('orders', orders, trading_day)
+        return self._apply(changes, lambda rows: self.db_manager.insert_orders(rows))
+
+    def sync_positions(self, positions: Optional[List[Dict[str, Any]]],
+                       trading_day: Optional[str] = None) -> ChangeSet:
+        """
+        比对持仓快照，写入新增/变化的持仓，并删除同一交易日已平掉的持仓
+
+        Args:
+            positions: query_positions() 的结果，空列表表示已全部平仓，
+                       None 表示查询失败（不做比对）
+            trading_day: 快照所属交易日，空列表时据此确定删除哪一交易日的持仓
+
+        Returns:
+            ChangeSet
+        """
+        changes = self.diff('positions', positions, trading_day)
+        return self._apply(changes,
+                           lambda rows: self.db_manager.insert_positions(rows),
+                           lambda keys: self.db_manager.delete_positions(keys))
+
+    def sync_instruments(self, instruments: Optional[List[Dict[str, Any]]]) -> ChangeSet:
+        """
+        比对合约快照，写入新增/变化的合约，并把不再返回的合约标记为非交易
+
+        Args:
+            instruments: query_instruments() 的结果，None 表示查询失败（不做比对）
+
+        Returns:
+            ChangeSet
+        """
+        changes = self.diff('instruments', instruments)
+        return self._apply(
+            changes,
+            lambda rows: self.db_manager.insert_instrument_info(rows),
+            lambda keys: self.db_manager.retire_instruments([k['instrument_id'] for k in keys])
+        )
+
+    def sync_accounts(self, accounts: Optional[List[Dict[str, Any]]]) -> ChangeSet:
+        """
+        比对资金快照（资金暂无数据库表，只比对并更新状态）
+
+        Args:
+            accounts: query_accounts() 的结果，None 表示查询失败（不做比对）
+
+        Returns:
+            ChangeSet
+        """
+        changes = self.diff('accounts', accounts)
+        if changes.available:
+            self.commit(changes)
+        return changes
+
+    def sync_snapshot(self, orders: Optional[List[Dict[str, Any]]] = None,
+                      positions: Optional[List[Dict[str, Any]]] = None,
+                      trades: Optional[List[Dict[str, Any]]] = None,
+                      accounts: Optional[List[Dict[str, Any]]] = None,
+                      trading_day: Optional[str] = None) -> Tuple[Optional[int], Dict[str, ChangeSet]]:
+        """
+        把一个下载周期的数据作为一个快照写库（DatabaseManager.write_snapshot），
+        写入成功后把比对结果记为已落库状态
+
+        快照按同一内容哈希只写入有变化的记录；状态随之更新，之后的 sync_* 不会把
+        快照已写入的记录再写一遍。没有自然键的委托带上 fallback_order_key() 写库，
+        与 sync_orders 写入的是同一行
+
+        Args:
+            orders: 委托列表
+            positions: 持仓列表，空列表表示已全部平仓
+            trades: 成交列表（不做变更检测，直接交给快照）
+            accounts: 资金账户列表
+            trading_day: 快照所属交易日（通常取登录返回的交易日）
+            各类数据为 None 表示本周期未查询或查询失败
+
+        Returns:
+            (快照编号，失败时为 None, {数据类型: ChangeSet})
+        """
+        if orders is not None:
+            with self._locks['orders']:
+                fallback_orders = set(self._fallback_orders)
+            orders = self._keys('orders', orders, fallback_orders)[1]
+        data = {'orders': orders, 'positions': positions, 'accounts': accounts}
+        changes = {kind: self.diff(kind, rows, trading_day) for kind, rows in data.items()}
+        if self.db_manager is None:
+            return None, changes
+        snapshot_id = self.db_manager.write_snapshot(orders=orders, positions=positions,
+                                                     trades=trades, accounts=accounts,
+                                                     trading_day=trading_day)
+        for kind, change in changes.items():
+            if not change.available:
+                continue
+            if snapshot_id is not None:
+                self.commit(change)
+            else:
+                with self._locks[kind]:
+                    self._stats[kind]['failed'] += 1
+        if snapshot_id is None:
+            logger.warning("快照写入失败，下一轮重试")
+        return snapshot_id, changes
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取各类数据的累计计数
+
+        Returns:
+            {数据类型: {cycles, inserted, updated, deleted, skipped, failed, tracked}}
+        """
+        result = {}
+        for name in DATASETS:
+            with self._locks[name]:
+                result[name] = dict(self._stats[name], tracked=len(self._state[name]))
+        return result
@@ -11,9 +11,13 @@ CTP Mini API真实实现
 import os
 import sys
 from datetime import datetime
-from typing import Callable, Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional
 import time
-from threading import Event
+from threading import Lock, Timer
+
+from order_book import OrderBook
+from position_book import PositionBook
+from query_scheduler import QueryFuture, QueryScheduler, THROTTLED_CODES
 
 # 是否强制使用模拟CTP实现：
 # 1) 优先读取环境变量 USE_MOCK_CTP（"1"/"true" 表示启用模拟）;
@@ -31,11 +35,37 @@ except ImportError:
     CTP_AVAILABLE = False
 
 
+# 查询类别 -> (中文名称, ReqQry* 方法名)
+QUERY_KINDS = {
+    'orders': ('委托', 'ReqQryOrder'),
+    'positions': ('持仓', 'ReqQryInvestorPosition'),
+    'instruments': ('合约', 'ReqQryInstrument'),
+    'trades': ('成交', 'ReqQryTrade'),
+    'accounts': ('资金', 'ReqQryTradingAccount'),
+}
+# 查询类别 -> 请求结构体名
+_QUERY_FIELDS = {
+    'orders': 'CThostFtdcQryOrderField',
+    'positions': 'CThostFtdcQryInvestorPositionField',
+    'instruments': 'CThostFtdcQryInstrumentField',
+    'trades': 'CThostFtdcQryTradeField',
+    'accounts': 'CThostFtdcQryTradingAccountField',
+}
+# 过滤参数 -> 请求结构体字段
+_FILTER_FIELDS = {
+    'instrument_id': 'InstrumentID',
+    'exchange_id': 'ExchangeID',
+}
+
+
 class CTPTraderAPIReal:
     """CTP交易API真实实现"""
     
     def __init__(self, broker_id: str, user_id: str, password: str, 
-                 front_addr: str, app_id: str = "", auth_code: str = ""):
+                 front_addr: str, app_id: str = "", auth_code: str = "",
+                 query_rate: float = 1.0, query_burst: int = 1,
+                 query_timeout: float = 10.0, queue_timeout: float = 60.0,
+                 position_reconcile_interval: float = 60.0):
         """
         初始化CTP交易API
         
@@ -46,6 +76,11 @@ class CTPTraderAPIReal:
             front_addr: 前置机地址
             app_id: 应用标识
             auth_code: 认证码
+            query_rate: 每秒发送的查询数，与交易前置的流控限制一致
+            query_burst: 空闲后允许连续发送的查询数
+            query_timeout: 查询发出后等待全部结果的秒数
+            queue_timeout: 查询在流控队列中等待发送的最长秒数
+            position_reconcile_interval: 持仓簿与持仓查询核对的间隔秒数，0 表示不核对
         """
         self.broker_id = broker_id
         self.user_id = user_id
@@ -80,7 +115,10 @@ class CTPTraderAPIReal:
             'on_position_rsp': None,
             'on_trade_rsp': None,
             'on_instrument_rsp': None,
-            'on_account_rsp': None
+            'on_account_rsp': None,
+            # 私有流推送：委托/成交有变化时通知
+            'on_order': None,
+            'on_trade': None
         }
         
         # CTP API对象
@@ -92,11 +130,23 @@ class CTPTraderAPIReal:
         if not os.path.exists(self.flow_path):
             os.makedirs(self.flow_path)
         
-        # 查询结果存储
-        self._pos_results = []
-        self._pos_event = Event()
-        self._qry_results = []
-        self._qry_event = Event()
+        # 在途查询：nRequestID -> QueryFuture
+        self._pending: Dict[int, QueryFuture] = {}
+        self._pending_lock = Lock()
+        self._req_id_lock = Lock()
+        # 委托/成交簿：登录后查询一次初始化，之后由 OnRtnOrder/OnRtnTrade 推送维护
+        self.order_book = OrderBook()
+        self._book_trading_day = None
+        # 持仓簿：登录后查询一次初始化，之后由成交推送增量维护，定期重新查询核对
+        self.position_book = PositionBook()
+        self.position_reconcile_interval = position_reconcile_interval
+        self._reconcile_timer: Optional[Timer] = None
+        self._multiplier_requested = set()
+        # 查询流控调度：令牌桶限速、优先级排队、流控拒绝自动重发、相同查询合并
+        self.query_timeout = query_timeout
+        self.queue_timeout = queue_timeout
+        self._scheduler = QueryScheduler(self._send_query, rate=query_rate, burst=query_burst,
+                                         on_failed=self._report_query_error)
     
     def set_callback(self, event: str, callback: Callable):
         """设置回调函数"""
@@ -104,15 +154,18 @@ class CTPTraderAPIReal:
             self.callbacks[event] = callback
     
     def _next_req_id(self):
-        """获取下一个请求ID"""
-        self.request_id += 1
-        return self.request_id
+        """获取下一个请求ID（多个线程同时发送查询时保证不重复）"""
+        with self._req_id_lock:
+            self.request_id += 1
+            return self.request_id
 
     def connect(self):
         """连接到CTP交易前置"""
         if not CTP_AVAILABLE:
             raise RuntimeError("openctp-ctp 库不可用，请先安装并检查环境")
 
+        # disconnect() 停止了查询调度，重新连接时恢复
+        self._scheduler.start()
         try:
             # 创建API实例
             self.api = tdapi.CThostFtdcTraderApi.CreateFtdcTraderApi()
@@ -169,6 +222,9 @@ class CTPTraderAPIReal:
         return True
 
     def disconnect(self):
+        self._scheduler.stop("已断开连接")
+        self._fail_pending_queries("已断开连接")
+        self._stop_books()
         if self.api:
             try:
                 self.api.Release()
@@ -179,211 +235,285 @@ class CTPTraderAPIReal:
         self.is_connected = False
         self.is_logged_in = False
 
-    def query_orders(self, instrument_id: str = "", exchange_id: str = "") -> list:
-        """查询当日委托：真实环境下应调用 ReqQryOrder"""
-        if not self.api or not self.is_logged_in:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("尚未登录，无法查询委托")
-            return []
-
-        # 发送查询请求
-        try:
-            req = tdapi.CThostFtdcQryOrderField()
-            req.BrokerID = self.broker_id
-            req.InvestorID = self.user_id
-            if instrument_id:
-                req.InstrumentID = instrument_id
-            if exchange_id:
-                req.ExchangeID = exchange_id
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"构造委托查询请求失败: {e}")
-            return []
+    def submit_query(self, kind: str, priority: int = None, **filters) -> QueryFuture:
+        """
+        提交一次 ReqQry* 查询，不等待结果
 
-        try:
-            ret = self.api.ReqQryOrder(req, self._next_req_id())
-            if ret != 0:
-                if self.callbacks['on_error']:
-                    self.callbacks['on_error'](f"委托查询请求发送失败，错误码: {ret}")
-                return []
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"发送委托查询失败: {e}")
-            return []
+        查询先进入流控调度队列（见 query_scheduler），按优先级和前置的频率限制发送，
+        被流控拒绝时自动重发，排队中的相同查询合并为一次。每次请求使用独立的 nRequestID
+        和结果缓冲，SPI 回调按 nRequestID 把记录送到对应的 QueryFuture，
+        多个查询可以同时在途，各自在收到 bIsLast 时完成
 
-        # 由于CTP查询是异步的，这里暂时返回空列表，实际数据通过回调处理
-        # 如果需要同步返回数据，需要类似持仓查询的事件等待机制
-        return []
+        Args:
+            kind: 查询类别，见 QUERY_KINDS（orders/positions/instruments/trades/accounts）
+            priority: 优先级，数值越小越先发送，为空时按类别取默认值
+            **filters: 过滤条件，如 instrument_id、exchange_id
 
-    def query_positions(self, instrument_id: str = "") -> list:
-        """查询持仓：发送 ReqQryInvestorPosition，并同步等待 SPI 返回全部结果"""
+        Returns:
+            QueryFuture；未登录或发送失败时为已完成且带 error 的 future
+        """
+        what = QUERY_KINDS[kind][0]
         if not self.api or not self.is_logged_in:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("尚未登录，无法查询持仓")
-            return []
-
-        # 清空上一次结果
-        self._pos_results = []
-        self._pos_event.clear()
-
-        # 构造查询请求结构体，参考 C++ Demo 中 ReqQryInvestorPosition(nullptr,...)
-        try:
-            req = tdapi.CThostFtdcQryInvestorPositionField()
-            # 经纪商、投资者必填
-            req.BrokerID = self.broker_id
-            req.InvestorID = self.user_id
-            # 合约可选过滤
-            if instrument_id:
-                req.InstrumentID = instrument_id
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"构造持仓查询请求失败: {e}")
-            return []
-
-        # 发送查询请求
-        try:
-            ret = self.api.ReqQryInvestorPosition(req, self._next_req_id())
-            if ret != 0:
-                if self.callbacks['on_error']:
-                    self.callbacks['on_error'](f"持仓查询请求发送失败，错误码: {ret}")
-                return []
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"发送持仓查询失败: {e}")
-            return []
-
-        # 等待 SPI 回调结束（bIsLast=True 时会 set 事件），最多等 10 秒
-        finished = self._pos_event.wait(timeout=10)
-        if not finished:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("持仓查询超时")
+            return self._failed_query(kind, f"尚未登录，无法查询{what}")
+        return self._scheduler.submit(kind, priority, **filters)
 
-        return list(self._pos_results)
+    def _send_query(self, future: QueryFuture) -> int:
+        """
+        调度线程调用：构造请求并发送
 
-    def query_instruments(self, instrument_id: str = "", exchange_id: str = "") -> list:
-        """查询合约：真实环境下应调用 ReqQryInstrument，这里先占位返回空列表"""
+        Returns:
+            ReqQry* 的返回码；-2/-3 时由调度器稍后重发
+        """
+        what, method = QUERY_KINDS[future.kind]
         if not self.api or not self.is_logged_in:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("尚未登录，无法查询合约")
-            return []
-
-        # 清空之前的查询结果
-        self._qry_results = []
-        self._qry_event.clear()
+            future.set_done(f"尚未登录，无法查询{what}")
+            self._report_query_error(future)
+            return -1
 
-        # 发送查询请求
+        # 构造查询请求结构体，经纪商、投资者必填，其余为可选过滤
         try:
-            req = tdapi.CThostFtdcQryInstrumentField()
+            req = getattr(tdapi, _QUERY_FIELDS[future.kind])()
             req.BrokerID = self.broker_id
-            req.InstrumentID = instrument_id
-            req.ExchangeID = exchange_id
+            if future.kind != 'instruments':
+                req.InvestorID = self.user_id
+            for name, value in future.filters.items():
+                if value:
+                    setattr(req, _FILTER_FIELDS[name], value)
         except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"构造合约查询请求失败: {e}")
-            return []
-
+            future.set_done(f"构造{what}查询请求失败: {e}")
+            self._report_query_error(future)
+            return -1
+
+        # 先登记再发送：回调可能在 Req* 返回之前就到达
+        request_id = self._next_req_id()
+        future.request_id = request_id
+        with self._pending_lock:
+            self._pending[request_id] = future
         try:
-            ret = self.api.ReqQryInstrument(req, self._next_req_id())
-            if ret != 0:
-                if self.callbacks['on_error']:
-                    self.callbacks['on_error'](f"合约查询请求发送失败，错误码: {ret}")
-                return []
+            ret = getattr(self.api, method)(req, request_id)
         except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"发送合约查询失败: {e}")
-            return []
+            self._complete_query(request_id, f"发送{what}查询失败: {e}")
+            return -1
+        if ret == 0:
+            future.set_sent(request_id)
+        elif ret in THROTTLED_CODES:
+            # 被流控拒绝，撤销登记等待重发
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+        else:
+            self._complete_query(request_id, f"{what}查询请求发送失败，错误码: {ret}")
+        return ret
+
+    def _failed_query(self, kind: str, error: str) -> QueryFuture:
+        future = QueryFuture(kind)
+        future.set_done(error)
+        self._report_query_error(future)
+        return future
+
+    def _report_query_error(self, future: QueryFuture):
+        if future.error and self.callbacks['on_error']:
+            self.callbacks['on_error'](future.error)
+
+    def _route_query_row(self, request_id: int, row: Dict[str, Any]):
+        """SPI 回调：把一条查询结果追加到对应请求"""
+        with self._pending_lock:
+            future = self._pending.get(request_id)
+        if future is not None:
+            future.rows.append(row)
+
+    def _mark_query_error(self, request_id: int, error: str) -> Optional[QueryFuture]:
+        """SPI 回调：非最后一条的错误响应记到对应请求，结束时一并报告"""
+        with self._pending_lock:
+            future = self._pending.get(request_id)
+        if future is not None and not future.error:
+            future.error = error
+        return future
+
+    def _complete_query(self, request_id: int, error: str = None) -> QueryFuture:
+        """SPI 回调（bIsLast）或发送失败：结束对应请求并唤醒等待方"""
+        with self._pending_lock:
+            future = self._pending.pop(request_id, None)
+        if future is not None:
+            future.set_done(error)
+            self._report_query_error(future)
+        return future
+
+    def _fail_pending_queries(self, error: str):
+        """前置断开时结束全部在途查询，等待方立即返回已收到的部分"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_done(error)
+
+    def _wait_query(self, future: QueryFuture) -> list:
+        """同步等待查询完成，排队或应答超时后放弃该请求并返回已收到的部分"""
+        if not future.wait_sent(self.queue_timeout) or not future.wait(self.query_timeout):
+            self.abandon_query(future)
+        return list(future.rows)
+
+    def abandon_query(self, future: QueryFuture):
+        """
+        放弃一次超时的查询：尚在排队的从队列撤回，已发送的不再接收应答
 
-        # 等待查询完成
-        finished = self._qry_event.wait(timeout=10)
-        if not finished:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("合约查询超时")
+        Args:
+            future: submit_query 返回的 QueryFuture
+        """
+        if future.done():
+            return
+        what = QUERY_KINDS[future.kind][0]
+        if not future.sent():
+            if self._scheduler.cancel(future, f"{what}查询排队超时"):
+                return
+        with self._pending_lock:
+            self._pending.pop(future.request_id, None)
+        if future.set_done(f"{what}查询超时") and self.callbacks['on_error']:
+            self.callbacks['on_error'](f"{what}查询超时")
+
+    def query_all(self, kinds=('positions', 'accounts', 'orders', 'trades')) -> Dict[str, list]:
+        """
+        一次提交多类查询并等待全部完成，由调度器按优先级和流控依次发送
 
-        return list(self._qry_results)
+        Returns:
+            {查询类别: 结果列表}；查询出错或超时的类别为 None（部分结果不可用于判定记录消失，
+            写快照时沿用之前的版本）
+        """
+        # 委托簿、持仓簿已初始化时委托/成交/持仓直接取自推送维护的簿，不再发送查询
+        booked = {kind for kind in kinds if self._is_booked(kind)}
+        futures = {kind: self.submit_query(kind) for kind in kinds if kind not in booked}
+        result = {}
+        for kind, future in futures.items():
+            rows = self._wait_query(future)
+            result[kind] = None if future.error else rows
+        if 'orders' in booked:
+            result['orders'] = self.order_book.orders()
+        if 'trades' in booked:
+            result['trades'] = self.order_book.trades()
+        if 'positions' in booked:
+            result['positions'] = self.position_book.get_positions()
+        return result
+
+    def _is_booked(self, kind: str) -> bool:
+        if kind in ('orders', 'trades'):
+            return self.order_book.is_seeded(kind)
+        return kind == 'positions' and self.position_book.is_seeded()
+
+    def query_stats(self) -> Dict[str, int]:
+        """查询调度指标：提交、合并、发送、被流控拒绝、失败次数和排队数"""
+        return self._scheduler.stats()
+
+    def _seed_books(self, trading_day: str):
+        """登录后初始化委托簿和持仓簿：换交易日时清空，然后查询一次当日委托、成交和持仓"""
+        if trading_day and trading_day != self._book_trading_day:
+            self.order_book.clear()
+            self.position_book.clear()
+            self.position_book.trading_day = trading_day
+            self._book_trading_day = trading_day
+        # 断线期间可能漏掉推送，重新登录后同样以查询结果核对一次
+        self.order_book.begin_seed()
+        for kind in ('positions', 'orders', 'trades'):
+            self.submit_query(kind).add_done_callback(self._seed_from_query)
+
+    def _stop_books(self):
+        """断开后委托簿、持仓簿不再视为最新，停止持仓核对"""
+        self.order_book.begin_seed()
+        self.position_book.unseed()
+        timer, self._reconcile_timer = self._reconcile_timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def _seed_from_query(self, future: QueryFuture):
+        """
+        不带过滤条件的委托/成交/持仓查询成功后，用结果初始化（或核对）对应的簿；
+        持仓查询无论成败都安排下一次核对，失败时由下一次核对重新初始化
+        """
+        if any(future.filters.values()):
+            return
+        if future.error:
+            if future.kind == 'positions':
+                self._schedule_reconcile()
+            return
+        if future.kind == 'orders':
+            self.order_book.seed(orders=future.rows)
+        elif future.kind == 'trades':
+            self.order_book.seed(trades=future.rows)
+        elif future.kind == 'positions':
+            if self.position_book.is_seeded():
+                self.position_book.reconcile(future.rows)
+            else:
+                self.position_book.seed(future.rows)
+            for row in future.rows:
+                self._ensure_multiplier(row.get('instrument_id'))
+            self._schedule_reconcile()
+
+    def _ensure_multiplier(self, instrument_id: str):
+        """持仓簿缺少某个合约的乘数时查询一次该合约"""
+        if not instrument_id or self.position_book.has_multiplier(instrument_id) \
+                or instrument_id in self._multiplier_requested:
+            return
+        self._multiplier_requested.add(instrument_id)
+        future = self.submit_query('instruments', instrument_id=instrument_id)
+        # 查询失败时允许下次再查
+        future.add_done_callback(
+            lambda f: f.error and self._multiplier_requested.discard(instrument_id))
+
+    def _schedule_reconcile(self):
+        """安排下一次持仓核对"""
+        if self.position_reconcile_interval <= 0 or not self.is_logged_in:
+            return
+        timer = Timer(self.position_reconcile_interval, self.reconcile_positions)
+        timer.daemon = True
+        old, self._reconcile_timer = self._reconcile_timer, timer
+        if old is not None:
+            old.cancel()
+        timer.start()
+
+    def reconcile_positions(self) -> QueryFuture:
+        """
+        重新查询一次持仓并与持仓簿核对（数量不一致时以查询结果为准），不等待结果
 
-    def query_trades(self, instrument_id: str = "") -> list:
-        """查询成交：发送 ReqQryTrade，并同步等待结果"""
-        if not self.api or not self.is_logged_in:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("尚未登录，无法查询成交")
-            return []
+        按较低优先级排队，不挤占界面发起的查询；核对完成后自动安排下一次
+        """
+        future = self.submit_query('positions', priority=2)
+        future.add_done_callback(self._seed_from_query)
+        return future
 
-        # 清空上一次结果
-        self._qry_results = []
-        self._qry_event.clear()
+    def query_orders(self, instrument_id: str = "", exchange_id: str = "") -> list:
+        """
+        查询当日委托（同时通过 on_order_rsp 回调通知）
 
-        # 构造查询请求结构体
-        try:
-            req = tdapi.CThostFtdcQryTradeField()
-            req.BrokerID = self.broker_id
-            req.InvestorID = self.user_id
-            if instrument_id:
-                req.InstrumentID = instrument_id
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"构造成交查询请求失败: {e}")
-            return []
+        委托簿已初始化时直接从簿中返回，否则发送 ReqQryOrder 并同步等待结果
+        """
+        if self.order_book.is_seeded('orders'):
+            rows = self.order_book.orders(instrument_id=instrument_id, exchange_id=exchange_id)
+            if self.callbacks['on_order_rsp']:
+                self.callbacks['on_order_rsp'](list(rows))
+            return rows
+        return self._wait_query(self.submit_query(
+            'orders', instrument_id=instrument_id, exchange_id=exchange_id))
 
-        # 发送查询请求
-        try:
-            ret = self.api.ReqQryTrade(req, self._next_req_id())
-            if ret != 0:
-                if self.callbacks['on_error']:
-                    self.callbacks['on_error'](f"成交查询请求发送失败，错误码: {ret}")
-                return []
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"发送成交查询失败: {e}")
-            return []
+    def query_positions(self, instrument_id: str = "") -> list:
+        """
+        查询持仓：持仓簿已初始化时立即从簿中返回，
+        否则发送 ReqQryInvestorPosition，并同步等待 SPI 返回全部结果
+        """
+        if self.position_book.is_seeded():
+            return self.position_book.get_positions(instrument_id=instrument_id)
+        return self._wait_query(self.submit_query('positions', instrument_id=instrument_id))
 
-        # 等待查询完成
-        finished = self._qry_event.wait(timeout=10)
-        if not finished:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("成交查询超时")
+    def query_instruments(self, instrument_id: str = "", exchange_id: str = "") -> list:
+        """查询合约：发送 ReqQryInstrument 并同步等待结果"""
+        return self._wait_query(self.submit_query(
+            'instruments', instrument_id=instrument_id, exchange_id=exchange_id))
 
-        return list(self._qry_results)
+    def query_trades(self, instrument_id: str = "") -> list:
+        """查询成交：委托簿已初始化时直接从簿中返回，否则发送 ReqQryTrade 并同步等待结果"""
+        if self.order_book.is_seeded('trades'):
+            return self.order_book.trades(instrument_id=instrument_id)
+        return self._wait_query(self.submit_query('trades', instrument_id=instrument_id))
 
     def query_accounts(self) -> list:
         """查询资金：发送 ReqQryTradingAccount 并同步等待结果"""
-        if not self.api or not self.is_logged_in:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("尚未登录，无法查询资金")
-            return []
-
-        # 清空上一次结果
-        self._qry_results = []
-        self._qry_event.clear()
-
-        # 构造查询请求结构体
-        try:
-            req = tdapi.CThostFtdcQryTradingAccountField()
-            req.BrokerID = self.broker_id
-            req.InvestorID = self.user_id
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"构造资金查询请求失败: {e}")
-            return []
-
-        # 发送查询请求
-        try:
-            ret = self.api.ReqQryTradingAccount(req, self._next_req_id())
-            if ret != 0:
-                if self.callbacks['on_error']:
-                    self.callbacks['on_error'](f"资金查询请求发送失败，错误码: {ret}")
-                return []
-        except Exception as e:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error'](f"发送资金查询失败: {e}")
-            return []
-
-        # 等待查询完成
-        finished = self._qry_event.wait(timeout=10)
-        if not finished:
-            if self.callbacks['on_error']:
-                self.callbacks['on_error']("资金查询超时")
-
-        return list(self._qry_results)
+        return self._wait_query(self.submit_query('accounts'))
 
 
 class CTPTraderSpi(tdapi.CThostFtdcTraderSpi if CTP_AVAILABLE else object):
@@ -417,6 +547,9 @@ class CTPTraderSpi(tdapi.CThostFtdcTraderSpi if CTP_AVAILABLE else object):
         print(f"交易前置断开，原因：{nReason}")
         self.api_wrapper.is_connected = False
         self.api_wrapper.is_logged_in = False
+        self.api_wrapper._fail_pending_queries(f"交易前置断开，原因：{nReason}")
+        # 断线期间的推送会漏掉，重新登录并核对之前不再从委托簿、持仓簿直接返回
+        self.api_wrapper._stop_books()
         if self.api_wrapper.callbacks['on_disconnected']:
             self.api_wrapper.callbacks['on_disconnected']()
     
@@ -458,6 +591,8 @@ class CTPTraderSpi(tdapi.CThostFtdcTraderSpi if CTP_AVAILABLE else object):
                 'system_name': pRspUserLogin.SystemName if hasattr(pRspUserLogin, 'SystemName') else ''
             }
             
+            self.api_wrapper._seed_books(pRspUserLogin.TradingDay)
+
             if self.api_wrapper.callbacks['on_login']:
                 self.api_wrapper.callbacks['on_login'](login_info)
     
@@ -470,21 +605,17 @@ class CTPTraderSpi(tdapi.CThostFtdcTraderSpi if CTP_AVAILABLE else object):
     
     def OnRspQryInvestorPosition(self, pInvestorPosition, pRspInfo, nRequestID, bIsLast):
         """持仓查询响应：将 CTP 结构转换成我们自己的 daily_positions 字段"""
-        # 错误处理
+        # 错误处理：即使出错也结束该请求的等待
         if pRspInfo and pRspInfo.ErrorID != 0:
-            err = f"查询持仓失败: {pRspInfo.ErrorID} {getattr(pRspInfo, 'ErrorMsg', '')}"
-            if self.api_wrapper.callbacks['on_error']:
-                self.api_wrapper.callbacks['on_error'](err)
-            # 即使出错也结束等待
-            if bIsLast:
-                self.api_wrapper._pos_event.set()
+            self._query_failed('持仓', pRspInfo, nRequestID, bIsLast)
             return
 
         if pInvestorPosition:
             try:
                 # CTP 方向/今昨字段映射为我们的 direction/position_type
                 posi = pInvestorPosition
-                direction = '多头' if getattr(posi, 'PosiDirection', '') == getattr(tdapi, 'THOST_FTDC_D_Buy', '0') else '空头'
+                # PosiDirection：'2' 多头、'3' 空头（'1' 净持仓按多头处理）
+                direction = '空头' if getattr(posi, 'PosiDirection', '') == getattr(tdapi, 'THOST_FTDC_PD_Short', '3') else '多头'
                 # position_type 暂时用 "总仓"，后续如有需要可根据 TodayPosition/YdPosition 拆分
                 position_type = '总仓'
                 volume = getattr(posi, 'Position', 0) or 0
@@ -511,80 +642,120 @@ class CTPTraderSpi(tdapi.CThostFtdcTraderSpi if CTP_AVAILABLE else object):
                     'close_profit': float(close_profit),
                     'position_profit': float(position_profit),
                     'trading_day': trading_day,
+                    # 持仓簿初始化用：今/昨仓数量和开仓成本（金额）
+                    'exchange_id': getattr(posi, 'ExchangeID', '') or '',
+                    'today_volume': int(available_volume),
+                    'yd_volume': max(0, int(volume) - int(available_volume)),
+                    'open_cost': float(getattr(posi, 'OpenCost', 0.0) or 0.0),
                 }
-                self.api_wrapper._pos_results.append(row)
+                self.api_wrapper._route_query_row(nRequestID, row)
             except Exception as e:
                 if self.api_wrapper.callbacks['on_error']:
                     self.api_wrapper.callbacks['on_error'](f"处理持仓数据时异常: {e}")
 
         if bIsLast:
             # 通知等待方查询结束
-            self.api_wrapper._pos_event.set()
+            self.api_wrapper._complete_query(nRequestID)
     
+    def _order_row(self, pOrder) -> Dict[str, Any]:
+        """把 CThostFtdcOrderField 转换为 daily_orders 字段（查询响应和推送共用）"""
+        return {
+            'order_time': pOrder.InsertTime if hasattr(pOrder, 'InsertTime') else '',
+            'instrument_id': pOrder.InstrumentID,
+            'direction': '买入' if pOrder.Direction == getattr(tdapi, 'THOST_FTDC_D_Buy', '0') else '卖出',
+            'offset_flag': self._parse_offset_flag(pOrder.CombOffsetFlag[0]) if pOrder.CombOffsetFlag else '',
+            'order_price': pOrder.LimitPrice,
+            'order_volume': pOrder.VolumeTotalOriginal,
+            'traded_volume': pOrder.VolumeTraded,
+            'order_status': self._parse_order_status(pOrder.OrderStatus),
+            'remark': pOrder.StatusMsg if hasattr(pOrder, 'StatusMsg') else '',
+            'trading_day': pOrder.TradingDay if hasattr(pOrder, 'TradingDay') else '',
+            # CTP 自然键，入库时用于去重
+            'front_id': getattr(pOrder, 'FrontID', None),
+            'session_id': getattr(pOrder, 'SessionID', None),
+            'order_ref': getattr(pOrder, 'OrderRef', ''),
+            'exchange_id': getattr(pOrder, 'ExchangeID', ''),
+            'order_sys_id': getattr(pOrder, 'OrderSysID', '').strip()
+        }
+
+    def _trade_row(self, pTrade) -> Dict[str, Any]:
+        """把 CThostFtdcTradeField 转换为成交字典（查询响应和推送共用）"""
+        return {
+            'trade_time': pTrade.TradeTime if hasattr(pTrade, 'TradeTime') else '',
+            'instrument_id': pTrade.InstrumentID,
+            'direction': '买入' if pTrade.Direction == getattr(tdapi, 'THOST_FTDC_D_Buy', '0') else '卖出',
+            'offset_flag': self._parse_offset_flag(pTrade.OffsetFlag),
+            'price': pTrade.Price,
+            'volume': pTrade.Volume,
+            'trade_id': str(pTrade.TradeID).strip(),
+            'trading_day': pTrade.TradingDay if hasattr(pTrade, 'TradingDay') else '',
+            # 成交编号在同一交易所、同一方向内唯一；报单编号关联到委托
+            'exchange_id': getattr(pTrade, 'ExchangeID', ''),
+            'order_sys_id': getattr(pTrade, 'OrderSysID', '').strip()
+        }
+
     def OnRspQryOrder(self, pOrder, pRspInfo, nRequestID, bIsLast):
         """查询报单响应"""
         if pRspInfo and pRspInfo.ErrorID != 0:
-            err = f"查询委托失败: {pRspInfo.ErrorID} {getattr(pRspInfo, 'ErrorMsg', '')}"
-            if self.api_wrapper.callbacks['on_error']:
-                self.api_wrapper.callbacks['on_error'](err)
+            self._query_failed('委托', pRspInfo, nRequestID, bIsLast)
             return
 
         if pOrder:
-            order = {
-                'order_time': pOrder.InsertTime if hasattr(pOrder, 'InsertTime') else '',
-                'instrument_id': pOrder.InstrumentID,
-                'direction': '买入' if pOrder.Direction == getattr(tdapi, 'THOST_FTDC_D_Buy', '0') else '卖出',
-                'offset_flag': self._parse_offset_flag(pOrder.CombOffsetFlag[0]) if pOrder.CombOffsetFlag else '',
-                'order_price': pOrder.LimitPrice,
-                'order_volume': pOrder.VolumeTotalOriginal,
-                'traded_volume': pOrder.VolumeTraded,
-                'order_status': self._parse_order_status(pOrder.OrderStatus),
-                'remark': pOrder.StatusMsg if hasattr(pOrder, 'StatusMsg') else '',
-                'trading_day': pOrder.TradingDay if hasattr(pOrder, 'TradingDay') else ''
-            }
-            self.api_wrapper._order_cache.append(order)
+            self.api_wrapper._route_query_row(nRequestID, self._order_row(pOrder))
         
-        if bIsLast and self.api_wrapper.callbacks['on_order_rsp']:
-            self.api_wrapper.callbacks['on_order_rsp'](self.api_wrapper._order_cache)
-            self.api_wrapper._order_cache = []
+        if bIsLast:
+            future = self.api_wrapper._complete_query(nRequestID)
+            if future is not None and self.api_wrapper.callbacks['on_order_rsp']:
+                self.api_wrapper.callbacks['on_order_rsp'](list(future.rows))
     
     def OnRspQryTrade(self, pTrade, pRspInfo, nRequestID, bIsLast):
         """查询成交响应"""
         if pRspInfo and pRspInfo.ErrorID != 0:
-            err = f"查询成交失败: {pRspInfo.ErrorID} {getattr(pRspInfo, 'ErrorMsg', '')}"
-            if self.api_wrapper.callbacks['on_error']:
-                self.api_wrapper.callbacks['on_error'](err)
-            # 即使出错也要通知结束
-            if bIsLast:
-                self.api_wrapper._qry_event.set()
+            self._query_failed('成交', pRspInfo, nRequestID, bIsLast)
             return
 
         if pTrade:
-            trade = {
-                'trade_time': pTrade.TradeTime if hasattr(pTrade, 'TradeTime') else '',
-                'instrument_id': pTrade.InstrumentID,
-                'direction': '买入' if pTrade.Direction == getattr(tdapi, 'THOST_FTDC_D_Buy', '0') else '卖出',
-                'offset_flag': self._parse_offset_flag(pTrade.OffsetFlag),
-                'price': pTrade.Price,
-                'volume': pTrade.Volume,
-                'trade_id': pTrade.TradeID,
-                'trading_day': pTrade.TradingDay if hasattr(pTrade, 'TradingDay') else ''
-            }
-            self.api_wrapper._qry_results.append(trade)
+            self.api_wrapper._route_query_row(nRequestID, self._trade_row(pTrade))
         
         if bIsLast:
             # 通知等待方查询结束
-            self.api_wrapper._qry_event.set()
+            self.api_wrapper._complete_query(nRequestID)
+
+    def OnRtnOrder(self, pOrder):
+        """报单推送（私有流）：更新委托簿"""
+        if not pOrder:
+            return
+        try:
+            order = self._order_row(pOrder)
+        except Exception as e:
+            if self.api_wrapper.callbacks['on_error']:
+                self.api_wrapper.callbacks['on_error'](f"处理报单推送时异常: {e}")
+            return
+        if self.api_wrapper.order_book.apply_order(order) and self.api_wrapper.callbacks['on_order']:
+            self.api_wrapper.callbacks['on_order'](order)
+
+    def OnRtnTrade(self, pTrade):
+        """成交推送（私有流）：更新委托簿和持仓簿"""
+        if not pTrade:
+            return
+        try:
+            trade = self._trade_row(pTrade)
+        except Exception as e:
+            if self.api_wrapper.callbacks['on_error']:
+                self.api_wrapper.callbacks['on_error'](f"处理成交推送时异常: {e}")
+            return
+        # 委托簿识别出的新成交才计入持仓，重复推送不会重复开平
+        if not self.api_wrapper.order_book.apply_trade(trade):
+            return
+        self.api_wrapper.position_book.apply_trade(trade)
+        self.api_wrapper._ensure_multiplier(trade['instrument_id'])
+        if self.api_wrapper.callbacks['on_trade']:
+            self.api_wrapper.callbacks['on_trade'](trade)
     
     def OnRspQryInstrument(self, pInstrument, pRspInfo, nRequestID, bIsLast):
         """查询合约响应"""
         if pRspInfo and pRspInfo.ErrorID != 0:
-            err = f"查询合约失败: {pRspInfo.ErrorID} {getattr(pRspInfo, 'ErrorMsg', '')}"
-            if self.api_wrapper.callbacks['on_error']:
-                self.api_wrapper.callbacks['on_error'](err)
-            # 即使出错也要通知结束
-            if bIsLast:
-                self.api_wrapper._qry_event.set()
+            self._query_failed('合约', pRspInfo, nRequestID, bIsLast)
             return
 
         if pInstrument:
@@ -605,21 +776,18 @@ class CTPTraderSpi(tdapi.CThostFtdcTraderSpi if CTP_AVAILABLE else object):
                 'long_margin_ratio': pInstrument.LongMarginRatio,
                 'short_margin_ratio': pInstrument.ShortMarginRatio
             }
-            self.api_wrapper._qry_results.append(instrument)
+            self.api_wrapper.position_book.set_multiplier(instrument['instrument_id'],
+                                                          instrument['volume_multiple'])
+            self.api_wrapper._route_query_row(nRequestID, instrument)
         
         if bIsLast:
             # 通知等待方查询结束
-            self.api_wrapper._qry_event.set()
+            self.api_wrapper._complete_query(nRequestID)
     
     def OnRspQryTradingAccount(self, pTradingAccount, pRspInfo, nRequestID, bIsLast):
         """查询资金响应"""
         if pRspInfo and pRspInfo.ErrorID != 0:
-            err = f"查询资金失败: {pRspInfo.ErrorID} {getattr(pRspInfo, 'ErrorMsg', '')}"
-            if self.api_wrapper.callbacks['on_error']:
-                self.api_wrapper.callbacks['on_error'](err)
-            # 即使出错也要通知结束
-            if bIsLast:
-                self.api_wrapper._qry_event.set()
+            self._query_failed('资金', pRspInfo, nRequestID, bIsLast)
             return
 
         if pTradingAccount:
@@ -638,12 +806,25 @@ class CTPTraderSpi(tdapi.CThostFtdcTraderSpi if CTP_AVAILABLE else object):
                 'position_profit': pTradingAccount.PositionProfit,
                 'trading_day': pTradingAccount.TradingDay
             }
-            self.api_wrapper._qry_results.append(account)
+            self.api_wrapper._route_query_row(nRequestID, account)
         
         if bIsLast:
             # 通知等待方查询结束
-            self.api_wrapper._qry_event.set()
+            self.api_wrapper._complete_query(nRequestID)
     
+    def _query_failed(self, what: str, pRspInfo, nRequestID, bIsLast):
+        """
+        查询错误响应：错误信息记到对应请求，bIsLast 时结束该请求（错误经 on_error 通知）；
+        非最后一条的错误同样使该请求以错误结束，已收到的记录不作为完整结果
+        """
+        err = f"查询{what}失败: {pRspInfo.ErrorID} {getattr(pRspInfo, 'ErrorMsg', '')}"
+        if bIsLast:
+            future = self.api_wrapper._complete_query(nRequestID, err)
+        else:
+            future = self.api_wrapper._mark_query_error(nRequestID, err)
+        if future is None and self.api_wrapper.callbacks['on_error']:
+            self.api_wrapper.callbacks['on_error'](err)
+
     def _parse_offset_flag(self, flag):
         """解析开平标志"""
         flag_map = {
@@ -856,6 +1037,7 @@ class CTPMdSpi(mdapi.CThostFtdcMdSpi if CTP_AVAILABLE else object):
         if pDepthMarketData:
             market_data = {
                 'instrument_id': pDepthMarketData.InstrumentID,
+                'exchange_id': getattr(pDepthMarketData, 'ExchangeID', ''),
                 'last_price': pDepthMarketData.LastPrice,
                 'pre_settlement_price': pDepthMarketData.PreSettlementPrice,
                 'pre_close_price': pDepthMarketData.PreClosePrice,
@@ -868,6 +1050,8 @@ class CTPMdSpi(mdapi.CThostFtdcMdSpi if CTP_AVAILABLE else object):
                 'volume': pDepthMarketData.Volume,
                 'turnover': pDepthMarketData.Turnover,
                 'open_interest': pDepthMarketData.OpenInterest,
+                'close_price': pDepthMarketData.ClosePrice,
+                'settlement_price': pDepthMarketData.SettlementPrice,
                 'bid_price1': pDepthMarketData.BidPrice1,
                 'bid_volume1': pDepthMarketData.BidVolume1,
                 'ask_price1': pDepthMarketData.AskPrice1,
@@ -162,7 +162,12 @@ class CTPTraderAPI:
                 'traded_volume': 1,
                 'order_status': '全部成交',
                 'remark': f'模拟委托1({self.user_id})',
-                'trading_day': trading_day
+                'trading_day': trading_day,
+                'front_id': 1,
+                'session_id': 1,
+                'order_ref': '1',
+                'exchange_id': 'SHFE',
+                'order_sys_id': '1'
             },
             {
                 'order_time': '10:15:20',
@@ -174,7 +179,12 @@ class CTPTraderAPI:
                 'traded_volume': 1,
                 'order_status': '部分成交还在队列中',
                 'remark': f'模拟委托2({self.user_id})',
-                'trading_day': trading_day
+                'trading_day': trading_day,
+                'front_id': 1,
+                'session_id': 1,
+                'order_ref': '2',
+                'exchange_id': 'SHFE',
+                'order_sys_id': '2'
             },
         ]
         
@@ -7,22 +7,679 @@ MySQL数据库管理模块
 
 import pymysql
 from pymysql import Error
-from pymysql.cursors import DictCursor
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+from pymysql.cursors import DictCursor, SSDictCursor
+from collections import deque
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Dict, Any, Callable, Iterator, Optional, Sequence, Tuple
+import base64
+import functools
+import json
 import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from db_metrics import MetricsRegistry, TimedConnection
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 各表批量写入的字段顺序
+ORDER_COLUMNS = (
+    'order_time', 'instrument_id', 'direction', 'offset_flag', 'order_price',
+    'order_volume', 'traded_volume', 'order_status', 'remark', 'trading_day',
+    'front_id', 'session_id', 'order_ref', 'exchange_id', 'order_sys_id', 'order_key'
+)
+# 同一委托再次下载时更新的字段
+ORDER_UPDATE_COLUMNS = ('traded_volume', 'order_status', 'remark', 'order_sys_id')
+# 委托的 CTP 自然键字段，旧表连接时补建
+ORDER_IDENTITY_COLUMNS = {
+    'front_id': "INT COMMENT '前置编号'",
+    'session_id': "INT COMMENT '会话编号'",
+    'order_ref': "VARCHAR(13) COMMENT '报单引用'",
+    'exchange_id': "VARCHAR(9) COMMENT '交易所代码'",
+    'order_sys_id': "VARCHAR(21) COMMENT '报单编号'",
+    'order_key': "VARCHAR(64) COMMENT '委托唯一标识'",
+}
+MARKET_DATA_COLUMNS = (
+    'instrument_id', 'exchange_id', 'update_time', 'last_price', 'pre_settlement_price',
+    'pre_close_price', 'open_price', 'highest_price', 'lowest_price', 'volume', 'turnover',
+    'open_interest', 'close_price', 'settlement_price', 'upper_limit_price',
+    'lower_limit_price', 'bid_price1', 'bid_volume1', 'ask_price1', 'ask_volume1', 'trading_day'
+)
+INSTRUMENT_COLUMNS = (
+    'instrument_id', 'exchange_id', 'instrument_name', 'product_id', 'product_class',
+    'delivery_year', 'delivery_month', 'volume_multiple', 'price_tick', 'create_date',
+    'open_date', 'expire_date', 'start_delivery_date', 'end_delivery_date', 'is_trading',
+    'long_margin_ratio', 'short_margin_ratio', 'max_market_order_volume',
+    'min_market_order_volume', 'max_limit_order_volume', 'min_limit_order_volume'
+)
+# 合约参数再次下载时更新的字段
+INSTRUMENT_UPDATE_COLUMNS = ('instrument_name', 'is_trading', 'long_margin_ratio', 'short_margin_ratio')
+KLINE_COLUMNS = (
+    'instrument_id', 'period', 'trading_day', 'bar_time', 'open_price', 'high_price',
+    'low_price', 'close_price', 'volume', 'turnover', 'open_interest', 'tick_count'
+)
+# 同一根K线重复写入时更新的字段
+KLINE_UPDATE_COLUMNS = tuple(
+    c for c in KLINE_COLUMNS if c not in ('instrument_id', 'period', 'bar_time')
+)
+
+# 持仓按 (instrument_id, direction, trading_day) 唯一，重复下载整行替换
+_POSITION_REPLACE_SQL = """
+    REPLACE INTO daily_positions
+    (instrument_id, direction, position_type, volume, available_volume,
+     open_price, position_price, close_profit, position_profit, trading_day)
+    VALUES (%(instrument_id)s, %(direction)s, %(position_type)s, %(volume)s,
+            %(available_volume)s, %(open_price)s, %(position_price)s,
+            %(close_profit)s, %(position_profit)s, %(trading_day)s)
+"""
+_POSITION_DELETE_SQL = """
+    DELETE FROM daily_positions
+    WHERE trading_day = %(trading_day)s AND instrument_id = %(instrument_id)s
+      AND direction = %(direction)s
+"""
+
+# 每日汇总表：按 (trading_day, instrument_id) 预聚合，写入明细时在同一事务内增量维护
+ORDER_SUMMARY_COLUMNS = (
+    'trading_day', 'instrument_id', 'order_count', 'order_volume', 'traded_volume',
+    'filled_orders', 'cancelled_orders'
+)
+POSITION_SUMMARY_COLUMNS = (
+    'trading_day', 'instrument_id', 'long_volume', 'short_volume', 'position_profit',
+    'close_profit'
+)
+MARKET_SUMMARY_COLUMNS = (
+    'trading_day', 'instrument_id', 'exchange_id', 'open_price', 'high_price', 'low_price',
+    'last_price', 'pre_settlement_price', 'volume', 'turnover', 'open_interest',
+    'tick_count', 'last_seq'
+)
+SUMMARY_TABLES = ('daily_order_summary', 'daily_position_summary', 'daily_market_summary')
+# 行情汇总的排序字段
+_MOVER_ORDERS = {
+    'change_pct': "(last_price - pre_settlement_price) / pre_settlement_price",
+    'volume': "volume",
+    'turnover': "turnover",
+    'open_interest': "open_interest",
+}
+
+
+def _session_seq(update_time) -> int:
+    """
+    把行情时间换算为交易日内的先后序号（秒）
+
+    交易日从前一晚夜盘开始：18:00 之后的时间排在最前，零点后的夜盘和日盘依次在后
+    """
+    try:
+        h, m, sec = (int(x) for x in str(update_time).split(':')[:3])
+    except ValueError:
+        return 0
+    seconds = h * 3600 + m * 60 + sec
+    return seconds - 18 * 3600 if seconds >= 18 * 3600 else seconds + 6 * 3600
+
+
+def _product_of(instrument_id: str) -> str:
+    """由合约代码取品种代码（合约参数表中没有该合约时使用）"""
+    match = re.match(r'[A-Za-z]+', instrument_id or '')
+    return match.group(0) if match else instrument_id
+
+
+# 分层保留：超出保留期的交易日从明细表移入对应的 *_history 表（或压缩归档文件），
+# archive_catalog 记录每个已归档交易日的位置，query_* 按交易日查询时据此合并历史数据
+HISTORY_TABLES = {
+    'daily_orders': 'daily_orders_history',
+    'daily_positions': 'daily_positions_history',
+    'market_data': 'market_data_history',
+}
+# 有独立日分区的 market_data 交易日整体换出到 market_data_arch_<交易日>，归档位置记为 'table:<表名>'
+_ARCH_TABLE_PREFIX = 'market_data_arch_'
+
+
+def history_source(table: str, location: str) -> Optional[str]:
+    """
+    归档位置对应的历史数据表
+
+    Args:
+        table: 明细表
+        location: archive_catalog 中的归档位置
+
+    Returns:
+        'table' 为 history 表，'table:<表名>' 为换出的分区表，归档文件返回 None
+    """
+    if location == 'table':
+        return HISTORY_TABLES[table]
+    if location.startswith('table:'):
+        return location[len('table:'):]
+    return None
+
+
+# 合并热数据与历史数据后的排序：(排序字段, 是否倒序)，与各 query_* 的 ORDER BY 一致
+_HISTORY_ORDER = {
+    'daily_orders': (('trading_day', 'order_time'), True),
+    'daily_positions': (('instrument_id', 'direction'), False),
+    'market_data': (('trading_day', 'update_time'), True),
+}
+
+
+# 一致性快照：一个下载周期的委托/持仓/成交/资金在同一事务内写入 snapshot_rows，
+# 每条记录带有效区间 [valid_from, valid_to)，按快照编号即可读出当时的完整视图
+SNAPSHOT_KINDS = ('orders', 'positions', 'trades', 'accounts')
+# 快照中消失即视为不存在的数据；委托和成交在交易日内只增不减
+_SNAPSHOT_REMOVABLE = ('positions', 'accounts')
+_ORDER_FALLBACK_FIELDS = ('order_time', 'instrument_id', 'direction', 'offset_flag',
+                          'order_price', 'order_volume')
+
+
+def snapshot_row_key(kind: str, row: Dict[str, Any]) -> str:
+    """
+    快照记录在交易日内的唯一键
+
+    Args:
+        kind: 数据类型（orders/positions/trades/accounts）
+        row: 记录字典
+
+    Returns:
+        键字符串
+    """
+    if kind == 'orders':
+        return order_key(row) or 'R:' + '|'.join(
+            str(row.get(f) or '') for f in _ORDER_FALLBACK_FIELDS)
+    if kind == 'positions':
+        return f"{row.get('instrument_id') or ''}|{row.get('direction') or ''}"
+    if kind == 'trades':
+        return (f"{row.get('exchange_id') or ''}|{row.get('trade_id') or ''}|"
+                f"{row.get('direction') or ''}")
+    return str(row.get('account_id') or '')
+
+
+def _snapshot_json(row: Dict[str, Any]) -> str:
+    return json.dumps(row, ensure_ascii=False, sort_keys=True, default=str)
+
+
+# 二级索引方案：与 query_* 的过滤和排序方式一一对应
+# 修改方案时递增 INDEX_PLAN_VERSION，连接时会对旧表补建新索引并删除被取代的索引
+INDEX_PLAN_VERSION = 2
+INDEX_PLAN = {
+    'daily_orders': {
+        'idx_day_time': ('trading_day', 'order_time'),
+        'idx_inst_day_time': ('instrument_id', 'trading_day', 'order_time'),
+    },
+    'daily_positions': {
+        'idx_day_inst_dir': ('trading_day', 'instrument_id', 'direction'),
+    },
+    'market_data': {
+        'idx_day_time': ('trading_day', 'update_time'),
+        'idx_inst_day_time': ('instrument_id', 'trading_day', 'update_time'),
+    },
+    'instrument_info': {
+        'idx_product': ('product_id',),
+        'idx_exch_trading_inst': ('exchange_id', 'is_trading', 'instrument_id'),
+        'idx_trading_inst': ('is_trading', 'instrument_id'),
+    },
+}
+# 被上述组合索引取代的旧单列索引
+OBSOLETE_INDEXES = {
+    'daily_orders': ('idx_instrument', 'idx_trading_day', 'idx_order_time'),
+    'daily_positions': ('idx_trading_day',),
+    'market_data': ('idx_instrument', 'idx_trading_day', 'idx_update_time'),
+    'instrument_info': ('idx_exchange',),
+}
+
+# 紧凑存储：以下枚举文本列在紧凑表中存 TINYINT 编码，编码与文本的对应关系保存在 enum_label 表
+# 这里预置 CTP 常用取值（编码从 1 开始，0 表示空文本），其余文本首次写入时自动分配编码
+ENUM_LABELS = {
+    'direction': ('买入', '卖出', '多头', '空头'),
+    'offset_flag': ('开仓', '平仓', '强平', '平今', '平昨', '强减', '本地强平', '未知'),
+    'order_status': ('全部成交', '部分成交还在队列中', '部分成交不在队列中', '未成交还在队列中',
+                     '未成交不在队列中', '撤单', '未知', '尚未触发', '已触发'),
+    'position_type': ('总仓', '今仓', '昨仓'),
+}
+# trading_day 为 NOT NULL 的表，紧凑存储时空交易日写为 0
+_NOT_NULL_DAY_TABLES = ('market_data', 'market_data_latest')
+
+# 服务端/客户端禁用 LOAD DATA LOCAL 时的错误码
+_LOCAL_INFILE_DISABLED_ERRORS = (1148, 2068, 3948)
+
+
+def _tsv_field(value) -> str:
+    """按 LOAD DATA 默认转义规则格式化单个字段"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, Decimal)):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    text = str(value)
+    if any(c in text for c in '\\\t\n\r\0'):
+        text = (text.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0'))
+    return text
+
+
+def order_key(order: Dict[str, Any]) -> Optional[str]:
+    """
+    由 CTP 自然键生成委托唯一标识
+
+    优先使用 FrontID/SessionID/OrderRef（报单一提交即确定），
+    报单引用为空时（如非本系统报入的委托）使用 ExchangeID/OrderSysID；
+    两者都没有时（如 CSV 导入的委托）返回 None，不参与去重
+
+    Args:
+        order: 委托字典
+
+    Returns:
+        唯一标识字符串或 None
+    """
+    order_ref = str(order.get('order_ref') or '').strip()
+    if order_ref and order.get('front_id') is not None and order.get('session_id') is not None:
+        return f"S:{order['front_id']}:{order['session_id']}:{order_ref}"
+    order_sys_id = str(order.get('order_sys_id') or '').strip()
+    if order_sys_id:
+        return f"X:{order.get('exchange_id') or ''}:{order_sys_id}"
+    return None
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    """数据库返回的时间（datetime 或 SQLite 的文本）转换为 datetime"""
+    if isinstance(value, datetime) or value is None:
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _stale_legacy_orders(rows: List[Dict[str, Any]], group_cols: Sequence[str],
+                         batch_gap: float) -> List[int]:
+    """
+    在一个交易日的委托中找出可删除的旧记录（见 compact_orders）
+
+    Args:
+        rows: 该交易日全部委托的 id、order_key、create_time 和分组字段，按 id 排序
+        group_cols: 判定同一委托的字段
+        batch_gap: 划分下载批次的时间间隔（秒）
+
+    Returns:
+        待删除记录的 id 列表
+    """
+    keyed = {tuple(row[c] for c in group_cols) for row in rows if row['order_key'] is not None}
+    stale = []
+    batches: Dict[Tuple, List[Tuple[int, int]]] = {}
+    batch, last_time = 0, None
+    for row in rows:
+        if row['order_key'] is not None:
+            continue
+        group = tuple(row[c] for c in group_cols)
+        if group in keyed:
+            stale.append(row['id'])
+            continue
+        created = _as_datetime(row['create_time'])
+        if last_time is not None and created is not None and \
+                (created - last_time).total_seconds() > batch_gap:
+            batch += 1
+        last_time = created or last_time
+        batches.setdefault(group, []).append((batch, row['id']))
+    for members in batches.values():
+        newest = max(b for b, _ in members)
+        stale.extend(row_id for b, row_id in members if b < newest)
+    return sorted(stale)
+
+
+def _encode_page_token(trading_day: Optional[str], row_id: int) -> str:
+    """把键集位置 (trading_day, id) 编码为不透明的翻页令牌"""
+    raw = json.dumps([trading_day, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_page_token(token: str) -> Tuple[Optional[str], int]:
+    """解析翻页令牌，格式错误时抛出 ValueError"""
+    try:
+        trading_day, row_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return trading_day, int(row_id)
+    except Exception as e:
+        raise ValueError(f"无效的翻页令牌: {token}") from e
+
+
+class _PoolEntry:
+    """连接池中的一条物理连接及其时间戳"""
+
+    __slots__ = ('conn', 'created_at', 'last_used', 'generation')
+
+    def __init__(self, conn: pymysql.Connection, generation: int):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+        self.generation = generation
+
+
+class _PooledConnection:
+    """
+    借出的连接代理
+
+    除 close() 外的属性和方法全部透传给底层 pymysql 连接；
+    close() 不会真正关闭连接，而是把连接归还给连接池，
+    因此原有 "获取连接 -> 使用 -> close()" 的写法无需改动。
+    """
+
+    def __init__(self, pool: 'ConnectionPool', entry: _PoolEntry):
+        self._pool = pool
+        self._entry = entry
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._entry.conn, name)
+
+    def close(self):
+        """归还连接到连接池"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._entry)
+
+
+class ConnectionPool:
+    """
+    线程安全的有界MySQL连接池
+
+    - 连接总数不超过 max_size，池满时借用方最多等待 timeout 秒
+    - 空闲超过 idle_timeout 的连接会被回收
+    - 存活超过 max_lifetime 的连接在归还或借出时重建
+    - 空闲超过 ping_interval 的连接借出前先 ping 做健康检查
+    - 同一线程重复借用时复用同一条连接（按借用深度计数）
+    """
+
+    def __init__(self, connect_kwargs: Dict[str, Any], max_size: int = 8,
+                 timeout: float = 10.0, idle_timeout: float = 300.0,
+                 max_lifetime: float = 3600.0, ping_interval: float = 30.0):
+        """
+        初始化连接池
+
+        Args:
+            connect_kwargs: 传给 pymysql.connect 的参数
+            max_size: 最大连接数
+            timeout: 池满时借用的最长等待秒数
+            idle_timeout: 空闲连接回收秒数
+            max_lifetime: 连接最长存活秒数
+            ping_interval: 借出前做健康检查的空闲阈值秒数
+        """
+        self._connect_kwargs = dict(connect_kwargs)
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._local = threading.local()
+        self._size = 0
+        self._in_use = 0
+        self._generation = 0
+
+        # 连接池指标
+        self._created = 0
+        self._closed = 0
+        self._borrowed = 0
+        self._timeouts = 0
+        self._health_failures = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _open(self) -> pymysql.Connection:
+        """建立一条新的物理连接"""
+        conn = pymysql.connect(**self._connect_kwargs)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _discard(self, conn: pymysql.Connection):
+        """关闭一条物理连接（不修改连接计数）"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._closed += 1
+
+    def _evict_idle_locked(self, now: float) -> List[_PoolEntry]:
+        """在持锁状态下摘除过期的空闲连接，返回需要关闭的连接"""
+        evicted = []
+        # 空闲队列左端是最早归还的连接
+        while self._idle:
+            entry = self._idle[0]
+            if (now - entry.last_used > self.idle_timeout
+                    or now - entry.created_at > self.max_lifetime
+                    or entry.generation != self._generation):
+                self._idle.popleft()
+                self._size -= 1
+                evicted.append(entry)
+            else:
+                break
+        return evicted
+
+    def _is_expired(self, entry: _PoolEntry, now: float) -> bool:
+        return (now - entry.created_at > self.max_lifetime
+                or entry.generation != self._generation)
+
+    def _check_health(self, entry: _PoolEntry, now: float) -> bool:
+        """借出前检查连接是否可用"""
+        if self._is_expired(entry, now):
+            return False
+        if now - entry.last_used <= self.ping_interval:
+            return True
+        try:
+            entry.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._cond:
+                self._health_failures += 1
+            return False
+
+    def acquire(self, exclusive: bool = False) -> _PooledConnection:
+        """
+        借用一条连接，池满且超时则抛出 OperationalError
+
+        Args:
+            exclusive: 为 True 时借出一条独占连接，不与本线程的其他借用共享，
+                       用于流式游标等需要长时间占用连接的场景
+        """
+        entry = None if exclusive else getattr(self._local, 'entry', None)
+        if entry is not None:
+            self._local.depth += 1
+            return _PooledConnection(self, entry)
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        evicted = []
+        timed_out = False
+        with self._cond:
+            while True:
+                evicted.extend(self._evict_idle_locked(time.monotonic()))
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    timed_out = True
+                    break
+                self._cond.wait(remaining)
+            if not timed_out:
+                self._in_use += 1
+                self._borrowed += 1
+                waited = time.monotonic() - start
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            generation = self._generation
+
+        for old in evicted:
+            self._discard(old.conn)
+        if timed_out:
+            raise pymysql.err.OperationalError(
+                2013, f"连接池已耗尽，等待 {self.timeout} 秒后仍无可用连接")
+
+        try:
+            if entry is not None and not self._check_health(entry, time.monotonic()):
+                self._discard(entry.conn)
+                entry = None
+            if entry is None:
+                entry = _PoolEntry(self._open(), generation)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        if not exclusive:
+            self._local.entry = entry
+            self._local.depth = 1
+        return _PooledConnection(self, entry)
+
+    def release(self, entry: _PoolEntry):
+        """归还连接，同一线程的嵌套借用在最外层归还时才真正放回池中"""
+        if getattr(self._local, 'entry', None) is entry:
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.entry = None
+
+        # 结束未提交的事务，避免下一位借用方看到旧的一致性快照
+        reusable = True
+        try:
+            entry.conn.rollback()
+        except Exception:
+            reusable = False
+
+        now = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if reusable and not self._is_expired(entry, now):
+                entry.last_used = now
+                self._idle.append(entry)
+            else:
+                self._size -= 1
+                reusable = False
+            self._cond.notify()
+        if not reusable:
+            self._discard(entry.conn)
+
+    def close(self):
+        """关闭所有空闲连接；借出中的连接在归还时关闭，之后仍可重新借用"""
+        with self._cond:
+            self._generation += 1
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry.conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回连接池指标"""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'created': self._created,
+                'closed': self._closed,
+                'borrowed': self._borrowed,
+                'timeouts': self._timeouts,
+                'health_failures': self._health_failures,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+                'wait_time_avg': round(self._wait_total / self._borrowed, 6) if self._borrowed else 0.0,
+            }
+
+
+def _spoolable(method):
+    """
+    写入方法的本地缓冲包装
+
+    启用 enable_spool() 后，数据库不可用或写入过慢时数据先追加到本地缓冲文件，
+    由后台线程回放；回放线程自身的调用直接写库
+    """
+    @functools.wraps(method)
+    def wrapper(self, rows):
+        replayer = self._spool
+        if replayer is None or not rows or getattr(self._write_local, 'replaying', False):
+            return method(self, rows)
+        return replayer.write(method.__name__, rows, lambda: method(self, rows))
+    return wrapper
+
+
+def _timed(method):
+    """
+    把方法的一次调用记为一个操作（见 db_metrics）
+
+    记录总耗时、行数（由返回值推断）和是否出错；期间借用连接、执行、取数、提交的耗时
+    由 _get_connection() 返回的 TimedConnection 记到该操作名下
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None:
+            return method(self, *args, **kwargs)
+        op = metrics.begin(method.__name__)
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException as e:
+            metrics.end(op, error=e)
+            raise
+        metrics.end(op, result)
+        return result
+    return wrapper
+
+
+def _invalidates(table: str):
+    """
+    写入方法的查询结果缓存失效
+
+    启用 enable_result_cache() 后，写入（含补写已结算交易日）完成时使本批数据涉及的
+    交易日在该表的缓存条目失效
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, rows):
+            try:
+                return method(self, rows)
+            finally:
+                self._invalidate_results(table, rows)
+        return wrapper
+    return decorator
+
 
 class DatabaseManager:
     """数据库管理类"""
+
+    # NULL 安全的等值比较运算符（SQLite 后端为 IS）
+    _null_safe_eq = '<=>'
+    # 加锁读后缀（SQLite 写事务本身串行，为空）
+    _for_update = ' FOR UPDATE'
+    # 多参数取大/取小函数（SQLite 为 MAX/MIN）
+    _greatest = 'GREATEST'
+    _least = 'LEAST'
+    # 归档目录内存副本的有效期（秒），用于感知其他进程登记的归档
+    archive_catalog_ttl = 60.0
     
     def __init__(self, host: str = "localhost", port: int = 3306,
                  user: str = "root", password: str = "",
-                 database: str = "ctp_trading"):
+                 database: str = "ctp_trading", pool_size: int = 8,
+                 pool_timeout: float = 10.0, pool_idle_timeout: float = 300.0,
+                 pool_max_lifetime: float = 3600.0, bulk_load: bool = False,
+                 bulk_threshold: int = 5000, metrics: bool = True,
+                 slow_query_threshold: float = 0.5):
         """
         初始化数据库连接
         
@@ -32,19 +689,68 @@ class DatabaseManager:
             user: 用户名
             password: 密码
             database: 数据库名
+            pool_size: 连接池最大连接数
+            pool_timeout: 连接池耗尽时的最长等待秒数
+            pool_idle_timeout: 空闲连接回收秒数
+            pool_max_lifetime: 连接最长存活秒数
+            bulk_load: 是否启用 LOAD DATA LOCAL INFILE 批量导入
+            bulk_threshold: 单次写入达到该条数时才走批量导入
+            metrics: 是否统计各操作的耗时指标（见 db_metrics）
+            slow_query_threshold: 单条SQL超过该秒数记为慢SQL
         """
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.database = database
-        # 不再长时间持有共享连接，改为按需获取
+        self.bulk_load = bulk_load
+        self.bulk_threshold = bulk_threshold
+        # 仅在初始化库表时使用的临时连接
         self.connection: Optional[pymysql.Connection] = None
+        # 各操作从连接池借用连接，避免每次调用重复握手
+        self._pool = ConnectionPool(
+            dict(
+                host=self.host,
+                port=self.port,
+                user=self.user,
+                password=self.password,
+                database=self.database,
+                charset="utf8mb4",
+                autocommit=False,
+                cursorclass=DictCursor,  # 查询结果使用字典形式
+                local_infile=bulk_load,
+            ),
+            max_size=pool_size,
+            timeout=pool_timeout,
+            idle_timeout=pool_idle_timeout,
+            max_lifetime=pool_max_lifetime,
+        )
+        self._init_state(metrics, slow_query_threshold)
+
+    def _init_state(self, metrics: bool, slow_query_threshold: float):
+        """初始化与存储后端无关的状态（各后端的 __init__ 建好连接池后调用）"""
+        # 紧凑存储：trading_day 已转换为 INT 的表，以及枚举编码的双向映射
+        self._compact_tables = set()
+        self._enum_lock = threading.Lock()
+        self._enum_codes: Dict[str, Dict[str, int]] = {}
+        self._enum_labels: Dict[str, Dict[int, str]] = {}
+        # 本地缓冲：enable_spool() 后由 SpoolReplayer 接管不可用/过慢时的写入
+        self._spool = None
+        self._write_local = threading.local()
+        # 同一进程内的快照写入串行执行，保证 snapshot_id 按提交顺序递增
+        self._snapshot_lock = threading.Lock()
+        # 各操作的耗时/行数/错误/慢SQL指标
+        self.metrics = MetricsRegistry(slow_query_threshold) if metrics else None
+        # 已结算交易日的查询结果缓存：enable_result_cache() 后启用
+        self._result_cache = None
+        # 归档目录的内存副本：{明细表: (读取时刻, {交易日: 归档位置})}，mark_archived 后失效
+        self._archive_lock = threading.Lock()
+        self._archive_catalog: Dict[str, Tuple[float, Dict[str, str]]] = {}
     
     def connect(self) -> bool:
         """连接到MySQL数据库"""
         try:
-            # 立即建立一次连接用于初始化数据库和表结构，之后每个操作再按需获取新连接
+            # 立即建立一次连接用于初始化数据库和表结构，之后每个操作从连接池借用连接
             self.connection = pymysql.connect(
                 host=self.host,
                 port=self.port,
@@ -68,6 +774,12 @@ class DatabaseManager:
             self.connection.close()
             self.connection = None
             
+            # 读取各表是否已转换为紧凑存储及枚举编码
+            self.reload_schema()
+            
+            # 预建未来交易日的行情分区
+            self.maintain_market_data_partitions()
+            
             return True
         except Error as e:
             logger.error(f"数据库连接失败: {e}")
@@ -75,17 +787,310 @@ class DatabaseManager:
             return False
     
     def _get_connection(self) -> pymysql.Connection:
-        """为当前操作获取一个新的数据库连接"""
-        return pymysql.connect(
-            host=self.host,
-            port=self.port,
-            user=self.user,
-            password=self.password,
-            database=self.database,
-            charset="utf8mb4",
-            autocommit=False,
-            cursorclass=DictCursor,  # 查询结果使用字典形式
-        )
+        """从连接池借用连接，调用方 close() 即归还；启用指标时返回记录耗时的包装"""
+        metrics = self.metrics
+        if metrics is None:
+            return self._pool.acquire()
+        start = time.perf_counter()
+        try:
+            conn = self._pool.acquire()
+        except Exception as e:
+            metrics.record_error(e)
+            raise
+        finally:
+            metrics.observe_phase('connect', time.perf_counter() - start)
+        return TimedConnection(conn, metrics)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """连接池指标：等待时间、借出数、创建/关闭次数等"""
+        return self._pool.stats()
+
+    def dump_metrics(self, fmt: str = 'prometheus') -> str:
+        """
+        导出操作指标和连接池指标
+
+        Args:
+            fmt: prometheus 或 json
+
+        Returns:
+            指标文本，未启用指标时为空字符串
+        """
+        if self.metrics is None:
+            return ''
+        pool = {k: v for k, v in self.pool_stats().items()
+                if isinstance(v, (int, float)) and not isinstance(v, bool)}
+        if fmt == 'json':
+            return self.metrics.to_json(indent=2, extra={'pool': pool})
+        if fmt != 'prometheus':
+            raise ValueError(f"不支持的指标格式: {fmt}")
+        return self.metrics.to_prometheus(gauges={f"pool_{k}": v for k, v in pool.items()})
+
+    def _count_rows(self, rows: int):
+        """指定当前操作计入的行数（返回值不是行数的操作使用）"""
+        op = self.metrics.current() if self.metrics is not None else None
+        if op is not None:
+            op.rows = rows
+
+    # ------------------------------------------------------------------
+    # 本地缓冲
+    # ------------------------------------------------------------------
+    def enable_spool(self, directory: str = "./spool/db/", latency_threshold: float = 2.0,
+                     cooldown: float = 30.0, segment_mb: int = 64,
+                     fsync_interval: float = 0.05, batch_rows: int = 20000,
+                     retry_interval: float = 5.0):
+        """
+        启用本地缓冲，需在 connect() 成功后调用
+
+        Args:
+            directory: 缓冲目录
+            latency_threshold: 单次写入超过该秒数即切换为缓冲模式
+            cooldown: 切换后至少保持缓冲模式的秒数
+            segment_mb: 单个分段文件大小上限（MB）
+            fsync_interval: 批量 fsync 间隔秒数
+            batch_rows: 回放时单次合并写入的最大行数
+            retry_interval: 数据库不可用时的回放重试间隔秒数
+
+        Returns:
+            SpoolReplayer 实例
+        """
+        from write_spool import SpoolReplayer, WriteSpool
+
+        self.disable_spool()
+        spool = WriteSpool(directory, segment_bytes=segment_mb * 1024 * 1024,
+                           fsync_interval=fsync_interval)
+        replayer = SpoolReplayer(self, spool, latency_threshold=latency_threshold,
+                                 cooldown=cooldown, batch_rows=batch_rows,
+                                 retry_interval=retry_interval)
+        replayer.start()
+        self._spool = replayer
+        logger.info(f"已启用本地缓冲: {directory}")
+        return replayer
+
+    def disable_spool(self):
+        """停止回放线程，未回放的数据保留在缓冲目录，下次启用时继续回放"""
+        replayer, self._spool = self._spool, None
+        if replayer is not None:
+            replayer.stop()
+
+    def spool_stats(self) -> Dict[str, Any]:
+        """本地缓冲指标：是否处于缓冲模式、缓冲/回放行数、积压字节数等"""
+        return self._spool.stats() if self._spool is not None else {}
+
+    def _note_write_error(self, error: Exception):
+        """记录本线程最近一次写入错误，供本地缓冲判断是否需要切换"""
+        self._write_local.error = error
+
+    # ------------------------------------------------------------------
+    # 查询结果缓存
+    # ------------------------------------------------------------------
+    def enable_result_cache(self, directory: str = "./cache/query/", memory_entries: int = 64,
+                            current_trading_day: Optional[str] = None):
+        """
+        启用已结算交易日的查询结果缓存（见 result_cache）
+
+        Args:
+            directory: 缓存目录
+            memory_entries: 内存中保留的最近使用条目数
+            current_trading_day: 当前交易日，早于它的交易日才缓存；为空时取本地日期，
+                登录后可用 set_current_trading_day() 更新
+
+        Returns:
+            ResultCache 实例
+        """
+        from result_cache import ResultCache
+
+        self._result_cache = ResultCache(directory, memory_entries=memory_entries,
+                                         current_trading_day=current_trading_day)
+        logger.info(f"已启用查询结果缓存: {directory}")
+        return self._result_cache
+
+    def disable_result_cache(self):
+        """停用查询结果缓存，缓存文件保留在目录中"""
+        self._result_cache = None
+
+    def set_current_trading_day(self, trading_day: Optional[str]):
+        """设置当前交易日（通常取登录返回的交易日），该交易日及之后的查询不走缓存"""
+        if self._result_cache is not None:
+            self._result_cache.current_trading_day = trading_day or None
+
+    def invalidate_result_cache(self, table: Optional[str] = None,
+                                trading_day: Optional[str] = None) -> int:
+        """
+        手动使查询结果缓存失效（绕过 DatabaseManager 直接改库后使用）
+
+        Args:
+            table: 明细表，为空时所有表
+            trading_day: 交易日，为空时所有交易日
+
+        Returns:
+            失效的内存条目数
+        """
+        if self._result_cache is None:
+            return 0
+        return self._result_cache.invalidate(table, trading_day)
+
+    def result_cache_stats(self) -> Dict[str, int]:
+        """查询结果缓存指标：内存/磁盘命中、未命中、绕过、失效次数等"""
+        return self._result_cache.stats() if self._result_cache is not None else {}
+
+    def _invalidate_results(self, table: str, rows: Optional[List[Dict[str, Any]]]):
+        """使一批写入涉及的交易日在 table 的缓存条目失效"""
+        cache = self._result_cache
+        if cache is None or not rows:
+            return
+        for day in {str(row.get('trading_day')) for row in rows if row.get('trading_day')}:
+            cache.invalidate(table, day)
+
+    def _cached_query(self, table: str, trading_day: Optional[str], filters: tuple,
+                      load) -> List[Dict[str, Any]]:
+        """按交易日的查询经缓存读取；未启用缓存或未指定交易日时直接查询"""
+        cache = self._result_cache
+        if cache is None or not trading_day:
+            return load()
+        return cache.get_or_load(table, trading_day, filters, load)
+
+    # ------------------------------------------------------------------
+    # 紧凑存储的编码层
+    #
+    # 经 schema_migrator 转换后的表中，trading_day 存 INT（YYYYMMDD），
+    # 枚举文本列存 TINYINT 编码。写入前在这里编码、读出后解码，
+    # 对外的字典结构与未转换的表完全一致。
+    # ------------------------------------------------------------------
+    def reload_schema(self) -> bool:
+        """重新读取紧凑存储状态和枚举编码，表结构迁移后需调用"""
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT TABLE_NAME AS table_name FROM information_schema.COLUMNS "
+                    "WHERE TABLE_SCHEMA = %s AND COLUMN_NAME = 'trading_day' AND DATA_TYPE = 'int'",
+                    (self.database,)
+                )
+                compact = {row['table_name'] for row in cursor.fetchall()}
+                cursor.execute("SELECT column_name, code, label FROM enum_label")
+                rows = cursor.fetchall()
+            codes: Dict[str, Dict[str, int]] = {}
+            labels: Dict[str, Dict[int, str]] = {}
+            for row in rows:
+                codes.setdefault(row['column_name'], {})[row['label']] = row['code']
+                labels.setdefault(row['column_name'], {})[row['code']] = row['label']
+            with self._enum_lock:
+                self._compact_tables = compact
+                self._enum_codes = codes
+                self._enum_labels = labels
+            return True
+        except Error as e:
+            logger.error(f"读取表结构信息失败: {e}")
+            return False
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def is_compact(self, table: str) -> bool:
+        """表是否已转换为紧凑存储"""
+        return table in self._compact_tables
+
+    def enum_code(self, column: str, label) -> Optional[int]:
+        """
+        返回枚举文本对应的编码，新文本自动分配编码
+
+        Args:
+            column: 枚举字段名
+            label: 文本，已是编码时原样返回
+
+        Returns:
+            编码，label 为 None 或分配失败时返回 None
+        """
+        if label is None or isinstance(label, int):
+            return label
+        label = str(label)
+        code = self._enum_codes.get(column, {}).get(label)
+        if code is not None:
+            return code
+        with self._enum_lock:
+            code = self._enum_codes.get(column, {}).get(label)
+            if code is None:
+                code = self._add_enum_label(column, label)
+            return code
+
+    def _add_enum_label(self, column: str, label: str) -> Optional[int]:
+        """为新文本分配编码（调用方持有 _enum_lock）"""
+        conn = None
+        try:
+            # 独占连接：不能混入调用方当前的写入事务
+            conn = self._pool.acquire(exclusive=True)
+            with conn.cursor() as cursor:
+                # 多个进程并发分配时编码可能冲突，冲突被忽略后重新分配
+                for _ in range(5):
+                    cursor.execute(
+                        "INSERT IGNORE INTO enum_label (column_name, code, label) "
+                        "SELECT %s, COALESCE(MAX(code), 0) + 1, %s FROM enum_label WHERE column_name = %s",
+                        (column, label, column)
+                    )
+                    conn.commit()
+                    cursor.execute(
+                        "SELECT code FROM enum_label WHERE column_name = %s AND label = %s",
+                        (column, label)
+                    )
+                    row = cursor.fetchone()
+                    if row:
+                        self._enum_codes.setdefault(column, {})[label] = row['code']
+                        self._enum_labels.setdefault(column, {})[row['code']] = label
+                        logger.info(f"枚举 {column} 新增编码 {row['code']}: {label}")
+                        return row['code']
+            logger.error(f"枚举 {column} 分配编码失败: {label}")
+            return None
+        except Error as e:
+            logger.error(f"枚举 {column} 分配编码失败: {label} {e}")
+            return None
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _day_param(self, table: str, trading_day):
+        """把查询条件中的交易日转换为表中的存储类型"""
+        if table in self._compact_tables and str(trading_day).isdigit():
+            return int(trading_day)
+        return trading_day
+
+    def _day_literal(self, table: str, trading_day: str) -> str:
+        """生成分区定义中的交易日字面量"""
+        if table in self._compact_tables:
+            return str(int(trading_day))
+        return f"'{trading_day}'"
+
+    def _encode_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """写入紧凑表前把交易日和枚举文本转换为存储类型，未转换的表原样返回"""
+        if table not in self._compact_tables:
+            return rows
+        empty_day = 0 if table in _NOT_NULL_DAY_TABLES else None
+        encoded = []
+        for row in rows:
+            row = dict(row)
+            for column in ENUM_LABELS:
+                if column in row:
+                    row[column] = self.enum_code(column, row[column])
+            if 'trading_day' in row:
+                day = row['trading_day']
+                row['trading_day'] = int(day) if str(day).isdigit() else empty_day
+            encoded.append(row)
+        return encoded
+
+    def _decode_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """把紧凑表读出的编码还原为文本，未转换的表读出的文本不受影响"""
+        for column, labels in self._enum_labels.items():
+            value = row.get(column)
+            if isinstance(value, int):
+                row[column] = labels.get(value, str(value))
+        day = row.get('trading_day')
+        if isinstance(day, int):
+            row['trading_day'] = str(day) if day else ''
+        return row
 
     def _create_database(self):
         """创建数据库"""
@@ -115,13 +1120,20 @@ class DatabaseManager:
                         order_status VARCHAR(20) COMMENT '状态',
                         remark TEXT COMMENT '备注',
                         trading_day VARCHAR(20) COMMENT '交易日',
+                        front_id INT COMMENT '前置编号',
+                        session_id INT COMMENT '会话编号',
+                        order_ref VARCHAR(13) COMMENT '报单引用',
+                        exchange_id VARCHAR(9) COMMENT '交易所代码',
+                        order_sys_id VARCHAR(21) COMMENT '报单编号',
+                        order_key VARCHAR(64) COMMENT '委托唯一标识',
                         create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        INDEX idx_instrument (instrument_id),
-                        INDEX idx_trading_day (trading_day),
-                        INDEX idx_order_time (order_time)
+                        UNIQUE KEY uk_order (trading_day, order_key),
+                        INDEX idx_day_time (trading_day, order_time),
+                        INDEX idx_inst_day_time (instrument_id, trading_day, order_time)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='当日委托表'
                 """)
+                self._migrate_order_identity(cursor)
                 
                 # 当日持仓表
                 cursor.execute("""
@@ -140,14 +1152,14 @@ class DatabaseManager:
                         create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                         UNIQUE KEY uk_position (instrument_id, direction, trading_day),
-                        INDEX idx_trading_day (trading_day)
+                        INDEX idx_day_inst_dir (trading_day, instrument_id, direction)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='当日持仓表'
                 """)
                 
-                # 商品行情表
-                cursor.execute("""
+                # 商品行情表（按交易日RANGE分区，主键需包含分区列）
+                cursor.execute(f"""
                     CREATE TABLE IF NOT EXISTS market_data (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        id INT AUTO_INCREMENT,
                         instrument_id VARCHAR(31) COMMENT '合约代码',
                         exchange_id VARCHAR(10) COMMENT '交易所代码',
                         update_time VARCHAR(20) COMMENT '行情更新时间 (HH:MM:SS)',
@@ -168,13 +1180,67 @@ class DatabaseManager:
                         bid_volume1 INT COMMENT '买一量',
                         ask_price1 DECIMAL(15, 4) COMMENT '卖一价',
                         ask_volume1 INT COMMENT '卖一量',
-                        trading_day VARCHAR(20) COMMENT '交易日',
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
                         create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         record_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        INDEX idx_instrument (instrument_id),
-                        INDEX idx_trading_day (trading_day),
-                        INDEX idx_update_time (update_time)
+                        PRIMARY KEY (id, trading_day),
+                        INDEX idx_day_time (trading_day, update_time),
+                        INDEX idx_inst_day_time (instrument_id, trading_day, update_time)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='商品行情表'
+                    PARTITION BY RANGE COLUMNS(trading_day) (
+                        PARTITION p_history VALUES LESS THAN ('{datetime.now().strftime('%Y%m%d')}'),
+                        PARTITION p_future VALUES LESS THAN (MAXVALUE)
+                    )
+                """)
+                
+                # 最新行情表：每个合约一行，由行情写入路径同步维护
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS market_data_latest (
+                        instrument_id VARCHAR(31) NOT NULL PRIMARY KEY COMMENT '合约代码',
+                        exchange_id VARCHAR(10) COMMENT '交易所代码',
+                        update_time VARCHAR(20) COMMENT '行情更新时间 (HH:MM:SS)',
+                        last_price DECIMAL(15, 4) COMMENT '最新价',
+                        pre_settlement_price DECIMAL(15, 4) COMMENT '昨结算价',
+                        pre_close_price DECIMAL(15, 4) COMMENT '昨收盘价',
+                        open_price DECIMAL(15, 4) COMMENT '今开盘价',
+                        highest_price DECIMAL(15, 4) COMMENT '最高价',
+                        lowest_price DECIMAL(15, 4) COMMENT '最低价',
+                        volume INT COMMENT '成交量',
+                        turnover DECIMAL(20, 2) COMMENT '成交额',
+                        open_interest INT COMMENT '持仓量',
+                        close_price DECIMAL(15, 4) COMMENT '今收盘价',
+                        settlement_price DECIMAL(15, 4) COMMENT '今结算价',
+                        upper_limit_price DECIMAL(15, 4) COMMENT '涨停价',
+                        lower_limit_price DECIMAL(15, 4) COMMENT '跌停价',
+                        bid_price1 DECIMAL(15, 4) COMMENT '买一价',
+                        bid_volume1 INT COMMENT '买一量',
+                        ask_price1 DECIMAL(15, 4) COMMENT '卖一价',
+                        ask_volume1 INT COMMENT '卖一量',
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
+                        record_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        INDEX idx_exchange (exchange_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='最新行情表'
+                """)
+                
+                # K线表：主键即查询路径，按合约+周期+时间范围读取
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS kline (
+                        instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+                        period VARCHAR(8) NOT NULL COMMENT '周期(1m/5m/15m/1d)',
+                        bar_time DATETIME NOT NULL COMMENT 'K线起始时间',
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
+                        open_price DECIMAL(15, 4) COMMENT '开盘价',
+                        high_price DECIMAL(15, 4) COMMENT '最高价',
+                        low_price DECIMAL(15, 4) COMMENT '最低价',
+                        close_price DECIMAL(15, 4) COMMENT '收盘价',
+                        volume BIGINT COMMENT '成交量',
+                        turnover DECIMAL(20, 2) COMMENT '成交额',
+                        open_interest DECIMAL(20, 2) COMMENT '持仓量',
+                        tick_count INT COMMENT 'tick数',
+                        record_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (instrument_id, period, bar_time),
+                        INDEX idx_day_period (trading_day, period)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='K线表'
                 """)
                 
                 # 商品参数表
@@ -205,46 +1271,585 @@ class DatabaseManager:
                         create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                         INDEX idx_product (product_id),
-                        INDEX idx_exchange (exchange_id)
+                        INDEX idx_exch_trading_inst (exchange_id, is_trading, instrument_id),
+                        INDEX idx_trading_inst (is_trading, instrument_id)
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='商品参数表'
                 """)
                 
-                self.connection.commit()
-                logger.info("数据表结构已创建")
-        except Error as e:
-            logger.error(f"创建数据表失败: {e}")
-            self.connection.rollback()
-    
-    def insert_orders(self, orders: List[Dict[str, Any]]) -> int:
-        """
-        批量插入委托数据
-        
-        Args:
-            orders: 委托数据列表
-            
-        Returns:
-            插入的记录数
-        """
-        if not orders:
-            return 0
-        
-        try:
-            conn = self._get_connection()
-            with conn.cursor() as cursor:
-                sql = """
-                    INSERT INTO daily_orders 
-                    (order_time, instrument_id, direction, offset_flag, order_price, 
-                     order_volume, traded_volume, order_status, remark, trading_day)
-                    VALUES (%(order_time)s, %(instrument_id)s, %(direction)s, %(offset_flag)s,
-                            %(order_price)s, %(order_volume)s, %(traded_volume)s, 
-                            %(order_status)s, %(remark)s, %(trading_day)s)
-                """
-                count = cursor.executemany(sql, orders)
-                conn.commit()
-                logger.info(f"成功插入 {count} 条委托记录")
+                # 下载快照表：每个下载周期一行，snapshot_id 按提交顺序单调递增
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS snapshot (
+                        snapshot_id BIGINT NOT NULL PRIMARY KEY COMMENT '快照编号',
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
+                        order_count INT COMMENT '委托数',
+                        position_count INT COMMENT '持仓数',
+                        trade_count INT COMMENT '成交数',
+                        account_count INT COMMENT '资金账户数',
+                        changed_rows INT COMMENT '新增/变化/消失的记录数',
+                        create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        INDEX idx_day (trading_day, snapshot_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='下载快照表'
+                """)
+                
+                # 快照记录版本表：记录在 [valid_from, valid_to) 区间的快照中有效
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS snapshot_rows (
+                        kind VARCHAR(16) NOT NULL COMMENT '数据类型(orders/positions/trades/accounts)',
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
+                        row_key VARCHAR(128) NOT NULL COMMENT '记录键',
+                        valid_from BIGINT NOT NULL COMMENT '起始快照',
+                        valid_to BIGINT NULL COMMENT '失效快照，NULL 表示仍有效',
+                        instrument_id VARCHAR(31) NOT NULL DEFAULT '' COMMENT '合约代码',
+                        row_hash CHAR(32) NOT NULL COMMENT '内容哈希',
+                        data TEXT NOT NULL COMMENT '记录内容(JSON)',
+                        PRIMARY KEY (kind, trading_day, row_key, valid_from)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='快照记录版本表'
+                """)
+                
+                # 每日汇总表：按交易日 × 合约预聚合，写入明细时增量维护
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS daily_order_summary (
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
+                        instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+                        order_count INT NOT NULL DEFAULT 0 COMMENT '委托笔数',
+                        order_volume BIGINT NOT NULL DEFAULT 0 COMMENT '委托数量',
+                        traded_volume BIGINT NOT NULL DEFAULT 0 COMMENT '成交数量',
+                        filled_orders INT NOT NULL DEFAULT 0 COMMENT '全部成交笔数',
+                        cancelled_orders INT NOT NULL DEFAULT 0 COMMENT '撤单笔数',
+                        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (trading_day, instrument_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日委托汇总表'
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS daily_position_summary (
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
+                        instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+                        long_volume BIGINT NOT NULL DEFAULT 0 COMMENT '多头持仓',
+                        short_volume BIGINT NOT NULL DEFAULT 0 COMMENT '空头持仓',
+                        position_profit DECIMAL(15, 2) NOT NULL DEFAULT 0 COMMENT '持仓盈亏',
+                        close_profit DECIMAL(15, 2) NOT NULL DEFAULT 0 COMMENT '平仓盈亏',
+                        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (trading_day, instrument_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日持仓汇总表'
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS daily_market_summary (
+                        trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日',
+                        instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+                        exchange_id VARCHAR(10) COMMENT '交易所代码',
+                        open_price DECIMAL(15, 4) COMMENT '开盘价',
+                        high_price DECIMAL(15, 4) COMMENT '最高价',
+                        low_price DECIMAL(15, 4) COMMENT '最低价',
+                        last_price DECIMAL(15, 4) COMMENT '最新价',
+                        pre_settlement_price DECIMAL(15, 4) COMMENT '昨结算价',
+                        volume BIGINT COMMENT '成交量',
+                        turnover DECIMAL(20, 2) COMMENT '成交额',
+                        open_interest INT COMMENT '持仓量',
+                        tick_count INT NOT NULL DEFAULT 0 COMMENT '行情条数',
+                        last_seq INT NOT NULL DEFAULT -1 COMMENT '最新行情在交易日内的序号',
+                        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (trading_day, instrument_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日行情汇总表'
+                """)
+                
+                # 归档目录表：已移出明细表的交易日及其位置（history 表或归档文件）
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS archive_catalog (
+                        table_name VARCHAR(31) NOT NULL COMMENT '明细表',
+                        trading_day VARCHAR(20) NOT NULL COMMENT '交易日',
+                        location VARCHAR(255) NOT NULL COMMENT 'table 或归档文件路径',
+                        row_count BIGINT COMMENT '归档行数',
+                        archive_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        PRIMARY KEY (table_name, trading_day)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='归档目录表'
+                """)
+                
+                # 表结构版本表
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        component VARCHAR(31) PRIMARY KEY COMMENT '组件',
+                        version INT NOT NULL COMMENT '已应用版本',
+                        update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='表结构版本表'
+                """)
+                
+                # 紧凑存储的枚举编码表
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS enum_label (
+                        column_name VARCHAR(32) NOT NULL COMMENT '字段名',
+                        code TINYINT UNSIGNED NOT NULL COMMENT '编码',
+                        label VARCHAR(64) COLLATE utf8mb4_bin NOT NULL COMMENT '文本',
+                        PRIMARY KEY (column_name, code),
+                        UNIQUE KEY uk_label (column_name, label)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='枚举编码表'
+                """)
+                seeds = []
+                for column, labels in ENUM_LABELS.items():
+                    seeds.append((column, 0, ''))
+                    seeds.extend((column, i, label) for i, label in enumerate(labels, 1))
+                cursor.executemany(
+                    "INSERT IGNORE INTO enum_label (column_name, code, label) VALUES (%s, %s, %s)",
+                    seeds
+                )
+                
+                # 旧版本创建的表按索引方案补建/删除索引
+                self._apply_index_plan(cursor)
+                
+                self.connection.commit()
+                logger.info("数据表结构已创建")
+        except Error as e:
+            logger.error(f"创建数据表失败: {e}")
+            self.connection.rollback()
+    
+    def _migrate_order_identity(self, cursor):
+        """为旧的 daily_orders 补建 CTP 自然键字段和唯一键"""
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'daily_orders'",
+            (self.database,)
+        )
+        existing = {r[0] for r in cursor.fetchall()}
+        clauses = [
+            f"ADD COLUMN {name} {definition}"
+            for name, definition in ORDER_IDENTITY_COLUMNS.items()
+            if name not in existing
+        ]
+        if not clauses:
+            return
+        # 旧记录的 order_key 为 NULL，不受唯一键约束，可用 compact_orders 清理
+        if 'order_key' not in existing:
+            clauses.append("ADD UNIQUE KEY uk_order (trading_day, order_key)")
+        cursor.execute("ALTER TABLE daily_orders " + ", ".join(clauses))
+        logger.info(f"daily_orders 已补建委托自然键: {clauses}")
+
+    def _apply_index_plan(self, cursor):
+        """按 INDEX_PLAN 调整各表二级索引，已是最新版本时直接跳过"""
+        cursor.execute("SELECT version FROM schema_version WHERE component = 'index_plan'")
+        row = cursor.fetchone()
+        if row and row[0] >= INDEX_PLAN_VERSION:
+            return
+
+        cursor.execute(
+            "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = %s",
+            (self.database,)
+        )
+        existing = {(r[0], r[1]) for r in cursor.fetchall()}
+
+        for table, indexes in INDEX_PLAN.items():
+            clauses = [
+                f"ADD INDEX {name} ({', '.join(cols)})"
+                for name, cols in indexes.items()
+                if (table, name) not in existing
+            ]
+            clauses += [
+                f"DROP INDEX {name}"
+                for name in OBSOLETE_INDEXES.get(table, ())
+                if (table, name) in existing
+            ]
+            if clauses:
+                cursor.execute(f"ALTER TABLE {table} " + ", ".join(clauses))
+                logger.info(f"{table} 索引已调整: {clauses}")
+
+        cursor.execute(
+            "INSERT INTO schema_version (component, version) VALUES ('index_plan', %s) "
+            "ON DUPLICATE KEY UPDATE version = VALUES(version)",
+            (INDEX_PLAN_VERSION,)
+        )
+
+    def _get_partitions(self, cursor, table: str) -> List[Dict[str, Any]]:
+        """读取表的分区定义，未分区的表返回空列表"""
+        cursor.execute(
+            "SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound, TABLE_ROWS AS table_rows "
+            "FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION",
+            (self.database, table)
+        )
+        return list(cursor.fetchall())
+
+    def maintain_market_data_partitions(self, days_ahead: int = 10,
+                                        retention_days: Optional[int] = None,
+                                        archive: bool = False) -> Dict[str, List[str]]:
+        """
+        维护 market_data 的交易日分区
+
+        - 从 p_future 中拆分出未来 days_ahead 天（跳过周末）的日分区
+        - 指定 retention_days 时，早于保留期的日分区整体删除；archive=True 时
+          先用 EXCHANGE PARTITION 换出到 market_data_arch_YYYYMMDD 表再删除空分区，
+          并登记到归档目录（按该交易日查询时照常读出），
+          两种方式都只修改元数据，耗时与分区行数无关
+
+        连接时执行一次，之后由 RetentionManager 每轮执行（见其 partitions 参数）
+
+        Args:
+            days_ahead: 预建未来多少个自然日的分区
+            retention_days: 保留最近多少个自然日的分区，None 表示不清理
+            archive: 过期分区是否归档为独立表
+
+        Returns:
+            {'created': [...], 'dropped': [...], 'archived': [...]}
+        """
+        result = {'created': [], 'dropped': [], 'archived': []}
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                partitions = self._get_partitions(cursor, 'market_data')
+                if not partitions:
+                    logger.info("market_data 未分区，跳过分区维护（可调用 partition_market_data 转换）")
+                    return result
+
+                bounds = [p['bound'].strip("'") for p in partitions
+                          if p['bound'] and p['bound'] != 'MAXVALUE']
+                last_bound = max(bounds) if bounds else ''
+
+                # 1. 预建未来分区
+                today = datetime.now().date()
+                new_parts = []
+                for i in range(days_ahead + 1):
+                    day = today + timedelta(days=i)
+                    if day.weekday() >= 5:
+                        continue
+                    upper = (day + timedelta(days=1)).strftime('%Y%m%d')
+                    if upper <= last_bound:
+                        continue
+                    name = f"p{day.strftime('%Y%m%d')}"
+                    new_parts.append(
+                        f"PARTITION {name} VALUES LESS THAN ({self._day_literal('market_data', upper)})")
+                    result['created'].append(name)
+                    last_bound = upper
+                if new_parts:
+                    cursor.execute(
+                        "ALTER TABLE market_data REORGANIZE PARTITION p_future INTO ("
+                        + ", ".join(new_parts)
+                        + ", PARTITION p_future VALUES LESS THAN (MAXVALUE))"
+                    )
+
+                # 2. 清理过期分区
+                if retention_days is not None:
+                    cutoff = (today - timedelta(days=retention_days)).strftime('%Y%m%d')
+                    for p in partitions:
+                        name = p['name']
+                        if not name.startswith('p2') or name[1:] >= cutoff:
+                            continue
+                        if archive:
+                            arch_table = _ARCH_TABLE_PREFIX + name[1:]
+                            self._create_exchange_table(cursor, arch_table)
+                            self._swap_out_partition(cursor, name, arch_table)
+                            result['archived'].append(arch_table)
+                        else:
+                            cursor.execute(f"ALTER TABLE market_data DROP PARTITION {name}")
+                        result['dropped'].append(name)
+            conn.commit()
+            if result['archived']:
+                self.reload_schema()
+                for arch_table in result['archived']:
+                    self.mark_archived('market_data', arch_table[len(_ARCH_TABLE_PREFIX):],
+                                       'table:' + arch_table)
+            if any(result.values()):
+                logger.info(f"行情分区维护完成: {result}")
+            return result
+        except Error as e:
+            logger.error(f"行情分区维护失败: {e}")
+            return result
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _create_exchange_table(self, cursor, arch_table: str):
+        """建与 market_data 结构相同的不分区表，用于 EXCHANGE PARTITION"""
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {arch_table} LIKE market_data")
+        if self._get_partitions(cursor, arch_table):
+            cursor.execute(f"ALTER TABLE {arch_table} REMOVE PARTITIONING")
+
+    def _swap_out_partition(self, cursor, name: str, arch_table: str):
+        """
+        把 market_data 的分区换出到 arch_table 后删除该分区
+
+        arch_table 为空时直接交换（只改元数据）；上次换出后中断、分区中又有新行时，
+        把分区中的行追加到 arch_table（只有中断后写入的少量行）
+        """
+        cursor.execute(f"SELECT 1 FROM market_data PARTITION ({name}) LIMIT 1")
+        if cursor.fetchone() is not None:
+            cursor.execute(f"SELECT 1 FROM {arch_table} LIMIT 1")
+            if cursor.fetchone() is None:
+                cursor.execute(f"ALTER TABLE market_data EXCHANGE PARTITION {name} "
+                               f"WITH TABLE {arch_table} WITHOUT VALIDATION")
+            else:
+                cursor.execute(f"INSERT INTO {arch_table} SELECT * FROM market_data PARTITION ({name})")
+        cursor.execute(f"ALTER TABLE market_data DROP PARTITION {name}")
+
+    def _day_partition(self, cursor, table: str, trading_day: str) -> Optional[str]:
+        """
+        只包含该交易日的日分区名，没有时返回 None
+
+        p<交易日> 的区间中除该交易日外只能是周末；p_history 等跨多个交易日的分区
+        不能整体换出或删除
+        """
+        if table != 'market_data':
+            return None
+        name = f"p{trading_day}"
+        lower = None
+        for p in self._get_partitions(cursor, table):
+            bound = (p['bound'] or '').strip("'")
+            if p['name'] != name:
+                lower = bound
+                continue
+            try:
+                day = datetime.strptime(str(trading_day), '%Y%m%d').date()
+                start = datetime.strptime(lower or '', '%Y%m%d').date()
+                end = datetime.strptime(bound, '%Y%m%d').date()
+            except ValueError:
+                return None
+            while start < end:
+                if start != day and start.weekday() < 5:
+                    return None
+                start += timedelta(days=1)
+            return name
+        return None
+
+    def partition_market_data(self) -> bool:
+        """
+        将旧版本创建的未分区 market_data 转换为按交易日分区
+
+        需要重建整张表，仅在升级时执行一次；已有数据全部放入 p_history 分区，
+        之后由 maintain_market_data_partitions 逐日拆分未来分区。
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                if self._get_partitions(cursor, 'market_data'):
+                    return True
+                today = datetime.now().strftime('%Y%m%d')
+                if self.is_compact('market_data'):
+                    day_type = "INT UNSIGNED NOT NULL DEFAULT 0"
+                    cursor.execute("UPDATE market_data SET trading_day = 0 WHERE trading_day IS NULL")
+                else:
+                    day_type = "VARCHAR(20) NOT NULL DEFAULT ''"
+                    cursor.execute("UPDATE market_data SET trading_day = '' WHERE trading_day IS NULL")
+                conn.commit()
+                cursor.execute(f"""
+                    ALTER TABLE market_data
+                        MODIFY trading_day {day_type} COMMENT '交易日',
+                        DROP PRIMARY KEY,
+                        ADD PRIMARY KEY (id, trading_day)
+                    PARTITION BY RANGE COLUMNS(trading_day) (
+                        PARTITION p_history VALUES LESS THAN ({self._day_literal('market_data', today)}),
+                        PARTITION p_future VALUES LESS THAN (MAXVALUE)
+                    )
+                """)
+            logger.info("market_data 已转换为按交易日分区")
+        except Error as e:
+            logger.error(f"转换 market_data 分区失败: {e}")
+            return False
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.maintain_market_data_partitions()
+        return True
+
+    def explain_partitions(self, trading_day: str, instrument_id: Optional[str] = None) -> List[str]:
+        """
+        返回按交易日查询行情时实际访问的分区，用于确认分区裁剪是否生效
+
+        Args:
+            trading_day: 交易日
+            instrument_id: 合约代码
+
+        Returns:
+            EXPLAIN 输出的 partitions 列拆分后的分区名列表
+        """
+        sql = "SELECT * FROM market_data WHERE trading_day = %s"
+        params = [self._day_param('market_data', trading_day)]
+        if instrument_id:
+            sql += " AND instrument_id = %s"
+            params.append(instrument_id)
+        plan = self.explain(sql, params)
+        partitions = (plan[0].get('partitions') if plan else None) or ''
+        return [p for p in partitions.split(',') if p]
+
+    def _upsert_sql(self, table: str, columns: Sequence[str],
+                    update_columns: Sequence[str]) -> str:
+        """生成按唯一键合并的批量写入SQL，唯一键冲突时只更新 update_columns"""
+        updates = ", ".join(f"{c} = VALUES({c})" for c in update_columns)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(f'%({c})s' for c in columns)}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+    def _new_value(self, column: str) -> str:
+        """合并写入时引用待写入的新值"""
+        return f"VALUES({column})"
+
+    def _merge_sql(self, table: str, columns: Sequence[str],
+                   assignments: Sequence[Tuple[str, str]]) -> str:
+        """生成按唯一键合并的批量写入SQL，唯一键冲突时按 assignments 的表达式依次更新"""
+        updates = ", ".join(f"{c} = {expr}" for c, expr in assignments)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(f'%({c})s' for c in columns)}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+    def _use_bulk_load(self, row_count: int) -> bool:
+        """是否对本次写入启用 LOAD DATA LOCAL INFILE"""
+        return self.bulk_load and row_count >= self.bulk_threshold
+
+    def _bulk_load(self, table: str, columns: Sequence[str], rows: List[Dict[str, Any]],
+                   update_columns: Optional[Sequence[str]] = None,
+                   before_commit: Optional[Callable[[Any], Any]] = None) -> Optional[int]:
+        """
+        通过 LOAD DATA LOCAL INFILE 批量导入
+
+        先在内存中拼出TSV内容，再写入临时文件交给 pymysql 发送（pymysql 只支持按文件路径上传）。
+        指定 update_columns 时先导入临时暂存表，再用 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE
+        合并到目标表，保持与 executemany 相同的upsert语义。
+
+        Args:
+            table: 目标表
+            columns: 导入字段
+            rows: 数据行
+            update_columns: 主键冲突时更新的字段，为空表示直接追加
+            before_commit: 提交前以游标调用，用于在同一事务内刷新汇总；
+                它失败时整批回滚，由调用方回退到 executemany
+
+        Returns:
+            导入的记录数；服务端不支持或导入失败时返回 None，由调用方回退到 executemany
+        """
+        col_sql = ", ".join(columns)
+        buffer = "".join(
+            "\t".join(_tsv_field(row.get(col)) for col in columns) + "\n"
+            for row in rows
+        )
+
+        fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=".tsv")
+        conn = None
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.write(buffer)
+
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                target = table
+                if update_columns:
+                    target = f"_stage_{table}"
+                    cursor.execute(
+                        f"CREATE TEMPORARY TABLE IF NOT EXISTS {target} "
+                        f"SELECT {col_sql} FROM {table} WHERE 1=0"
+                    )
+                    cursor.execute(f"TRUNCATE TABLE {target}")
+
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {target} CHARACTER SET utf8mb4 "
+                    f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                    f"({col_sql})",
+                    (path,)
+                )
+                count = cursor.rowcount
+
+                if update_columns:
+                    updates = ", ".join(f"{col}=VALUES({col})" for col in update_columns)
+                    cursor.execute(
+                        f"INSERT INTO {table} ({col_sql}) SELECT {col_sql} FROM {target} "
+                        f"ON DUPLICATE KEY UPDATE {updates}"
+                    )
+                    cursor.execute(f"TRUNCATE TABLE {target}")
+
+                if before_commit is not None:
+                    before_commit(cursor)
+            conn.commit()
+            logger.info(f"批量导入 {count} 条记录到 {table}")
+            return count
+        except Error as e:
+            if e.args and e.args[0] in _LOCAL_INFILE_DISABLED_ERRORS:
+                # 服务端未开启 local_infile，之后不再尝试
+                self.bulk_load = False
+                logger.warning(f"服务端不支持 LOAD DATA LOCAL INFILE，回退到逐批插入: {e}")
+            else:
+                logger.error(f"批量导入 {table} 失败，回退到逐批插入: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return None
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _order_rows(self, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按 ORDER_COLUMNS 整理委托并生成 order_key（记录已带 order_key 时沿用），已编码为表中的存储形式"""
+        rows = []
+        for order in orders:
+            row = {c: order.get(c) for c in ORDER_COLUMNS}
+            row['order_key'] = order.get('order_key') or order_key(order)
+            rows.append(row)
+        return self._encode_rows('daily_orders', rows)
+
+    def _position_keys(self, positions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """取持仓的唯一键字段，已编码为表中的存储形式"""
+        return self._encode_rows('daily_positions', [
+            {'trading_day': p.get('trading_day'), 'instrument_id': p.get('instrument_id'),
+             'direction': p.get('direction')}
+            for p in positions
+        ])
+
+    @_spoolable
+    @_invalidates('daily_orders')
+    @_timed
+    def insert_orders(self, orders: List[Dict[str, Any]]) -> int:
+        """
+        批量写入委托数据
+        
+        带 CTP 自然键的委托按 (trading_day, order_key) 去重，重复下载时只更新
+        成交量、状态等字段；记录自带 order_key 时（变更检测为没有自然键的委托生成的键）
+        按该键去重；两者都没有的委托（如 CSV 导入）直接追加
+        
+        Args:
+            orders: 委托数据列表
+            
+        Returns:
+            写入的记录数
+        """
+        if not orders:
+            return 0
+
+        rows = self._order_rows(orders)
+
+        if self._use_bulk_load(len(rows)):
+            # 委托汇总与明细在同一事务内提交
+            count = self._bulk_load(
+                'daily_orders', ORDER_COLUMNS, rows, ORDER_UPDATE_COLUMNS,
+                before_commit=lambda cursor: self._refresh_order_summary(cursor, orders)
+            )
+            if count is not None:
                 return count
+        
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                sql = self._upsert_sql('daily_orders', ORDER_COLUMNS, ORDER_UPDATE_COLUMNS)
+                cursor.executemany(sql, rows)
+                # 同一事务内刷新委托汇总
+                self._refresh_order_summary(cursor, orders)
+                conn.commit()
+                logger.info(f"成功写入 {len(rows)} 条委托记录")
+                return len(rows)
         except Error as e:
             logger.error(f"插入委托数据失败: {e}")
+            self._note_write_error(e)
             try:
                 conn.rollback()
             except Exception:
@@ -256,6 +1861,72 @@ class DatabaseManager:
             except Exception:
                 pass
 
+    def compact_orders(self, batch_size: int = 1000, batch_gap: float = 30.0) -> int:
+        """
+        清理旧版本重复下载产生的重复委托（一次性维护操作）
+        
+        只处理没有自然键（order_key 为 NULL）的旧记录，按交易日逐日处理：
+        
+        1. 同一交易日已有带自然键的新记录时，委托时间、合约、方向、开平、价格、数量
+           与之相同的旧记录已被新记录取代，直接删除
+        2. 其余旧记录按 id 顺序划分下载批次（相邻记录的 create_time 相差超过 batch_gap 秒
+           视为新的一批），内容相同的记录只保留最近一批，同一批中真实存在的相同委托
+           不会被误删，一批写入跨过秒边界也不受影响
+        
+        按批删除并逐批提交。
+        
+        Args:
+            batch_size: 每批删除的记录数
+            batch_gap: 划分下载批次的时间间隔（秒）
+            
+        Returns:
+            删除的记录数
+        """
+        group_cols = ('order_time', 'instrument_id', 'direction', 'offset_flag',
+                      'order_price', 'order_volume')
+        eq = self._null_safe_eq
+        removed = 0
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT DISTINCT trading_day FROM daily_orders WHERE order_key IS NULL"
+                )
+                days = [row['trading_day'] for row in cursor.fetchall()]
+                for day in days:
+                    cursor.execute(
+                        f"SELECT id, order_key, create_time, {', '.join(group_cols)} "
+                        f"FROM daily_orders WHERE trading_day {eq} %s ORDER BY id", (day,))
+                    ids = _stale_legacy_orders(cursor.fetchall(), group_cols, batch_gap)
+                    for i in range(0, len(ids), batch_size):
+                        batch = ids[i:i + batch_size]
+                        cursor.execute(
+                            f"DELETE FROM daily_orders WHERE id IN ({', '.join(['%s'] * len(batch))})",
+                            batch
+                        )
+                        conn.commit()
+                        removed += len(batch)
+                    if ids:
+                        logger.info(f"交易日 {day} 清理重复委托 {len(ids)} 条")
+                        self.invalidate_result_cache('daily_orders', day)
+            return removed
+        except Error as e:
+            logger.error(f"清理重复委托失败: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return removed
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @_spoolable
+    @_invalidates('daily_positions')
+    @_timed
     def insert_positions(self, positions: List[Dict[str, Any]]) -> int:
         """
         批量插入持仓数据（使用REPLACE INTO避免重复）
@@ -269,23 +1940,57 @@ class DatabaseManager:
         if not positions:
             return 0
         
+        rows = self._encode_rows('daily_positions', positions)
         try:
             conn = self._get_connection()
             with conn.cursor() as cursor:
-                sql = """
-                    REPLACE INTO daily_positions 
-                    (instrument_id, direction, position_type, volume, available_volume,
-                     open_price, position_price, close_profit, position_profit, trading_day)
-                    VALUES (%(instrument_id)s, %(direction)s, %(position_type)s, %(volume)s,
-                            %(available_volume)s, %(open_price)s, %(position_price)s,
-                            %(close_profit)s, %(position_profit)s, %(trading_day)s)
-                """
-                count = cursor.executemany(sql, positions)
+                count = cursor.executemany(_POSITION_REPLACE_SQL, rows)
+                self._refresh_position_summary(cursor, positions)
                 conn.commit()
                 logger.info(f"成功更新 {count} 条持仓记录")
                 return count
         except Error as e:
             logger.error(f"插入持仓数据失败: {e}")
+            self._note_write_error(e)
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return 0
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @_spoolable
+    @_invalidates('daily_positions')
+    @_timed
+    def delete_positions(self, positions: List[Dict[str, Any]]) -> int:
+        """
+        删除已平掉的持仓
+        
+        Args:
+            positions: 持仓键列表，每项包含 trading_day/instrument_id/direction
+            
+        Returns:
+            删除的记录数
+        """
+        if not positions:
+            return 0
+
+        keys = self._position_keys(positions)
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                cursor.executemany(_POSITION_DELETE_SQL, keys)
+                self._refresh_position_summary(cursor, positions)
+                conn.commit()
+                logger.info(f"成功删除 {len(keys)} 条持仓记录")
+                return len(keys)
+        except Error as e:
+            logger.error(f"删除持仓数据失败: {e}")
+            self._note_write_error(e)
             try:
                 conn.rollback()
             except Exception:
@@ -297,6 +2002,9 @@ class DatabaseManager:
             except Exception:
                 pass
 
+    @_spoolable
+    @_invalidates('market_data')
+    @_timed
     def insert_market_data(self, market_data: List[Dict[str, Any]]) -> int:
         """
         批量插入行情数据
@@ -309,6 +2017,14 @@ class DatabaseManager:
         """
         if not market_data:
             return 0
+
+        rows = self._encode_rows('market_data', market_data)
+        if self._use_bulk_load(len(rows)):
+            # tick_count 是累加的，汇总必须与明细在同一事务内提交
+            count = self._bulk_load('market_data', MARKET_DATA_COLUMNS, rows,
+                                    before_commit=lambda cursor: self._refresh_market(cursor, market_data))
+            if count is not None:
+                return count
         
         try:
             conn = self._get_connection()
@@ -326,12 +2042,15 @@ class DatabaseManager:
                             %(upper_limit_price)s, %(lower_limit_price)s, %(bid_price1)s,
                             %(bid_volume1)s, %(ask_price1)s, %(ask_volume1)s, %(trading_day)s)
                 """
-                count = cursor.executemany(sql, market_data)
+                count = cursor.executemany(sql, rows)
+                # 同一事务内刷新最新行情表和每日行情汇总
+                self._refresh_market(cursor, market_data)
                 conn.commit()
                 logger.info(f"成功插入 {count} 条行情记录")
                 return count
         except Error as e:
             logger.error(f"插入行情数据失败: {e}")
+            self._note_write_error(e)
             try:
                 conn.rollback()
             except Exception:
@@ -343,48 +2062,90 @@ class DatabaseManager:
             except Exception:
                 pass
 
-    def insert_instrument_info(self, instruments: List[Dict[str, Any]]) -> int:
+    def _refresh_market(self, cursor, market_data: List[Dict[str, Any]]) -> int:
+        """刷新最新行情表和每日行情汇总（在调用方的事务内），返回更新的合约数"""
+        count = self._upsert_latest(cursor, market_data)
+        self._update_market_summary(cursor, market_data)
+        return count
+
+    def _upsert_latest(self, cursor, market_data: List[Dict[str, Any]]) -> int:
         """
-        批量插入合约参数数据
+        把一批行情合并进 market_data_latest
+
+        写入时仅当新行情不早于已有行情才覆盖，同一交易日内按交易时段先后比较
+        （夜盘早于日盘）；trading_day/update_time 放在最后赋值，前面的字段比较的仍是旧值
+        """
+        rows = self._latest_rows(market_data)
+        if not rows:
+            return 0
+
+        newer = ("(VALUES(trading_day) > trading_day OR "
+                 f"(VALUES(trading_day) = trading_day AND "
+                 f"{self._session_order_sql('VALUES(update_time)')} >= "
+                 f"{self._session_order_sql('update_time')}))")
+        update_cols = [c for c in MARKET_DATA_COLUMNS
+                       if c not in ('instrument_id', 'trading_day', 'update_time')]
+        updates = [f"{c} = IF({newer}, VALUES({c}), {c})" for c in update_cols]
+        updates.append(f"update_time = IF({newer}, VALUES(update_time), update_time)")
+        updates.append(
+            "trading_day = IF(VALUES(trading_day) > trading_day, VALUES(trading_day), trading_day)"
+        )
+        sql = (
+            f"INSERT INTO market_data_latest ({', '.join(MARKET_DATA_COLUMNS)}) "
+            f"VALUES ({', '.join(f'%({c})s' for c in MARKET_DATA_COLUMNS)}) "
+            f"ON DUPLICATE KEY UPDATE {', '.join(updates)}"
+        )
+        cursor.executemany(sql, self._encode_rows('market_data_latest', rows))
+        return len(rows)
+
+    @staticmethod
+    def _session_order_sql(update_time: str) -> str:
+        """
+        与 _session_seq 顺序一致的 SQL 排序表达式：18:00 之后的夜盘时间前缀 0，其余前缀 1，
+        HH:MM:SS 文本按字符串比较即为交易日内的先后
+        """
+        return f"CONCAT(IF({update_time} >= '18:00:00', '0', '1'), {update_time})"
+
+    @staticmethod
+    def _latest_rows(market_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批内按合约去重，只保留每个合约最新的一条行情（同一时刻取后到的一条）"""
+        latest: Dict[str, Dict[str, Any]] = {}
+        for row in market_data:
+            inst = row.get('instrument_id')
+            if not inst:
+                continue
+            old = latest.get(inst)
+            if old is None or (str(row.get('trading_day') or ''), _session_seq(row.get('update_time'))) >= \
+                    (str(old.get('trading_day') or ''), _session_seq(old.get('update_time'))):
+                latest[inst] = row
+        rows = [{c: row.get(c) for c in MARKET_DATA_COLUMNS} for row in latest.values()]
+        for row in rows:
+            row['trading_day'] = row['trading_day'] or ''
+        return rows
+
+    @_timed
+    def upsert_latest_quotes(self, market_data: List[Dict[str, Any]]) -> int:
+        """
+        单独一个事务刷新最新行情表和每日行情汇总
         
         Args:
-            instruments: 合约参数列表
+            market_data: 行情数据列表
             
         Returns:
-            插入的记录数
+            更新的合约数
         """
-        if not instruments:
+        if not market_data:
             return 0
         
+        conn = None
         try:
             conn = self._get_connection()
             with conn.cursor() as cursor:
-                sql = """
-                    INSERT INTO instrument_info 
-                    (instrument_id, exchange_id, instrument_name, product_id, product_class,
-                     delivery_year, delivery_month, volume_multiple, price_tick, create_date,
-                     open_date, expire_date, start_delivery_date, end_delivery_date, is_trading,
-                     long_margin_ratio, short_margin_ratio, max_market_order_volume,
-                     min_market_order_volume, max_limit_order_volume, min_limit_order_volume)
-                    VALUES (%(instrument_id)s, %(exchange_id)s, %(instrument_name)s, %(product_id)s,
-                            %(product_class)s, %(delivery_year)s, %(delivery_month)s,
-                            %(volume_multiple)s, %(price_tick)s, %(create_date)s, %(open_date)s,
-                            %(expire_date)s, %(start_delivery_date)s, %(end_delivery_date)s,
-                            %(is_trading)s, %(long_margin_ratio)s, %(short_margin_ratio)s,
-                            %(max_market_order_volume)s, %(min_market_order_volume)s,
-                            %(max_limit_order_volume)s, %(min_limit_order_volume)s)
-                    ON DUPLICATE KEY UPDATE
-                        instrument_name=VALUES(instrument_name),
-                        is_trading=VALUES(is_trading),
-                        long_margin_ratio=VALUES(long_margin_ratio),
-                        short_margin_ratio=VALUES(short_margin_ratio)
-                """
-                count = cursor.executemany(sql, instruments)
+                count = self._refresh_market(cursor, market_data)
                 conn.commit()
-                logger.info(f"成功更新 {count} 条合约参数记录")
                 return count
         except Error as e:
-            logger.error(f"插入合约参数失败: {e}")
+            logger.error(f"更新最新行情失败: {e}")
             try:
                 conn.rollback()
             except Exception:
@@ -396,141 +2157,1492 @@ class DatabaseManager:
             except Exception:
                 pass
 
-    def query_orders(self, trading_day: Optional[str] = None, 
-                    instrument_id: Optional[str] = None,
-                    limit: int = 1000) -> List[Dict[str, Any]]:
-        """查询委托数据，返回字典列表"""
+    @_spoolable
+    @_timed
+    def insert_bars(self, bars: List[Dict[str, Any]]) -> int:
+        """
+        批量写入K线，同一合约、周期、时间的K线重复写入时覆盖
+        
+        Args:
+            bars: K线列表，字段见 KLINE_COLUMNS
+            
+        Returns:
+            写入的K线数
+        """
+        if not bars:
+            return 0
+        
+        rows = [{c: bar.get(c) for c in KLINE_COLUMNS} for bar in bars]
+        if self._use_bulk_load(len(rows)):
+            count = self._bulk_load('kline', KLINE_COLUMNS, rows, KLINE_UPDATE_COLUMNS)
+            if count is not None:
+                return count
+        
+        conn = None
         try:
             conn = self._get_connection()
             with conn.cursor() as cursor:
-                sql = "SELECT * FROM daily_orders WHERE 1=1"
-                params = []
-                
-                if trading_day:
-                    sql += " AND trading_day = %s"
-                    params.append(trading_day)
-                
-                if instrument_id:
-                    sql += " AND instrument_id = %s"
-                    params.append(instrument_id)
-                
-                sql += " ORDER BY order_time DESC LIMIT %s"
-                params.append(limit)
-                
-                cursor.execute(sql, params)
-                rows = cursor.fetchall()
-                return rows
+                sql = self._upsert_sql('kline', KLINE_COLUMNS, KLINE_UPDATE_COLUMNS)
+                cursor.executemany(sql, rows)
+                conn.commit()
+                logger.debug(f"成功写入 {len(rows)} 根K线")
+                return len(rows)
         except Error as e:
-            logger.error(f"查询委托数据失败: {e}")
-            return []
+            logger.error(f"写入K线失败: {e}")
+            self._note_write_error(e)
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return 0
         finally:
             try:
                 conn.close()
             except Exception:
                 pass
-    
-    def query_positions(self, trading_day: Optional[str] = None,
-                       instrument_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        """查询持仓数据，返回字典列表"""
+
+    @_spoolable
+    @_timed
+    def insert_instrument_info(self, instruments: List[Dict[str, Any]]) -> int:
+        """
+        批量插入合约参数数据
+        
+        Args:
+            instruments: 合约参数列表
+            
+        Returns:
+            插入的记录数
+        """
+        if not instruments:
+            return 0
+
+        if self._use_bulk_load(len(instruments)):
+            count = self._bulk_load(
+                'instrument_info', INSTRUMENT_COLUMNS, instruments,
+                update_columns=INSTRUMENT_UPDATE_COLUMNS
+            )
+            if count is not None:
+                return count
+        
         try:
             conn = self._get_connection()
             with conn.cursor() as cursor:
-                sql = "SELECT * FROM daily_positions WHERE 1=1"
-                params = []
-                
-                if trading_day:
-                    sql += " AND trading_day = %s"
-                    params.append(trading_day)
-                
-                if instrument_id:
-                    sql += " AND instrument_id = %s"
-                    params.append(instrument_id)
-                
-                sql += " ORDER BY instrument_id, direction"
-                
-                cursor.execute(sql, params)
-                rows = cursor.fetchall()
-                return rows
+                sql = self._upsert_sql('instrument_info', INSTRUMENT_COLUMNS, INSTRUMENT_UPDATE_COLUMNS)
+                count = cursor.executemany(sql, instruments)
+                conn.commit()
+                logger.info(f"成功更新 {count} 条合约参数记录")
+                return count
         except Error as e:
-            logger.error(f"查询持仓数据失败: {e}")
-            return []
+            logger.error(f"插入合约参数失败: {e}")
+            self._note_write_error(e)
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return 0
         finally:
             try:
                 conn.close()
             except Exception:
                 pass
-    
-    def query_market_data(self, trading_day: Optional[str] = None,
+
+    @_spoolable
+    @_timed
+    def retire_instruments(self, instrument_ids: List[str]) -> int:
+        """
+        把不再由柜台返回的合约标记为非交易（保留合约参数供历史查询）
+        
+        Args:
+            instrument_ids: 合约代码列表
+            
+        Returns:
+            标记的记录数
+        """
+        if not instrument_ids:
+            return 0
+
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                sql = "UPDATE instrument_info SET is_trading = 0 WHERE instrument_id = %s"
+                cursor.executemany(sql, [(i,) for i in instrument_ids])
+                conn.commit()
+                logger.info(f"成功标记 {len(instrument_ids)} 个合约为非交易")
+                return len(instrument_ids)
+        except Error as e:
+            logger.error(f"标记非交易合约失败: {e}")
+            self._note_write_error(e)
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return 0
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------
+    # 每日汇总表
+    #
+    # 委托/持仓汇总在写入明细的同一事务内，对本次涉及的 (交易日, 合约) 分组重新聚合，
+    # 委托状态更新、持仓删除后汇总都保持准确；行情为只追加的明细，
+    # 每批先在内存中按分组预聚合，再与汇总表中的已有值合并
+    # ------------------------------------------------------------------
+    def _label_param(self, table: str, column: str, label: str):
+        """把查询条件中的枚举文本转换为表中的存储类型"""
+        if table in self._compact_tables:
+            return self.enum_code(column, label)
+        return label
+
+    @staticmethod
+    def _summary_keys(rows: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """按交易日归集一批记录涉及的合约"""
+        keys: Dict[str, set] = {}
+        for row in rows:
+            inst = row.get('instrument_id')
+            if inst:
+                keys.setdefault(str(row.get('trading_day') or ''), set()).add(inst)
+        return {day: sorted(insts) for day, insts in keys.items()}
+
+    def _replace_summary(self, cursor, table: str, columns: Sequence[str], day: str,
+                         instruments: List[str], rows: List[Dict[str, Any]]) -> int:
+        """写入重新聚合的分组，已没有明细的分组从汇总表删除"""
+        if rows:
+            cursor.executemany(
+                self._upsert_sql(table, columns, columns[2:]),
+                [dict({c: row.get(c) for c in columns}, trading_day=day) for row in rows]
+            )
+        gone = sorted(set(instruments) - {row['instrument_id'] for row in rows})
+        if gone:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE trading_day = %s "
+                f"AND instrument_id IN ({', '.join(['%s'] * len(gone))})",
+                [day] + gone
+            )
+        return len(rows)
+
+    def _refresh_order_summary(self, cursor, orders: List[Dict[str, Any]]) -> int:
+        """重新聚合一批委托涉及的 (交易日, 合约) 分组（在调用方的事务内）"""
+        filled = self._label_param('daily_orders', 'order_status', '全部成交')
+        cancelled = self._label_param('daily_orders', 'order_status', '撤单')
+        count = 0
+        for day, instruments in self._summary_keys(orders).items():
+            cursor.execute(
+                "SELECT instrument_id, COUNT(*) AS order_count, "
+                "COALESCE(SUM(order_volume), 0) AS order_volume, "
+                "COALESCE(SUM(traded_volume), 0) AS traded_volume, "
+                "SUM(CASE WHEN order_status = %s THEN 1 ELSE 0 END) AS filled_orders, "
+                "SUM(CASE WHEN order_status = %s THEN 1 ELSE 0 END) AS cancelled_orders "
+                f"FROM daily_orders WHERE instrument_id IN ({', '.join(['%s'] * len(instruments))}) "
+                "AND trading_day = %s GROUP BY instrument_id",
+                [filled, cancelled] + instruments + [self._day_param('daily_orders', day)]
+            )
+            count += self._replace_summary(cursor, 'daily_order_summary', ORDER_SUMMARY_COLUMNS,
+                                           day, instruments, cursor.fetchall())
+        return count
+
+    def _refresh_position_summary(self, cursor, positions: List[Dict[str, Any]]) -> int:
+        """重新聚合一批持仓涉及的 (交易日, 合约) 分组（在调用方的事务内）"""
+        longs = [self._label_param('daily_positions', 'direction', label) for label in ('多头', '买入')]
+        count = 0
+        for day, instruments in self._summary_keys(positions).items():
+            cursor.execute(
+                "SELECT instrument_id, "
+                "SUM(CASE WHEN direction IN (%s, %s) THEN volume ELSE 0 END) AS long_volume, "
+                "SUM(CASE WHEN direction IN (%s, %s) THEN 0 ELSE volume END) AS short_volume, "
+                "COALESCE(SUM(position_profit), 0) AS position_profit, "
+                "COALESCE(SUM(close_profit), 0) AS close_profit "
+                f"FROM daily_positions WHERE trading_day = %s "
+                f"AND instrument_id IN ({', '.join(['%s'] * len(instruments))}) "
+                "GROUP BY instrument_id",
+                longs + longs + [self._day_param('daily_positions', day)] + instruments
+            )
+            count += self._replace_summary(cursor, 'daily_position_summary', POSITION_SUMMARY_COLUMNS,
+                                           day, instruments, cursor.fetchall())
+        return count
+
+    @staticmethod
+    def _accumulate_market_summary(groups: Dict[Tuple[str, str], Dict[str, Any]],
+                                   market_data: List[Dict[str, Any]]):
+        """把一批行情按 (交易日, 合约) 预聚合进 groups"""
+        def pick(fn, a, b):
+            return b if a is None else a if b is None else fn(a, b)
+
+        for tick in market_data:
+            inst = tick.get('instrument_id')
+            if not inst:
+                continue
+            key = (str(tick.get('trading_day') or ''), inst)
+            last = tick.get('last_price')
+            high = tick.get('highest_price') if tick.get('highest_price') is not None else last
+            low = tick.get('lowest_price') if tick.get('lowest_price') is not None else last
+            seq = _session_seq(tick.get('update_time'))
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    'trading_day': key[0], 'instrument_id': inst,
+                    'exchange_id': tick.get('exchange_id'), 'open_price': None,
+                    'high_price': None, 'low_price': None, 'last_price': None,
+                    'pre_settlement_price': None, 'volume': None, 'turnover': None,
+                    'open_interest': None, 'tick_count': 0, 'last_seq': -1,
+                }
+            group['tick_count'] += 1
+            group['high_price'] = pick(max, group['high_price'], high)
+            group['low_price'] = pick(min, group['low_price'], low)
+            # 成交量、成交额是交易日累计值
+            group['volume'] = pick(max, group['volume'], tick.get('volume'))
+            group['turnover'] = pick(max, group['turnover'], tick.get('turnover'))
+            if group['open_price'] is None:
+                group['open_price'] = tick.get('open_price')
+            if group['pre_settlement_price'] is None:
+                group['pre_settlement_price'] = tick.get('pre_settlement_price')
+            if seq >= group['last_seq']:
+                group['last_seq'] = seq
+                group['last_price'] = last
+                group['open_interest'] = tick.get('open_interest')
+
+    def _merge_market_summary(self, cursor, groups: Dict[Tuple[str, str], Dict[str, Any]]) -> int:
+        """把预聚合的分组合并进 daily_market_summary（在调用方的事务内）"""
+        if not groups:
+            return 0
+        new = self._new_value
+        greatest, least = self._greatest, self._least
+        newer = f"{new('last_seq')} >= last_seq"
+        assignments = [
+            ('exchange_id', f"COALESCE({new('exchange_id')}, exchange_id)"),
+            ('open_price', f"COALESCE(open_price, {new('open_price')})"),
+            ('pre_settlement_price', f"COALESCE(pre_settlement_price, {new('pre_settlement_price')})"),
+            ('high_price', f"{greatest}(COALESCE(high_price, {new('high_price')}), "
+                           f"COALESCE({new('high_price')}, high_price))"),
+            ('low_price', f"{least}(COALESCE(low_price, {new('low_price')}), "
+                          f"COALESCE({new('low_price')}, low_price))"),
+            ('volume', f"{greatest}(COALESCE(volume, 0), COALESCE({new('volume')}, 0))"),
+            ('turnover', f"{greatest}(COALESCE(turnover, 0), COALESCE({new('turnover')}, 0))"),
+            ('last_price', f"CASE WHEN {newer} THEN {new('last_price')} ELSE last_price END"),
+            ('open_interest', f"CASE WHEN {newer} THEN {new('open_interest')} ELSE open_interest END"),
+            ('tick_count', f"tick_count + {new('tick_count')}"),
+            # last_seq 最后赋值，前面的比较用的仍是旧值
+            ('last_seq', f"{greatest}(last_seq, {new('last_seq')})"),
+        ]
+        cursor.executemany(self._merge_sql('daily_market_summary', MARKET_SUMMARY_COLUMNS, assignments),
+                           list(groups.values()))
+        return len(groups)
+
+    def _update_market_summary(self, cursor, market_data: List[Dict[str, Any]]) -> int:
+        """把一批行情增量合并进每日行情汇总（在调用方的事务内）"""
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._accumulate_market_summary(groups, market_data)
+        return self._merge_market_summary(cursor, groups)
+
+    @_timed
+    def rebuild_daily_summary(self, trading_day: str) -> Dict[str, int]:
+        """
+        按明细重建某个交易日的汇总
+
+        用于启用汇总表之前的历史数据，或数据导入工具直接写明细之后的校正
+
+        Args:
+            trading_day: 交易日
+
+        Returns:
+            {汇总表: 分组数}
+        """
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        batch = []
+        for tick in self.iter_market_data(trading_day):
+            batch.append(tick)
+            if len(batch) >= 5000:
+                self._accumulate_market_summary(groups, batch)
+                batch = []
+        self._accumulate_market_summary(groups, batch)
+
+        result = {}
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                for table in SUMMARY_TABLES:
+                    cursor.execute(f"DELETE FROM {table} WHERE trading_day = %s", (trading_day,))
+                keys = {}
+                for table in ('daily_orders', 'daily_positions'):
+                    cursor.execute(
+                        f"SELECT DISTINCT instrument_id FROM {table} WHERE trading_day = %s",
+                        (self._day_param(table, trading_day),)
+                    )
+                    keys[table] = [{'trading_day': trading_day, 'instrument_id': row['instrument_id']}
+                                   for row in cursor.fetchall()]
+                result['daily_order_summary'] = self._refresh_order_summary(cursor, keys['daily_orders'])
+                result['daily_position_summary'] = self._refresh_position_summary(
+                    cursor, keys['daily_positions'])
+                result['daily_market_summary'] = self._merge_market_summary(cursor, groups)
+            conn.commit()
+            logger.info(f"交易日 {trading_day} 汇总重建完成: {result}")
+            return result
+        except Error as e:
+            logger.error(f"重建每日汇总失败: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return {}
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @_timed
+    def query_daily_summary(self, trading_day: str, instrument_id: Optional[str] = None,
+                            by_product: bool = False) -> List[Dict[str, Any]]:
+        """
+        读取某交易日的汇总：每个合约（或品种）一行，合并委托、持仓和行情汇总
+
+        Args:
+            trading_day: 交易日
+            instrument_id: 合约代码
+            by_product: 是否按品种汇总（品种取自合约参数表，缺失时取合约代码的字母前缀）
+
+        Returns:
+            字典列表，含委托笔数/委托量/成交量/成交比例、多空持仓/盈亏、行情开高低收/成交量/成交额/涨跌幅
+        """
+        merged: Dict[str, Dict[str, Any]] = {}
+        for table, columns in (('daily_order_summary', ORDER_SUMMARY_COLUMNS),
+                               ('daily_position_summary', POSITION_SUMMARY_COLUMNS),
+                               ('daily_market_summary', MARKET_SUMMARY_COLUMNS)):
+            sql = f"SELECT * FROM {table} WHERE trading_day = %s"
+            params = [trading_day]
+            if instrument_id:
+                sql += " AND instrument_id = %s"
+                params.append(instrument_id)
+            for row in self._fetch_all(sql, params, "每日汇总"):
+                entry = merged.setdefault(row['instrument_id'], {
+                    'trading_day': trading_day, 'instrument_id': row['instrument_id']})
+                entry.update({c: row.get(c) for c in columns[2:] if c != 'last_seq'})
+
+        rows = [merged[inst] for inst in sorted(merged)]
+        if by_product:
+            rows = self._summary_by_product(rows)
+        for row in rows:
+            order_volume = row.get('order_volume')
+            row['fill_ratio'] = (float(row.get('traded_volume') or 0) / float(order_volume)
+                                 if order_volume else None)
+            last, pre = row.get('last_price'), row.get('pre_settlement_price')
+            row['change_pct'] = (round((float(last) - float(pre)) / float(pre) * 100, 2)
+                                 if last and pre else None)
+        return rows
+
+    def _summary_by_product(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """把合约汇总行按品种相加，价格类字段不参与"""
+        products = {}
+        if rows:
+            instruments = [row['instrument_id'] for row in rows]
+            infos = self._fetch_all(
+                "SELECT instrument_id, product_id FROM instrument_info "
+                f"WHERE instrument_id IN ({', '.join(['%s'] * len(instruments))})",
+                instruments, "合约品种"
+            )
+            products = {info['instrument_id']: info['product_id'] for info in infos if info['product_id']}
+        additive = [c for columns in (ORDER_SUMMARY_COLUMNS, POSITION_SUMMARY_COLUMNS)
+                    for c in columns[2:]] + ['volume', 'turnover', 'open_interest', 'tick_count']
+        grouped: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            product = products.get(row['instrument_id']) or _product_of(row['instrument_id'])
+            entry = grouped.setdefault(product, {'trading_day': row['trading_day'],
+                                                 'product_id': product, 'instruments': 0})
+            entry['instruments'] += 1
+            for column in additive:
+                if row.get(column) is not None:
+                    entry[column] = (entry.get(column) or 0) + row[column]
+        return [grouped[product] for product in sorted(grouped)]
+
+    @_timed
+    def query_top_movers(self, trading_day: str, limit: int = 10,
+                         order_by: str = 'change_pct', ascending: bool = False) -> List[Dict[str, Any]]:
+        """
+        读取某交易日行情汇总的排行（涨跌幅/成交量/成交额/持仓量）
+
+        Args:
+            trading_day: 交易日
+            limit: 返回条数
+            order_by: change_pct/volume/turnover/open_interest
+            ascending: 是否升序（跌幅榜）
+
+        Returns:
+            字典列表，附带 change_pct（%）
+        """
+        if order_by not in _MOVER_ORDERS:
+            raise ValueError(f"不支持的排序字段: {order_by}")
+        change = _MOVER_ORDERS['change_pct']
+        sql = (
+            f"SELECT *, ROUND({change} * 100, 2) AS change_pct FROM daily_market_summary "
+            "WHERE trading_day = %s AND last_price > 0 AND pre_settlement_price > 0 "
+            f"ORDER BY {_MOVER_ORDERS[order_by]} {'ASC' if ascending else 'DESC'} LIMIT %s"
+        )
+        return self._fetch_all(sql, [trading_day, limit], "行情排行")
+
+    @_timed
+    def query_pnl_history(self, start_day: Optional[str] = None,
+                          end_day: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按交易日读取持仓盈亏合计（每个交易日一行）
+
+        Args:
+            start_day: 起始交易日（含）
+            end_day: 结束交易日（含）
+
+        Returns:
+            字典列表：trading_day、instruments、long_volume、short_volume、
+            position_profit、close_profit、total_profit
+        """
+        sql = ("SELECT trading_day, COUNT(*) AS instruments, SUM(long_volume) AS long_volume, "
+               "SUM(short_volume) AS short_volume, SUM(position_profit) AS position_profit, "
+               "SUM(close_profit) AS close_profit, "
+               "SUM(position_profit + close_profit) AS total_profit "
+               "FROM daily_position_summary WHERE 1=1")
+        params = []
+        if start_day:
+            sql += " AND trading_day >= %s"
+            params.append(start_day)
+        if end_day:
+            sql += " AND trading_day <= %s"
+            params.append(end_day)
+        sql += " GROUP BY trading_day ORDER BY trading_day"
+        return self._fetch_all(sql, params, "盈亏历史")
+
+    # ------------------------------------------------------------------
+    # 分层保留
+    #
+    # RetentionManager 决定哪些交易日移出明细表，这里提供分批移动/删除和归档目录。
+    # 每批在一个短事务内按主键复制并删除，批间暂停，不会长时间持锁或撑大回滚段
+    # ------------------------------------------------------------------
+    def _create_history_table(self, table: str):
+        """按明细表结构建 history 表（不分区）"""
+        history = HISTORY_TABLES[table]
+        conn = self._get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {history} LIKE {table}")
+                if self._get_partitions(cursor, history):
+                    cursor.execute(f"ALTER TABLE {history} REMOVE PARTITIONING")
+            conn.commit()
+        finally:
+            conn.close()
+        self.reload_schema()
+
+    def history_location(self, table: str, trading_day: str) -> Optional[str]:
+        """
+        查询交易日的归档位置
+
+        Returns:
+            'table'（history 表）、'table:<表名>'（整体换出的行情分区）、归档文件路径，
+            未归档返回 None
+        """
+        rows = self._fetch_all(
+            "SELECT location FROM archive_catalog WHERE table_name = %s AND trading_day = %s",
+            [table, str(trading_day)], "归档目录"
+        )
+        return rows[0]['location'] if rows else None
+
+    def archived_days(self, table: str) -> Dict[str, str]:
+        """
+        列出某明细表已归档的交易日
+
+        Returns:
+            {交易日: 归档位置}
+        """
+        rows = self._fetch_all(
+            "SELECT trading_day, location FROM archive_catalog WHERE table_name = %s",
+            [table], "归档目录"
+        )
+        return {row['trading_day']: row['location'] for row in rows}
+
+    def _archive_locations(self, table: str) -> Dict[str, str]:
+        """
+        按交易日查询时使用的归档目录（内存副本）
+
+        本进程内的 mark_archived 会立即使副本失效；其他进程登记的归档在
+        archive_catalog_ttl 秒内可见。读取失败时不缓存，下次查询重新读取
+
+        Returns:
+            {交易日: 归档位置}
+        """
+        now = time.monotonic()
+        with self._archive_lock:
+            cached = self._archive_catalog.get(table)
+        if cached is not None and now - cached[0] < self.archive_catalog_ttl:
+            return cached[1]
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT trading_day, location FROM archive_catalog WHERE table_name = %s",
+                    [table]
+                )
+                locations = {str(row['trading_day']): row['location'] for row in cursor.fetchall()}
+        except Error as e:
+            logger.error(f"查询归档目录失败: {e}")
+            return {}
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._archive_lock:
+            self._archive_catalog[table] = (now, locations)
+        return locations
+
+    def _invalidate_archive_catalog(self, table: str):
+        with self._archive_lock:
+            self._archive_catalog.pop(table, None)
+
+    def mark_archived(self, table: str, trading_day: str, location: str,
+                      row_count: Optional[int] = None) -> bool:
+        """
+        在归档目录中登记交易日的归档位置，之后 query_* 按该位置读取这一天
+
+        Args:
+            table: 明细表
+            trading_day: 交易日
+            location: 'table' 或归档文件路径
+            row_count: 归档行数
+
+        Returns:
+            是否成功
+        """
+        columns = ('table_name', 'trading_day', 'location', 'row_count')
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                cursor.execute(self._upsert_sql('archive_catalog', columns, columns[2:]),
+                               {'table_name': table, 'trading_day': str(trading_day),
+                                'location': location, 'row_count': row_count})
+            conn.commit()
+            return True
+        except Error as e:
+            logger.error(f"登记归档目录失败: {e}")
+            return False
+        finally:
+            # 提交结果不确定时也丢弃内存副本，下次查询重新读取
+            self._invalidate_archive_catalog(table)
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def move_to_history(self, table: str, trading_day: str, batch_size: int = 5000,
+                        pause: float = 0.05) -> int:
+        """
+        把一个交易日的明细分批移入 history 表
+
+        先在归档目录登记，移动过程中按该交易日查询会同时读两张表，结果始终完整；
+        中途失败或中断后再次调用会从剩余的行继续。
+        market_data 中有独立日分区的交易日用 EXCHANGE PARTITION 整体换出到
+        market_data_arch_<交易日>（见 _exchange_day_partition），不逐行复制
+
+        Args:
+            table: daily_orders/daily_positions/market_data
+            trading_day: 交易日
+            batch_size: 每批移动的行数
+            pause: 每批提交后的休眠秒数
+
+        Returns:
+            本次移动的行数
+        """
+        moved = self._exchange_day_partition(table, trading_day, batch_size, pause)
+        if moved is not None:
+            return moved
+        history = HISTORY_TABLES[table]
+        try:
+            self._create_history_table(table)
+        except Error as e:
+            logger.error(f"创建 {history} 失败: {e}")
+            return 0
+        if self.is_compact(table) != self.is_compact(history):
+            logger.error(f"{table} 与 {history} 的存储结构不一致（紧凑化迁移前后），请先迁移 {history}")
+            return 0
+        if not self.mark_archived(table, trading_day, 'table'):
+            return 0
+        moved = self._drain_day(table, trading_day, batch_size, pause, history)
+        count = self._fetch_all(
+            f"SELECT COUNT(*) AS n FROM {history} WHERE trading_day = %s",
+            [self._day_param(history, trading_day)], "归档行数"
+        )
+        if count:
+            self.mark_archived(table, trading_day, 'table', int(count[0]['n']))
+        return moved
+
+    def _exchange_day_partition(self, table: str, trading_day: str, batch_size: int,
+                                pause: float) -> Optional[int]:
+        """
+        把 market_data 的日分区整体换出到 market_data_arch_<交易日> 并删除该分区
+
+        先登记归档位置 'table:market_data_arch_<交易日>'，换出只修改元数据；
+        换出后迟到的同一交易日行情落在相邻分区，随后分批移入同一张表
+
+        Returns:
+            移出的行数；该交易日没有独立分区（也未曾换出）时返回 None，由调用方分批移动
+        """
+        if table != 'market_data':
+            return None
+        arch_table = _ARCH_TABLE_PREFIX + str(trading_day)
+        location = 'table:' + arch_table
+        resume = self.history_location(table, trading_day) == location
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                name = self._day_partition(cursor, table, trading_day)
+                if name is None and not resume:
+                    return None
+                if name is not None:
+                    self._create_exchange_table(cursor, arch_table)
+                    self.reload_schema()
+                    if not self.mark_archived(table, trading_day, location):
+                        return 0
+                    cursor.execute(f"SELECT COUNT(*) AS n FROM market_data PARTITION ({name})")
+                    exchanged = int(cursor.fetchone()['n'])
+                    self._swap_out_partition(cursor, name, arch_table)
+                    logger.info(f"market_data 分区 {name} 已换出到 {arch_table}（{exchanged} 行）")
+                else:
+                    exchanged = 0
+            conn.commit()
+        except Error as e:
+            logger.error(f"换出 market_data 交易日 {trading_day} 的分区失败: {e}")
+            return 0
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        moved = exchanged + self._drain_day(table, trading_day, batch_size, pause, arch_table)
+        count = self._fetch_all(f"SELECT COUNT(*) AS n FROM {arch_table}", [], "归档行数")
+        if count:
+            self.mark_archived(table, trading_day, location, int(count[0]['n']))
+        return moved
+
+    def purge_day(self, table: str, trading_day: str, batch_size: int = 5000,
+                  pause: float = 0.05) -> int:
+        """
+        分批删除一个交易日的明细（该交易日已写入归档文件并登记后使用）
+
+        market_data 中有独立日分区的交易日直接删除分区，剩余的行（迟到的行情）再分批删除
+
+        Args:
+            table: daily_orders/daily_positions/market_data
+            trading_day: 交易日
+            batch_size: 每批删除的行数
+            pause: 每批提交后的休眠秒数
+
+        Returns:
+            删除的行数
+        """
+        dropped = 0
+        conn = None
+        try:
+            conn = self._get_connection()
+            with conn.cursor() as cursor:
+                name = self._day_partition(cursor, table, trading_day)
+                if name is not None:
+                    cursor.execute(f"SELECT COUNT(*) AS n FROM market_data PARTITION ({name})")
+                    dropped = int(cursor.fetchone()['n'])
+                    cursor.execute(f"ALTER TABLE market_data DROP PARTITION {name}")
+                    logger.info(f"market_data 分区 {name} 已删除（{dropped} 行）")
+            conn.commit()
+        except Error as e:
+            logger.error(f"删除 market_data 交易日 {trading_day} 的分区失败: {e}")
+            dropped = 0
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return dropped + self._drain_day(table, trading_day, batch_size, pause, None)
+
+    def _drain_day(self, table: str, trading_day: str, batch_size: int, pause: float,
+                   history: Optional[str]) -> int:
+        """按主键分批把一个交易日的行复制到 history（为 None 时不复制）并删除"""
+        day = self._day_param(table, trading_day)
+        drained = 0
+        while True:
+            conn = None
+            try:
+                conn = self._get_connection()
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT id FROM {table} WHERE trading_day = %s ORDER BY id LIMIT %s",
+                        (day, batch_size)
+                    )
+                    ids = [row['id'] for row in cursor.fetchall()]
+                    if not ids:
+                        break
+                    marks = ', '.join(['%s'] * len(ids))
+                    if history:
+                        cursor.execute(
+                            f"INSERT INTO {history} SELECT * FROM {table} WHERE id IN ({marks})", ids)
+                    cursor.execute(f"DELETE FROM {table} WHERE id IN ({marks})", ids)
+                conn.commit()
+                drained += len(ids)
+            except Error as e:
+                logger.error(f"归档 {table} 交易日 {trading_day} 失败: {e}")
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                break
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            if pause:
+                time.sleep(pause)
+        if drained:
+            logger.info(f"{table} 交易日 {trading_day} 已移出 {drained} 行")
+        return drained
+
+    # ------------------------------------------------------------------
+    # 一致性快照
+    # ------------------------------------------------------------------
+    @_timed
+    def write_snapshot(self, orders: Optional[List[Dict[str, Any]]] = None,
+                       positions: Optional[List[Dict[str, Any]]] = None,
+                       trades: Optional[List[Dict[str, Any]]] = None,
+                       accounts: Optional[List[Dict[str, Any]]] = None,
+                       trading_day: Optional[str] = None) -> Optional[int]:
+        """
+        在一个事务内写入一个下载周期的委托、持仓、成交和资金
+
+        与上一版本相比新增/变化的记录生成新版本，变化和消失的旧版本在本快照失效；
+        变化的委托和持仓同时写入 daily_orders/daily_positions，已平掉的持仓从
+        daily_positions 删除。某类数据为 None 表示本周期未查询或查询失败，沿用之前的版本；
+        列表（包括空列表）是完整的查询结果，其中没有的持仓、资金判定为消失，
+        因此调用方不能把失败或不完整的查询结果以空列表传入
+
+        Args:
+            orders: 委托列表
+            positions: 持仓列表，空列表表示已全部平仓
+            trades: 成交列表
+            accounts: 资金账户列表
+            trading_day: 交易日（通常取登录返回的交易日），为空时取记录中的交易日；
+                         夜盘时自然日与交易日不同，因此不以当天日期代替
+
+        Returns:
+            快照编号，失败或无法确定交易日时返回 None
+        """
+        data = {'orders': orders, 'positions': positions, 'trades': trades,
+                'accounts': accounts}
+        if all(rows is None for rows in data.values()):
+            return None
+        if not trading_day:
+            trading_day = next((str(row['trading_day']) for rows in data.values() if rows
+                                for row in rows if row.get('trading_day')), None)
+        if not trading_day:
+            logger.error("写入快照失败: 未指定交易日，记录中也没有交易日")
+            return None
+
+        with self._snapshot_lock:
+            conn = None
+            try:
+                conn = self._get_connection()
+                with conn.cursor() as cursor:
+                    # 加锁读取上一个编号：并发写入快照的进程在此排队，编号与提交顺序一致
+                    cursor.execute(
+                        f"SELECT COALESCE(MAX(snapshot_id), 0) AS last_id FROM snapshot{self._for_update}"
+                    )
+                    snapshot_id = int(cursor.fetchone()['last_id']) + 1
+                    changed = {}
+                    for kind in SNAPSHOT_KINDS:
+                        if data[kind] is not None:
+                            changed[kind] = self._write_snapshot_rows(
+                                cursor, snapshot_id, trading_day, kind, data[kind])
+
+                    # 当前状态表只写有变化的委托和持仓
+                    if changed.get('orders') and changed['orders'][0]:
+                        cursor.executemany(
+                            self._upsert_sql('daily_orders', ORDER_COLUMNS, ORDER_UPDATE_COLUMNS),
+                            self._order_rows(changed['orders'][0])
+                        )
+                        self._refresh_order_summary(cursor, changed['orders'][0])
+                    if changed.get('positions'):
+                        upserts, removed = changed['positions']
+                        upserts = [dict(p, trading_day=trading_day) for p in upserts]
+                        if upserts:
+                            cursor.executemany(_POSITION_REPLACE_SQL,
+                                               self._encode_rows('daily_positions', upserts))
+                        if removed:
+                            cursor.executemany(_POSITION_DELETE_SQL, self._position_keys(removed))
+                        self._refresh_position_summary(cursor, upserts + removed)
+
+                    counts = {k: (len(v) if v is not None else None) for k, v in data.items()}
+                    cursor.execute(
+                        "INSERT INTO snapshot (snapshot_id, trading_day, order_count, position_count, "
+                        "trade_count, account_count, changed_rows) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                        (snapshot_id, trading_day, counts['orders'], counts['positions'],
+                         counts['trades'], counts['accounts'],
+                         sum(len(u) + len(r) for u, r in changed.values()))
+                    )
+                conn.commit()
+                if changed.get('orders'):
+                    self._invalidate_results('daily_orders', changed['orders'][0])
+                if changed.get('positions') and any(changed['positions']):
+                    self._invalidate_results('daily_positions', [{'trading_day': trading_day}])
+                self._count_rows(sum(len(u) + len(r) for u, r in changed.values()))
+                logger.info(f"快照 {snapshot_id} 已写入（交易日 {trading_day}，"
+                            f"变化 {sum(len(u) + len(r) for u, r in changed.values())} 条）")
+                return snapshot_id
+            except Error as e:
+                logger.error(f"写入快照失败: {e}")
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                return None
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def _write_snapshot_rows(self, cursor, snapshot_id: int, trading_day: str, kind: str,
+                             rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        把一类数据与当前有效版本比对并写入新版本（在调用方的事务内）
+
+        内容哈希与变更检测层相同（change_detector.content_hash），取记录的全部字段
+
+        Returns:
+            (新增/变化的记录, 消失的记录)
+        """
+        from change_detector import content_hash
+        current: Dict[str, Dict[str, Any]] = {}
+        repeats: Dict[str, int] = {}
+        for row in rows:
+            key = snapshot_row_key(kind, row)
+            if key.startswith('R:'):
+                # 没有自然键的委托按出现顺序区分
+                repeats[key] = repeats.get(key, 0) + 1
+                if repeats[key] > 1:
+                    key = f"{key}#{repeats[key]}"
+            current[key] = row
+
+        cursor.execute(
+            "SELECT row_key, row_hash, data FROM snapshot_rows "
+            "WHERE kind = %s AND trading_day = %s AND valid_to IS NULL",
+            (kind, trading_day)
+        )
+        open_rows = {r['row_key']: r for r in cursor.fetchall()}
+
+        inserts, closes, upserts, removed = [], [], [], []
+        for key, row in current.items():
+            payload = _snapshot_json(row)
+            digest = content_hash(row, sorted(row))
+            old = open_rows.get(key)
+            if old is not None and old['row_hash'] == digest:
+                continue
+            if old is not None:
+                closes.append(key)
+            inserts.append((kind, trading_day, key, snapshot_id,
+                            str(row.get('instrument_id') or ''), digest, payload))
+            upserts.append(row)
+        if kind in _SNAPSHOT_REMOVABLE:
+            for key, old in open_rows.items():
+                if key not in current:
+                    closes.append(key)
+                    removed.append(dict(json.loads(old['data']), trading_day=trading_day))
+
+        if closes:
+            cursor.executemany(
+                "UPDATE snapshot_rows SET valid_to = %s WHERE kind = %s AND trading_day = %s "
+                "AND row_key = %s AND valid_to IS NULL",
+                [(snapshot_id, kind, trading_day, key) for key in closes]
+            )
+        if inserts:
+            cursor.executemany(
+                "INSERT INTO snapshot_rows (kind, trading_day, row_key, valid_from, instrument_id, "
+                "row_hash, data) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                inserts
+            )
+        return upserts, removed
+
+    def latest_snapshot_id(self, trading_day: Optional[str] = None) -> Optional[int]:
+        """
+        最近一个已提交的快照编号
+
+        Args:
+            trading_day: 交易日，为空表示全部
+
+        Returns:
+            快照编号，没有快照时返回 None
+        """
+        snapshots = self.list_snapshots(trading_day, limit=1)
+        return snapshots[0]['snapshot_id'] if snapshots else None
+
+    @_timed
+    def list_snapshots(self, trading_day: Optional[str] = None,
+                       limit: int = 100) -> List[Dict[str, Any]]:
+        """按编号倒序列出快照及各类数据条数"""
+        sql = "SELECT * FROM snapshot"
+        params = []
+        if trading_day:
+            sql += " WHERE trading_day = %s"
+            params.append(trading_day)
+        sql += " ORDER BY snapshot_id DESC LIMIT %s"
+        params.append(limit)
+        return self._fetch_all(sql, params, "快照列表")
+
+    @_timed
+    def query_snapshot(self, snapshot_id: Optional[int] = None,
+                       kinds: Sequence[str] = SNAPSHOT_KINDS,
+                       instrument_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        读出“截至快照 N”的一致视图
+
+        只按版本区间过滤，不加锁；之后写入的快照不会改变同一 N 的读取结果
+
+        Args:
+            snapshot_id: 快照编号，为空时取最新快照
+            kinds: 要读取的数据类型
+            instrument_id: 合约代码（资金不受此条件限制）
+
+        Returns:
+            {'snapshot': 快照信息, 'orders': [...], 'positions': [...], ...}，
+            快照不存在时返回空字典
+        """
+        if snapshot_id is None:
+            snapshots = self.list_snapshots(limit=1)
+        else:
+            snapshots = self._fetch_all("SELECT * FROM snapshot WHERE snapshot_id = %s",
+                                        [snapshot_id], "快照")
+        if not snapshots:
+            return {}
+        meta = snapshots[0]
+        result = {'snapshot': meta}
+        for kind in kinds:
+            sql = ("SELECT data FROM snapshot_rows WHERE kind = %s AND trading_day = %s "
+                   "AND valid_from <= %s AND (valid_to IS NULL OR valid_to > %s)")
+            params = [kind, meta['trading_day'], meta['snapshot_id'], meta['snapshot_id']]
+            if instrument_id and kind != 'accounts':
+                sql += " AND instrument_id = %s"
+                params.append(instrument_id)
+            sql += " ORDER BY row_key"
+            result[kind] = [json.loads(r['data'])
+                            for r in self._fetch_all(sql, params, "快照记录")]
+        return result
+
+    def _orders_query(self, trading_day: Optional[str] = None,
+                      instrument_id: Optional[str] = None,
+                      limit: int = 1000, table: str = 'daily_orders'):
+        """构造委托查询SQL，排序与 idx_day_time / idx_inst_day_time 一致"""
+        sql = f"SELECT * FROM {table} WHERE 1=1"
+        params = []
+        
+        if trading_day:
+            sql += " AND trading_day = %s"
+            params.append(self._day_param(table, trading_day))
+        
+        if instrument_id:
+            sql += " AND instrument_id = %s"
+            params.append(instrument_id)
+        
+        sql += " ORDER BY trading_day DESC, order_time DESC LIMIT %s"
+        params.append(limit)
+        return sql, params
+
+    def _positions_query(self, trading_day: Optional[str] = None,
                          instrument_id: Optional[str] = None,
-                         limit: int = 1000) -> List[Dict[str, Any]]:
-        """查询行情数据，返回字典列表"""
+                         table: str = 'daily_positions'):
+        """构造持仓查询SQL，排序与 idx_day_inst_dir / uk_position 一致"""
+        sql = f"SELECT * FROM {table} WHERE 1=1"
+        params = []
+        
+        if trading_day:
+            sql += " AND trading_day = %s"
+            params.append(self._day_param(table, trading_day))
+        
+        if instrument_id:
+            sql += " AND instrument_id = %s"
+            params.append(instrument_id)
+        
+        sql += " ORDER BY instrument_id, direction"
+        return sql, params
+
+    def _market_data_query(self, trading_day: Optional[str] = None,
+                           instrument_id: Optional[str] = None,
+                           limit: int = 1000, table: str = 'market_data'):
+        """构造行情查询SQL，排序与 idx_day_time / idx_inst_day_time 一致"""
+        sql = f"SELECT * FROM {table} WHERE 1=1"
+        params = []
+        
+        if trading_day:
+            sql += " AND trading_day = %s"
+            params.append(self._day_param(table, trading_day))
+        
+        if instrument_id:
+            sql += " AND instrument_id = %s"
+            params.append(instrument_id)
+        
+        sql += " ORDER BY trading_day DESC, update_time DESC LIMIT %s"
+        params.append(limit)
+        return sql, params
+
+    def _instrument_info_query(self, instrument_id: Optional[str] = None,
+                               exchange_id: Optional[str] = None,
+                               is_trading: Optional[bool] = None):
+        """构造合约参数查询SQL"""
+        sql = "SELECT * FROM instrument_info WHERE 1=1"
+        params = []
+        
+        if instrument_id:
+            sql += " AND instrument_id = %s"
+            params.append(instrument_id)
+        
+        if exchange_id:
+            sql += " AND exchange_id = %s"
+            params.append(exchange_id)
+        
+        if is_trading is not None:
+            sql += " AND is_trading = %s"
+            params.append(1 if is_trading else 0)
+        
+        sql += " ORDER BY instrument_id"
+        return sql, params
+
+    def _fetch_all(self, sql: str, params: list, what: str) -> List[Dict[str, Any]]:
+        """执行查询并返回全部结果，失败时记录日志并返回空列表"""
+        conn = None
         try:
             conn = self._get_connection()
             with conn.cursor() as cursor:
-                sql = "SELECT * FROM market_data WHERE 1=1"
-                params = []
-                
-                if trading_day:
-                    sql += " AND trading_day = %s"
-                    params.append(trading_day)
-                
-                if instrument_id:
-                    sql += " AND instrument_id = %s"
-                    params.append(instrument_id)
-                
-                sql += " ORDER BY update_time DESC LIMIT %s"
-                params.append(limit)
-                
                 cursor.execute(sql, params)
                 rows = cursor.fetchall()
-                return rows
+                return [self._decode_row(row) for row in rows]
         except Error as e:
-            logger.error(f"查询行情数据失败: {e}")
+            logger.error(f"查询{what}失败: {e}")
             return []
         finally:
             try:
                 conn.close()
             except Exception:
                 pass
+
+    @_timed
+    def query_orders(self, trading_day: Optional[str] = None, 
+                    instrument_id: Optional[str] = None,
+                    limit: int = 1000) -> List[Dict[str, Any]]:
+        """查询委托数据，返回字典列表（已归档的交易日自动读取历史数据，已结算交易日可走结果缓存）"""
+        build = functools.partial(self._orders_query, trading_day, instrument_id, limit)
+        load = functools.partial(self._query_with_history, 'daily_orders', trading_day, instrument_id,
+                                 limit, build, "委托数据")
+        return self._cached_query('daily_orders', trading_day, (instrument_id, limit), load)
+    
+    @_timed
+    def query_positions(self, trading_day: Optional[str] = None,
+                       instrument_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """查询持仓数据，返回字典列表（已归档的交易日自动读取历史数据，已结算交易日可走结果缓存）"""
+        build = functools.partial(self._positions_query, trading_day, instrument_id)
+        load = functools.partial(self._query_with_history, 'daily_positions', trading_day, instrument_id,
+                                 None, build, "持仓数据")
+        return self._cached_query('daily_positions', trading_day, (instrument_id,), load)
     
+    @_timed
+    def query_market_data(self, trading_day: Optional[str] = None,
+                         instrument_id: Optional[str] = None,
+                         limit: int = 1000) -> List[Dict[str, Any]]:
+        """查询行情数据，返回字典列表（已归档的交易日自动读取历史数据，已结算交易日可走结果缓存）"""
+        build = functools.partial(self._market_data_query, trading_day, instrument_id, limit)
+        load = functools.partial(self._query_with_history, 'market_data', trading_day, instrument_id,
+                                 limit, build, "行情数据")
+        return self._cached_query('market_data', trading_day, (instrument_id, limit), load)
+
+    def _query_with_history(self, table: str, trading_day: Optional[str],
+                            instrument_id: Optional[str], limit: Optional[int],
+                            build, what: str) -> List[Dict[str, Any]]:
+        """
+        按交易日查询时合并已归档的数据
+
+        归档在 history 表（或换出的分区表）的交易日同时读明细表和该表（移动过程中两边各有一部分）；
+        归档为文件的交易日只读文件（文件写完整后才从明细表删除）
+        """
+        location = self._archive_locations(table).get(str(trading_day)) if trading_day else None
+        if location is None:
+            sql, params = build(table=table)
+            return self._fetch_all(sql, params, what)
+        history = history_source(table, location)
+        if history is not None:
+            rows = []
+            for source in (table, history):
+                sql, params = build(table=source)
+                rows.extend(self._fetch_all(sql, params, what))
+        else:
+            from retention_manager import read_archive_file
+            try:
+                rows = [row for row in read_archive_file(location)
+                        if not instrument_id or row.get('instrument_id') == instrument_id]
+            except (OSError, ValueError) as e:
+                logger.error(f"读取归档文件失败: {location} {e}")
+                return []
+        columns, descending = _HISTORY_ORDER[table]
+        rows.sort(key=lambda row: tuple(str(row.get(c) or '') for c in columns), reverse=descending)
+        return rows[:limit] if limit else rows
+    
+    @_timed
     def query_instrument_info(self, instrument_id: Optional[str] = None,
                              exchange_id: Optional[str] = None,
                              is_trading: Optional[bool] = None) -> List[Dict[str, Any]]:
         """查询合约参数，返回字典列表"""
+        sql, params = self._instrument_info_query(instrument_id, exchange_id, is_trading)
+        return self._fetch_all(sql, params, "合约参数")
+
+    @_timed
+    def query_latest_quotes(self, instrument_ids: Optional[List[str]] = None,
+                            exchange_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查询各合约最新行情（读 market_data_latest，每个合约一行）
+        
+        Args:
+            instrument_ids: 合约代码列表，为空表示全部合约
+            exchange_id: 交易所代码
+            
+        Returns:
+            字典列表，字段与 market_data 相同
+        """
+        sql = "SELECT * FROM market_data_latest WHERE 1=1"
+        params = []
+        
+        if instrument_ids:
+            sql += f" AND instrument_id IN ({', '.join(['%s'] * len(instrument_ids))})"
+            params.extend(instrument_ids)
+        
+        if exchange_id:
+            sql += " AND exchange_id = %s"
+            params.append(exchange_id)
+        
+        sql += " ORDER BY instrument_id"
+        return self._fetch_all(sql, params, "最新行情")
+
+    def _bars_query(self, instrument_id: str, period: str = '1m',
+                    start=None, end=None, trading_day: Optional[str] = None,
+                    limit: Optional[int] = None):
+        """构造K线查询SQL，返回 (sql, params)"""
+        sql = "SELECT * FROM kline WHERE instrument_id = %s AND period = %s"
+        params = [instrument_id, period]
+        if start:
+            sql += " AND bar_time >= %s"
+            params.append(start)
+        if end:
+            sql += " AND bar_time < %s"
+            params.append(end)
+        if trading_day:
+            sql += " AND trading_day = %s"
+            params.append(trading_day)
+        if limit:
+            # 取最近的 limit 根，返回前再按时间正序排列
+            sql += " ORDER BY bar_time DESC LIMIT %s"
+            params.append(limit)
+        else:
+            sql += " ORDER BY bar_time"
+        return sql, params
+
+    @_timed
+    def query_bars(self, instrument_id: str, period: str = '1m',
+                   start=None, end=None, trading_day: Optional[str] = None,
+                   limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        查询K线，按时间正序返回
+        
+        Args:
+            instrument_id: 合约代码
+            period: 周期（1m/5m/15m/1d）
+            start: 起始时间（含），datetime 或 'YYYY-MM-DD HH:MM:SS'
+            end: 结束时间（不含）
+            trading_day: 交易日
+            limit: 只返回最近的 limit 根
+            
+        Returns:
+            字典列表，字段见 KLINE_COLUMNS
+        """
+        sql, params = self._bars_query(instrument_id, period, start, end, trading_day, limit)
+        rows = self._fetch_all(sql, params, "K线")
+        if limit:
+            rows.reverse()
+        return rows
+
+    # ------------------------------------------------------------------
+    # 流式读取与键集分页
+    #
+    # 按 (trading_day, id) 做键集分页：逐个交易日推进，交易日内按 id 翻页。
+    # market_data 按交易日分区且主键为 (id, trading_day)，交易日内按 id
+    # 翻页是单个分区上的主键范围扫描；其余表单日数据量小，不需要额外索引。
+    # 每页通过 SSDictCursor 分批取回，内存占用只与 fetch_size 有关。
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _filters(**conditions) -> Tuple[str, list]:
+        """把非空的等值条件拼成 WHERE 子句"""
+        where, params = ["1=1"], []
+        for column, value in conditions.items():
+            if value is None or value == '':
+                continue
+            where.append(f"{column} = %s")
+            params.append(value)
+        return " AND ".join(where), params
+
+    def _keyset_query(self, table: str, where: str, params: list, by_day: bool,
+                      trading_day: Optional[str], after_id: Optional[int],
+                      limit: int, descending: bool = False):
+        """构造一页键集分页SQL：给定交易日内 id 大于(倒序时小于) after_id 的记录"""
+        sql = f"SELECT * FROM {table} WHERE {where}"
+        params = list(params)
+        if by_day:
+            sql += " AND trading_day = %s"
+            params.append(trading_day)
+        if after_id is not None:
+            sql += " AND id < %s" if descending else " AND id > %s"
+            params.append(after_id)
+        sql += f" ORDER BY id {'DESC' if descending else 'ASC'} LIMIT %s"
+        params.append(limit)
+        return sql, params
+
+    @staticmethod
+    def _next_trading_day(cursor, table: str, where: str, params: list,
+                          after: Optional[str], descending: bool) -> Optional[str]:
+        """查找满足条件的下一个交易日，after 为空时返回第一个交易日"""
+        sql = f"SELECT {'MAX' if descending else 'MIN'}(trading_day) AS day FROM {table} WHERE {where}"
+        params = list(params)
+        if after is not None:
+            sql += " AND trading_day < %s" if descending else " AND trading_day > %s"
+            params.append(after)
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        return row['day'] if row else None
+
+    def _iter_keyset(self, table: str, where: str, params: list, by_day: bool = True,
+                     page_size: int = 5000, fetch_size: int = 1000,
+                     page_token: Optional[str] = None,
+                     descending: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        按键集分页流式读取一张表
+
+        使用独占连接，避免调用方在迭代过程中借用同一连接；
+        每页结束后提交事务，长时间导出不会一直持有一致性读视图。
+        """
+        page_size = max(1, int(page_size))
+        fetch_size = max(1, min(int(fetch_size), page_size))
+        day, after_id = _decode_page_token(page_token) if page_token else (None, None)
+        if day is not None:
+            day = self._day_param(table, day)
+
+        conn = None
         try:
-            conn = self._get_connection()
+            conn = self._pool.acquire(exclusive=True)
             with conn.cursor() as cursor:
-                sql = "SELECT * FROM instrument_info WHERE 1=1"
-                params = []
-                
-                if instrument_id:
-                    sql += " AND instrument_id = %s"
-                    params.append(instrument_id)
-                
-                if exchange_id:
-                    sql += " AND exchange_id = %s"
-                    params.append(exchange_id)
-                
-                if is_trading is not None:
-                    sql += " AND is_trading = %s"
-                    params.append(1 if is_trading else 0)
-                
-                sql += " ORDER BY instrument_id"
-                
-                cursor.execute(sql, params)
-                rows = cursor.fetchall()
-                return rows
+                if by_day and day is None:
+                    day = self._next_trading_day(cursor, table, where, params, None, descending)
+            while not by_day or day is not None:
+                sql, page_params = self._keyset_query(
+                    table, where, params, by_day, day, after_id, page_size, descending)
+                count = 0
+                with conn.cursor(SSDictCursor) as cursor:
+                    cursor.execute(sql, page_params)
+                    while True:
+                        rows = cursor.fetchmany(fetch_size)
+                        if not rows:
+                            break
+                        for row in rows:
+                            count += 1
+                            after_id = row['id']
+                            yield self._decode_row(row)
+                conn.commit()
+                if count == page_size:
+                    continue
+                if not by_day:
+                    break
+                with conn.cursor() as cursor:
+                    day = self._next_trading_day(cursor, table, where, params, day, descending)
+                after_id = None
         except Error as e:
-            logger.error(f"查询合约参数失败: {e}")
-            return []
+            logger.error(f"流式读取 {table} 失败: {e}")
+            raise
         finally:
-            try:
+            if conn:
                 conn.close()
-            except Exception:
-                pass
 
-    def get_distinct_trading_days(self, table_name: str):
-        """获取指定表中已存在的去重交易日列表，按交易日倒序排序"""
+    def _query_page(self, table: str, where: str, params: list, by_day: bool,
+                    page_size: int, page_token: Optional[str], descending: bool,
+                    what: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """取一页数据及下一页令牌，失败时返回空页"""
+        page_size = max(1, int(page_size))
+        rows = []
+        # 多取一条用于判断是否还有下一页
+        it = self._iter_keyset(table, where, params, by_day, page_size + 1,
+                               page_size + 1, page_token, descending)
+        try:
+            for row in it:
+                rows.append(row)
+                if len(rows) > page_size:
+                    break
+        except Error:
+            logger.error(f"分页查询{what}失败")
+            return [], None
+        finally:
+            it.close()
+        if len(rows) <= page_size:
+            return rows, None
+        last = rows[page_size - 1]
+        return rows[:page_size], _encode_page_token(last.get('trading_day') if by_day else None,
+                                                    last['id'])
+
+    def iter_orders(self, trading_day: Optional[str] = None,
+                    instrument_id: Optional[str] = None, page_size: int = 5000,
+                    fetch_size: int = 1000, page_token: Optional[str] = None,
+                    descending: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        流式读取委托数据，按 (trading_day, id) 顺序逐条返回
+        
+        Args:
+            trading_day: 交易日
+            instrument_id: 合约代码
+            page_size: 每条SQL读取的行数
+            fetch_size: 每次从服务端取回的行数
+            page_token: 从该令牌之后继续读取
+            descending: 是否按交易日和 id 倒序
+            
+        Returns:
+            逐条产出字典的生成器，数据库错误时记录日志并抛出 pymysql.Error
+        """
+        where, params = self._filters(trading_day=self._day_param('daily_orders', trading_day),
+                                      instrument_id=instrument_id)
+        return self._iter_keyset('daily_orders', where, params, True,
+                                 page_size, fetch_size, page_token, descending)
+
+    def iter_positions(self, trading_day: Optional[str] = None,
+                       instrument_id: Optional[str] = None, page_size: int = 5000,
+                       fetch_size: int = 1000, page_token: Optional[str] = None,
+                       descending: bool = False) -> Iterator[Dict[str, Any]]:
+        """流式读取持仓数据，参数同 iter_orders"""
+        where, params = self._filters(trading_day=self._day_param('daily_positions', trading_day),
+                                      instrument_id=instrument_id)
+        return self._iter_keyset('daily_positions', where, params, True,
+                                 page_size, fetch_size, page_token, descending)
+
+    def iter_market_data(self, trading_day: Optional[str] = None,
+                         instrument_id: Optional[str] = None, page_size: int = 5000,
+                         fetch_size: int = 1000, page_token: Optional[str] = None,
+                         descending: bool = False) -> Iterator[Dict[str, Any]]:
+        """流式读取行情数据，参数同 iter_orders"""
+        where, params = self._filters(trading_day=self._day_param('market_data', trading_day),
+                                      instrument_id=instrument_id)
+        return self._iter_keyset('market_data', where, params, True,
+                                 page_size, fetch_size, page_token, descending)
+
+    def iter_instrument_info(self, exchange_id: Optional[str] = None,
+                             is_trading: Optional[bool] = None, page_size: int = 5000,
+                             fetch_size: int = 1000, page_token: Optional[str] = None,
+                             descending: bool = False) -> Iterator[Dict[str, Any]]:
+        """流式读取合约参数，合约表没有交易日，按 id 翻页"""
+        where, params = self._filters(
+            exchange_id=exchange_id,
+            is_trading=None if is_trading is None else (1 if is_trading else 0))
+        return self._iter_keyset('instrument_info', where, params, False,
+                                 page_size, fetch_size, page_token, descending)
+
+    @_timed
+    def query_orders_page(self, trading_day: Optional[str] = None,
+                          instrument_id: Optional[str] = None, page_size: int = 200,
+                          page_token: Optional[str] = None,
+                          descending: bool = True) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        分页查询委托数据，不使用 OFFSET
+        
+        Args:
+            trading_day: 交易日
+            instrument_id: 合约代码
+            page_size: 每页行数
+            page_token: 上一页返回的令牌，为空表示第一页
+            descending: 是否最新的在前
+            
+        Returns:
+            (本页字典列表, 下一页令牌)，没有下一页时令牌为 None
+        """
+        where, params = self._filters(trading_day=self._day_param('daily_orders', trading_day),
+                                      instrument_id=instrument_id)
+        return self._query_page('daily_orders', where, params, True,
+                                page_size, page_token, descending, "委托数据")
+
+    @_timed
+    def query_positions_page(self, trading_day: Optional[str] = None,
+                             instrument_id: Optional[str] = None, page_size: int = 200,
+                             page_token: Optional[str] = None,
+                             descending: bool = True) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页查询持仓数据，参数同 query_orders_page"""
+        where, params = self._filters(trading_day=self._day_param('daily_positions', trading_day),
+                                      instrument_id=instrument_id)
+        return self._query_page('daily_positions', where, params, True,
+                                page_size, page_token, descending, "持仓数据")
+
+    @_timed
+    def query_market_data_page(self, trading_day: Optional[str] = None,
+                               instrument_id: Optional[str] = None, page_size: int = 200,
+                               page_token: Optional[str] = None,
+                               descending: bool = True) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页查询行情数据，参数同 query_orders_page"""
+        where, params = self._filters(trading_day=self._day_param('market_data', trading_day),
+                                      instrument_id=instrument_id)
+        return self._query_page('market_data', where, params, True,
+                                page_size, page_token, descending, "行情数据")
+
+    @_timed
+    def query_instrument_info_page(self, exchange_id: Optional[str] = None,
+                                   is_trading: Optional[bool] = None, page_size: int = 200,
+                                   page_token: Optional[str] = None,
+                                   descending: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页查询合约参数，按 id 翻页"""
+        where, params = self._filters(
+            exchange_id=exchange_id,
+            is_trading=None if is_trading is None else (1 if is_trading else 0))
+        return self._query_page('instrument_info', where, params, False,
+                                page_size, page_token, descending, "合约参数")
+
+    def explain(self, sql: str, params: Optional[list] = None) -> List[Dict[str, Any]]:
+        """返回SQL的执行计划（EXPLAIN 输出）"""
+        return self._fetch_all("EXPLAIN " + sql, params or [], "执行计划")
+
+    def explain_query_paths(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        对 query_* 的各种过滤组合生成执行计划
+
+        Returns:
+            {查询路径名称: EXPLAIN 输出}
+        """
+        day, inst, exch = '20250102', 'cu2501', 'SHFE'
+        shapes = {
+            'orders(day)': self._orders_query(day),
+            'orders(instrument)': self._orders_query(None, inst),
+            'orders(day, instrument)': self._orders_query(day, inst),
+            'orders()': self._orders_query(),
+            'positions(day)': self._positions_query(day),
+            'positions(instrument)': self._positions_query(None, inst),
+            'positions(day, instrument)': self._positions_query(day, inst),
+            'market_data(day)': self._market_data_query(day),
+            'market_data(instrument)': self._market_data_query(None, inst),
+            'market_data(day, instrument)': self._market_data_query(day, inst),
+            'market_data()': self._market_data_query(),
+            'market_data(keyset)': self._keyset_query(
+                'market_data', '1=1', [], True, self._day_param('market_data', day), 0, 5000),
+            'instrument_info(instrument)': self._instrument_info_query(inst),
+            'instrument_info(trading)': self._instrument_info_query(None, None, True),
+            'instrument_info(exchange, trading)': self._instrument_info_query(None, exch, True),
+            'kline(instrument, range)': self._bars_query(
+                inst, '1m', '2025-01-02 09:00:00', '2025-01-02 15:00:00'),
+            'kline(instrument, latest)': self._bars_query(inst, '1m', limit=500),
+        }
+        return {name: self.explain(sql, params) for name, (sql, params) in shapes.items()}
+
+    def get_distinct_trading_days(self, table_name: str, include_history: bool = True):
+        """获取指定表中已存在的去重交易日列表，按交易日倒序排序（默认含已归档的交易日）"""
         conn = None
         try:
             conn = self._get_connection()
@@ -538,7 +3650,10 @@ class DatabaseManager:
                 sql = f"SELECT DISTINCT trading_day FROM {table_name} ORDER BY trading_day DESC"
                 cursor.execute(sql)
                 rows = cursor.fetchall()
-                return [row['trading_day'] for row in rows if row.get('trading_day')]
+                days = {self._decode_row(row)['trading_day'] for row in rows}
+                if include_history and table_name in HISTORY_TABLES:
+                    days.update(self.archived_days(table_name))
+                return sorted((day for day in days if day), reverse=True)
         except Exception as e:
             # 这里不能直接调用 GUI 的 log，只做简单打印
             print(f"获取交易日列表失败: {e}")
@@ -549,12 +3664,51 @@ class DatabaseManager:
 
     def close(self):
         """关闭数据库连接"""
+        self.disable_spool()
         if self.connection:
             try:
                 self.connection.close()
             except Exception:
                 pass
             self.connection = None
+        self._pool.close()
+
+
+
+def create_database_manager(db_config: Dict[str, Any]) -> DatabaseManager:
+    """
+    按 config.json 的 database 配置创建存储后端
+
+    Args:
+        db_config: database 配置段，backend 为 mysql（默认）或 sqlite
+
+    Returns:
+        DatabaseManager 或 SQLiteManager 实例（接口相同），需再调用 connect()
+    """
+    backend = db_config.get('backend', 'mysql')
+    if backend == 'sqlite':
+        from sqlite_manager import SQLiteManager
+        return SQLiteManager(
+            path=db_config.get('path', './data/ctp_trading.db'),
+            cache_size_mb=db_config.get('cache_size_mb', 64),
+            mmap_size_mb=db_config.get('mmap_size_mb', 256),
+            max_idle_connections=db_config.get('max_idle_connections', 4),
+            metrics=db_config.get('metrics', True),
+            slow_query_threshold=db_config.get('slow_query_threshold', 0.5),
+        )
+    if backend != 'mysql':
+        raise ValueError(f"未知的存储后端: {backend}")
+    return DatabaseManager(
+        host=db_config.get('host', 'localhost'),
+        port=db_config.get('port', 3306),
+        user=db_config.get('user', 'root'),
+        password=db_config.get('password', ''),
+        database=db_config.get('database', 'ctp_trading'),
+        pool_size=db_config.get('pool_size', 8),
+        bulk_load=db_config.get('bulk_load', False),
+        metrics=db_config.get('metrics', True),
+        slow_query_threshold=db_config.get('slow_query_threshold', 0.5),
+    )
 
 
 if __name__ == "__main__":
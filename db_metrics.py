@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库操作指标
+DatabaseManager 的每次 insert_* / query_* 调用记为一个操作，按阶段统计耗时：
+  connect —— 从连接池借用连接（含建连）
+  execute —— execute/executemany
+  fetch   —— fetchone/fetchmany/fetchall
+  commit  —— 提交事务
+同时统计每个操作的调用次数、行数、出错次数，并记录超过阈值的慢SQL（SQL文本与参数）。
+指标保存在进程内，可导出为 Prometheus 文本格式或 JSON
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('connect', 'execute', 'fetch', 'commit')
+
+# 慢SQL记录中 SQL 文本和参数的最大长度
+_MAX_SQL_CHARS = 2000
+_MAX_PARAMS_CHARS = 500
+
+
+class Histogram:
+    """固定桶的耗时直方图（非线程安全，由 MetricsRegistry 加锁）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数（取所在桶的上界，落在 +Inf 桶时取最大值）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else 0.0,
+            'max': round(self.max, 6),
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'p99': round(self.quantile(0.99), 6),
+        }
+
+
+class _OperationStats:
+    """单个操作名的累计指标"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.duration = Histogram(buckets)
+        self.phases = {phase: Histogram(buckets) for phase in PHASES}
+
+
+class _Operation:
+    """一次进行中的操作，保存在线程的操作栈上"""
+
+    __slots__ = ('name', 'start', 'rows', 'failed')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.rows: Optional[int] = None  # 为 None 时由返回值推断
+        self.failed = False
+
+
+def _result_rows(result) -> int:
+    """由操作的返回值推断行数：写入返回条数，查询返回列表，分页返回 (列表, 令牌)"""
+    if isinstance(result, bool):
+        return 0
+    if isinstance(result, int):
+        return max(result, 0)
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    return 0
+
+
+def _label(value: str) -> str:
+    """Prometheus 标签值转义"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """
+    进程内的数据库操作指标
+
+    用法：
+        print(db_manager.metrics.to_prometheus())
+        stats = db_manager.metrics.snapshot()
+        stats['operations']['insert_market_data']['rows_per_second']
+    """
+
+    def __init__(self, slow_threshold: float = 0.5, slow_capacity: int = 100,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        初始化指标
+
+        Args:
+            slow_threshold: 单条SQL执行超过该秒数记为慢SQL，<=0 表示不记录
+            slow_capacity: 保留最近多少条慢SQL
+            buckets: 直方图桶上界（秒）
+        """
+        self.slow_threshold = slow_threshold
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ops: Dict[str, _OperationStats] = {}
+        self._errors: Dict[Tuple[str, str], int] = {}
+        self._slow = deque(maxlen=max(1, int(slow_capacity)))
+        self._slow_total = 0
+        self._started = time.time()
+
+    # ------------------------------------------------------------------
+    # 记录
+    # ------------------------------------------------------------------
+    def _stats(self, name: str) -> _OperationStats:
+        stats = self._ops.get(name)
+        if stats is None:
+            stats = self._ops[name] = _OperationStats(self.buckets)
+        return stats
+
+    def current(self) -> Optional[_Operation]:
+        """本线程正在进行的最内层操作"""
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def begin(self, name: str) -> _Operation:
+        """开始一个操作"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        op = _Operation(name)
+        stack.append(op)
+        return op
+
+    def end(self, op: _Operation, result=None, error: Optional[BaseException] = None):
+        """结束操作，记录总耗时、行数和是否出错"""
+        elapsed = time.perf_counter() - op.start
+        if error is not None and not op.failed:
+            # 未经游标记录过的异常（游标抛出的已在 record_error 中计数）
+            self.record_error(error)
+        op.failed = op.failed or error is not None
+        stack = getattr(self._local, 'stack', None)
+        if stack and stack[-1] is op:
+            stack.pop()
+        rows = op.rows if op.rows is not None else _result_rows(result)
+        with self._lock:
+            stats = self._stats(op.name)
+            stats.calls += 1
+            stats.rows += rows
+            stats.errors += 1 if op.failed else 0
+            stats.duration.observe(elapsed)
+
+    def observe_phase(self, phase: str, seconds: float):
+        """记录当前操作某个阶段的耗时，不在操作内时记到 other"""
+        op = self.current()
+        with self._lock:
+            self._stats(op.name if op else 'other').phases[phase].observe(seconds)
+
+    def record_statement(self, sql: str, params, seconds: float):
+        """执行完一条SQL后调用，超过阈值时记为慢SQL"""
+        if self.slow_threshold <= 0 or seconds < self.slow_threshold:
+            return
+        op = self.current()
+        if isinstance(params, (list, tuple)) and params and isinstance(params[0], (dict, list, tuple)):
+            # executemany 只记录批次大小和第一组参数
+            text = f"[{len(params)} rows] {params[0]!r}"
+        else:
+            text = repr(params)
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'operation': op.name if op else 'other',
+            'seconds': round(seconds, 6),
+            'sql': ' '.join(str(sql).split())[:_MAX_SQL_CHARS],
+            'params': text[:_MAX_PARAMS_CHARS],
+        }
+        with self._lock:
+            self._slow.append(entry)
+            self._slow_total += 1
+
+    def record_error(self, error: BaseException, operation: Optional[str] = None):
+        """记录一次数据库错误，并把当前操作标记为出错"""
+        op = self.current()
+        if op is not None:
+            op.failed = True
+        name = operation or (op.name if op else 'other')
+        key = (name, type(error).__name__)
+        with self._lock:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def reset(self):
+        """清空全部指标"""
+        with self._lock:
+            self._ops.clear()
+            self._errors.clear()
+            self._slow.clear()
+            self._slow_total = 0
+            self._started = time.time()
+
+    # ------------------------------------------------------------------
+    # 导出
+    # ------------------------------------------------------------------
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """最近的慢SQL，最新的在后"""
+        with self._lock:
+            return list(self._slow)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        导出全部指标
+
+        Returns:
+            {'uptime', 'operations': {操作: {calls, errors, rows, rows_per_second,
+              duration, phases}}, 'errors': [...], 'slow_queries': [...], 'slow_total'}
+        """
+        with self._lock:
+            operations = {}
+            for name in sorted(self._ops):
+                stats = self._ops[name]
+                seconds = stats.duration.sum
+                operations[name] = {
+                    'calls': stats.calls,
+                    'errors': stats.errors,
+                    'rows': stats.rows,
+                    'rows_per_second': round(stats.rows / seconds, 1) if seconds > 0 else 0.0,
+                    'duration': stats.duration.snapshot(),
+                    'phases': {phase: h.snapshot() for phase, h in stats.phases.items() if h.count},
+                }
+            errors = [{'operation': op, 'error': kind, 'count': n}
+                      for (op, kind), n in sorted(self._errors.items())]
+            return {
+                'uptime': round(time.time() - self._started, 3),
+                'operations': operations,
+                'errors': errors,
+                'slow_queries': list(self._slow),
+                'slow_total': self._slow_total,
+            }
+
+    def to_json(self, indent: Optional[int] = None, extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        导出为 JSON 文本
+
+        Args:
+            indent: 缩进
+            extra: 附加的字段（如连接池指标）
+        """
+        data = self.snapshot()
+        if extra:
+            data.update(extra)
+        return json.dumps(data, ensure_ascii=False, indent=indent, default=str)
+
+    def to_prometheus(self, prefix: str = 'ctp_db',
+                      gauges: Optional[Dict[str, float]] = None) -> str:
+        """
+        导出为 Prometheus 文本格式
+
+        Args:
+            prefix: 指标名前缀
+            gauges: 附加的瞬时值 {名称: 数值}，如连接池 in_use
+
+        Returns:
+            可直接作为 /metrics 响应体的文本
+        """
+        lines = []
+
+        def header(name, kind, text):
+            lines.append(f"# HELP {prefix}_{name} {text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def histogram(name, labels, h: Histogram):
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                lines.append(f'{prefix}_{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{prefix}_{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f'{prefix}_{name}_sum{{{labels}}} {h.sum:.6f}')
+            lines.append(f'{prefix}_{name}_count{{{labels}}} {h.count}')
+
+        with self._lock:
+            ops = sorted(self._ops.items())
+            header('operations_total', 'counter', '操作调用次数')
+            for name, stats in ops:
+                lines.append(f'{prefix}_operations_total{{operation="{_label(name)}"}} {stats.calls}')
+            header('operation_errors_total', 'counter', '出错的操作次数')
+            for name, stats in ops:
+                lines.append(f'{prefix}_operation_errors_total{{operation="{_label(name)}"}} {stats.errors}')
+            header('rows_total', 'counter', '操作写入或返回的行数')
+            for name, stats in ops:
+                lines.append(f'{prefix}_rows_total{{operation="{_label(name)}"}} {stats.rows}')
+            header('operation_duration_seconds', 'histogram', '操作总耗时')
+            for name, stats in ops:
+                histogram('operation_duration_seconds', f'operation="{_label(name)}"', stats.duration)
+            header('phase_duration_seconds', 'histogram', '操作各阶段耗时（connect/execute/fetch/commit）')
+            for name, stats in ops:
+                for phase, h in stats.phases.items():
+                    if h.count:
+                        histogram('phase_duration_seconds',
+                                  f'operation="{_label(name)}",phase="{phase}"', h)
+            header('errors_total', 'counter', '数据库错误次数')
+            for (op, kind), n in sorted(self._errors.items()):
+                lines.append(f'{prefix}_errors_total{{operation="{_label(op)}",error="{_label(kind)}"}} {n}')
+            header('slow_queries_total', 'counter', '慢SQL条数')
+            lines.append(f'{prefix}_slow_queries_total {self._slow_total}')
+        for name, value in sorted((gauges or {}).items()):
+            header(name, 'gauge', name)
+            lines.append(f'{prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class TimedCursor:
+    """记录 execute/fetch 耗时的游标包装，其余属性透传"""
+
+    def __init__(self, cursor, metrics: MetricsRegistry):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _execute(self, method, sql, params):
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        except Exception as e:
+            self._metrics.record_error(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._metrics.observe_phase('execute', elapsed)
+            self._metrics.record_statement(sql, params, elapsed)
+
+    def execute(self, sql, params=None):
+        return self._execute(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, params):
+        return self._execute(self._cursor.executemany, sql, params)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._metrics.observe_phase('fetch', time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, *(() if size is None else (size,)))
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+
+class TimedConnection:
+    """记录 commit 耗时、返回 TimedCursor 的连接包装，其余属性透传"""
+
+    def __init__(self, conn, metrics: MetricsRegistry):
+        self._conn = conn
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._metrics)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return self._conn.commit()
+        except Exception as e:
+            self._metrics.record_error(e)
+            raise
+        finally:
+            self._metrics.observe_phase('commit', time.perf_counter() - start)
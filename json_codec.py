@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+记录的 JSON 编解码
+本地写入缓冲（write_spool）和明细归档文件（retention_manager）共用同一种编码：
+datetime/date 编码为 {"$dt": ISO 文本}/{"$d": ISO 文本}，读回时还原为原类型；
+Decimal 编码为浮点数
+
+用法：
+    text = json.dumps(row, default=json_default)
+    row = json.loads(text, object_hook=json_object_hook)
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+
+
+def json_default(value):
+    """json.dumps 的 default：编码 JSON 不支持的日期时间和 Decimal"""
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"无法编码为 JSON 的类型: {type(value)}")
+
+
+def json_object_hook(obj):
+    """json.loads 的 object_hook：还原 json_default 编码的日期时间"""
+    if len(obj) == 1:
+        if '$dt' in obj:
+            return datetime.fromisoformat(obj['$dt'])
+        if '$d' in obj:
+            return date.fromisoformat(obj['$d'])
+    return obj
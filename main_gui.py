@@ -17,7 +17,9 @@ from tkcalendar import Calendar
 # 市场行情暂时仍使用模拟封装
 from ctp_api_wrapper import CTPMarketAPI
 
-from database_manager import DatabaseManager
+from database_manager import create_database_manager
+from change_detector import ChangeDetector
+from retention_manager import RetentionManager
 
 
 class CTPTradingGUI:
@@ -31,6 +33,8 @@ class CTPTradingGUI:
         
         # 当前交易日（默认为今天）
         self.current_trading_day = datetime.now().strftime('%Y%m%d')
+        # 登录返回的交易日（夜盘时晚于自然日），未登录时为 None
+        self.login_trading_day = None
         
         # 配置文件路径
         self.config_file = "config.json"
@@ -40,6 +44,10 @@ class CTPTradingGUI:
         self.trader_api = None
         self.market_api = None
         self.db_manager = None
+        # 变更检测：自动下载只写入有变化的记录
+        self.change_detector = None
+        # 明细表分层保留和行情分区维护（config.json 的 database.retention）
+        self.retention_manager = None
         
         # 连接状态
         self.is_connected = False
@@ -47,6 +55,9 @@ class CTPTradingGUI:
         
         # 自动下载定时器
         self.auto_download_timer = None
+        # 委托簿增量落库定时器，同一时刻只有一次落库在进行
+        self.book_flush_timer = None
+        self._book_flushing = False
         
         # 创建UI
         self.create_widgets()
@@ -467,9 +478,9 @@ class CTPTradingGUI:
         self.market_front_var.set(self.config['ctp']['market_front'])
         
         # 数据库配置
-        self.db_host_var.set(self.config['database']['host'])
-        self.db_user_var.set(self.config['database']['user'])
-        self.db_password_var.set(self.config['database']['password'])
+        self.db_host_var.set(self.config['database'].get('host', ''))
+        self.db_user_var.set(self.config['database'].get('user', ''))
+        self.db_password_var.set(self.config['database'].get('password', ''))
         
         # 使用模拟CTP配置
         self.use_mock_ctp_var.set(self.config['ctp'].get('use_mock', False))
@@ -526,17 +537,33 @@ class CTPTradingGUI:
             self.is_logged_in = False  # 连接前重置登录状态，防止旧状态影响
 
             # 初始化数据库
-            self.db_manager = DatabaseManager(
+            # 存储后端由 config.json 的 database.backend 决定（mysql/sqlite）
+            self.db_manager = create_database_manager(dict(
+                self.config['database'],
                 host=self.db_host_var.get(),
                 user=self.db_user_var.get(),
                 password=self.db_password_var.get(),
-                database=self.config['database']['database']
-            )
+            ))
             if not self.db_manager.connect():
                 self.log("[连接] 数据库连接失败")
                 messagebox.showerror("错误", "数据库连接失败")
                 return
             self.log("[连接] 数据库连接成功")
+            spool_config = self.config['database'].get('spool')
+            if spool_config:
+                self.db_manager.enable_spool(**spool_config)
+                self.log(f"[连接] 已启用本地写入缓冲: {spool_config.get('directory', './spool/db/')}")
+            cache_config = self.config['database'].get('result_cache')
+            if cache_config:
+                self.db_manager.enable_result_cache(**cache_config)
+                self.log(f"[连接] 已启用查询结果缓存: {cache_config.get('directory', './cache/query/')}")
+            # 未配置分层保留时也启动，定期预建行情分区
+            retention_config = dict({'tables': {}}, **(self.config['database'].get('retention') or {}))
+            self.retention_manager = RetentionManager(self.db_manager, **retention_config)
+            self.retention_manager.start()
+            if retention_config['tables']:
+                self.log(f"[连接] 已启用明细表分层保留: {retention_config['tables']}")
+            self.change_detector = ChangeDetector(self.db_manager)
 
             # 根据界面开关唯一决定使用真实/模拟CTP
             use_mock = self.use_mock_ctp_var.get()
@@ -571,7 +598,10 @@ class CTPTradingGUI:
                     password=self.password_var.get(),
                     front_addr=self.trade_front_var.get(),
                     app_id=ctp_conf.get('app_id'),
-                    auth_code=ctp_conf.get('auth_code')
+                    auth_code=ctp_conf.get('auth_code'),
+                    query_rate=ctp_conf.get('query_rate', 1.0),
+                    query_burst=ctp_conf.get('query_burst', 1),
+                    position_reconcile_interval=ctp_conf.get('position_reconcile_interval', 60)
                 )
                 self.log(f"[连接] 真实CTP初始化参数: {trader_params}")
                 self.trader_api = TraderCls(**trader_params)
@@ -648,6 +678,11 @@ class CTPTradingGUI:
         """处理CTP登录成功回调"""
         self.is_logged_in = True
         self.update_status("已登录")
+        # 登录返回的交易日之前的交易日已结算，查询结果可以缓存
+        trading_day = (login_info or {}).get('trading_day')
+        self.login_trading_day = trading_day or None
+        if trading_day and self.db_manager:
+            self.db_manager.set_current_trading_day(trading_day)
         self.log(f"[登录] CTP系统登录成功: {login_info}")
         # 打印登录成功后相关参数
         if hasattr(self.trader_api, 'get_login_params'):
@@ -655,16 +690,56 @@ class CTPTradingGUI:
         else:
             self.log("[登录] 登录参数: 由trader_api内部保存")
         self.update_connect_btn_state()
+        self.schedule_book_flush()
         messagebox.showinfo("成功", "连接成功！")
 
+    def schedule_book_flush(self, interval_ms: int = 1000):
+        """登录后定期把委托簿中有变化的委托增量写库"""
+        if self.book_flush_timer:
+            self.root.after_cancel(self.book_flush_timer)
+            self.book_flush_timer = None
+        if not self.is_logged_in:
+            return
+        self.flush_order_book()
+        self.book_flush_timer = self.root.after(interval_ms,
+                                                lambda: self.schedule_book_flush(interval_ms))
+
+    def flush_order_book(self):
+        """取出委托簿中上次落库之后变化的委托，在后台线程写入 daily_orders"""
+        book = getattr(self.trader_api, 'order_book', None)
+        if book is None or not self.db_manager or self._book_flushing:
+            return
+        # 新成交随下一次快照写入，这里只写委托
+        orders, _ = book.drain()
+        if not orders:
+            return
+        self._book_flushing = True
+        def task():
+            try:
+                if not self.db_manager.insert_orders(orders):
+                    book.restore(orders)
+            except Exception as e:
+                book.restore(orders)
+                self.log(f"委托增量写库异常: {e}")
+            finally:
+                self._book_flushing = False
+        threading.Thread(target=task, daemon=True).start()
+
     def disconnect_from_ctp(self):
         """断开CTP连接"""
+        if self.book_flush_timer:
+            self.root.after_cancel(self.book_flush_timer)
+            self.book_flush_timer = None
         if self.trader_api:
             self.trader_api.disconnect()
+        if self.retention_manager:
+            self.retention_manager.stop()
+            self.retention_manager = None
         if self.db_manager:
             self.db_manager.close()
         self.is_connected = False
         self.is_logged_in = False
+        self.login_trading_day = None
         self.update_connect_btn_state()
         self.update_status("已断开")
         self.log("已断开连接")
@@ -678,17 +753,31 @@ class CTPTradingGUI:
             self.log("开始下载委托数据...")
             try:
                 orders = self.trader_api.query_orders() if self.trader_api else []
-                if self.db_manager and orders:
-                    count = self.db_manager.insert_orders(orders)
-                    self.log(f"已写入 {count} 条委托记录到数据库")
-                elif not orders:
+                if not orders:
                     self.log("未获取到委托数据")
+                if self.change_detector and orders is not None:
+                    changes = self.change_detector.sync_orders(orders, self.login_trading_day)
+                    self.log(f"委托数据同步: {changes.summary()}")
                 self.log("委托数据下载完成")
             except Exception as e:
                 self.log(f"下载委托数据异常: {e}")
             self.query_orders()
         threading.Thread(target=task, daemon=True).start()
     
+    def _query_complete(self, kind: str):
+        """
+        查询一类数据作为完整快照
+
+        变更检测会按快照删除已平掉的持仓、标记不再返回的合约，部分结果不能当作全集；
+        支持 query_all 的 API 在查询出错或超时时返回 None
+        """
+        api = self.trader_api
+        if not api:
+            return []
+        if hasattr(api, 'query_all'):
+            return api.query_all((kind,))[kind]
+        return getattr(api, 'query_' + kind)()
+
     def download_positions(self):
         """下载持仓数据"""
         if not self.is_logged_in:
@@ -697,18 +786,62 @@ class CTPTradingGUI:
         def task():
             self.log("开始下载持仓数据...")
             try:
-                positions = self.trader_api.query_positions() if self.trader_api else []
-                if self.db_manager and positions:
-                    count = self.db_manager.insert_positions(positions)
-                    self.log(f"已写入 {count} 条持仓记录到数据库")
-                elif not positions:
-                    self.log("未获取到持仓数据")
+                positions = self._query_complete('positions')
+                if positions is None:
+                    self.log("持仓查询失败，本次不同步持仓")
+                else:
+                    if not positions:
+                        self.log("当前无持仓")
+                    # 空列表也同步：删除本交易日已全部平掉的持仓
+                    if self.change_detector:
+                        changes = self.change_detector.sync_positions(positions,
+                                                                      self.login_trading_day)
+                        self.log(f"持仓数据同步: {changes.summary()}")
                 self.log("持仓数据下载完成")
             except Exception as e:
                 self.log(f"下载持仓数据异常: {e}")
             self.query_positions()
         threading.Thread(target=task, daemon=True).start()
     
+    def download_snapshot(self):
+        """下载委托、持仓、成交和资金，作为一个快照在同一事务内写库"""
+        if not self.is_logged_in:
+            return
+        def task():
+            api = self.trader_api
+            if not api or not self.change_detector:
+                return
+            try:
+                if hasattr(api, 'query_all'):
+                    # 四类查询一次提交，由查询调度按优先级和流控连续发送
+                    data = api.query_all(('positions', 'accounts', 'orders', 'trades'))
+                    failed = [kind for kind, rows in data.items() if rows is None]
+                    if failed:
+                        self.log(f"查询失败，本次快照沿用之前的数据: {failed}")
+                else:
+                    # 未实现的查询传 None，表示本周期不更新该类数据
+                    data = dict(
+                        orders=api.query_orders(),
+                        positions=api.query_positions(),
+                        trades=api.query_trades() if hasattr(api, 'query_trades') else None,
+                        accounts=api.query_accounts() if hasattr(api, 'query_accounts') else None,
+                    )
+                # 经变更检测写入快照，之后的手动下载只写快照之后的变化
+                snapshot_id, changes = self.change_detector.sync_snapshot(
+                    trading_day=self.login_trading_day, **data)
+                if snapshot_id is None:
+                    self.log("快照写入失败")
+                    return
+                for kind, change in changes.items():
+                    if change:
+                        self.log(f"{kind} 同步: {change.summary()}")
+                self.log(f"快照 {snapshot_id} 下载完成")
+            except Exception as e:
+                self.log(f"下载快照异常: {e}")
+            self.query_orders()
+            self.query_positions()
+        threading.Thread(target=task, daemon=True).start()
+    
     def download_market_data(self):
         """下载行情数据"""
         if not self.is_logged_in:
@@ -725,16 +858,15 @@ class CTPTradingGUI:
         def task():
             self.log("开始下载合约参数...")
             try:
-                instruments = self.trader_api.query_instruments() if self.trader_api else []
-                if self.db_manager and instruments:
-                    # 兼容 insert_instruments/insert_instrument_info
-                    if hasattr(self.db_manager, 'insert_instruments'):
-                        count = self.db_manager.insert_instruments(instruments)
-                    else:
-                        count = self.db_manager.insert_instrument_info(instruments)
-                    self.log(f"已写入 {count} 条合约参数记录到数据库")
-                elif not instruments:
-                    self.log("未获取到合约参数")
+                instruments = self._query_complete('instruments')
+                if instruments is None:
+                    self.log("合约查询失败，本次不同步合约参数")
+                else:
+                    if not instruments:
+                        self.log("未获取到合约参数")
+                    if self.change_detector:
+                        changes = self.change_detector.sync_instruments(instruments)
+                        self.log(f"合约参数同步: {changes.summary()}")
                 self.log("合约参数下载完成")
             except Exception as e:
                 self.log(f"下载合约参数异常: {e}")
@@ -901,7 +1033,8 @@ class CTPTradingGUI:
             return
         
         instrument_id = self.market_instrument_var.get() or None
-        market_data = self.db_manager.query_market_data(instrument_id=instrument_id)
+        # 每个合约只显示最新一笔行情，直接读最新行情表
+        market_data = self.db_manager.query_latest_quotes([instrument_id] if instrument_id else None)
         
         # 清空表格
         for item in self.market_tree.get_children():
@@ -991,8 +1124,7 @@ class CTPTradingGUI:
         """调度自动下载"""
         if self.auto_download_var.get() and self.is_logged_in:
             self.log("执行自动下载...")
-            self.download_orders()
-            self.download_positions()
+            self.download_snapshot()
             
             # 下次调度
             self.auto_download_timer = self.root.after(interval * 1000, 
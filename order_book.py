@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+推送驱动的委托/成交簿
+登录后用一次 ReqQryOrder/ReqQryTrade 的结果初始化，之后由私有流推送 OnRtnOrder/OnRtnTrade
+逐条更新，按委托唯一标识、合约和状态建立索引。CTPTraderAPIReal.query_orders/query_trades
+直接从这里返回，不再每个下载周期全量查询；有变化的记录累积在待落库列表中，
+由调用方定期 drain() 后增量写库
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from database_manager import order_key
+
+logger = logging.getLogger(__name__)
+
+# 没有自然键的委托按以下字段识别（与变更检测的回退键一致）
+_ORDER_FALLBACK_KEY = ('trading_day', 'order_time', 'instrument_id', 'direction',
+                       'offset_flag', 'order_price', 'order_volume')
+# 成交编号只在同一交易所、同一买卖方向内唯一
+_TRADE_KEY = ('trading_day', 'exchange_id', 'trade_id', 'direction')
+
+
+def book_order_key(order: Dict[str, Any]) -> str:
+    """委托在簿中的键：CTP 自然键，缺失时用委托内容"""
+    natural = order_key(order)
+    if natural is not None:
+        return natural
+    return 'F:' + ':'.join(str(order.get(f) or '') for f in _ORDER_FALLBACK_KEY)
+
+
+def book_trade_key(trade: Dict[str, Any]) -> Tuple:
+    """成交在簿中的键"""
+    return tuple(str(trade.get(f) or '').strip() for f in _TRADE_KEY)
+
+
+class OrderBook:
+    """
+    委托/成交簿
+
+    用法：
+        book = OrderBook()
+        book.begin_seed()
+        book.seed(orders=query_orders_result, trades=query_trades_result)
+        book.apply_order(order)            # OnRtnOrder
+        book.apply_trade(trade)            # OnRtnTrade
+        book.orders(instrument_id='rb2505', status='未成交还在队列中')
+        orders, trades = book.drain()      # 上次 drain 之后变化的委托和新成交
+
+    线程安全：推送在 CTP 回调线程写入，查询和 drain 可在任意线程调用
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders: Dict[str, Dict[str, Any]] = {}
+        self._orders_by_instrument: Dict[str, Set[str]] = {}
+        self._orders_by_status: Dict[str, Set[str]] = {}
+        self._trades: Dict[Tuple, Dict[str, Any]] = {}
+        self._trades_by_instrument: Dict[str, List[Tuple]] = {}
+        # 待落库：变化过的委托键（保持首次变化顺序）和新成交键
+        self._dirty_orders: Dict[str, None] = {}
+        self._new_trades: List[Tuple] = []
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._seeded = {'orders': False, 'trades': False}
+        # begin_seed() 之后收到推送的委托键：这些委托比随后到达的查询结果新
+        self._touched: Set[str] = set()
+        self._stats = {'order_pushes': 0, 'trade_pushes': 0, 'unchanged': 0, 'duplicates': 0}
+
+    def add_listener(self, callback: Callable[[str, Dict[str, Any]], None]):
+        """注册变化通知 callback(kind, row)，kind 为 order 或 trade，在推送线程内调用"""
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, row: Dict[str, Any]):
+        for callback in self._listeners:
+            try:
+                callback(kind, row)
+            except Exception as e:
+                logger.error(f"委托簿变化通知异常: {e}")
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def _put_order_locked(self, key: str, order: Dict[str, Any]) -> bool:
+        old = self._orders.get(key)
+        if old == order:
+            return False
+        if old is not None:
+            self._orders_by_instrument.get(old.get('instrument_id'), set()).discard(key)
+            self._orders_by_status.get(old.get('order_status'), set()).discard(key)
+        self._orders[key] = order
+        self._orders_by_instrument.setdefault(order.get('instrument_id'), set()).add(key)
+        self._orders_by_status.setdefault(order.get('order_status'), set()).add(key)
+        self._dirty_orders[key] = None
+        return True
+
+    def _put_trade_locked(self, key: Tuple, trade: Dict[str, Any]) -> bool:
+        if key in self._trades:
+            return False
+        self._trades[key] = trade
+        self._trades_by_instrument.setdefault(trade.get('instrument_id'), []).append(key)
+        self._new_trades.append(key)
+        return True
+
+    def apply_order(self, order: Dict[str, Any]) -> bool:
+        """
+        应用一条委托推送（OnRtnOrder），同一委托整行替换
+
+        Returns:
+            内容是否有变化
+        """
+        row = dict(order)
+        with self._lock:
+            self._stats['order_pushes'] += 1
+            key = book_order_key(row)
+            self._touched.add(key)
+            changed = self._put_order_locked(key, row)
+            if not changed:
+                self._stats['unchanged'] += 1
+        if changed:
+            self._notify('order', row)
+        return changed
+
+    def apply_trade(self, trade: Dict[str, Any]) -> bool:
+        """
+        应用一条成交推送（OnRtnTrade），重复推送的成交忽略
+
+        Returns:
+            是否为新成交
+        """
+        row = dict(trade)
+        with self._lock:
+            self._stats['trade_pushes'] += 1
+            added = self._put_trade_locked(book_trade_key(row), row)
+            if not added:
+                self._stats['duplicates'] += 1
+        if added:
+            self._notify('trade', row)
+        return added
+
+    def begin_seed(self):
+        """
+        开始（重新）初始化：登录或断线重连后调用，随后发出查询并把结果交给 seed()
+
+        断线期间可能漏掉推送，在 seed() 之前 is_seeded() 为 False
+        """
+        with self._lock:
+            self._seeded = {'orders': False, 'trades': False}
+            self._touched = set()
+
+    def seed(self, orders: Optional[List[Dict[str, Any]]] = None,
+             trades: Optional[List[Dict[str, Any]]] = None):
+        """
+        用查询结果初始化（或核对）委托簿
+
+        begin_seed() 之后收到过推送的委托比查询结果新，不被查询结果覆盖；
+        其他委托以查询结果为准
+
+        Args:
+            orders: ReqQryOrder 的结果，None 表示不初始化委托
+            trades: ReqQryTrade 的结果，None 表示不初始化成交
+        """
+        with self._lock:
+            if orders is not None:
+                for order in orders:
+                    key = book_order_key(order)
+                    if key not in self._touched:
+                        self._put_order_locked(key, dict(order))
+                self._seeded['orders'] = True
+            if trades is not None:
+                for trade in trades:
+                    self._put_trade_locked(book_trade_key(trade), dict(trade))
+                self._seeded['trades'] = True
+
+    def is_seeded(self, kind: str) -> bool:
+        """orders/trades 是否已由查询结果初始化，未初始化时簿中只有登录后的推送"""
+        return self._seeded.get(kind, False)
+
+    def clear(self):
+        """清空委托簿（重新登录、切换交易日时使用），待落库的变化一并丢弃"""
+        with self._lock:
+            self._orders.clear()
+            self._orders_by_instrument.clear()
+            self._orders_by_status.clear()
+            self._trades.clear()
+            self._trades_by_instrument.clear()
+            self._dirty_orders.clear()
+            self._new_trades.clear()
+            self._seeded = {'orders': False, 'trades': False}
+            self._touched = set()
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def get_order(self, key: str) -> Optional[Dict[str, Any]]:
+        """按委托唯一标识（order_key）取委托"""
+        with self._lock:
+            order = self._orders.get(key)
+            return dict(order) if order is not None else None
+
+    def orders(self, instrument_id: Optional[str] = None, status: Optional[str] = None,
+               exchange_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按条件取委托
+
+        Args:
+            instrument_id: 合约代码
+            status: 委托状态（中文，如“撤单”）
+            exchange_id: 交易所代码
+
+        Returns:
+            委托字典列表（副本），按委托时间排序
+        """
+        with self._lock:
+            keys = None
+            if instrument_id:
+                keys = set(self._orders_by_instrument.get(instrument_id, ()))
+            if status:
+                by_status = self._orders_by_status.get(status, set())
+                keys = set(by_status) if keys is None else keys & by_status
+            rows = [self._orders[k] for k in (self._orders if keys is None else keys)]
+            if exchange_id:
+                rows = [r for r in rows if r.get('exchange_id') == exchange_id]
+            rows = [dict(r) for r in rows]
+        rows.sort(key=lambda r: (str(r.get('trading_day') or ''), str(r.get('order_time') or '')))
+        return rows
+
+    def trades(self, instrument_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按合约取成交
+
+        Returns:
+            成交字典列表（副本），按到达顺序
+        """
+        with self._lock:
+            if instrument_id:
+                keys = self._trades_by_instrument.get(instrument_id, [])
+                return [dict(self._trades[k]) for k in keys]
+            return [dict(t) for t in self._trades.values()]
+
+    def drain(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        取出上次 drain 之后变化的委托（每个委托只取最新状态）和新成交
+
+        Returns:
+            (委托列表, 成交列表)
+        """
+        with self._lock:
+            orders = [dict(self._orders[k]) for k in self._dirty_orders]
+            trades = [dict(self._trades[k]) for k in self._new_trades]
+            self._dirty_orders = {}
+            self._new_trades = []
+        return orders, trades
+
+    def restore(self, orders: List[Dict[str, Any]]):
+        """落库失败时把 drain() 取出的委托重新标记为待落库（成交不重试，由快照周期补写）"""
+        with self._lock:
+            for order in orders:
+                key = book_order_key(order)
+                if key in self._orders:
+                    self._dirty_orders[key] = None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取计数
+
+        Returns:
+            {orders, trades, pending_orders, pending_trades, order_pushes, trade_pushes,
+             unchanged, duplicates}
+        """
+        with self._lock:
+            return dict(self._stats, orders=len(self._orders), trades=len(self._trades),
+                        pending_orders=len(self._dirty_orders),
+                        pending_trades=len(self._new_trades))
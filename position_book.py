@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+增量维护的持仓簿
+登录后用一次 ReqQryInvestorPosition 的结果初始化，之后每笔成交推送（OnRtnTrade）在 O(1) 内
+更新对应合约、方向的今仓/昨仓数量、开仓成本和平仓盈亏。CTPTraderAPIReal.query_positions
+直接从这里返回，不再每个下载周期阻塞等待持仓查询；后台定期重新查询一次持仓与簿核对，
+数量不一致时记录日志并以查询结果为准。
+
+约定：
+- 开仓成本、平仓盈亏按金额（价格 × 数量 × 合约乘数）记录，与 CTP 的 OpenCost/CloseProfit 一致
+- 平仓按平均开仓成本结转，平仓盈亏为逐笔口径；核对时以 CTP 返回的数值为准
+- 平今只减今仓，平昨只减昨仓，其余平仓先平昨仓、再平今仓
+- 持仓盈亏（position_profit）取自最近一次查询，成交不更新
+"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LONG = '多头'
+SHORT = '空头'
+
+# 只减今仓、只减昨仓的开平标志，其余平仓先平昨再平今
+_CLOSE_TODAY = ('平今',)
+_CLOSE_YESTERDAY = ('平昨',)
+
+
+class _Position:
+    """一个合约、一个方向的持仓"""
+
+    __slots__ = ('instrument_id', 'direction', 'exchange_id', 'today_volume', 'yd_volume',
+                 'open_cost', 'close_profit', 'position_profit', 'trading_day')
+
+    def __init__(self, instrument_id: str, direction: str):
+        self.instrument_id = instrument_id
+        self.direction = direction
+        self.exchange_id = ''
+        self.today_volume = 0
+        self.yd_volume = 0
+        self.open_cost = 0.0
+        self.close_profit = 0.0
+        self.position_profit = 0.0
+        self.trading_day = ''
+
+    @property
+    def volume(self) -> int:
+        return self.today_volume + self.yd_volume
+
+
+def position_direction(trade_direction: str, offset_flag: str) -> str:
+    """成交影响的持仓方向：买开、卖平对应多头，卖开、买平对应空头"""
+    buy = trade_direction in ('买入', '买', LONG)
+    if offset_flag == '开仓':
+        return LONG if buy else SHORT
+    return SHORT if buy else LONG
+
+
+class PositionBook:
+    """
+    持仓簿
+
+    用法：
+        book = PositionBook()
+        book.set_multiplier('rb2505', 10)
+        book.seed(query_positions_result)    # 登录后初始化
+        book.apply_trade(trade)              # OnRtnTrade
+        book.get_positions()                 # 立即返回
+        book.reconcile(fresh_query_result)   # 定期核对，返回数量不一致的持仓
+
+    线程安全：成交在 CTP 回调线程写入，读取和核对可在任意线程调用
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._positions: Dict[Tuple[str, str], _Position] = {}
+        self._multipliers: Dict[str, float] = {}
+        self._seeded = False
+        self.trading_day = ''
+        self._stats = {'trades': 0, 'reconciles': 0, 'mismatches': 0, 'overclosed': 0}
+
+    # ------------------------------------------------------------------
+    # 合约乘数
+    # ------------------------------------------------------------------
+    def set_multiplier(self, instrument_id: str, multiplier):
+        """设置合约乘数（来自合约查询的 volume_multiple），未设置时按 1 计算"""
+        try:
+            value = float(multiplier)
+        except (TypeError, ValueError):
+            return
+        if value > 0:
+            with self._lock:
+                self._multipliers[instrument_id] = value
+
+    def has_multiplier(self, instrument_id: str) -> bool:
+        return instrument_id in self._multipliers
+
+    def instruments(self) -> List[str]:
+        """簿中出现过的合约"""
+        with self._lock:
+            return sorted({key[0] for key in self._positions})
+
+    # ------------------------------------------------------------------
+    # 初始化与核对
+    # ------------------------------------------------------------------
+    def _build_locked(self, rows: List[Dict[str, Any]]) -> Dict[Tuple[str, str], _Position]:
+        """把查询结果按 (合约, 方向) 汇总，上期所/能源中心的今仓、昨仓两条记录合并为一条"""
+        positions: Dict[Tuple[str, str], _Position] = {}
+        for row in rows:
+            instrument_id = row.get('instrument_id') or ''
+            direction = row.get('direction') or LONG
+            key = (instrument_id, direction)
+            pos = positions.get(key)
+            if pos is None:
+                pos = positions[key] = _Position(instrument_id, direction)
+            volume = int(row.get('volume') or 0)
+            today = row.get('today_volume')
+            today = int(today) if today is not None else int(row.get('available_volume') or 0)
+            yd = row.get('yd_volume')
+            yd = int(yd) if yd is not None else max(0, volume - today)
+            pos.today_volume += today
+            pos.yd_volume += yd
+            open_cost = row.get('open_cost')
+            if open_cost is None:
+                open_cost = float(row.get('open_price') or 0.0) * volume * \
+                    self._multipliers.get(instrument_id, 1.0)
+            pos.open_cost += float(open_cost)
+            pos.close_profit += float(row.get('close_profit') or 0.0)
+            pos.position_profit += float(row.get('position_profit') or 0.0)
+            pos.exchange_id = row.get('exchange_id') or pos.exchange_id
+            pos.trading_day = row.get('trading_day') or pos.trading_day
+        return positions
+
+    def seed(self, rows: List[Dict[str, Any]], trading_day: Optional[str] = None):
+        """
+        用持仓查询结果初始化持仓簿，之前的内容全部替换
+
+        CTP 的查询响应和私有流推送在同一连接上按顺序到达，响应到达之前推送的成交
+        已包含在查询结果中，因此直接替换即可
+
+        Args:
+            rows: ReqQryInvestorPosition 的结果
+            trading_day: 当前交易日
+        """
+        with self._lock:
+            self._positions = self._build_locked(rows)
+            if trading_day:
+                self.trading_day = trading_day
+            self._seeded = True
+
+    def reconcile(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        与一次新的持仓查询结果核对，并以查询结果为准替换持仓簿
+
+        Args:
+            rows: ReqQryInvestorPosition 的结果
+
+        Returns:
+            今仓/昨仓数量不一致的持仓：[{instrument_id, direction, book, query}]，
+            book/query 为 (今仓, 昨仓)
+        """
+        with self._lock:
+            fresh = self._build_locked(rows)
+            mismatches = []
+            for key in set(self._positions) | set(fresh):
+                old = self._positions.get(key)
+                new = fresh.get(key)
+                book = (old.today_volume, old.yd_volume) if old else (0, 0)
+                query = (new.today_volume, new.yd_volume) if new else (0, 0)
+                if book != query:
+                    mismatches.append({'instrument_id': key[0], 'direction': key[1],
+                                       'book': book, 'query': query})
+            self._positions = fresh
+            self._seeded = True
+            self._stats['reconciles'] += 1
+            self._stats['mismatches'] += len(mismatches)
+        for m in mismatches:
+            logger.warning(f"持仓核对不一致，以查询结果为准: {m['instrument_id']} {m['direction']} "
+                           f"簿(今,昨)={m['book']} 查询(今,昨)={m['query']}")
+        return mismatches
+
+    def is_seeded(self) -> bool:
+        """是否已由查询结果初始化"""
+        return self._seeded
+
+    def unseed(self):
+        """断线后调用：期间可能漏掉成交推送，重新初始化之前 is_seeded() 为 False"""
+        with self._lock:
+            self._seeded = False
+
+    def clear(self):
+        """清空持仓簿（切换交易日时使用），合约乘数保留"""
+        with self._lock:
+            self._positions = {}
+            self._seeded = False
+
+    # ------------------------------------------------------------------
+    # 成交
+    # ------------------------------------------------------------------
+    def apply_trade(self, trade: Dict[str, Any]) -> bool:
+        """
+        应用一笔成交（OnRtnTrade），调用方负责过滤重复推送
+
+        Returns:
+            是否更新了持仓（开平标志无法识别时忽略）
+        """
+        offset = trade.get('offset_flag') or ''
+        if offset in ('', '未知'):
+            return False
+        instrument_id = trade.get('instrument_id') or ''
+        direction = position_direction(trade.get('direction') or '', offset)
+        volume = int(trade.get('volume') or 0)
+        price = float(trade.get('price') or 0.0)
+        if volume <= 0:
+            return False
+
+        with self._lock:
+            self._stats['trades'] += 1
+            key = (instrument_id, direction)
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = self._positions[key] = _Position(instrument_id, direction)
+            pos.exchange_id = trade.get('exchange_id') or pos.exchange_id
+            pos.trading_day = trade.get('trading_day') or pos.trading_day or self.trading_day
+            multiplier = self._multipliers.get(instrument_id, 1.0)
+
+            if offset == '开仓':
+                pos.today_volume += volume
+                pos.open_cost += price * volume * multiplier
+                return True
+
+            held = pos.volume
+            if offset in _CLOSE_TODAY:
+                from_today, from_yd = min(volume, pos.today_volume), 0
+            elif offset in _CLOSE_YESTERDAY:
+                from_today, from_yd = 0, min(volume, pos.yd_volume)
+            else:
+                from_yd = min(volume, pos.yd_volume)
+                from_today = min(volume - from_yd, pos.today_volume)
+            closed = from_today + from_yd
+            if closed < volume:
+                # 簿中持仓不足（初始化前的成交或漏推），等待下一次核对修正
+                self._stats['overclosed'] += 1
+            if closed:
+                cost = pos.open_cost * closed / held
+                proceeds = price * closed * multiplier
+                pos.close_profit += proceeds - cost if direction == LONG else cost - proceeds
+                pos.open_cost -= cost
+                pos.today_volume -= from_today
+                pos.yd_volume -= from_yd
+                if not pos.volume:
+                    pos.open_cost = 0.0
+            return True
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def _row(self, pos: _Position) -> Dict[str, Any]:
+        volume = pos.volume
+        multiplier = self._multipliers.get(pos.instrument_id, 1.0)
+        open_price = pos.open_cost / (volume * multiplier) if volume else 0.0
+        return {
+            'instrument_id': pos.instrument_id,
+            'direction': pos.direction,
+            'position_type': '总仓',
+            'volume': volume,
+            'available_volume': pos.today_volume,
+            'open_price': open_price,
+            'position_price': open_price,
+            'close_profit': pos.close_profit,
+            'position_profit': pos.position_profit,
+            'trading_day': pos.trading_day or self.trading_day,
+            'exchange_id': pos.exchange_id,
+            'today_volume': pos.today_volume,
+            'yd_volume': pos.yd_volume,
+            'open_cost': pos.open_cost,
+        }
+
+    def get_positions(self, instrument_id: Optional[str] = None,
+                      include_flat: bool = False) -> List[Dict[str, Any]]:
+        """
+        立即返回当前持仓，字段与持仓查询结果一致（每个合约、方向一条）
+
+        Args:
+            instrument_id: 合约代码，为空时返回全部
+            include_flat: 是否包含已平完、只剩平仓盈亏的记录
+
+        Returns:
+            持仓字典列表，按合约、方向排序
+        """
+        with self._lock:
+            rows = [self._row(pos) for key, pos in self._positions.items()
+                    if (not instrument_id or key[0] == instrument_id)
+                    and (include_flat or pos.volume)]
+        rows.sort(key=lambda r: (r['instrument_id'], r['direction']))
+        return rows
+
+    def get_position(self, instrument_id: str, direction: str) -> Optional[Dict[str, Any]]:
+        """取单个合约、方向的持仓"""
+        with self._lock:
+            pos = self._positions.get((instrument_id, direction))
+            return self._row(pos) if pos is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取计数
+
+        Returns:
+            {positions, trades, reconciles, mismatches, overclosed}
+        """
+        with self._lock:
+            return dict(self._stats, positions=sum(1 for p in self._positions.values() if p.volume))
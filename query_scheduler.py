@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+CTP 查询流控调度
+CTP 交易前置限制查询频率（通常每秒 1 次），超出时 ReqQry* 返回 -2（未处理请求超过许可数）
+或 -3（每秒发送请求数超过许可数）。QueryScheduler 位于 CTPTraderAPIReal 的各查询方法之前：
+
+- 令牌桶：按前置的限制匀速发送，允许少量突发
+- 优先级队列：持仓、资金先于委托、成交，合约列表最后
+- 返回 -2/-3 时按指数退避自动重发，不再直接报“请求发送失败”
+- 排队中的相同查询（类别和过滤条件都相同）合并为一次请求，调用方共享同一个 QueryFuture
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 前置流控拒绝的返回码，稍后重发即可成功
+THROTTLED_CODES = (-2, -3)
+
+# 查询类别的默认优先级，数值越小越先发送
+DEFAULT_PRIORITIES = {
+    'positions': 0,
+    'accounts': 0,
+    'orders': 1,
+    'trades': 1,
+    'instruments': 2,
+}
+
+
+class QueryFuture:
+    """一次查询的结果：发送后 SPI 回调按 nRequestID 追加记录，收到 bIsLast 时完成"""
+
+    def __init__(self, kind: str, filters: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.filters = dict(filters or {})
+        self.request_id = 0
+        self.rows: List[Dict[str, Any]] = []
+        self.error = None
+        self.attempts = 0
+        self._sent = threading.Event()
+        self._done = threading.Event()
+        self._callbacks: List[Callable[['QueryFuture'], None]] = []
+        self._callback_lock = threading.Lock()
+
+    def set_sent(self, request_id: int):
+        self.request_id = request_id
+        self._sent.set()
+
+    def set_done(self, error: str = None) -> bool:
+        """结束查询，返回是否为首次结束（重复结束时保留第一次的结果）"""
+        with self._callback_lock:
+            if self._done.is_set():
+                return False
+            if error:
+                self.error = error
+            self._sent.set()
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+        return True
+
+    def add_done_callback(self, callback: Callable[['QueryFuture'], None]):
+        """查询结束后调用 callback(future)（在结束查询的线程内）；已结束时立即调用"""
+        with self._callback_lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback(self)
+        except Exception as e:
+            logger.error(f"查询完成回调异常: {e}")
+
+    def sent(self) -> bool:
+        return self._sent.is_set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait_sent(self, timeout: float = None) -> bool:
+        """等待请求离开队列（已发送或已失败），返回是否在超时前完成"""
+        return self._sent.wait(timeout)
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待查询完成，返回是否在超时前完成"""
+        return self._done.wait(timeout)
+
+    def result(self, timeout: float = None) -> List[Dict[str, Any]]:
+        """等待并返回结果记录（超时返回已收到的部分）"""
+        self._done.wait(timeout)
+        return list(self.rows)
+
+
+class _Entry:
+    """排队中的一次查询"""
+
+    __slots__ = ('key', 'future', 'priority', 'seq', 'not_before')
+
+    def __init__(self, key: Tuple, future: QueryFuture, priority: int, seq: int):
+        self.key = key
+        self.future = future
+        self.priority = priority
+        self.seq = seq
+        self.not_before = 0.0
+
+
+class QueryScheduler:
+    """
+    查询调度器
+
+    用法：
+        scheduler = QueryScheduler(send)       # send(future) -> ReqQry* 返回码
+        future = scheduler.submit('positions')
+        rows = future.result(timeout)
+
+    send 由后台线程调用，负责构造请求、分配 nRequestID 并调用 ReqQry*；
+    返回 0 表示已发送，-2/-3 时稍后重发，其他值视为失败
+    """
+
+    def __init__(self, send: Callable[[QueryFuture], int], rate: float = 1.0, burst: int = 1,
+                 max_retries: int = 5, backoff: float = 0.5, backoff_max: float = 8.0,
+                 priorities: Optional[Dict[str, int]] = None,
+                 on_failed: Optional[Callable[[QueryFuture], None]] = None):
+        """
+        初始化调度器
+
+        Args:
+            send: 实际发送查询的函数
+            rate: 每秒发送的查询数（令牌补充速度），与前置的流控限制一致
+            burst: 令牌桶容量，即空闲后允许连续发送的查询数
+            max_retries: 被流控拒绝后的最多重发次数
+            backoff: 第一次重发前的等待秒数，之后每次翻倍
+            backoff_max: 重发等待秒数上限
+            priorities: 各查询类别的优先级，缺省见 DEFAULT_PRIORITIES
+            on_failed: 调度器结束失败查询（重发次数用尽、取消、停止）后的通知
+        """
+        self._send = send
+        self._on_failed = on_failed
+        self.rate = max(0.01, float(rate))
+        self.burst = max(1, int(burst))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff = max(0.0, float(backoff))
+        self.backoff_max = max(self.backoff, float(backoff_max))
+        self.priorities = dict(DEFAULT_PRIORITIES, **(priorities or {}))
+        self._cond = threading.Condition()
+        self._queue: List[_Entry] = []
+        self._seq = 0
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._stats = {'submitted': 0, 'coalesced': 0, 'sent': 0, 'throttled': 0,
+                       'failed': 0, 'cancelled': 0}
+
+    @staticmethod
+    def _key(kind: str, filters: Dict[str, Any]) -> Tuple:
+        return (kind,) + tuple(sorted((k, v) for k, v in filters.items() if v))
+
+    def submit(self, kind: str, priority: Optional[int] = None, **filters) -> QueryFuture:
+        """
+        提交一次查询
+
+        Args:
+            kind: 查询类别
+            priority: 优先级，为空时按类别取默认值
+            **filters: 过滤条件
+
+        Returns:
+            QueryFuture；队列中已有相同查询时返回同一个 future
+        """
+        if priority is None:
+            priority = self.priorities.get(kind, max(self.priorities.values()) + 1)
+        key = self._key(kind, filters)
+        with self._cond:
+            self._stats['submitted'] += 1
+            for entry in self._queue:
+                if entry.key == key:
+                    # 合并到排队中的相同查询，优先级取较高者
+                    entry.priority = min(entry.priority, priority)
+                    self._stats['coalesced'] += 1
+                    self._cond.notify()
+                    return entry.future
+            future = QueryFuture(kind, filters)
+            if not self._stopped:
+                self._seq += 1
+                self._queue.append(_Entry(key, future, priority, self._seq))
+                self._ensure_thread()
+                self._cond.notify()
+                return future
+        self._fail(future, "查询调度已停止")
+        return future
+
+    def _fail(self, future: QueryFuture, error: str):
+        if future.set_done(error) and self._on_failed is not None:
+            try:
+                self._on_failed(future)
+            except Exception as e:
+                logger.error(f"查询失败通知异常: {e}")
+
+    def cancel(self, future: QueryFuture, error: str = "查询已取消") -> bool:
+        """从队列中撤回尚未发送的查询，返回是否撤回成功"""
+        with self._cond:
+            for entry in self._queue:
+                if entry.future is future:
+                    self._queue.remove(entry)
+                    self._stats['cancelled'] += 1
+                    break
+            else:
+                return False
+        self._fail(future, error)
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="QueryScheduler", daemon=True)
+            self._thread.start()
+
+    def _refill(self, now: float):
+        self._tokens = min(float(self.burst), self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _next_entry(self) -> Optional[_Entry]:
+        """在锁内等待下一个可发送的查询（已到重发时间且有令牌），停止时返回 None"""
+        while not self._stopped:
+            now = time.monotonic()
+            self._refill(now)
+            ready = [e for e in self._queue if e.not_before <= now]
+            if ready and self._tokens >= 1:
+                entry = min(ready, key=lambda e: (e.priority, e.seq))
+                self._queue.remove(entry)
+                self._tokens -= 1
+                return entry
+            if ready:
+                timeout = (1 - self._tokens) / self.rate
+            elif self._queue:
+                timeout = min(e.not_before for e in self._queue) - now
+            else:
+                timeout = None
+            self._cond.wait(timeout)
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                entry = self._next_entry()
+            if entry is None:
+                return
+            future = entry.future
+            future.attempts += 1
+            try:
+                ret = self._send(future)
+            except Exception as e:
+                logger.error(f"发送查询失败: {entry.key} {e}")
+                self._fail(future, f"发送查询失败: {e}")
+                continue
+            with self._cond:
+                if ret in THROTTLED_CODES and future.attempts <= self.max_retries:
+                    # 被流控拒绝：令牌清空并退避后重新排队，优先级和先后顺序不变
+                    self._stats['throttled'] += 1
+                    self._tokens = 0.0
+                    entry.not_before = time.monotonic() + min(
+                        self.backoff_max, self.backoff * 2 ** (future.attempts - 1))
+                    self._queue.append(entry)
+                    continue
+                self._stats['sent' if ret == 0 else 'failed'] += 1
+            if ret in THROTTLED_CODES:
+                self._fail(future, f"查询被流控拒绝 {future.attempts} 次，错误码: {ret}")
+            elif ret != 0:
+                self._fail(future, f"查询发送失败，错误码: {ret}")
+
+    def start(self):
+        """stop() 之后重新接受查询（重新连接时调用），令牌桶重新装满"""
+        with self._cond:
+            self._stopped = False
+            self._tokens = float(self.burst)
+            self._refilled = time.monotonic()
+
+    def stop(self, error: str = "查询调度已停止"):
+        """停止后台线程，排队中的查询立即以错误结束，之后提交的查询直到 start() 都直接失败"""
+        with self._cond:
+            self._stopped = True
+            pending, self._queue = self._queue, []
+            self._cond.notify_all()
+        for entry in pending:
+            self._fail(entry.future, error)
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(5)
+        self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取累计计数
+
+        Returns:
+            {submitted, coalesced, sent, throttled, failed, cancelled, queued}
+        """
+        with self._cond:
+            result = dict(self._stats)
+            result['queued'] = len(self._queue)
+        return result
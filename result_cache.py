@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+已结算交易日的查询结果缓存
+交易日结算后委托、持仓、行情明细不再变化，DatabaseManager.query_orders/query_positions/
+query_market_data 对这些交易日的结果按 (表, 交易日, 过滤条件) 缓存在本地磁盘，
+最近使用的若干条同时保留在内存，界面反复切换过滤条件时不再每次读库。
+
+当前交易日及之后的交易日不缓存；通过 insert_*/delete_positions/write_snapshot 补写某个交易日时，
+该交易日的全部缓存条目随即失效（共用同一缓存目录的其他进程下次读取时也会发现）。
+
+文件格式：<cache_dir>/<表名>/<交易日>/<过滤条件摘要>.bin，
+12 字节头（魔数、版本、CRC32，小端）+ zlib 压缩的 pickle 负载 (字段名, 行元组列表)。
+缓存文件只由本进程写入和读取，缓存目录不要与不受信任的用户共享
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'CTRC'
+_VERSION = 1
+_HEADER = struct.Struct('<4sII')
+_SUFFIX = '.bin'
+
+
+def encode_result(rows: List[Dict[str, Any]]) -> bytes:
+    """把查询结果编码为缓存文件内容，同一结果的各行字段相同，只保存一次字段名"""
+    columns = tuple(rows[0]) if rows else ()
+    payload = zlib.compress(pickle.dumps(
+        (columns, [tuple(row.get(c) for c in columns) for row in rows]),
+        protocol=pickle.HIGHEST_PROTOCOL))
+    return _HEADER.pack(_MAGIC, _VERSION, zlib.crc32(payload)) + payload
+
+
+def decode_result(data: bytes) -> List[Dict[str, Any]]:
+    """
+    解码缓存文件内容
+
+    Raises:
+        ValueError: 文件头、版本或校验不符
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("缓存文件不完整")
+    magic, version, crc = _HEADER.unpack_from(data)
+    payload = data[_HEADER.size:]
+    if magic != _MAGIC or version != _VERSION or zlib.crc32(payload) != crc:
+        raise ValueError("缓存文件头或校验不符")
+    columns, values = pickle.loads(zlib.decompress(payload))
+    return [dict(zip(columns, row)) for row in values]
+
+
+class ResultCache:
+    """
+    两级（内存 + 磁盘）查询结果缓存
+
+    用法：
+        cache = ResultCache('./cache/query/')
+        rows = cache.get_or_load('daily_orders', '20250102', (instrument_id, limit), load)
+
+    load 为实际查询数据库的函数；交易日未结算时直接调用 load，不读写缓存
+    """
+
+    def __init__(self, directory: str = "./cache/query/", memory_entries: int = 64,
+                 current_trading_day: Optional[str] = None):
+        """
+        初始化缓存
+
+        Args:
+            directory: 缓存文件根目录
+            memory_entries: 内存中保留的最近使用条目数，0 表示只用磁盘
+            current_trading_day: 当前交易日（YYYYMMDD），早于它的交易日视为已结算；
+                为空时取本地日期
+        """
+        self.directory = directory
+        self.memory_entries = max(0, int(memory_entries))
+        self.current_trading_day = current_trading_day
+        self._lock = threading.Lock()
+        # 键 -> (行列表, 缓存文件的 (mtime_ns, size))，命中时核对文件未被其他进程失效
+        self._memory: 'OrderedDict[Tuple, Tuple[List[Dict[str, Any]], Tuple[int, int]]]' = OrderedDict()
+        # 各 (表, 交易日) 的失效代数和整体失效次数，查询期间发生失效的结果不写入缓存
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._epoch = 0
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0,
+                       'stored': 0, 'invalidated': 0, 'errors': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def is_closed(self, trading_day) -> bool:
+        """交易日是否已结算（早于当前交易日，且早于本地日期）"""
+        day = str(trading_day or '')
+        if len(day) != 8 or not day.isdigit():
+            return False
+        today = datetime.now().strftime('%Y%m%d')
+        current = self.current_trading_day
+        return day < (min(str(current), today) if current else today)
+
+    def _day_dir(self, table: str, trading_day: str) -> str:
+        return os.path.join(self.directory, table, trading_day)
+
+    def _path(self, table: str, trading_day: str, filters: Tuple) -> str:
+        digest = hashlib.sha1(repr(filters).encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self._day_dir(table, trading_day), digest + _SUFFIX)
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _remember(self, key: Tuple, rows: List[Dict[str, Any]], signature: Tuple[int, int]):
+        if not self.memory_entries:
+            return
+        with self._lock:
+            self._memory[key] = (rows, signature)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_or_load(self, table: str, trading_day, filters: Tuple,
+                    load: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        读取缓存，未命中时调用 load 并把结果写入缓存
+
+        Args:
+            table: 明细表
+            trading_day: 交易日
+            filters: 交易日以外的查询条件（合约、条数等），需可 repr
+            load: 查询数据库的函数
+
+        Returns:
+            查询结果
+        """
+        if not self.is_closed(trading_day):
+            with self._lock:
+                self._stats['bypassed'] += 1
+            return load()
+
+        day = str(trading_day)
+        key = (table, day, filters)
+        path = self._path(table, day, filters)
+        signature = self._signature(path)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and signature is not None and cached[1] == signature:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+            else:
+                cached = None
+                self._memory.pop(key, None)
+            generation = self._generation(table, day)
+        if cached is not None:
+            # 返回副本，调用方修改结果不影响缓存
+            return [dict(row) for row in cached[0]]
+
+        if signature is not None:
+            try:
+                with open(path, 'rb') as f:
+                    rows = decode_result(f.read())
+                self._remember(key, [dict(row) for row in rows], signature)
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                return rows
+            except (OSError, ValueError, pickle.UnpicklingError, zlib.error, EOFError) as e:
+                logger.warning(f"查询结果缓存文件损坏，已删除: {path} {e}")
+                self._remove(path)
+
+        rows = load()
+        with self._lock:
+            self._stats['misses'] += 1
+        # 空结果可能是查询失败或尚未补数，不缓存
+        if rows:
+            self._store(key, path, rows, generation)
+        return rows
+
+    def _generation(self, table: str, day: str) -> Tuple[int, int]:
+        return self._epoch, self._generations.get((table, day), 0)
+
+    def _store(self, key: Tuple, path: str, rows: List[Dict[str, Any]],
+               generation: Tuple[int, int]):
+        """
+        先写临时文件再原子替换，文件存在即完整
+
+        查询期间该交易日被补写过时结果可能是旧数据，不缓存；写文件时恰好发生失效的，写完后删除
+        """
+        if self._generation(key[0], key[1]) != generation:
+            return
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(encode_result(rows))
+            os.replace(tmp, path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"写入查询结果缓存失败: {path} {e}")
+            self._remove(tmp)
+            with self._lock:
+                self._stats['errors'] += 1
+            return
+        with self._lock:
+            if self._generation(key[0], key[1]) != generation:
+                self._remove(path)
+                return
+            self._stats['stored'] += 1
+        signature = self._signature(path)
+        if signature is not None:
+            self._remember(key, [dict(row) for row in rows], signature)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def invalidate(self, table: Optional[str] = None, trading_day=None) -> int:
+        """
+        使缓存条目失效
+
+        Args:
+            table: 明细表，为空时所有表
+            trading_day: 交易日，为空时该表的所有交易日
+
+        Returns:
+            失效的内存条目数
+        """
+        day = str(trading_day) if trading_day else None
+        with self._lock:
+            keys = [k for k in self._memory
+                    if (table is None or k[0] == table) and (day is None or k[1] == day)]
+            for k in keys:
+                del self._memory[k]
+            if table and day:
+                self._generations[(table, day)] = self._generations.get((table, day), 0) + 1
+            else:
+                self._epoch += 1
+            self._stats['invalidated'] += 1
+
+        try:
+            tables = [table] if table else os.listdir(self.directory)
+        except OSError:
+            tables = []
+        for name in tables:
+            path = os.path.join(self.directory, name)
+            shutil.rmtree(os.path.join(path, day) if day else path, ignore_errors=True)
+        return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取累计计数
+
+        Returns:
+            {memory_hits, disk_hits, misses, bypassed, stored, invalidated, errors, memory_entries}
+        """
+        with self._lock:
+            result = dict(self._stats)
+            result['memory_entries'] = len(self._memory)
+        return result
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+明细表分层保留
+daily_orders/daily_positions/market_data 按表配置保留最近多少个交易日的热数据，
+更早的交易日分批移入对应的 *_history 表，或写成 gzip 压缩的 JSON Lines 文件后从明细表删除；
+market_data 有独立日分区的交易日整体换出或删除分区，不逐行移动。
+归档位置登记在 archive_catalog 表，DatabaseManager.query_* 按交易日查询时自动读取，调用方无需修改。
+每轮执行前先维护 market_data 的交易日分区（预建未来分区、按配置清理过期分区）
+
+归档文件：<archive_dir>/<表名>/<交易日>.jsonl.gz，每行一条记录，
+日期时间字段的编码与本地写入缓冲（write_spool）相同（见 json_codec）
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from database_manager import HISTORY_TABLES, history_source
+from json_codec import json_default, json_object_hook
+
+logger = logging.getLogger(__name__)
+
+RETENTION_MODES = ('table', 'file')
+
+# 导出归档文件时使用的流式读取接口
+_ITERATORS = {
+    'daily_orders': 'iter_orders',
+    'daily_positions': 'iter_positions',
+    'market_data': 'iter_market_data',
+}
+
+
+def archive_file_path(archive_dir: str, table: str, trading_day: str) -> str:
+    """归档文件路径"""
+    return os.path.join(archive_dir, table, f"{trading_day}.jsonl.gz")
+
+
+def write_archive_file(path: str, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    把记录写成 gzip 压缩的 JSON Lines 文件
+
+    先写临时文件并落盘，再原子替换，文件存在即完整
+
+    Args:
+        path: 归档文件路径
+        rows: 记录迭代器
+
+    Returns:
+        写入的记录数
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp'
+    count = 0
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':'),
+                                   default=json_default).encode('utf-8'))
+                f.write(b'\n')
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+def read_archive_file(path: str) -> List[Dict[str, Any]]:
+    """
+    读取归档文件
+
+    Args:
+        path: 归档文件路径
+
+    Returns:
+        字典列表，字段与明细表查询结果相同
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line, object_hook=json_object_hook) for line in f if line.strip()]
+
+
+class RetentionManager:
+    """
+    明细表保留管理器
+
+    用法：
+        retention = RetentionManager(db_manager, {
+            'daily_orders': {'hot_days': 20},
+            'market_data': {'hot_days': 5, 'mode': 'file'},
+        })
+        retention.run_once()      # 或 retention.start() 在后台按 interval 定期执行
+
+    tables 为空时只做分区维护，长时间运行的程序也能按时预建新交易日的分区
+
+    每批在一个短事务内移动 batch_size 行，批间暂停 pause 秒；
+    执行中断后下次运行会从剩余的行继续，已登记的交易日沿用原来的归档位置
+    """
+
+    def __init__(self, db_manager, tables: Dict[str, Dict[str, Any]],
+                 archive_dir: str = "./archive/history/", batch_size: int = 5000,
+                 pause: float = 0.05, interval: float = 3600.0,
+                 partitions: Optional[Dict[str, Any]] = None):
+        """
+        初始化保留管理器
+
+        Args:
+            db_manager: 已 connect() 的数据库管理器
+            tables: {明细表: {'hot_days': 保留的交易日数, 'mode': 'table'/'file'}}
+            archive_dir: 归档文件根目录（mode 为 file 时使用）
+            batch_size: 每批移动/删除的行数
+            pause: 每批提交后的休眠秒数，用于降低对线上写入的影响
+            interval: 后台定期执行的间隔秒数
+            partitions: 分区维护参数 {'days_ahead', 'retention_days', 'archive'}，
+                        传给 maintain_market_data_partitions；默认只预建未来分区
+        """
+        for table, policy in tables.items():
+            if table not in HISTORY_TABLES:
+                raise ValueError(f"不支持分层保留的表: {table}")
+            if int(policy.get('hot_days', 0)) < 1:
+                raise ValueError(f"{table} 的 hot_days 至少为 1")
+            if policy.get('mode', 'table') not in RETENTION_MODES:
+                raise ValueError(f"不支持的归档方式: {policy.get('mode')}")
+        self.db = db_manager
+        self.tables = {t: dict(p) for t, p in tables.items()}
+        self.archive_dir = archive_dir
+        self.batch_size = max(1, int(batch_size))
+        self.pause = max(0.0, float(pause))
+        self.interval = max(1.0, float(interval))
+        self.partitions = dict(partitions or {})
+        unknown = set(self.partitions) - {'days_ahead', 'retention_days', 'archive'}
+        if unknown:
+            raise ValueError(f"不支持的分区维护参数: {sorted(unknown)}")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'runs': 0, 'days': 0, 'rows': 0, 'failed_days': 0,
+                       'partitions_created': 0, 'partitions_dropped': 0}
+
+    def plan(self) -> Dict[str, List[str]]:
+        """
+        计算各表超出保留期、需要移出的交易日
+
+        Returns:
+            {明细表: [交易日, ...]}，交易日从旧到新
+        """
+        result = {}
+        for table, policy in self.tables.items():
+            days = self.db.get_distinct_trading_days(table, include_history=False)
+            result[table] = sorted(days[int(policy['hot_days']):])
+        return result
+
+    def archive_day(self, table: str, trading_day: str, mode: str = 'table') -> int:
+        """
+        把一个交易日移出明细表
+
+        Args:
+            table: 明细表
+            trading_day: 交易日
+            mode: table 移入 history 表；file 写归档文件后删除
+
+        Returns:
+            移出的行数，失败返回 -1
+        """
+        location = self.db.history_location(table, trading_day)
+        in_table = location is not None and history_source(table, location) is not None
+        if in_table or (location is None and mode == 'table'):
+            return self.db.move_to_history(table, trading_day, self.batch_size, self.pause)
+
+        if location is None:
+            location = archive_file_path(self.archive_dir, table, trading_day)
+            try:
+                rows = getattr(self.db, _ITERATORS[table])(trading_day=trading_day)
+                count = write_archive_file(location, rows)
+            except Exception as e:
+                logger.error(f"写入归档文件失败: {location} {e}")
+                return -1
+            # 文件完整写好并登记后才删除明细
+            if not self.db.mark_archived(table, trading_day, location, count):
+                return -1
+        return self.db.purge_day(table, trading_day, self.batch_size, self.pause)
+
+    def run_once(self) -> Dict[str, Dict[str, int]]:
+        """
+        执行一轮保留策略
+
+        Returns:
+            {明细表: {交易日: 移出的行数}}
+        """
+        result: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            maintained = self.db.maintain_market_data_partitions(**self.partitions)
+            self._stats['partitions_created'] += len(maintained['created'])
+            self._stats['partitions_dropped'] += len(maintained['dropped'])
+            for table, days in self.plan().items():
+                mode = self.tables[table].get('mode', 'table')
+                for day in days:
+                    if self._stop.is_set():
+                        return result
+                    count = self.archive_day(table, day, mode)
+                    result.setdefault(table, {})[day] = count
+                    if count < 0:
+                        self._stats['failed_days'] += 1
+                    else:
+                        self._stats['days'] += 1
+                        self._stats['rows'] += count
+            self._stats['runs'] += 1
+        if result:
+            logger.info(f"分层保留完成: {result}")
+        return result
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"分层保留执行失败: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """启动后台线程，立即执行一轮，之后每隔 interval 秒执行一次"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="RetentionManager", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """停止后台线程（当前批次提交后退出）"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取累计计数
+
+        Returns:
+            {runs, days, rows, failed_days, partitions_created, partitions_dropped}
+        """
+        return dict(self._stats)
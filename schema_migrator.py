@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+表结构紧凑化迁移工具
+把旧表的 VARCHAR 交易日、中文枚举文本和 utf8mb4 代码列转换为紧凑类型：
+  - trading_day: INT UNSIGNED (YYYYMMDD)
+  - direction/offset_flag/order_status/position_type: TINYINT UNSIGNED 编码（见 enum_label 表）
+  - 合约/交易所/品种等 CTP 代码: ascii 字符集
+
+采用影子表在线迁移：建好紧凑结构的 _new_<表>，用触发器同步迁移期间的增删改，
+按主键顺序分块复制存量数据，最后用 RENAME TABLE 原子替换，迁移过程中原表可正常读写。
+DatabaseManager 的编码层会把读出的数据还原为原来的字典格式，调用方无需修改。
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from pymysql import Error
+
+from database_manager import DatabaseManager, ENUM_LABELS
+
+logger = logging.getLogger(__name__)
+
+_ASCII = "CHARACTER SET ascii COLLATE ascii_general_ci"
+
+# 各表需要转换的字段及目标类型
+COMPACT_COLUMNS = {
+    'daily_orders': {
+        'instrument_id': f"VARCHAR(31) {_ASCII} COMMENT '合约代码'",
+        'direction': "TINYINT UNSIGNED COMMENT '方向(编码见 enum_label)'",
+        'offset_flag': "TINYINT UNSIGNED COMMENT '开平(编码见 enum_label)'",
+        'order_status': "TINYINT UNSIGNED COMMENT '状态(编码见 enum_label)'",
+        'trading_day': "INT UNSIGNED COMMENT '交易日(YYYYMMDD)'",
+        'order_ref': f"VARCHAR(13) {_ASCII} COMMENT '报单引用'",
+        'exchange_id': f"VARCHAR(9) {_ASCII} COMMENT '交易所代码'",
+        'order_sys_id': f"VARCHAR(21) {_ASCII} COMMENT '报单编号'",
+        'order_key': f"VARCHAR(64) {_ASCII} COMMENT '委托唯一标识'",
+    },
+    'daily_positions': {
+        'instrument_id': f"VARCHAR(31) {_ASCII} COMMENT '合约代码'",
+        'direction': "TINYINT UNSIGNED COMMENT '方向(编码见 enum_label)'",
+        'position_type': "TINYINT UNSIGNED COMMENT '持仓类型(编码见 enum_label)'",
+        'trading_day': "INT UNSIGNED COMMENT '交易日(YYYYMMDD)'",
+    },
+    'market_data': {
+        'instrument_id': f"VARCHAR(31) {_ASCII} COMMENT '合约代码'",
+        'exchange_id': f"VARCHAR(10) {_ASCII} COMMENT '交易所代码'",
+        'trading_day': "INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '交易日(YYYYMMDD)'",
+    },
+    'market_data_latest': {
+        'instrument_id': f"VARCHAR(31) {_ASCII} NOT NULL COMMENT '合约代码'",
+        'exchange_id': f"VARCHAR(10) {_ASCII} COMMENT '交易所代码'",
+        'trading_day': "INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '交易日(YYYYMMDD)'",
+    },
+    'instrument_info': {
+        'instrument_id': f"VARCHAR(31) {_ASCII} COMMENT '合约代码'",
+        'exchange_id': f"VARCHAR(10) {_ASCII} COMMENT '交易所代码'",
+        'product_id': f"VARCHAR(31) {_ASCII} COMMENT '品种代码'",
+    },
+}
+
+
+class SchemaMigrator:
+    """紧凑表结构迁移器"""
+
+    def __init__(self, db_manager: DatabaseManager, chunk_size: int = 10000,
+                 pause: float = 0.0):
+        """
+        初始化迁移器
+
+        Args:
+            db_manager: 已 connect() 的数据库管理器
+            chunk_size: 每块复制的行数
+            pause: 每块复制后的休眠秒数，用于降低对线上写入的影响
+        """
+        self.db = db_manager
+        self.chunk_size = max(1, int(chunk_size))
+        self.pause = pause
+
+    # ------------------------------------------------------------------
+    # 空间统计
+    # ------------------------------------------------------------------
+    def table_sizes(self, tables: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        统计各表的数据和索引占用（先 ANALYZE 刷新统计信息）
+
+        Returns:
+            {表名: {'rows': 行数估计, 'data_bytes': 数据字节, 'index_bytes': 索引字节}}
+        """
+        tables = tables or list(COMPACT_COLUMNS)
+        sizes = {}
+        conn = None
+        try:
+            conn = self.db._get_connection()
+            with conn.cursor() as cursor:
+                for table in tables:
+                    cursor.execute(f"ANALYZE TABLE {table}")
+                    cursor.fetchall()
+                    cursor.execute(
+                        "SELECT TABLE_ROWS AS table_rows, DATA_LENGTH AS data_bytes, "
+                        "INDEX_LENGTH AS index_bytes FROM information_schema.TABLES "
+                        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                        (self.db.database, table)
+                    )
+                    row = cursor.fetchone()
+                    if row:
+                        sizes[table] = {
+                            'rows': int(row['table_rows'] or 0),
+                            'data_bytes': int(row['data_bytes'] or 0),
+                            'index_bytes': int(row['index_bytes'] or 0),
+                        }
+            return sizes
+        except Error as e:
+            logger.error(f"统计表空间失败: {e}")
+            return sizes
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------
+    # 迁移
+    # ------------------------------------------------------------------
+    def migrate(self, tables: Optional[List[str]] = None,
+                keep_old: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        逐表迁移为紧凑结构，已迁移的表跳过
+
+        Args:
+            tables: 要迁移的表，默认全部
+            keep_old: 是否保留原表（重命名为 _old_<表>）
+
+        Returns:
+            {表名: {'status': 'migrated'/'skipped'/'failed', 'before': {...}, 'after': {...}}}
+        """
+        tables = tables or list(COMPACT_COLUMNS)
+        report = {}
+        for table in tables:
+            if table not in COMPACT_COLUMNS:
+                raise ValueError(f"不支持迁移的表: {table}")
+            before = self.table_sizes([table]).get(table, {})
+            conn = None
+            try:
+                conn = self.db._get_connection()
+                with conn.cursor() as cursor:
+                    if self._is_compact(cursor, table):
+                        report[table] = {'status': 'skipped', 'before': before, 'after': before}
+                        continue
+                    self._migrate_table(conn, cursor, table, keep_old)
+                status = 'migrated'
+            except Error as e:
+                logger.error(f"迁移 {table} 失败: {e}")
+                self._cleanup(table)
+                status = 'failed'
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self.db.reload_schema()
+            after = self.table_sizes([table]).get(table, {})
+            report[table] = {'status': status, 'before': before, 'after': after}
+            logger.info(f"{table} 迁移结果: {report[table]}")
+        return report
+
+    def _columns(self, cursor, table: str) -> List[Dict[str, Any]]:
+        cursor.execute(
+            "SELECT COLUMN_NAME AS name, DATA_TYPE AS data_type, CHARACTER_SET_NAME AS charset "
+            "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s "
+            "ORDER BY ORDINAL_POSITION",
+            (self.db.database, table)
+        )
+        return list(cursor.fetchall())
+
+    def _is_compact(self, cursor, table: str) -> bool:
+        """目标字段是否都已是紧凑类型"""
+        current = {c['name']: c for c in self._columns(cursor, table)}
+        for name, definition in COMPACT_COLUMNS[table].items():
+            column = current.get(name)
+            if column is None:
+                continue
+            if definition.startswith(('TINYINT', 'INT')):
+                if column['data_type'] not in ('tinyint', 'int'):
+                    return False
+            elif column['charset'] != 'ascii':
+                return False
+        return True
+
+    def _primary_key(self, cursor, table: str) -> List[str]:
+        """表的主键字段（按定义顺序）"""
+        cursor.execute(
+            "SELECT COLUMN_NAME AS name FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY' "
+            "ORDER BY ORDINAL_POSITION",
+            (self.db.database, table)
+        )
+        return [row['name'] for row in cursor.fetchall()]
+
+    def _expr(self, table: str, column: str, src: str) -> str:
+        """旧字段值到紧凑类型的转换表达式，src 为 'src'（复制）或 'NEW'（触发器）"""
+        value = f"{src}.{column}"
+        if column == 'trading_day' and column in COMPACT_COLUMNS[table]:
+            day = f"CAST(NULLIF({value}, '') AS UNSIGNED)"
+            return f"IFNULL({day}, 0)" if 'NOT NULL' in COMPACT_COLUMNS[table][column] else day
+        if column in ENUM_LABELS and column in COMPACT_COLUMNS[table]:
+            return (f"(SELECT code FROM enum_label WHERE column_name = '{column}' "
+                    f"AND label = {value} COLLATE utf8mb4_bin)")
+        return value
+
+    def _seed_labels(self, cursor, table: str, columns: List[str]):
+        """为表中已有的枚举文本预先分配编码，复制和触发器只需查表"""
+        for column in columns:
+            if column not in ENUM_LABELS or column not in COMPACT_COLUMNS[table]:
+                continue
+            cursor.execute(f"SELECT DISTINCT {column} AS label FROM {table} WHERE {column} IS NOT NULL")
+            for row in cursor.fetchall():
+                if self.db.enum_code(column, row['label']) is None:
+                    raise Error(f"{table}.{column} 无法为 {row['label']!r} 分配编码")
+
+    def _migrate_table(self, conn, cursor, table: str, keep_old: bool):
+        shadow, old = f"_new_{table}", f"_old_{table}"
+        columns = [c['name'] for c in self._columns(cursor, table)]
+        col_sql = ", ".join(columns)
+        self._cleanup(table)
+        self._seed_labels(cursor, table, columns)
+
+        # 1. 建影子表：复制原表定义后修改字段类型，分区表按整数边界重新分区
+        partitions = self.db._get_partitions(cursor, table)
+        cursor.execute(f"CREATE TABLE {shadow} LIKE {table}")
+        if partitions:
+            cursor.execute(f"ALTER TABLE {shadow} REMOVE PARTITIONING")
+        modifies = [f"MODIFY {name} {definition}"
+                    for name, definition in COMPACT_COLUMNS[table].items() if name in columns]
+        cursor.execute(f"ALTER TABLE {shadow} " + ", ".join(modifies))
+        if partitions:
+            defs = []
+            for p in partitions:
+                bound = p['bound'].strip("'")
+                value = bound if bound == 'MAXVALUE' else str(int(bound or 0))
+                defs.append(f"PARTITION {p['name']} VALUES LESS THAN ({value})")
+            cursor.execute(
+                f"ALTER TABLE {shadow} PARTITION BY RANGE COLUMNS(trading_day) ({', '.join(defs)})"
+            )
+
+        # 2. 触发器同步迁移期间的写入
+        new_values = ", ".join(self._expr(table, c, 'NEW') for c in columns)
+        for event in ('INSERT', 'UPDATE'):
+            cursor.execute(
+                f"CREATE TRIGGER _mig_{table}_{event[:3].lower()} AFTER {event} ON {table} "
+                f"FOR EACH ROW REPLACE INTO {shadow} ({col_sql}) VALUES ({new_values})"
+            )
+        # 删除按主键定位影子表中的行（主键字段同样要转换为紧凑类型）
+        primary_key = self._primary_key(cursor, table)
+        if not primary_key:
+            raise Error(f"{table} 没有主键，无法在线迁移")
+        match = " AND ".join(f"{c} = {self._expr(table, c, 'OLD')}" for c in primary_key)
+        cursor.execute(
+            f"CREATE TRIGGER _mig_{table}_del AFTER DELETE ON {table} "
+            f"FOR EACH ROW DELETE FROM {shadow} WHERE {match}"
+        )
+        conn.commit()
+
+        # 3. 按主键顺序分块复制存量数据；触发器已写入的较新数据不会被覆盖。
+        #    有自增 id 的表按 id 分块（分区表的主键为 (id, trading_day)，id 本身唯一），
+        #    否则按单列主键分块（如 market_data_latest 的 instrument_id）
+        key = 'id' if 'id' in columns else primary_key[0]
+        if key != 'id' and len(primary_key) > 1:
+            raise Error(f"{table} 的复合主键不支持分块复制")
+        select = ", ".join(self._expr(table, c, 'src') for c in columns)
+        last = None
+        copied = 0
+        while True:
+            after = "" if last is None else f"WHERE {key} > %s"
+            cursor.execute(
+                f"SELECT {key} AS k FROM {table} {after} ORDER BY {key} "
+                f"LIMIT 1 OFFSET {self.chunk_size - 1}",
+                () if last is None else (last,)
+            )
+            row = cursor.fetchone()
+            upper = row['k'] if row else None
+            conditions, params = [], []
+            if last is not None:
+                conditions.append(f"src.{key} > %s")
+                params.append(last)
+            if upper is not None:
+                conditions.append(f"src.{key} <= %s")
+                params.append(upper)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            cursor.execute(
+                f"INSERT IGNORE INTO {shadow} ({col_sql}) SELECT {select} FROM {table} AS src{where}",
+                params
+            )
+            conn.commit()
+            copied += cursor.rowcount
+            if upper is None:
+                break
+            last = upper
+            if self.pause:
+                time.sleep(self.pause)
+        logger.info(f"{table} 已复制 {copied} 条记录")
+
+        # 4. 原子替换并清理
+        cursor.execute(f"RENAME TABLE {table} TO {old}, {shadow} TO {table}")
+        self._drop_triggers(cursor, table)
+        if not keep_old:
+            cursor.execute(f"DROP TABLE {old}")
+        conn.commit()
+        logger.info(f"{table} 已转换为紧凑结构")
+
+    def _drop_triggers(self, cursor, table: str):
+        for suffix in ('ins', 'upd', 'del'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS _mig_{table}_{suffix}")
+
+    def _cleanup(self, table: str):
+        """清理失败或中断的迁移留下的触发器和影子表"""
+        conn = None
+        try:
+            conn = self.db._get_connection()
+            with conn.cursor() as cursor:
+                self._drop_triggers(cursor, table)
+                cursor.execute(f"DROP TABLE IF EXISTS _new_{table}")
+            conn.commit()
+        except Error as e:
+            logger.error(f"清理 {table} 迁移残留失败: {e}")
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def _mb(size: Dict[str, int], key: str) -> float:
+    return size.get(key, 0) / 1024 / 1024
+
+
+def _format_report(report: Dict[str, Dict[str, Any]]) -> str:
+    """格式化迁移前后的空间对比"""
+    lines = [f"{'表':<20}{'状态':<10}{'数据(前→后) MB':<24}{'索引(前→后) MB':<24}"]
+    for table, item in report.items():
+        before, after = item.get('before', {}), item.get('after', {})
+        lines.append(
+            f"{table:<20}{item['status']:<10}"
+            f"{_mb(before, 'data_bytes'):>8.2f} → {_mb(after, 'data_bytes'):<12.2f}"
+            f"{_mb(before, 'index_bytes'):>8.2f} → {_mb(after, 'index_bytes'):<12.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """命令行入口：读取 config.json 中的数据库配置执行迁移"""
+    parser = argparse.ArgumentParser(description="将表结构迁移为紧凑类型")
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--tables', nargs='*', help='要迁移的表，默认全部')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='每块复制的行数')
+    parser.add_argument('--pause', type=float, default=0.0, help='每块复制后的休眠秒数')
+    parser.add_argument('--keep-old', action='store_true', help='保留原表为 _old_<表>')
+    parser.add_argument('--report-only', action='store_true', help='只输出当前空间占用')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.config):
+        print(f"配置文件不存在: {args.config}")
+        return
+    with open(args.config, 'r', encoding='utf-8') as f:
+        db_config = json.load(f)['database']
+
+    db = DatabaseManager(
+        host=db_config['host'],
+        port=db_config.get('port', 3306),
+        user=db_config['user'],
+        password=db_config['password'],
+        database=db_config['database'],
+    )
+    if not db.connect():
+        print("数据库连接失败")
+        return
+
+    migrator = SchemaMigrator(db, chunk_size=args.chunk_size, pause=args.pause)
+    if args.report_only:
+        sizes = migrator.table_sizes(args.tables)
+        report = {t: {'status': '-', 'before': s, 'after': s} for t, s in sizes.items()}
+    else:
+        report = migrator.migrate(args.tables, keep_old=args.keep_old)
+    print(_format_report(report))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
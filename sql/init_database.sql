@@ -24,13 +24,21 @@ CREATE TABLE daily_orders (
     order_status VARCHAR(20) COMMENT '订单状态 (全部成交/部分成交/未成交等)',
     remark TEXT COMMENT '备注信息',
     trading_day VARCHAR(20) COMMENT '交易日 (YYYYMMDD)',
+    front_id INT COMMENT '前置编号',
+    session_id INT COMMENT '会话编号',
+    order_ref VARCHAR(13) COMMENT '报单引用',
+    exchange_id VARCHAR(9) COMMENT '交易所代码',
+    order_sys_id VARCHAR(21) COMMENT '报单编号',
+    order_key VARCHAR(64) COMMENT '委托唯一标识 (FrontID/SessionID/OrderRef 或 ExchangeID/OrderSysID)',
     create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '记录创建时间',
     update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
     
-    -- 索引
-    INDEX idx_instrument (instrument_id),
-    INDEX idx_trading_day (trading_day),
-    INDEX idx_order_time (order_time)
+    -- 同一委托重复下载时按自然键更新，不再追加
+    UNIQUE KEY uk_order (trading_day, order_key),
+    
+    -- 索引（与程序 INDEX_PLAN 保持一致，覆盖按交易日/合约过滤并按委托时间倒序的查询）
+    INDEX idx_day_time (trading_day, order_time),
+    INDEX idx_inst_day_time (instrument_id, trading_day, order_time)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='当日委托表';
 
 -- ============================================================================
@@ -56,17 +64,19 @@ CREATE TABLE daily_positions (
     
     -- 索引和约束
     UNIQUE KEY uk_position (instrument_id, direction, trading_day) COMMENT '防止重复持仓记录',
-    INDEX idx_trading_day (trading_day)
+    INDEX idx_day_inst_dir (trading_day, instrument_id, direction)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='当日持仓表';
 
 -- ============================================================================
 -- 3. 市场行情表 (market_data)
 -- 用途: 记录实时行情快照
+-- 分区: 按交易日 RANGE COLUMNS 分区，程序连接时自动预建未来交易日分区，
+--       过期分区可整体 DROP / EXCHANGE，查询按 trading_day 过滤时只扫描对应分区
 -- ============================================================================
 DROP TABLE IF EXISTS market_data;
 
 CREATE TABLE market_data (
-    id INT AUTO_INCREMENT PRIMARY KEY COMMENT '自增主键',
+    id INT AUTO_INCREMENT COMMENT '自增主键',
     instrument_id VARCHAR(31) COMMENT '合约代码',
     exchange_id VARCHAR(10) COMMENT '交易所代码 (SHFE/DCE/CZCE/CFFEX/INE/GFEX)',
     update_time VARCHAR(20) COMMENT '行情更新时间 (HH:MM:SS)',
@@ -87,15 +97,79 @@ CREATE TABLE market_data (
     bid_volume1 INT COMMENT '买一量',
     ask_price1 DECIMAL(15, 4) COMMENT '卖一价',
     ask_volume1 INT COMMENT '卖一量',
-    trading_day VARCHAR(20) COMMENT '交易日 (YYYYMMDD)',
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
     create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '记录创建时间',
     record_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
     
-    -- 索引
-    INDEX idx_instrument (instrument_id),
-    INDEX idx_trading_day (trading_day),
-    INDEX idx_update_time (update_time)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='市场行情表';
+    -- 主键和索引（分区表的主键必须包含分区列）
+    PRIMARY KEY (id, trading_day),
+    INDEX idx_day_time (trading_day, update_time),
+    INDEX idx_inst_day_time (instrument_id, trading_day, update_time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='市场行情表'
+PARTITION BY RANGE COLUMNS(trading_day) (
+    PARTITION p_history VALUES LESS THAN ('20250101'),
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+-- ============================================================================
+-- 3.1 最新行情表 (market_data_latest)
+-- 用途: 每个合约只保留最新一笔行情，由程序写入行情时同步 upsert，
+--       查询最新行情无需扫描 market_data
+-- ============================================================================
+DROP TABLE IF EXISTS market_data_latest;
+
+CREATE TABLE market_data_latest (
+    instrument_id VARCHAR(31) NOT NULL PRIMARY KEY COMMENT '合约代码',
+    exchange_id VARCHAR(10) COMMENT '交易所代码',
+    update_time VARCHAR(20) COMMENT '行情更新时间 (HH:MM:SS)',
+    last_price DECIMAL(15, 4) COMMENT '最新价',
+    pre_settlement_price DECIMAL(15, 4) COMMENT '昨结算价',
+    pre_close_price DECIMAL(15, 4) COMMENT '昨收盘价',
+    open_price DECIMAL(15, 4) COMMENT '今开盘价',
+    highest_price DECIMAL(15, 4) COMMENT '最高价',
+    lowest_price DECIMAL(15, 4) COMMENT '最低价',
+    volume INT COMMENT '成交量 (手)',
+    turnover DECIMAL(20, 2) COMMENT '成交额',
+    open_interest INT COMMENT '持仓量 (手)',
+    close_price DECIMAL(15, 4) COMMENT '今收盘价',
+    settlement_price DECIMAL(15, 4) COMMENT '今结算价',
+    upper_limit_price DECIMAL(15, 4) COMMENT '涨停板价',
+    lower_limit_price DECIMAL(15, 4) COMMENT '跌停板价',
+    bid_price1 DECIMAL(15, 4) COMMENT '买一价',
+    bid_volume1 INT COMMENT '买一量',
+    ask_price1 DECIMAL(15, 4) COMMENT '卖一价',
+    ask_volume1 INT COMMENT '卖一量',
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
+    record_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
+    
+    INDEX idx_exchange (exchange_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='最新行情表';
+
+-- ============================================================================
+-- 3.2 K线表 (kline)
+-- 用途: bar_engine.py 由实时行情合成的 1m/5m/15m/1d K线，
+--       bar_time 为K线起始的自然时间（夜盘零点后为次日日期），trading_day 为所属交易日
+-- ============================================================================
+DROP TABLE IF EXISTS kline;
+
+CREATE TABLE kline (
+    instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+    period VARCHAR(8) NOT NULL COMMENT '周期 (1m/5m/15m/1d)',
+    bar_time DATETIME NOT NULL COMMENT 'K线起始时间',
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
+    open_price DECIMAL(15, 4) COMMENT '开盘价',
+    high_price DECIMAL(15, 4) COMMENT '最高价',
+    low_price DECIMAL(15, 4) COMMENT '最低价',
+    close_price DECIMAL(15, 4) COMMENT '收盘价',
+    volume BIGINT COMMENT '成交量 (手)',
+    turnover DECIMAL(20, 2) COMMENT '成交额',
+    open_interest DECIMAL(20, 2) COMMENT '持仓量 (手)',
+    tick_count INT COMMENT 'tick数',
+    record_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
+    
+    PRIMARY KEY (instrument_id, period, bar_time),
+    INDEX idx_day_period (trading_day, period)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='K线表';
 
 -- ============================================================================
 -- 4. 合约信息表 (instrument_info)
@@ -131,15 +205,143 @@ CREATE TABLE instrument_info (
     
     -- 索引
     INDEX idx_product (product_id),
-    INDEX idx_exchange (exchange_id)
+    INDEX idx_exch_trading_inst (exchange_id, is_trading, instrument_id),
+    INDEX idx_trading_inst (is_trading, instrument_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='合约信息表';
 
+-- ============================================================================
+-- 5. 表结构版本表 (schema_version)
+-- 用途: 记录索引方案等结构变更已应用的版本，程序连接时据此决定是否调整索引
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS schema_version (
+    component VARCHAR(31) PRIMARY KEY COMMENT '组件',
+    version INT NOT NULL COMMENT '已应用版本',
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='表结构版本表';
+
+REPLACE INTO schema_version (component, version) VALUES ('index_plan', 2);
+
+-- ============================================================================
+-- 6. 枚举编码表 (enum_label)
+-- 用途: schema_migrator.py 把方向/开平/状态/持仓类型转换为 TINYINT 编码后，
+--       编码与中文文本的对应关系；程序读写时自动转换，手工查询可 JOIN 本表
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS enum_label (
+    column_name VARCHAR(32) NOT NULL COMMENT '字段名',
+    code TINYINT UNSIGNED NOT NULL COMMENT '编码',
+    label VARCHAR(64) COLLATE utf8mb4_bin NOT NULL COMMENT '文本',
+    PRIMARY KEY (column_name, code),
+    UNIQUE KEY uk_label (column_name, label)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='枚举编码表';
+
+INSERT IGNORE INTO enum_label (column_name, code, label) VALUES
+    ('direction', 0, ''), ('direction', 1, '买入'), ('direction', 2, '卖出'),
+    ('direction', 3, '多头'), ('direction', 4, '空头'),
+    ('offset_flag', 0, ''), ('offset_flag', 1, '开仓'), ('offset_flag', 2, '平仓'),
+    ('offset_flag', 3, '强平'), ('offset_flag', 4, '平今'), ('offset_flag', 5, '平昨'),
+    ('offset_flag', 6, '强减'), ('offset_flag', 7, '本地强平'), ('offset_flag', 8, '未知'),
+    ('order_status', 0, ''), ('order_status', 1, '全部成交'), ('order_status', 2, '部分成交还在队列中'),
+    ('order_status', 3, '部分成交不在队列中'), ('order_status', 4, '未成交还在队列中'),
+    ('order_status', 5, '未成交不在队列中'), ('order_status', 6, '撤单'), ('order_status', 7, '未知'),
+    ('order_status', 8, '尚未触发'), ('order_status', 9, '已触发'),
+    ('position_type', 0, ''), ('position_type', 1, '总仓'), ('position_type', 2, '今仓'),
+    ('position_type', 3, '昨仓');
+
+-- ============================================================================
+-- 7. 下载快照表 (snapshot) / 快照记录版本表 (snapshot_rows)
+-- 用途: 自动下载每个周期的委托/持仓/成交/资金在同一事务内写入，snapshot_id 单调递增；
+--       记录在 [valid_from, valid_to) 区间的快照中有效，按快照编号读出当时的一致视图
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS snapshot (
+    snapshot_id BIGINT NOT NULL PRIMARY KEY COMMENT '快照编号',
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
+    order_count INT COMMENT '委托数 (NULL=本周期未查询)',
+    position_count INT COMMENT '持仓数',
+    trade_count INT COMMENT '成交数',
+    account_count INT COMMENT '资金账户数',
+    changed_rows INT COMMENT '新增/变化/消失的记录数',
+    create_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '记录创建时间',
+    INDEX idx_day (trading_day, snapshot_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='下载快照表';
+
+CREATE TABLE IF NOT EXISTS snapshot_rows (
+    kind VARCHAR(16) NOT NULL COMMENT '数据类型 (orders/positions/trades/accounts)',
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
+    row_key VARCHAR(128) NOT NULL COMMENT '记录键',
+    valid_from BIGINT NOT NULL COMMENT '起始快照',
+    valid_to BIGINT NULL COMMENT '失效快照，NULL 表示仍有效',
+    instrument_id VARCHAR(31) NOT NULL DEFAULT '' COMMENT '合约代码',
+    row_hash CHAR(32) NOT NULL COMMENT '内容哈希',
+    data TEXT NOT NULL COMMENT '记录内容 (JSON)',
+    PRIMARY KEY (kind, trading_day, row_key, valid_from)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='快照记录版本表';
+
+-- ============================================================================
+-- 8. 每日汇总表 (daily_order_summary / daily_position_summary / daily_market_summary)
+-- 用途: 按 交易日 × 合约 预聚合的委托、持仓和行情统计，程序写入明细时在同一事务内增量维护，
+--       报表和界面直接读取，无需对明细表 GROUP BY
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS daily_order_summary (
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
+    instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+    order_count INT NOT NULL DEFAULT 0 COMMENT '委托笔数',
+    order_volume BIGINT NOT NULL DEFAULT 0 COMMENT '委托数量',
+    traded_volume BIGINT NOT NULL DEFAULT 0 COMMENT '成交数量',
+    filled_orders INT NOT NULL DEFAULT 0 COMMENT '全部成交笔数',
+    cancelled_orders INT NOT NULL DEFAULT 0 COMMENT '撤单笔数',
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
+    PRIMARY KEY (trading_day, instrument_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日委托汇总表';
+
+CREATE TABLE IF NOT EXISTS daily_position_summary (
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
+    instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+    long_volume BIGINT NOT NULL DEFAULT 0 COMMENT '多头持仓',
+    short_volume BIGINT NOT NULL DEFAULT 0 COMMENT '空头持仓',
+    position_profit DECIMAL(15, 2) NOT NULL DEFAULT 0 COMMENT '持仓盈亏',
+    close_profit DECIMAL(15, 2) NOT NULL DEFAULT 0 COMMENT '平仓盈亏',
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
+    PRIMARY KEY (trading_day, instrument_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日持仓汇总表';
+
+CREATE TABLE IF NOT EXISTS daily_market_summary (
+    trading_day VARCHAR(20) NOT NULL DEFAULT '' COMMENT '交易日 (YYYYMMDD)',
+    instrument_id VARCHAR(31) NOT NULL COMMENT '合约代码',
+    exchange_id VARCHAR(10) COMMENT '交易所代码',
+    open_price DECIMAL(15, 4) COMMENT '开盘价',
+    high_price DECIMAL(15, 4) COMMENT '最高价',
+    low_price DECIMAL(15, 4) COMMENT '最低价',
+    last_price DECIMAL(15, 4) COMMENT '最新价',
+    pre_settlement_price DECIMAL(15, 4) COMMENT '昨结算价',
+    volume BIGINT COMMENT '成交量',
+    turnover DECIMAL(20, 2) COMMENT '成交额',
+    open_interest INT COMMENT '持仓量',
+    tick_count INT NOT NULL DEFAULT 0 COMMENT '行情条数',
+    last_seq INT NOT NULL DEFAULT -1 COMMENT '最新行情在交易日内的序号（夜盘在前）',
+    update_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '记录更新时间',
+    PRIMARY KEY (trading_day, instrument_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='每日行情汇总表';
+
+-- ============================================================================
+-- 9. 归档目录表 (archive_catalog)
+-- 用途: retention_manager.py 把超出保留期的交易日移出明细表后，登记该交易日的位置
+--       ('table' 表示 *_history 表，否则为归档文件路径)；*_history 表由程序首次归档时按明细表结构创建
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS archive_catalog (
+    table_name VARCHAR(31) NOT NULL COMMENT '明细表',
+    trading_day VARCHAR(20) NOT NULL COMMENT '交易日 (YYYYMMDD)',
+    location VARCHAR(255) NOT NULL COMMENT 'table 或归档文件路径',
+    row_count BIGINT COMMENT '归档行数',
+    archive_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '登记时间',
+    PRIMARY KEY (table_name, trading_day)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='归档目录表';
+
 -- ============================================================================
 -- 初始化完成提示
 -- ============================================================================
 SELECT '数据库初始化完成！' AS message,
        'qihuo' AS database_name,
-       '4' AS tables_created,
+       '14' AS tables_created,
        'utf8mb4' AS charset;
 
 -- 查看创建的表
@@ -162,4 +364,9 @@ SHOW TABLES;
 --
 -- 4. 查看索引:
 --    SHOW INDEX FROM daily_orders;
+--
+-- 5. 查看行情分区及分区裁剪:
+--    SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+--    FROM information_schema.PARTITIONS WHERE TABLE_NAME = 'market_data';
+--    EXPLAIN SELECT * FROM market_data WHERE trading_day = '20250102';
 -- ============================================================================
@@ -4,13 +4,19 @@
 
 USE qihuo;
 
+-- 注: 执行 schema_migrator.py 转换为紧凑结构后，trading_day 为整数 (如 20250129)，
+--     direction/offset_flag/order_status/position_type 为编码，文本条件需改为关联 enum_label，例如:
+--     SELECT o.*, d.label AS direction_text FROM daily_orders o
+--     JOIN enum_label d ON d.column_name = 'direction' AND d.code = o.direction
+--     WHERE o.trading_day = 20250129 AND d.label = '买入';
+
 -- ============================================================================
 -- 1. 当日委托查询
 -- ============================================================================
 
 -- 查询所有委托
 SELECT * FROM daily_orders 
-ORDER BY order_time DESC 
+ORDER BY trading_day DESC, order_time DESC 
 LIMIT 100;
 
 -- 查询特定合约的委托
@@ -23,15 +29,17 @@ SELECT * FROM daily_orders
 WHERE trading_day = '20251229' 
 ORDER BY order_time DESC;
 
--- 统计各合约委托量
+-- 统计各合约委托量（读每日委托汇总表，无需 GROUP BY 明细）
 SELECT 
     instrument_id AS '合约',
-    COUNT(*) AS '委托笔数',
-    SUM(order_volume) AS '总委托量',
-    SUM(traded_volume) AS '总成交量'
-FROM daily_orders
-GROUP BY instrument_id
-ORDER BY COUNT(*) DESC;
+    order_count AS '委托笔数',
+    order_volume AS '总委托量',
+    traded_volume AS '总成交量',
+    filled_orders AS '全部成交笔数',
+    cancelled_orders AS '撤单笔数'
+FROM daily_order_summary
+WHERE trading_day = '20251229'
+ORDER BY order_count DESC;
 
 -- 查询未成交订单
 SELECT * FROM daily_orders 
@@ -60,12 +68,15 @@ SELECT * FROM daily_positions
 WHERE direction = '空头'
 ORDER BY position_profit DESC;
 
--- 统计总持仓盈亏
+-- 统计总持仓盈亏（读每日持仓汇总表，每个交易日一行）
 SELECT 
+    trading_day AS '交易日',
     SUM(position_profit) AS '总浮动盈亏',
     SUM(close_profit) AS '总平仓盈亏',
     SUM(position_profit + close_profit) AS '总盈亏'
-FROM daily_positions;
+FROM daily_position_summary
+GROUP BY trading_day
+ORDER BY trading_day DESC;
 
 -- 按合约统计持仓
 SELECT 
@@ -81,7 +92,7 @@ GROUP BY instrument_id, direction;
 -- 3. 市场行情查询
 -- ============================================================================
 
--- 查询最新行情
+-- 查询最新行情（每个合约一行，读最新行情表）
 SELECT 
     instrument_id AS '合约',
     exchange_id AS '交易所',
@@ -90,9 +101,8 @@ SELECT
     volume AS '成交量',
     open_interest AS '持仓量',
     update_time AS '更新时间'
-FROM market_data
-ORDER BY update_time DESC
-LIMIT 20;
+FROM market_data_latest
+ORDER BY instrument_id;
 
 -- 查询特定合约行情
 SELECT * FROM market_data 
@@ -106,7 +116,7 @@ SELECT
     last_price AS '最新价',
     pre_settlement_price AS '昨结算',
     ROUND((last_price - pre_settlement_price) / pre_settlement_price * 100, 2) AS '涨跌幅%'
-FROM market_data
+FROM market_data_latest
 WHERE last_price > 0 AND pre_settlement_price > 0
 ORDER BY (last_price - pre_settlement_price) / pre_settlement_price DESC
 LIMIT 10;
@@ -118,12 +128,12 @@ SELECT
     turnover AS '成交额',
     open_interest AS '持仓量',
     last_price AS '最新价'
-FROM market_data
+FROM market_data_latest
 ORDER BY volume DESC
 LIMIT 10;
 
--- 查询特定交易所的行情
-SELECT * FROM market_data 
+-- 查询特定交易所的最新行情
+SELECT * FROM market_data_latest 
 WHERE exchange_id = 'SHFE' 
 ORDER BY volume DESC;
 
@@ -184,23 +194,41 @@ SELECT
         ELSE 0
     END AS '浮动盈亏'
 FROM daily_positions p
-LEFT JOIN market_data m ON p.instrument_id = m.instrument_id
+LEFT JOIN market_data_latest m ON p.instrument_id = m.instrument_id
 LEFT JOIN instrument_info i ON p.instrument_id = i.instrument_id
 WHERE p.volume > 0
 ORDER BY p.instrument_id;
 
--- 今日交易活跃品种
+-- 今日交易活跃品种（汇总表每个合约一行，按品种再合计只涉及少量行）
 SELECT 
     i.product_id AS '品种',
-    COUNT(DISTINCT o.instrument_id) AS '合约数',
-    SUM(o.order_volume) AS '总委托量',
-    SUM(o.traded_volume) AS '总成交量',
-    ROUND(SUM(o.traded_volume) / SUM(o.order_volume) * 100, 2) AS '成交率%'
-FROM daily_orders o
-LEFT JOIN instrument_info i ON o.instrument_id = i.instrument_id
-WHERE o.trading_day = DATE_FORMAT(CURDATE(), '%Y%m%d')
+    COUNT(*) AS '合约数',
+    SUM(s.order_volume) AS '总委托量',
+    SUM(s.traded_volume) AS '总成交量',
+    ROUND(SUM(s.traded_volume) / SUM(s.order_volume) * 100, 2) AS '成交率%'
+FROM daily_order_summary s
+LEFT JOIN instrument_info i ON s.instrument_id = i.instrument_id
+WHERE s.trading_day = DATE_FORMAT(CURDATE(), '%Y%m%d')
 GROUP BY i.product_id
-ORDER BY SUM(o.traded_volume) DESC;
+ORDER BY SUM(s.traded_volume) DESC;
+
+-- 某交易日各合约开高低收（读每日行情汇总表，无需扫描 market_data）
+SELECT 
+    instrument_id AS '合约',
+    open_price AS '开盘',
+    high_price AS '最高',
+    low_price AS '最低',
+    last_price AS '最新',
+    ROUND((last_price - pre_settlement_price) / pre_settlement_price * 100, 2) AS '涨跌幅%',
+    volume AS '成交量',
+    turnover AS '成交额',
+    tick_count AS '行情条数'
+FROM daily_market_summary
+WHERE trading_day = '20251229'
+ORDER BY volume DESC;
+
+-- 汇总表与明细不一致时（如直接导入明细），在程序中按明细重建某交易日的汇总:
+--   db.rebuild_daily_summary('20251229')
 
 -- 各交易所持仓分布
 SELECT 
@@ -225,9 +253,8 @@ ORDER BY SUM(p.volume) DESC;
 -- DELETE FROM daily_positions 
 -- WHERE trading_day < DATE_FORMAT(DATE_SUB(CURDATE(), INTERVAL 30 DAY), '%Y%m%d');
 
--- 删除历史行情数据（保留最近7天）
--- DELETE FROM market_data 
--- WHERE create_time < DATE_SUB(NOW(), INTERVAL 7 DAY);
+-- 删除历史行情数据：market_data 按交易日分区，直接删除整个分区，无需逐行 DELETE
+-- ALTER TABLE market_data DROP PARTITION p20250102;
 
 -- ============================================================================
 -- 7. 表维护
@@ -0,0 +1,659 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SQLite 存储后端
+与 DatabaseManager 接口相同的嵌入式实现，本地开发、CI 和单机部署无需 MySQL 服务：
+  - WAL 模式，读写互不阻塞；synchronous=NORMAL、内存临时表、mmap 等参数针对批量写入调优
+  - 每个线程复用一个连接，每次 insert_* 调用在一个事务内批量写入
+  - 表结构和二级索引与 MySQL 版一致（索引取自 INDEX_PLAN），查询SQL直接复用 DatabaseManager
+
+config.json 中设置 "backend": "sqlite" 即可切换，见 database_manager.create_database_manager。
+SQLite 的错误统一转换为 pymysql.Error 抛出，调用方的异常处理无需区分后端。
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pymysql import err
+
+from database_manager import (
+    DatabaseManager, HISTORY_TABLES, INDEX_PLAN, MARKET_DATA_COLUMNS,
+)
+
+logger = logging.getLogger(__name__)
+
+# DECIMAL 按浮点存储；DATETIME/TIMESTAMP 列读出时还原为 datetime，与 pymysql 的返回类型一致
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+# 把 pymysql 风格的占位符转换为 sqlite3 风格
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+# 各表的唯一键，用于 INSERT ... ON CONFLICT
+_CONFLICT_KEYS = {
+    'daily_orders': ('trading_day', 'order_key'),
+    'daily_positions': ('instrument_id', 'direction', 'trading_day'),
+    'market_data_latest': ('instrument_id',),
+    'instrument_info': ('instrument_id',),
+    'kline': ('instrument_id', 'period', 'bar_time'),
+    'daily_order_summary': ('trading_day', 'instrument_id'),
+    'daily_position_summary': ('trading_day', 'instrument_id'),
+    'daily_market_summary': ('trading_day', 'instrument_id'),
+    'archive_catalog': ('table_name', 'trading_day'),
+}
+
+_NOW = "(datetime('now', 'localtime'))"
+
+_TABLES = {
+    'daily_orders': f"""
+        CREATE TABLE IF NOT EXISTS daily_orders (
+            id INTEGER PRIMARY KEY,
+            order_time TEXT,
+            instrument_id TEXT,
+            direction TEXT,
+            offset_flag TEXT,
+            order_price REAL,
+            order_volume INTEGER,
+            traded_volume INTEGER,
+            order_status TEXT,
+            remark TEXT,
+            trading_day TEXT,
+            front_id INTEGER,
+            session_id INTEGER,
+            order_ref TEXT,
+            exchange_id TEXT,
+            order_sys_id TEXT,
+            order_key TEXT,
+            create_time TIMESTAMP DEFAULT {_NOW},
+            update_time TIMESTAMP DEFAULT {_NOW},
+            UNIQUE (trading_day, order_key)
+        )
+    """,
+    'daily_positions': f"""
+        CREATE TABLE IF NOT EXISTS daily_positions (
+            id INTEGER PRIMARY KEY,
+            instrument_id TEXT,
+            direction TEXT,
+            position_type TEXT,
+            volume INTEGER,
+            available_volume INTEGER,
+            open_price REAL,
+            position_price REAL,
+            close_profit REAL,
+            position_profit REAL,
+            trading_day TEXT,
+            create_time TIMESTAMP DEFAULT {_NOW},
+            update_time TIMESTAMP DEFAULT {_NOW},
+            UNIQUE (instrument_id, direction, trading_day)
+        )
+    """,
+    'market_data': f"""
+        CREATE TABLE IF NOT EXISTS market_data (
+            id INTEGER PRIMARY KEY,
+            instrument_id TEXT,
+            exchange_id TEXT,
+            update_time TEXT,
+            last_price REAL,
+            pre_settlement_price REAL,
+            pre_close_price REAL,
+            open_price REAL,
+            highest_price REAL,
+            lowest_price REAL,
+            volume INTEGER,
+            turnover REAL,
+            open_interest INTEGER,
+            close_price REAL,
+            settlement_price REAL,
+            upper_limit_price REAL,
+            lower_limit_price REAL,
+            bid_price1 REAL,
+            bid_volume1 INTEGER,
+            ask_price1 REAL,
+            ask_volume1 INTEGER,
+            trading_day TEXT NOT NULL DEFAULT '',
+            create_time TIMESTAMP DEFAULT {_NOW},
+            record_time TIMESTAMP DEFAULT {_NOW}
+        )
+    """,
+    'market_data_latest': f"""
+        CREATE TABLE IF NOT EXISTS market_data_latest (
+            instrument_id TEXT NOT NULL PRIMARY KEY,
+            exchange_id TEXT,
+            update_time TEXT,
+            last_price REAL,
+            pre_settlement_price REAL,
+            pre_close_price REAL,
+            open_price REAL,
+            highest_price REAL,
+            lowest_price REAL,
+            volume INTEGER,
+            turnover REAL,
+            open_interest INTEGER,
+            close_price REAL,
+            settlement_price REAL,
+            upper_limit_price REAL,
+            lower_limit_price REAL,
+            bid_price1 REAL,
+            bid_volume1 INTEGER,
+            ask_price1 REAL,
+            ask_volume1 INTEGER,
+            trading_day TEXT NOT NULL DEFAULT '',
+            record_time TIMESTAMP DEFAULT {_NOW}
+        )
+    """,
+    'kline': f"""
+        CREATE TABLE IF NOT EXISTS kline (
+            instrument_id TEXT NOT NULL,
+            period TEXT NOT NULL,
+            bar_time DATETIME NOT NULL,
+            trading_day TEXT NOT NULL DEFAULT '',
+            open_price REAL,
+            high_price REAL,
+            low_price REAL,
+            close_price REAL,
+            volume INTEGER,
+            turnover REAL,
+            open_interest REAL,
+            tick_count INTEGER,
+            record_time TIMESTAMP DEFAULT {_NOW},
+            PRIMARY KEY (instrument_id, period, bar_time)
+        ) WITHOUT ROWID
+    """,
+    'instrument_info': f"""
+        CREATE TABLE IF NOT EXISTS instrument_info (
+            id INTEGER PRIMARY KEY,
+            instrument_id TEXT UNIQUE,
+            exchange_id TEXT,
+            instrument_name TEXT,
+            product_id TEXT,
+            product_class TEXT,
+            delivery_year INTEGER,
+            delivery_month INTEGER,
+            volume_multiple INTEGER,
+            price_tick REAL,
+            create_date TEXT,
+            open_date TEXT,
+            expire_date TEXT,
+            start_delivery_date TEXT,
+            end_delivery_date TEXT,
+            is_trading INTEGER DEFAULT 1,
+            long_margin_ratio REAL,
+            short_margin_ratio REAL,
+            max_market_order_volume INTEGER,
+            min_market_order_volume INTEGER,
+            max_limit_order_volume INTEGER,
+            min_limit_order_volume INTEGER,
+            create_time TIMESTAMP DEFAULT {_NOW},
+            update_time TIMESTAMP DEFAULT {_NOW}
+        )
+    """,
+    'snapshot': f"""
+        CREATE TABLE IF NOT EXISTS snapshot (
+            snapshot_id INTEGER NOT NULL PRIMARY KEY,
+            trading_day TEXT NOT NULL DEFAULT '',
+            order_count INTEGER,
+            position_count INTEGER,
+            trade_count INTEGER,
+            account_count INTEGER,
+            changed_rows INTEGER,
+            create_time TIMESTAMP DEFAULT {_NOW}
+        )
+    """,
+    'snapshot_rows': """
+        CREATE TABLE IF NOT EXISTS snapshot_rows (
+            kind TEXT NOT NULL,
+            trading_day TEXT NOT NULL DEFAULT '',
+            row_key TEXT NOT NULL,
+            valid_from INTEGER NOT NULL,
+            valid_to INTEGER,
+            instrument_id TEXT NOT NULL DEFAULT '',
+            row_hash TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (kind, trading_day, row_key, valid_from)
+        ) WITHOUT ROWID
+    """,
+    'daily_order_summary': f"""
+        CREATE TABLE IF NOT EXISTS daily_order_summary (
+            trading_day TEXT NOT NULL DEFAULT '',
+            instrument_id TEXT NOT NULL,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            order_volume INTEGER NOT NULL DEFAULT 0,
+            traded_volume INTEGER NOT NULL DEFAULT 0,
+            filled_orders INTEGER NOT NULL DEFAULT 0,
+            cancelled_orders INTEGER NOT NULL DEFAULT 0,
+            update_time TIMESTAMP DEFAULT {_NOW},
+            PRIMARY KEY (trading_day, instrument_id)
+        ) WITHOUT ROWID
+    """,
+    'daily_position_summary': f"""
+        CREATE TABLE IF NOT EXISTS daily_position_summary (
+            trading_day TEXT NOT NULL DEFAULT '',
+            instrument_id TEXT NOT NULL,
+            long_volume INTEGER NOT NULL DEFAULT 0,
+            short_volume INTEGER NOT NULL DEFAULT 0,
+            position_profit REAL NOT NULL DEFAULT 0,
+            close_profit REAL NOT NULL DEFAULT 0,
+            update_time TIMESTAMP DEFAULT {_NOW},
+            PRIMARY KEY (trading_day, instrument_id)
+        ) WITHOUT ROWID
+    """,
+    'daily_market_summary': f"""
+        CREATE TABLE IF NOT EXISTS daily_market_summary (
+            trading_day TEXT NOT NULL DEFAULT '',
+            instrument_id TEXT NOT NULL,
+            exchange_id TEXT,
+            open_price REAL,
+            high_price REAL,
+            low_price REAL,
+            last_price REAL,
+            pre_settlement_price REAL,
+            volume INTEGER,
+            turnover REAL,
+            open_interest INTEGER,
+            tick_count INTEGER NOT NULL DEFAULT 0,
+            last_seq INTEGER NOT NULL DEFAULT -1,
+            update_time TIMESTAMP DEFAULT {_NOW},
+            PRIMARY KEY (trading_day, instrument_id)
+        ) WITHOUT ROWID
+    """,
+    'archive_catalog': f"""
+        CREATE TABLE IF NOT EXISTS archive_catalog (
+            table_name TEXT NOT NULL,
+            trading_day TEXT NOT NULL,
+            location TEXT NOT NULL,
+            row_count INTEGER,
+            archive_time TIMESTAMP DEFAULT {_NOW},
+            PRIMARY KEY (table_name, trading_day)
+        ) WITHOUT ROWID
+    """,
+}
+
+# INDEX_PLAN 之外的二级索引（SQLite 索引名全库唯一，建索引时加表名前缀）
+# SQLite 的二级索引隐含 rowid，(trading_day) 索引即可支持交易日内按 id 的键集分页，
+# 对应 MySQL 版按交易日分区后的主键扫描
+_EXTRA_INDEXES = {
+    'daily_orders': {'idx_day_id': ('trading_day',)},
+    'market_data': {'idx_day_id': ('trading_day',)},
+    'market_data_latest': {'idx_exchange': ('exchange_id',)},
+    'kline': {'idx_day_period': ('trading_day', 'period')},
+    'snapshot': {'idx_day': ('trading_day', 'snapshot_id')},
+}
+
+
+def _wrap_error(e: sqlite3.Error) -> err.MySQLError:
+    """把 sqlite3 异常转换为对应的 pymysql 异常"""
+    if isinstance(e, sqlite3.IntegrityError):
+        return err.IntegrityError(0, str(e))
+    if isinstance(e, sqlite3.OperationalError):
+        return err.OperationalError(0, str(e))
+    return err.DatabaseError(0, str(e))
+
+
+class _SQLiteCursor:
+    """提供 pymysql DictCursor 的用法：上下文管理、%s 占位符、字典结果"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    @staticmethod
+    def _sql(sql: str) -> str:
+        return _PLACEHOLDER.sub(
+            lambda m: f":{m.group(1)}" if m.group(1) else ('?' if m.group(0) == '%s' else '%'),
+            sql)
+
+    def execute(self, sql: str, params=None) -> int:
+        try:
+            self._cursor.execute(self._sql(sql), params if params is not None else ())
+        except sqlite3.Error as e:
+            raise _wrap_error(e) from e
+        return self._cursor.rowcount
+
+    def executemany(self, sql: str, seq_of_params) -> int:
+        try:
+            self._cursor.executemany(self._sql(sql), seq_of_params)
+        except sqlite3.Error as e:
+            raise _wrap_error(e) from e
+        return self._cursor.rowcount
+
+    def _dict(self, row) -> Optional[Dict[str, Any]]:
+        return dict(zip(row.keys(), row)) if row is not None else None
+
+    def fetchone(self) -> Optional[Dict[str, Any]]:
+        return self._dict(self._cursor.fetchone())
+
+    def fetchmany(self, size: int) -> List[Dict[str, Any]]:
+        return [self._dict(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self) -> List[Dict[str, Any]]:
+        return [self._dict(row) for row in self._cursor.fetchall()]
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+
+class _SQLiteConnection:
+    """借出的连接，close() 即归还"""
+
+    def __init__(self, pool: '_SQLitePool', conn: sqlite3.Connection, exclusive: bool):
+        self._pool = pool
+        self._conn = conn
+        self._exclusive = exclusive
+
+    def cursor(self, cursor_class=None) -> _SQLiteCursor:
+        # cursor_class 仅为兼容 SSDictCursor 的调用方式；sqlite3 游标本身按需逐行读取
+        return _SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise _wrap_error(e) from e
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._pool.release(self._conn, self._exclusive)
+
+
+class _SQLitePool:
+    """
+    连接池：同一线程的嵌套借用复用同一连接，线程最后一次归还时连接回到空闲列表；
+    空闲连接最多保留 max_idle 个，多余的关闭，短生命周期的线程不会留下连接
+    """
+
+    def __init__(self, path: str, pragmas: Sequence[str], timeout: float, max_idle: int = 4):
+        self.path = path
+        self.pragmas = pragmas
+        self.timeout = timeout
+        self.max_idle = max(0, int(max_idle))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns: List[sqlite3.Connection] = []
+        self._idle: List[sqlite3.Connection] = []
+        self._stats = {'opened': 0, 'acquired': 0, 'closed': 0}
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(f"PRAGMA {pragma}")
+        with self._lock:
+            self._conns.append(conn)
+            self._stats['opened'] += 1
+        return conn
+
+    def acquire(self, exclusive: bool = False) -> _SQLiteConnection:
+        """
+        借用连接
+
+        Args:
+            exclusive: 是否使用独立连接（流式读取时避免与同线程的写入共用事务）
+        """
+        if exclusive:
+            return _SQLiteConnection(self, self._take(), True)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._take()
+            self._local.depth = 0
+        else:
+            with self._lock:
+                self._stats['acquired'] += 1
+        self._local.depth += 1
+        return _SQLiteConnection(self, conn, False)
+
+    def _take(self) -> sqlite3.Connection:
+        """取一个空闲连接，没有时新建"""
+        with self._lock:
+            self._stats['acquired'] += 1
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def release(self, conn: sqlite3.Connection, exclusive: bool):
+        if not exclusive:
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.conn = None
+        self._give_back(conn)
+
+    def _give_back(self, conn: sqlite3.Connection):
+        """连接不再被任何调用方使用：放回空闲列表，空闲列表已满或池已关闭时关闭"""
+        try:
+            if conn.in_transaction:
+                # 结束调用方未提交的事务，避免长期持有写锁
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            if conn in self._conns and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        self._discard(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            if conn in self._conns:
+                self._conns.remove(conn)
+                self._stats['closed'] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        with self._lock:
+            conns, self._conns, self._idle = self._conns, [], []
+        for conn in conns:
+            try:
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = len(self._conns)
+            stats['idle'] = len(self._idle)
+        stats['backend'] = 'sqlite'
+        return stats
+
+
+class SQLiteManager(DatabaseManager):
+    """SQLite 存储后端，接口与 DatabaseManager 相同"""
+
+    _null_safe_eq = 'IS'
+    _for_update = ''
+    _greatest = 'MAX'
+    _least = 'MIN'
+
+    def __init__(self, path: str = "./data/ctp_trading.db", cache_size_mb: int = 64,
+                 mmap_size_mb: int = 256, busy_timeout: float = 10.0,
+                 max_idle_connections: int = 4, metrics: bool = True,
+                 slow_query_threshold: float = 0.5):
+        """
+        初始化 SQLite 后端
+
+        Args:
+            path: 数据库文件路径
+            cache_size_mb: 每个连接的页缓存大小
+            mmap_size_mb: 内存映射读取的大小上限
+            busy_timeout: 等待其他连接释放写锁的秒数
+            max_idle_connections: 连接池保留的空闲连接数，超出的连接归还时关闭
+            metrics: 是否统计各操作的耗时指标
+            slow_query_threshold: 单条SQL超过该秒数记为慢SQL
+        """
+        self.host = ''
+        self.port = 0
+        self.user = ''
+        self.password = ''
+        self.database = path
+        self.path = path
+        self.bulk_load = False
+        self.bulk_threshold = 0
+        self.connection = None
+        self._pool = _SQLitePool(
+            path,
+            pragmas=(
+                "journal_mode = WAL",
+                "synchronous = NORMAL",
+                "temp_store = MEMORY",
+                f"cache_size = -{int(cache_size_mb) * 1024}",
+                f"mmap_size = {int(mmap_size_mb) * 1024 * 1024}",
+                "foreign_keys = OFF",
+            ),
+            timeout=busy_timeout,
+            max_idle=max_idle_connections,
+        )
+        self._init_state(metrics, slow_query_threshold)
+
+    def connect(self) -> bool:
+        """打开数据库文件并创建表结构"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self._create_tables()
+            logger.info(f"SQLite 数据库已就绪: {self.path}")
+            return True
+        except (OSError, err.MySQLError) as e:
+            logger.error(f"打开 SQLite 数据库失败: {e}")
+            return False
+
+    def _create_tables(self):
+        """创建表结构和二级索引"""
+        conn = self._get_connection()
+        try:
+            with conn.cursor() as cursor:
+                for ddl in _TABLES.values():
+                    cursor.execute(ddl)
+                indexes = {t: dict(v) for t, v in INDEX_PLAN.items()}
+                for table, extra in _EXTRA_INDEXES.items():
+                    indexes.setdefault(table, {}).update(extra)
+                for table, plan in indexes.items():
+                    for name, columns in plan.items():
+                        cursor.execute(
+                            f"CREATE INDEX IF NOT EXISTS {table}_{name} ON {table} ({', '.join(columns)})"
+                        )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reload_schema(self) -> bool:
+        """SQLite 后端不做紧凑存储转换"""
+        return True
+
+    def _create_history_table(self, table: str):
+        """按明细表的建表语句建 history 表，并建交易日索引"""
+        history = HISTORY_TABLES[table]
+        ddl = _TABLES[table].replace(f"CREATE TABLE IF NOT EXISTS {table} (",
+                                     f"CREATE TABLE IF NOT EXISTS {history} (", 1)
+        conn = self._get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(ddl)
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {history}_idx_day ON {history} (trading_day)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        """关闭全部连接"""
+        self.disable_spool()
+        self._pool.close()
+
+    # ------------------------------------------------------------------
+    # 方言差异
+    # ------------------------------------------------------------------
+    def _upsert_sql(self, table: str, columns: Sequence[str],
+                    update_columns: Sequence[str]) -> str:
+        updates = ", ".join(f"{c} = excluded.{c}" for c in update_columns)
+        if 'update_time' not in columns and table in ('daily_orders', 'instrument_info'):
+            updates += f", update_time = {_NOW}"
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(f'%({c})s' for c in columns)}) "
+            f"ON CONFLICT ({', '.join(_CONFLICT_KEYS[table])}) DO UPDATE SET {updates}"
+        )
+
+    def _new_value(self, column: str) -> str:
+        return f"excluded.{column}"
+
+    def _merge_sql(self, table: str, columns: Sequence[str],
+                   assignments: Sequence[Tuple[str, str]]) -> str:
+        updates = ", ".join(f"{c} = {expr}" for c, expr in assignments)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(f'%({c})s' for c in columns)}) "
+            f"ON CONFLICT ({', '.join(_CONFLICT_KEYS[table])}) DO UPDATE SET {updates}"
+        )
+
+    def _upsert_latest(self, cursor, market_data: List[Dict[str, Any]]) -> int:
+        """把一批行情合并进 market_data_latest，仅当新行情不早于已有行情才覆盖（夜盘早于日盘）"""
+        rows = self._latest_rows(market_data)
+        if not rows:
+            return 0
+        sql = self._upsert_sql(
+            'market_data_latest', MARKET_DATA_COLUMNS,
+            [c for c in MARKET_DATA_COLUMNS if c != 'instrument_id']
+        ) + (
+            " WHERE excluded.trading_day > market_data_latest.trading_day OR "
+            "(excluded.trading_day = market_data_latest.trading_day AND "
+            f"{self._session_order_sql('excluded.update_time')} >= "
+            f"{self._session_order_sql('market_data_latest.update_time')})"
+        )
+        cursor.executemany(sql, rows)
+        return len(rows)
+
+    @staticmethod
+    def _session_order_sql(update_time: str) -> str:
+        return f"(CASE WHEN {update_time} >= '18:00:00' THEN '0' ELSE '1' END || {update_time})"
+
+    def explain(self, sql: str, params: Optional[list] = None) -> List[Dict[str, Any]]:
+        """返回SQL的执行计划（EXPLAIN QUERY PLAN 输出）"""
+        return self._fetch_all("EXPLAIN QUERY PLAN " + sql, params or [], "执行计划")
+
+    # ------------------------------------------------------------------
+    # SQLite 不分区，分区维护接口保持可调用
+    # ------------------------------------------------------------------
+    def maintain_market_data_partitions(self, days_ahead: int = 10,
+                                        retention_days: Optional[int] = None,
+                                        archive: bool = False) -> Dict[str, List[str]]:
+        """SQLite 不分区，直接返回空结果"""
+        return {'created': [], 'dropped': [], 'archived': []}
+
+    def partition_market_data(self) -> bool:
+        """SQLite 不分区"""
+        return False
+
+    def _day_partition(self, cursor, table: str, trading_day: str) -> Optional[str]:
+        """SQLite 不分区，归档时总是分批移动"""
+        return None
+
+    def explain_partitions(self, trading_day: str, instrument_id: Optional[str] = None) -> List[str]:
+        """SQLite 不分区"""
+        return []
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+asyncio 封装测试脚本
+用模拟 API 检查协程查询、经查询调度完成的并发查询，以及行情流的订阅、分发和退订
+"""
+
+import asyncio
+import threading
+
+from async_ctp import AsyncCTPMarket, AsyncCTPTrader
+from ctp_api_wrapper import CTPMarketAPI, CTPTraderAPI
+from query_scheduler import QueryScheduler
+
+
+class _ScheduledTrader(CTPTraderAPI):
+    """模拟 API 加上查询调度：应答在另一个线程中稍后到达"""
+
+    queue_timeout = 5
+    query_timeout = 5
+
+    def __init__(self):
+        super().__init__('9999', 'test', '', '')
+        self.is_logged_in = True
+        self.scheduler = QueryScheduler(self._send, rate=100, burst=5)
+
+    def _send(self, future):
+        future.set_sent(future.attempts)
+        sync = getattr(self, 'query_' + future.kind)
+
+        def respond():
+            future.rows.extend(sync(**future.filters))
+            future.set_done()
+        threading.Timer(0.05, respond).start()
+        return 0
+
+    def submit_query(self, kind, priority=None, **filters):
+        return self.scheduler.submit(kind, priority, **filters)
+
+    def abandon_query(self, future):
+        self.scheduler.cancel(future)
+
+
+def test_async_trader():
+    """无 submit_query 的 API 在线程池中查询，有 submit_query 的由完成回调唤醒协程"""
+    async def run():
+        plain = CTPTraderAPI('9999', 'test', '', '')
+        plain.is_logged_in = True
+        trader = AsyncCTPTrader(plain)
+        positions = await trader.query_positions('rb2505')
+        assert positions and positions[0]['instrument_id'] == 'rb2505'
+
+        scheduled = _ScheduledTrader()
+        trader = AsyncCTPTrader(scheduled)
+        results = await trader.query_all(('positions', 'orders', 'trades'))
+        assert all(results[kind] for kind in ('positions', 'orders', 'trades'))
+        assert scheduled.scheduler.stats()['sent'] == 3
+        scheduled.scheduler.stop()
+
+    asyncio.run(run())
+
+
+def test_async_market():
+    """同一合约的多个行情流只订阅一次，推送按合约分发，最后一个流关闭时退订"""
+    async def run():
+        api = CTPMarketAPI('9999', 'test', '', '')
+        api.is_logged_in = True
+        calls = []
+        api.subscribe_market_data = lambda ids: calls.append(('sub', list(ids))) or True
+        api.unsubscribe_market_data = lambda ids: calls.append(('unsub', list(ids))) or True
+        market = AsyncCTPMarket(api)
+
+        rb = market.ticks(['rb2505'])
+        both = market.ticks(['rb2505', 'hc2505'])
+        assert calls == [('sub', ['rb2505']), ('sub', ['hc2505'])]
+
+        def feed():
+            for n in range(3):
+                for instrument_id in ('rb2505', 'hc2505', 'cu2505'):
+                    api.callbacks['on_market_data']({'instrument_id': instrument_id, 'volume': n})
+        threading.Thread(target=feed).start()
+
+        received = []
+        async for tick in rb:
+            received.append(tick['volume'])
+            if len(received) == 3:
+                rb.close()
+        assert received == [0, 1, 2]
+        async with both:
+            got = [await both.__anext__() for _ in range(6)]
+        assert {t['instrument_id'] for t in got} == {'rb2505', 'hc2505'}
+        assert calls[2:] == [('unsub', ['hc2505', 'rb2505'])]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_async_trader()
+    test_async_market()
+    print("asyncio 封装测试通过")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+历史K线回补测试脚本
+不需要数据库：直接构造 load_day_ticks 格式的列数组，检查 resample_day 的夜盘日期换算
+（周一交易日的夜盘在上周五、跨零点在周六）、收盘时刻归属、累计量求差和日线
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from bar_backfill import _night_offset, resample_day
+
+INSTRUMENTS = np.array(['rb2505', 'cu2505'])
+
+
+def _ticks(rows):
+    """rows: (合约编码, 'HH:MM:SS', 价格, 累计成交量)，按到达顺序编号"""
+    sec = [sum(int(x) * m for x, m in zip(t.split(':'), (3600, 60, 1))) for _, t, _, _ in rows]
+    price = np.array([r[2] for r in rows], dtype=float)
+    volume = np.array([r[3] for r in rows], dtype=float)
+    nan = np.full(len(rows), np.nan)
+    return {
+        'id': np.arange(len(rows)), 'instrument': np.array([r[0] for r in rows]),
+        'sec': np.array(sec, dtype=float), 'price': price, 'volume': volume,
+        'turnover': volume * 10.0, 'open_interest': np.full(len(rows), 1000.0),
+        'open': nan, 'high': nan, 'low': nan,
+    }
+
+
+def _bars(out, instrument_id, period):
+    return [
+        {name: out[name][i] for name in out}
+        for i in range(len(out['period']))
+        if out['instrument_id'][i] == instrument_id and out['period'][i] == period
+    ]
+
+
+def test_night_offset():
+    """夜盘自然日：周一交易日在上周五，其余在前一天，节后第一天跳过周末"""
+    assert _night_offset('20250106') == -3
+    assert _night_offset('20250107') == -1
+    assert _night_offset('20250103') == -1
+
+
+def test_resample_monday():
+    """周一交易日：周五夜盘、周六凌晨和周一日盘的 tick 各自落在正确的自然日"""
+    out = resample_day('20250106', INSTRUMENTS, _ticks([
+        (0, '21:00:01', 3000.0, 10),
+        (0, '21:00:30', 3004.0, 15),
+        (0, '00:30:00', 3001.0, 18),
+        (0, '09:00:05', 3010.0, 25),
+        (0, '10:15:00', 3012.0, 30),
+        (0, '10:30:10', 3009.0, 28),   # 重连后累计量回退，增量记 0
+        (0, '10:30:20', 3008.0, 31),
+        (1, '09:00:00', 70000.0, 0),   # 无成交不开K线
+    ]), periods=('1m', '15m', '1d'))
+
+    minute = _bars(out, 'rb2505', '1m')
+    assert [b['bar_time'] for b in minute] == [
+        datetime(2025, 1, 3, 21, 0), datetime(2025, 1, 4, 0, 30), datetime(2025, 1, 6, 9, 0),
+        datetime(2025, 1, 6, 10, 14), datetime(2025, 1, 6, 10, 30),
+    ]
+    assert [b['volume'] for b in minute] == [15, 3, 7, 5, 3]
+    assert (minute[0]['open_price'], minute[0]['high_price'], minute[0]['close_price']) == \
+        (3000.0, 3004.0, 3004.0)
+    # 回退后的无成交 tick 不作为K线开盘
+    assert (minute[-1]['open_price'], minute[-1]['tick_count']) == (3008.0, 1)
+    assert minute[-1]['trading_day'] == '20250106'
+
+    # 收盘时刻 10:15:00 归入 10:00 开始的 15 分钟K线
+    quarter = _bars(out, 'rb2505', '15m')
+    assert [b['bar_time'] for b in quarter][-2:] == \
+        [datetime(2025, 1, 6, 10, 0), datetime(2025, 1, 6, 10, 30)]
+    assert quarter[-2]['close_price'] == 3012.0
+
+    daily = _bars(out, 'rb2505', '1d')
+    assert len(daily) == 1 and daily[0]['bar_time'] == datetime(2025, 1, 6)
+    assert (daily[0]['open_price'], daily[0]['high_price'], daily[0]['low_price'],
+            daily[0]['volume']) == (3000.0, 3012.0, 3000.0, 31)
+    assert not _bars(out, 'cu2505', '1m')
+
+
+def test_resample_tuesday():
+    """周二交易日的夜盘在周一晚上，无效价格的 tick 被丢弃"""
+    out = resample_day('20250107', INSTRUMENTS, _ticks([
+        (1, '21:05:00', 70000.0, 2),
+        (1, '21:05:30', float('nan'), 3),
+        (1, '21:06:00', 1e308 * 10, 4),
+        (1, '09:01:00', 70100.0, 6),
+    ]), periods=('1m',))
+    minute = _bars(out, 'cu2505', '1m')
+    assert [b['bar_time'] for b in minute] == [datetime(2025, 1, 6, 21, 5),
+                                              datetime(2025, 1, 7, 9, 1)]
+    assert [b['volume'] for b in minute] == [2, 4]
+
+
+if __name__ == "__main__":
+    test_night_offset()
+    test_resample_monday()
+    test_resample_tuesday()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+K线实时合成测试脚本
+不需要数据库：用内存中的 kline 表检查累计量换算、跨零点的夜盘和迟到 tick 的处理
+"""
+
+from datetime import datetime
+
+from bar_engine import BarEngine
+
+
+class _FakeDB:
+    """按 (合约, 周期, bar_time) 覆盖写入，与 kline 表的 upsert 一致"""
+
+    def __init__(self):
+        self.kline = {}
+
+    def insert_bars(self, bars):
+        for bar in bars:
+            self.kline[(bar['instrument_id'], bar['period'], bar['bar_time'])] = dict(bar)
+        return len(bars)
+
+
+def _tick(update_time, price, volume, day='20250103', turnover=None):
+    return {'instrument_id': 'rb2505', 'update_time': update_time, 'last_price': price,
+            'volume': volume, 'turnover': turnover if turnover is not None else volume * price,
+            'open_interest': 1000, 'trading_day': day}
+
+
+def test_volume_delta():
+    """成交量按累计量的增量计入K线：首条 tick 只作基准，回退时丢弃，换交易日从零开始"""
+    engine = BarEngine(periods=('1m',))
+    now = datetime(2025, 1, 3, 9, 0, 30)
+    engine.update(_tick('09:00:01', 3000.0, 100), now)
+    assert engine.current_bar('rb2505') is None
+    engine.update(_tick('09:00:02', 3001.0, 110), now)
+    engine.update(_tick('09:00:03', 3002.0, 125), now)
+    bar = engine.current_bar('rb2505')
+    assert bar['volume'] == 25 and bar['turnover'] == 125 * 3002.0 - 100 * 3000.0
+    engine.update(_tick('09:00:04', 3003.0, 90), now)
+    assert engine.current_bar('rb2505')['volume'] == 25
+    engine.update(_tick('09:00:05', 3004.0, 95), now)
+    assert engine.current_bar('rb2505')['volume'] == 30
+
+    # 下一交易日第一条 tick 的累计量全部计入
+    engine.update(_tick('09:01:00', 3010.0, 7, day='20250106'), now)
+    bar = engine.current_bar('rb2505')
+    assert bar['volume'] == 7 and bar['trading_day'] == '20250106'
+
+
+def test_midnight():
+    """夜盘跨零点：按本地时钟补全自然日，零点前后分属两根K线"""
+    engine = BarEngine(periods=('1m',))
+    engine.update(_tick('23:59:58', 3000.0, 10), datetime(2025, 1, 3, 0, 0, 2))
+    engine.update(_tick('23:59:59', 3001.0, 12), datetime(2025, 1, 3, 0, 0, 2))
+    assert engine.current_bar('rb2505')['bar_time'] == datetime(2025, 1, 2, 23, 59)
+    engine.update(_tick('00:00:01', 3002.0, 15), datetime(2025, 1, 2, 23, 59, 59))
+    assert engine.current_bar('rb2505')['bar_time'] == datetime(2025, 1, 3, 0, 0)
+    engine.close_all()
+    engine.flush()
+    assert engine.stats()['closed'] == 2
+
+    # 恰好在收盘时刻的 tick 归入前一根K线
+    engine.update(_tick('01:00:00', 3003.0, 20), datetime(2025, 1, 3, 1, 0, 1))
+    assert engine.current_bar('rb2505')['bar_time'] == datetime(2025, 1, 3, 0, 59)
+
+
+def test_late_tick():
+    """按时间收盘后迟到的 tick 修正已收盘K线，不以残缺的新K线覆盖库中记录"""
+    db = _FakeDB()
+    engine = BarEngine(db, periods=('1m',), close_delay=3.0)
+    now = datetime(2025, 1, 3, 9, 0, 59)
+    engine.update(_tick('09:00:01', 3000.0, 100), now)
+    engine.update(_tick('09:00:10', 3005.0, 110), now)
+    engine.update(_tick('09:00:50', 3002.0, 120), now)
+    assert engine.close_expired(datetime(2025, 1, 3, 9, 1, 3)) == 1
+    assert engine.flush() == 1
+    key = ('rb2505', '1m', datetime(2025, 1, 3, 9, 0))
+    assert db.kline[key]['volume'] == 20 and db.kline[key]['tick_count'] == 2
+
+    engine.update(_tick('09:00:59', 3008.0, 124), datetime(2025, 1, 3, 9, 1, 4))
+    assert engine.current_bar('rb2505') is None
+    assert engine.flush() == 1
+    bar = db.kline[key]
+    assert (bar['volume'], bar['tick_count'], bar['high_price'], bar['close_price']) == \
+        (24, 3, 3008.0, 3008.0)
+
+    # 新K线开始后，比已收盘K线更早的 tick 并入当前K线
+    engine.update(_tick('09:01:05', 3001.0, 130), datetime(2025, 1, 3, 9, 1, 5))
+    engine.update(_tick('08:59:58', 2990.0, 131), datetime(2025, 1, 3, 9, 1, 6))
+    bar = engine.current_bar('rb2505')
+    assert bar['bar_time'] == datetime(2025, 1, 3, 9, 1)
+    assert (bar['volume'], bar['low_price']) == (7, 2990.0)
+
+    # 同一根K线在写库前被修正时只写一次
+    engine.update(_tick('09:02:00', 3003.0, 140), datetime(2025, 1, 3, 9, 2))
+    engine.update(_tick('09:01:59', 3004.0, 141), datetime(2025, 1, 3, 9, 2, 1))
+    assert engine.flush() == 1
+    assert db.kline[('rb2505', '1m', datetime(2025, 1, 3, 9, 1))]['volume'] == 8
+    stats = engine.stats()
+    assert stats['late'] == 3 and stats['revised'] == 2
+
+
+if __name__ == "__main__":
+    test_volume_delta()
+    test_midnight()
+    test_late_tick()
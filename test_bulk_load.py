@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量导入测试脚本
+不需要 MySQL：检查 TSV 字段转义；用记录SQL的假连接替换连接池，检查 LOAD DATA 路径上
+汇总表与明细在同一事务内提交，以及服务端不支持 LOCAL INFILE 时回退到 executemany
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+from pymysql.err import OperationalError
+
+from database_manager import DatabaseManager, MARKET_DATA_COLUMNS, _tsv_field
+
+DAY = '20250102'
+
+
+class _FakeCursor:
+    """记录执行的SQL，遇到 fail_on 中的片段时抛出 OperationalError"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _run(self, sql, count):
+        for fragment, code in self._conn.fail_on.items():
+            if fragment in sql:
+                raise OperationalError(code, f"模拟失败: {fragment}")
+        self._conn.pending.append(sql)
+        self.rowcount = count
+        return count
+
+    def execute(self, sql, params=None):
+        if sql.startswith('LOAD DATA'):
+            # 导入的行数即临时文件的行数
+            with open(params[0], encoding='utf-8') as f:
+                return self._run(sql, len(f.readlines()))
+        return self._run(sql, 1)
+
+    def executemany(self, sql, rows):
+        return self._run(sql, len(rows))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+class _FakeConnection:
+    """未提交的SQL在 pending 中，commit 后按事务归入 transactions"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = dict(fail_on or {})
+        self.pending = []
+        self.transactions = []
+        self.rollbacks = 0
+
+    def cursor(self, *args):
+        return _FakeCursor(self)
+
+    def commit(self):
+        self.transactions.append(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def _manager(conn):
+    db = DatabaseManager(bulk_load=True, bulk_threshold=1, metrics=False)
+    db._pool.acquire = lambda exclusive=False: conn
+    return db
+
+
+def _ticks(count):
+    return [dict(dict.fromkeys(MARKET_DATA_COLUMNS), instrument_id='rb2505', exchange_id='SHFE',
+                 update_time=f"09:00:{n:02d}", last_price=3000.0 + n, volume=n, trading_day=DAY)
+            for n in range(count)]
+
+
+def _touches(statements, table):
+    return any(table in sql for sql in statements)
+
+
+def test_tsv_field():
+    """字段按 LOAD DATA 默认转义规则输出"""
+    assert _tsv_field(None) == '\\N'
+    assert _tsv_field('') == ''
+    assert _tsv_field(True) == '1' and _tsv_field(False) == '0'
+    assert _tsv_field(42) == '42' and _tsv_field(Decimal('3000.50')) == '3000.50'
+    assert _tsv_field(0.1) == '0.1' and float(_tsv_field(1 / 3)) == 1 / 3
+    assert _tsv_field(datetime(2025, 1, 2, 9, 0, 1)) == '2025-01-02 09:00:01'
+    assert _tsv_field('a\tb') == 'a\\tb'
+    assert _tsv_field('a\nb\r') == 'a\\nb\\r'
+    assert _tsv_field('C:\\tmp') == 'C:\\\\tmp'
+    assert _tsv_field('a\0b') == 'a\\0b'
+    # 反斜杠先转义，不会与后续转义叠加
+    assert _tsv_field('\\\t') == '\\\\\\t'
+    # 字面的 \N 文本不会被当作 NULL
+    assert _tsv_field('\\N') == '\\\\N'
+    assert _tsv_field('螺纹钢') == '螺纹钢'
+
+
+def test_local_infile_disabled():
+    """1148/2068/3948 关闭批量导入并回退到 executemany，其他错误只回退本次"""
+    for code in (1148, 2068, 3948):
+        conn = _FakeConnection({'LOAD DATA': code})
+        db = _manager(conn)
+        assert db.insert_market_data(_ticks(3)) == 3
+        assert not db.bulk_load
+        assert conn.rollbacks == 1 and len(conn.transactions) == 1
+        statements = conn.transactions[0]
+        assert statements[0].lstrip().startswith('INSERT INTO market_data')
+        assert _touches(statements, 'daily_market_summary')
+
+        # 之后直接逐批插入，不再尝试 LOAD DATA
+        conn.fail_on.clear()
+        assert db.insert_market_data(_ticks(2)) == 2
+        assert not _touches(conn.transactions[1], 'LOAD DATA')
+
+    conn = _FakeConnection({'LOAD DATA': 1205})
+    db = _manager(conn)
+    assert db.insert_market_data(_ticks(3)) == 3
+    assert db.bulk_load and len(conn.transactions) == 1
+    conn.fail_on.clear()
+    assert db.insert_market_data(_ticks(2)) == 2
+    assert conn.transactions[1][0].startswith('LOAD DATA')
+
+    # 未达到阈值时不走批量导入
+    conn = _FakeConnection()
+    db = _manager(conn)
+    db.bulk_threshold = 10
+    assert db.insert_market_data(_ticks(3)) == 3
+    assert not _touches(conn.transactions[0], 'LOAD DATA')
+
+
+def test_summary_in_bulk_transaction():
+    """批量导入的行情、最新行情和每日汇总在同一事务内提交，汇总失败时明细一起回滚"""
+    conn = _FakeConnection()
+    assert _manager(conn).insert_market_data(_ticks(3)) == 3
+    assert len(conn.transactions) == 1
+    statements = conn.transactions[0]
+    assert statements[0].startswith('LOAD DATA LOCAL INFILE')
+    assert _touches(statements, 'market_data_latest')
+    assert _touches(statements, 'daily_market_summary')
+
+    # 汇总写入失败：批量导入回滚，回退的逐批插入同样失败，没有任何提交
+    conn = _FakeConnection({'daily_market_summary': 1205})
+    db = _manager(conn)
+    assert db.insert_market_data(_ticks(3)) == 0
+    assert conn.transactions == [] and conn.rollbacks == 2
+    # 不是 LOCAL INFILE 被禁用，下次仍走批量导入
+    assert db.bulk_load
+
+    # 委托汇总同样在批量导入的事务内刷新
+    conn = _FakeConnection()
+    orders = [{'instrument_id': 'rb2505', 'exchange_id': 'SHFE', 'trading_day': DAY,
+               'order_sys_id': str(n), 'order_volume': 1} for n in range(2)]
+    assert _manager(conn).insert_orders(orders) == 2
+    assert len(conn.transactions) == 1
+    assert _touches(conn.transactions[0], 'LOAD DATA LOCAL INFILE')
+    assert _touches(conn.transactions[0], 'daily_order_summary')
+
+
+if __name__ == "__main__":
+    test_tsv_field()
+    test_local_infile_disabled()
+    test_summary_in_bulk_transaction()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+变更检测层测试脚本
+使用临时 SQLite 库模拟多轮自动下载，确认未变化的记录不再写库
+"""
+
+from change_detector import ChangeDetector
+from test_support import make_orders, sqlite_db
+
+DAY = '20250103'
+
+
+def _positions(volumes):
+    return [
+        {'instrument_id': inst, 'direction': '多头', 'position_type': '总仓', 'volume': v,
+         'available_volume': v, 'open_price': 3000.0, 'position_price': 3000.0,
+         'close_profit': 0.0, 'position_profit': 0.0, 'trading_day': DAY}
+        for inst, v in volumes.items()
+    ]
+
+
+def _orders(statuses):
+    orders = make_orders(DAY, len(statuses))
+    for order, status in zip(orders, statuses):
+        order.update(order_status=status, traded_volume=1 if status == '全部成交' else 0)
+    return orders
+
+
+def test_change_detector():
+    """重复快照全部跳过，只写变化，平掉的持仓被删除"""
+    with sqlite_db() as (db, _):
+        detector = ChangeDetector(db)
+
+        changes = detector.sync_orders(_orders(['未成交还在队列中'] * 3))
+        assert len(changes.inserts) == 3 and changes.skipped == 0
+        changes = detector.sync_orders(_orders(['未成交还在队列中'] * 3))
+        assert not changes and changes.skipped == 3
+        changes = detector.sync_orders(_orders(['未成交还在队列中', '全部成交', '未成交还在队列中']))
+        assert len(changes.updates) == 1 and changes.skipped == 2
+        assert [o['order_status'] for o in db.query_orders(DAY)].count('全部成交') == 1
+
+        detector.sync_positions(_positions({'rb2505': 2, 'cu2505': 1}))
+        changes = detector.sync_positions(_positions({'rb2505': 3}))
+        assert len(changes.updates) == 1 and changes.deletes == [
+            {'trading_day': DAY, 'instrument_id': 'cu2505', 'direction': '多头'}]
+        positions = db.query_positions(DAY)
+        assert [(p['instrument_id'], p['volume']) for p in positions] == [('rb2505', 3)]
+
+        # 查询失败（None）时不比对，不删除持仓
+        changes = detector.sync_positions(None)
+        assert not changes.available and len(db.query_positions(DAY)) == 1
+
+        stats = detector.stats()
+        print(stats)
+        assert stats['orders']['skipped'] == 5
+        assert stats['positions']['deleted'] == 1
+        assert stats['positions']['cycles'] == 2
+
+
+def test_all_positions_closed():
+    """最后一笔持仓平掉后的空快照删除本交易日的持仓，不删除其他交易日的持仓"""
+    with sqlite_db() as (db, _):
+        detector = ChangeDetector(db)
+
+        detector.sync_positions(_positions({'rb2505': 2}))
+        changes = detector.sync_positions([], trading_day=DAY)
+        assert changes.deletes == [
+            {'trading_day': DAY, 'instrument_id': 'rb2505', 'direction': '多头'}]
+        assert db.query_positions(DAY) == []
+        assert not detector.sync_positions([], trading_day=DAY)
+
+        # 未给出交易日时按状态中最近的交易日删除
+        detector.sync_positions(_positions({'cu2505': 1}))
+        assert len(detector.sync_positions([]).deletes) == 1
+        assert db.query_positions(DAY) == []
+
+        # 新交易日的空快照只从状态中移除上一交易日的持仓
+        detector.sync_positions(_positions({'rb2505': 1}))
+        changes = detector.sync_positions([], trading_day='20250106')
+        assert not changes.deletes and detector.stats()['positions']['tracked'] == 0
+        assert [p['instrument_id'] for p in db.query_positions(DAY)] == ['rb2505']
+
+
+def test_sync_snapshot():
+    """快照写入后更新检测状态，之后的手动同步不再重写快照已写入的记录"""
+    with sqlite_db() as (db, _):
+        detector = ChangeDetector(db)
+
+        snapshot_id, changes = detector.sync_snapshot(
+            orders=_orders(['未成交还在队列中'] * 2), positions=_positions({'rb2505': 2}),
+            trades=[], accounts=None, trading_day=DAY)
+        assert snapshot_id is not None
+        assert len(changes['orders'].inserts) == 2 and len(changes['positions'].inserts) == 1
+        assert not changes['accounts'].available
+        assert len(db.query_orders(DAY)) == 2 and len(db.query_positions(DAY)) == 1
+
+        changes = detector.sync_orders(_orders(['未成交还在队列中', '全部成交']))
+        assert len(changes.updates) == 1 and changes.skipped == 1
+        changes = detector.sync_positions(_positions({'rb2505': 2}), trading_day=DAY)
+        assert not changes and changes.skipped == 1
+
+        # 空持仓列表平掉最后一个持仓，快照和检测状态一致
+        snapshot_id, changes = detector.sync_snapshot(positions=[], trading_day=DAY)
+        assert snapshot_id is not None and len(changes['positions'].deletes) == 1
+        assert db.query_positions(DAY) == [] and db.query_snapshot()['positions'] == []
+        assert detector.stats()['positions']['tracked'] == 0
+
+        # 无法确定交易日时不写快照，也不更新状态
+        snapshot_id, changes = detector.sync_snapshot(positions=[])
+        assert snapshot_id is None and detector.stats()['positions']['failed'] == 1
+
+
+def _instruments(ids):
+    return [
+        {'instrument_id': inst, 'exchange_id': 'SHFE', 'instrument_name': inst,
+         'product_id': inst[:2], 'product_class': '1', 'delivery_year': 2025,
+         'delivery_month': 5, 'volume_multiple': 10, 'price_tick': 1.0, 'create_date': '',
+         'open_date': '', 'expire_date': '', 'start_delivery_date': '', 'end_delivery_date': '',
+         'is_trading': 1, 'long_margin_ratio': 0.1, 'short_margin_ratio': 0.1,
+         'max_market_order_volume': 100, 'min_market_order_volume': 1,
+         'max_limit_order_volume': 100, 'min_limit_order_volume': 1}
+        for inst in ids
+    ]
+
+
+def test_failed_instrument_query():
+    """合约查询失败时不把合约标记为非交易，完整快照中消失的合约才标记"""
+    with sqlite_db() as (db, _):
+        detector = ChangeDetector(db)
+        detector.sync_instruments(_instruments(['rb2505', 'cu2505']))
+        assert detector.sync_instruments(None).summary() == "查询失败，本轮未同步"
+        trading = {i['instrument_id']: i['is_trading'] for i in db.query_instrument_info()}
+        assert trading == {'rb2505': 1, 'cu2505': 1}
+        changes = detector.sync_instruments(_instruments(['rb2505']))
+        assert changes.deletes == [{'instrument_id': 'cu2505'}]
+        trading = {i['instrument_id']: i['is_trading'] for i in db.query_instrument_info()}
+        assert trading == {'rb2505': 1, 'cu2505': 0}
+
+
+def test_unkeyed_orders():
+    """没有自然键的委托状态变化、之后补上报单编号时更新同一行，不追加重复记录"""
+    with sqlite_db() as (db, _):
+        detector = ChangeDetector(db)
+
+        def unkeyed(statuses, order_sys_id=''):
+            orders = _orders(statuses)
+            for order in orders:
+                order.update(order_time='09:00:00', order_ref='', front_id=None,
+                             session_id=None, order_sys_id=order_sys_id)
+            return orders
+
+        # 回退字段完全相同的两笔委托按出现顺序区分
+        assert len(detector.sync_orders(unkeyed(['未成交还在队列中'] * 2)).inserts) == 2
+        changes = detector.sync_orders(unkeyed(['全部成交', '未成交还在队列中']))
+        assert len(changes.updates) == 1 and not changes.inserts
+        assert sorted(o['order_status'] for o in db.query_orders(DAY)) == \
+            ['全部成交', '未成交还在队列中']
+
+        # 交易所回报补上报单编号后有了自然键，仍更新原来的行
+        changes = detector.sync_orders(unkeyed(['全部成交', '撤单'], order_sys_id='  1001'))
+        assert len(changes.updates) == 2 and not changes.inserts
+        orders = db.query_orders(DAY)
+        assert sorted(o['order_status'] for o in orders) == ['全部成交', '撤单']
+        assert {o['order_sys_id'] for o in orders} == {'  1001'}
+
+        # reset() 后全部重新写入，仍按原来的键覆盖
+        detector.reset('orders')
+        changes = detector.sync_orders(unkeyed(['全部成交', '撤单'], order_sys_id='  1001'))
+        assert len(changes.inserts) == 2 and len(db.query_orders(DAY)) == 2
+
+
+if __name__ == "__main__":
+    test_change_detector()
+    test_all_positions_closed()
+    test_sync_snapshot()
+    test_failed_instrument_query()
+    test_unkeyed_orders()
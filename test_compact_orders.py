@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+委托去重测试脚本
+检查 order_key 的自然键规则，并在临时 SQLite 库上模拟旧版本的重复下载，
+检查 compact_orders 只保留最近一批、不误删同批中的相同委托、清理已被带键记录取代的旧记录
+"""
+
+from database_manager import order_key
+from test_support import sqlite_db
+
+DAY = '20250103'
+
+
+def _order(n, **extra):
+    order = {'order_time': f"09:00:{n:02d}", 'instrument_id': 'rb2505', 'direction': '买入',
+             'offset_flag': '开仓', 'order_price': 3000.0, 'order_volume': 1,
+             'traded_volume': 0, 'order_status': '撤单', 'remark': '', 'trading_day': DAY}
+    order.update(extra)
+    return order
+
+
+def test_order_key():
+    """FrontID/SessionID/OrderRef 优先，其次 ExchangeID/OrderSysID，都没有时为 None"""
+    assert order_key(_order(1, front_id=1, session_id=2, order_ref=' 12')) == 'S:1:2:12'
+    assert order_key(_order(1, front_id=1, session_id=2, order_ref='',
+                            exchange_id='SHFE', order_sys_id='  99')) == 'X:SHFE:99'
+    assert order_key(_order(1, order_ref='12', exchange_id='SHFE')) is None
+    assert order_key(_order(1)) is None
+
+
+def _set_create_time(db, ids, create_time):
+    conn = db._get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE daily_orders SET create_time = %s WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                [create_time] + list(ids))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _ids(db):
+    return [row['id'] for row in db.iter_orders(DAY)]
+
+
+def test_compact_orders():
+    """旧记录按下载批次去重，同一批写入跨秒时不误删；被带键记录取代的旧记录删除"""
+    with sqlite_db() as (db, _):
+        # 三次下载：每次都包含两笔内容完全相同的委托 0 和一笔委托 1
+        batches = [('2025-01-03 09:05:00', '2025-01-03 09:05:00'),
+                   ('2025-01-03 09:10:00', '2025-01-03 09:10:00'),
+                   # 最近一批写入时跨过了秒边界
+                   ('2025-01-03 09:15:00', '2025-01-03 09:15:01')]
+        for first, second in batches:
+            before = set(_ids(db))
+            db.insert_orders([_order(0), _order(0), _order(1)])
+            new = sorted(set(_ids(db)) - before)
+            _set_create_time(db, new[:2], first)
+            _set_create_time(db, new[2:], second)
+        last_batch = sorted(_ids(db))[-3:]
+
+        assert db.compact_orders(batch_size=2) == 6
+        assert sorted(_ids(db)) == last_batch
+        assert db.compact_orders() == 0
+
+        # 升级后带自然键重新下载：内容相同的旧记录被取代
+        db.insert_orders([_order(0, front_id=1, session_id=1, order_ref='1'),
+                          _order(0, front_id=1, session_id=1, order_ref='2')])
+        assert db.compact_orders() == 2
+        orders = db.query_orders(DAY)
+        assert sorted(o['order_time'] for o in orders) == ['09:00:00', '09:00:00', '09:00:01']
+        assert sum(1 for o in orders if o['order_ref']) == 2
+
+
+if __name__ == "__main__":
+    test_order_key()
+    test_compact_orders()
+    print("委托去重测试通过")
@@ -9,7 +9,7 @@ import json
 import os
 import time
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # 从main_gui导入相关类
 from ctp_api_real import CTPTraderAPIReal
@@ -41,6 +41,15 @@ def test_connection():
         return
     print("数据库连接成功")
 
+    # 检查行情表分区裁剪：按交易日查询应只访问该交易日的分区（周末没有分区，取下一个工作日）
+    day = datetime.now().date()
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    trading_day = day.strftime('%Y%m%d')
+    partitions = db_manager.explain_partitions(trading_day)
+    print(f"按交易日 {trading_day} 查询行情访问的分区: {partitions}")
+    assert partitions == [f"p{trading_day}"], f"行情查询未命中分区裁剪: {partitions}"
+
     # 初始化CTP API
     ctp_conf = config['ctp']
     trader_api = CTPTraderAPIReal(
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库连接池测试脚本
+不需要 MySQL：把 pymysql.connect 替换为返回假连接的函数，检查同一线程的重复借用、
+独占连接、池满超时、空闲/存活期回收、close() 与借出中的连接以及连接池指标
+"""
+
+import threading
+import time
+
+import pymysql
+from pymysql.err import OperationalError
+
+from database_manager import ConnectionPool
+
+
+class _FakeConnection:
+    """记录 rollback/ping/close 调用的假连接"""
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.rollbacks = 0
+        self.pings = 0
+        self.closed = False
+        self.ping_error = None
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.ping_error is not None:
+            raise self.ping_error
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeConnect:
+    """替换 pymysql.connect，记录建立的全部连接"""
+
+    def __init__(self):
+        self.opened = []
+
+    def __enter__(self):
+        self._connect = pymysql.connect
+        pymysql.connect = self
+        return self
+
+    def __exit__(self, *exc):
+        pymysql.connect = self._connect
+        return False
+
+    def __call__(self, **kwargs):
+        conn = _FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+def test_reentrant_depth():
+    """同一线程嵌套借用复用同一条连接，最外层归还时才回到池中"""
+    with _FakeConnect() as fake:
+        pool = ConnectionPool({}, max_size=2)
+        outer = pool.acquire()
+        inner = pool.acquire()
+        assert inner.serial == outer.serial == 0
+        assert pool.stats()['in_use'] == 1 and len(fake.opened) == 1
+
+        inner.close()
+        inner.close()
+        assert pool.stats()['idle'] == 0 and fake.opened[0].rollbacks == 0
+        outer.close()
+        stats = pool.stats()
+        assert stats['idle'] == 1 and stats['in_use'] == 0
+        # 归还时结束未提交的事务
+        assert fake.opened[0].rollbacks == 1
+
+        # 归还后其他线程借到的是同一条空闲连接
+        seen = []
+        worker = threading.Thread(target=lambda: seen.append(pool.acquire().serial))
+        worker.start()
+        worker.join()
+        assert seen == [0] and len(fake.opened) == 1
+
+
+def test_exclusive():
+    """独占借用不共享本线程已借出的连接，也不影响之后的嵌套借用"""
+    with _FakeConnect() as fake:
+        pool = ConnectionPool({}, max_size=3)
+        shared = pool.acquire()
+        stream = pool.acquire(exclusive=True)
+        assert stream.serial != shared.serial
+        nested = pool.acquire()
+        assert nested.serial == shared.serial
+        assert pool.stats()['in_use'] == 2 and len(fake.opened) == 2
+
+        stream.close()
+        assert pool.stats()['idle'] == 1
+        nested.close()
+        shared.close()
+        assert pool.stats()['idle'] == 2 and pool.stats()['in_use'] == 0
+
+
+def test_timeout():
+    """池满时等待归还，超时抛出 OperationalError 并计数"""
+    with _FakeConnect():
+        pool = ConnectionPool({}, max_size=1, timeout=0.05)
+        held = pool.acquire(exclusive=True)
+        started = time.monotonic()
+        try:
+            pool.acquire(exclusive=True)
+            raise AssertionError("池满时应抛出 OperationalError")
+        except OperationalError as e:
+            assert e.args[0] == 2013
+        assert time.monotonic() - started >= 0.05
+        assert pool.stats()['timeouts'] == 1
+
+        # 等待中的借用方在连接归还后拿到连接
+        pool.timeout = 5.0
+        seen = []
+        waiter = threading.Thread(target=lambda: seen.append(pool.acquire().serial))
+        waiter.start()
+        time.sleep(0.05)
+        assert seen == []
+        held.close()
+        waiter.join()
+        assert seen == [0]
+        stats = pool.stats()
+        assert stats['timeouts'] == 1 and stats['wait_time_max'] >= 0.05
+
+
+def test_eviction():
+    """空闲超时和超过存活期的连接被关闭并重建，空闲较久的连接借出前先 ping"""
+    with _FakeConnect() as fake:
+        pool = ConnectionPool({}, max_size=2, idle_timeout=60, max_lifetime=600, ping_interval=10)
+        pool.acquire().close()
+
+        # 空闲超过 ping_interval：借出前 ping，正常则复用
+        pool._idle[0].last_used -= 20
+        conn = pool.acquire()
+        assert conn.serial == 0 and fake.opened[0].pings == 1
+        conn.close()
+
+        # ping 失败：关闭后重建
+        fake.opened[0].ping_error = OperationalError(2006, "MySQL server has gone away")
+        pool._idle[0].last_used -= 20
+        conn = pool.acquire()
+        assert conn.serial == 1 and fake.opened[0].closed
+        assert pool.stats()['health_failures'] == 1
+        conn.close()
+
+        # 空闲超过 idle_timeout：借用时直接回收，不再 ping
+        pool._idle[0].last_used -= 120
+        conn = pool.acquire()
+        assert conn.serial == 2 and fake.opened[1].closed and fake.opened[1].pings == 0
+        conn.close()
+
+        # 借出期间超过存活期：归还时关闭，不放回池中
+        conn = pool.acquire()
+        conn._entry.created_at -= 1200
+        conn.close()
+        assert fake.opened[2].closed
+        stats = pool.stats()
+        assert stats['size'] == 0 and stats['idle'] == 0
+        assert stats['created'] == 3 and stats['closed'] == 3
+
+
+def test_close_retires_borrowed():
+    """close() 立即关闭空闲连接，借出中的连接归还时关闭，之后仍可重新借用"""
+    with _FakeConnect() as fake:
+        pool = ConnectionPool({}, max_size=2)
+        pool.acquire(exclusive=True).close()
+        borrowed = pool.acquire(exclusive=True)
+        spare = pool.acquire(exclusive=True)
+        spare.close()
+        assert borrowed.serial == 0 and spare.serial == 1
+
+        pool.close()
+        assert fake.opened[1].closed and not fake.opened[0].closed
+        assert pool.stats()['size'] == 1
+        # 借出中的连接仍可使用，归还时关闭
+        borrowed.rollback()
+        borrowed.close()
+        assert fake.opened[0].closed
+        stats = pool.stats()
+        assert stats['size'] == 0 and stats['idle'] == 0 and stats['in_use'] == 0
+
+        conn = pool.acquire()
+        assert conn.serial == 2
+        conn.close()
+        assert pool.stats()['idle'] == 1
+
+
+def test_stats():
+    """连接池指标：建立/关闭/借用次数、连接数与等待时间"""
+    with _FakeConnect():
+        pool = ConnectionPool({}, max_size=4)
+        first = pool.acquire(exclusive=True)
+        second = pool.acquire()
+        # 嵌套借用不计入借用次数
+        pool.acquire().close()
+        pool.acquire(exclusive=True).close()
+        stats = pool.stats()
+        assert stats['max_size'] == 4 and stats['size'] == 3 and stats['in_use'] == 2
+        assert stats['created'] == 3 and stats['borrowed'] == 3 and stats['idle'] == 1
+        first.close()
+        second.close()
+        pool.close()
+        stats = pool.stats()
+        assert stats['size'] == 0 and stats['closed'] == 3 and stats['timeouts'] == 0
+        assert stats['wait_time_avg'] == round(stats['wait_time_total'] / 3, 6)
+
+    # 建立连接失败时释放占用的名额
+    with _FakeConnect() as fake:
+        def refuse(**kwargs):
+            raise OperationalError(2003, "Can't connect to MySQL server")
+        pymysql.connect = refuse
+        pool = ConnectionPool({}, max_size=1, timeout=0.01)
+        try:
+            pool.acquire()
+            raise AssertionError("建立连接失败时应抛出 OperationalError")
+        except OperationalError as e:
+            assert e.args[0] == 2003
+        stats = pool.stats()
+        assert stats['size'] == 0 and stats['in_use'] == 0
+        pymysql.connect = fake
+        pool.acquire().close()
+        assert pool.stats()['created'] == 1
+
+
+if __name__ == "__main__":
+    test_reentrant_depth()
+    test_exclusive()
+    test_timeout()
+    test_eviction()
+    test_close_retires_borrowed()
+    test_stats()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+CTPTraderAPIReal 查询链路测试脚本
+不需要 openctp-ctp 和前置：用记录请求的模拟 api 对象代替 CThostFtdcTraderApi，
+由测试直接调用 CTPTraderSpi 的应答回调，检查按 nRequestID 路由、错误结束和 query_all 的结果
+"""
+
+import threading
+import time
+import types
+
+import ctp_api_real
+
+
+class _Struct:
+    """代替 CTP 的请求/应答结构体"""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class _FakeTdApi:
+    """记录 ReqQry* 请求，应答由 respond 指定的函数在另一个线程中稍后回调"""
+
+    def __init__(self):
+        self.spi = None
+        self.requests = []
+        self.respond = {}
+
+    def __getattr__(self, method):
+        if not method.startswith('ReqQry'):
+            raise AttributeError(method)
+
+        def request(req, request_id):
+            self.requests.append((method, request_id))
+            handler = self.respond.get(method)
+            if handler is not None:
+                threading.Timer(0.02, handler, (self.spi, request_id)).start()
+            return 0
+        return request
+
+
+def _trader(**kwargs):
+    """已登录、带模拟 api 的交易 API（不触发登录后的委托簿/持仓簿初始化）"""
+    if not hasattr(ctp_api_real, 'tdapi'):
+        ctp_api_real.tdapi = types.SimpleNamespace(
+            **{name: _Struct for name in ctp_api_real._QUERY_FIELDS.values()})
+    trader = ctp_api_real.CTPTraderAPIReal('9999', 'test', '', 'tcp://127.0.0.1:0',
+                                           query_rate=100, query_burst=5,
+                                           query_timeout=2, queue_timeout=2, **kwargs)
+    trader.api = _FakeTdApi()
+    trader.spi = ctp_api_real.CTPTraderSpi(trader)
+    trader.api.spi = trader.spi
+    trader.is_logged_in = True
+    return trader
+
+
+def _account(spi, request_id):
+    spi.OnRspQryTradingAccount(
+        _Struct(AccountID='A1', PreBalance=100.0, Balance=90.0, Available=80.0,
+                WithdrawQuota=80.0, CurrMargin=10.0, FrozenMargin=0.0, FrozenCash=0.0,
+                FrozenCommission=0.0, Commission=1.0, CloseProfit=0.0, PositionProfit=0.0,
+                TradingDay='20250102'),
+        None, request_id, True)
+
+
+def _rejected(spi, request_id):
+    spi.OnRspQryInvestorPosition(None, _Struct(ErrorID=90, ErrorMsg='查询未就绪'),
+                                 request_id, True)
+
+
+def _position(spi, request_id):
+    spi.OnRspQryInvestorPosition(
+        _Struct(InstrumentID='rb2505', PosiDirection='2', Position=2, TodayPosition=0,
+                YdPosition=2, OpenCost=60000.0, CloseProfit=0.0, PositionProfit=0.0,
+                TradingDay='20250102', ExchangeID='SHFE'),
+        None, request_id, True)
+
+
+def _instrument(instrument_id):
+    return _Struct(InstrumentID=instrument_id, ExchangeID='SHFE', InstrumentName=instrument_id,
+                   ProductID=instrument_id[:2], ProductClass='1', DeliveryYear=2025,
+                   DeliveryMonth=5, VolumeMultiple=10, PriceTick=1.0, OpenDate='',
+                   ExpireDate='', IsTrading=1, LongMarginRatio=0.1, ShortMarginRatio=0.1)
+
+
+def test_request_id_routing():
+    """并发的同类查询按 nRequestID 各自收集结果；非最后一条的错误响应使该请求以错误结束"""
+    trader = _trader()
+    errors = []
+    trader.set_callback('on_error', errors.append)
+    rb = trader.submit_query('instruments', instrument_id='rb2505')
+    cu = trader.submit_query('instruments', instrument_id='cu2505')
+    au = trader.submit_query('instruments', instrument_id='au2506')
+    assert all(f.wait_sent(2) for f in (rb, cu, au))
+    assert len({rb.request_id, cu.request_id, au.request_id}) == 3
+    spi = trader.spi
+
+    # 应答交错到达，与发送顺序相反
+    spi.OnRspQryInstrument(_instrument('cu2505'), None, cu.request_id, False)
+    spi.OnRspQryInstrument(_instrument('rb2505'), None, rb.request_id, True)
+    spi.OnRspQryInstrument(_instrument('cu2505'), None, cu.request_id, True)
+    assert [r['instrument_id'] for r in rb.result(1)] == ['rb2505'] and rb.error is None
+    assert [r['instrument_id'] for r in cu.result(1)] == ['cu2505', 'cu2505']
+
+    # 中途的错误响应：请求未结束，后续记录照常收集，结束时带错误
+    spi.OnRspQryInstrument(_instrument('au2506'), None, au.request_id, False)
+    spi.OnRspQryInstrument(None, _Struct(ErrorID=90, ErrorMsg='查询未就绪'), au.request_id, False)
+    assert not au.done() and au.error and not errors
+    spi.OnRspQryInstrument(_instrument('au2506'), None, au.request_id, True)
+    assert au.wait(1) and '合约' in au.error and len(au.rows) == 2
+    assert errors == [au.error]
+
+    # 已结束或未知的请求编号不影响其他请求，错误直接报告
+    spi.OnRspQryInstrument(_instrument('rb2505'), None, rb.request_id, True)
+    spi.OnRspQryInstrument(None, _Struct(ErrorID=91, ErrorMsg=''), 9999, False)
+    assert len(rb.rows) == 1 and len(errors) == 2
+    assert not trader._pending
+    trader.disconnect()
+
+
+def test_query_all_failed_kind():
+    """出错的查询类别返回 None，成功的类别返回结果"""
+    trader = _trader()
+    trader.api.respond = {'ReqQryTradingAccount': _account,
+                          'ReqQryInvestorPosition': _rejected}
+    errors = []
+    trader.set_callback('on_error', errors.append)
+    result = trader.query_all(('positions', 'accounts'))
+    assert result['positions'] is None
+    assert [a['account_id'] for a in result['accounts']] == ['A1']
+    assert errors and '持仓' in errors[0]
+    trader.disconnect()
+
+
+def test_reconcile_after_failure():
+    """持仓核对查询失败后仍安排下一次核对，下一次成功时初始化持仓簿"""
+    trader = _trader(position_reconcile_interval=0.05)
+    replies = [_rejected]
+
+    def reply(spi, request_id):
+        (replies.pop(0) if replies else _position)(spi, request_id)
+    trader.api.respond = {'ReqQryInvestorPosition': reply}
+    first = trader.reconcile_positions()
+    assert first.wait(2) and first.error
+    deadline = time.monotonic() + 2
+    while not trader.position_book.is_seeded() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert trader.position_book.is_seeded()
+    assert [p['volume'] for p in trader.query_positions()] == [2]
+    trader.disconnect()
+    assert trader._reconcile_timer is None
+
+
+if __name__ == "__main__":
+    test_request_id_routing()
+    test_query_all_failed_kind()
+    test_reconcile_after_failure()
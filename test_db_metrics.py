@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库操作指标测试脚本
+在临时 SQLite 库上执行写入和查询，检查各阶段耗时、行数、错误计数、慢SQL和导出格式
+"""
+
+import json
+
+from pymysql.err import OperationalError
+
+from database_manager import MARKET_DATA_COLUMNS
+from test_support import sqlite_db
+
+DAY = '20250102'
+
+
+def test_db_metrics():
+    """insert_*/query_* 调用按操作记录耗时、行数和错误"""
+    # 阈值设为 0，每条SQL都记为慢SQL
+    with sqlite_db(slow_query_threshold=1e-9) as (db, _):
+        ticks = [dict(dict.fromkeys(MARKET_DATA_COLUMNS), instrument_id=f"x{n % 3}",
+                      update_time=f"09:00:{n % 60:02d}", last_price=3000.0, trading_day=DAY)
+                 for n in range(500)]
+        assert db.insert_market_data(ticks) == 500
+        assert len(db.query_market_data(DAY, limit=100)) == 100
+
+        # 出错的查询返回空列表，错误计到该操作名下（归档目录和委托各查询一次）
+        def unavailable(exclusive=False):
+            raise OperationalError(2003, "Can't connect to MySQL server")
+
+        db._pool.acquire = unavailable
+        assert db.query_orders(DAY) == []
+
+        stats = db.metrics.snapshot()
+        insert = stats['operations']['insert_market_data']
+        assert insert['calls'] == 1 and insert['rows'] == 500 and insert['errors'] == 0
+        assert {'connect', 'execute', 'commit'} <= set(insert['phases'])
+        assert insert['rows_per_second'] > 0
+        query = stats['operations']['query_market_data']
+        assert query['rows'] == 100 and 'fetch' in query['phases']
+        assert stats['operations']['query_orders']['errors'] == 1
+        assert {'operation': 'query_orders', 'error': 'OperationalError', 'count': 2} in stats['errors']
+        slow = [q for q in stats['slow_queries'] if q['operation'] == 'query_market_data']
+        assert slow and 'FROM market_data' in slow[-1]['sql'] and DAY in slow[-1]['params']
+
+        text = db.dump_metrics()
+        assert 'ctp_db_operations_total{operation="insert_market_data"} 1' in text
+        assert 'ctp_db_phase_duration_seconds_count{operation="insert_market_data",phase="commit"} 1' in text
+        assert 'ctp_db_pool_acquired' in text
+        assert json.loads(db.dump_metrics('json'))['operations']['query_orders']['errors'] == 1
+        print(text[:400])
+
+
+if __name__ == "__main__":
+    test_db_metrics()
@@ -25,6 +25,22 @@ modules_to_test = [
     ('ctp_api_wrapper', 'CTPTraderAPI'),
     ('ctp_api_real', 'CTPTraderAPIReal'),
     ('data_importer', 'DataImporter'),
+    ('tick_writer', 'TickWriter'),
+    ('schema_migrator', 'SchemaMigrator'),
+    ('tick_archive', 'TickArchiveReader'),
+    ('bar_engine', 'BarEngine'),
+    ('bar_backfill', 'BarBackfill'),
+    ('sqlite_manager', 'SQLiteManager'),
+    ('change_detector', 'ChangeDetector'),
+    ('json_codec', 'json_default'),
+    ('write_spool', 'SpoolReplayer'),
+    ('retention_manager', 'RetentionManager'),
+    ('db_metrics', 'MetricsRegistry'),
+    ('result_cache', 'ResultCache'),
+    ('query_scheduler', 'QueryScheduler'),
+    ('order_book', 'OrderBook'),
+    ('position_book', 'PositionBook'),
+    ('async_ctp', 'AsyncCTPTrader'),
 ]
 
 for module_name, class_name in modules_to_test:
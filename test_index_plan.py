@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+索引方案基准测试脚本
+在独立的基准库中写入接近真实规模的数据，并通过 EXPLAIN 确认
+DatabaseManager.query_* 的每种查询路径都不做全表扫描、不做 filesort
+"""
+
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from database_manager import DatabaseManager
+
+# 基准数据规模
+TRADING_DAYS = 20
+INSTRUMENTS = 500
+TICKS_PER_INSTRUMENT_DAY = 40
+ORDERS_PER_DAY = 2000
+
+
+def _trading_days(count):
+    """生成最近 count 个工作日"""
+    days = []
+    day = datetime.now().date()
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y%m%d'))
+        day -= timedelta(days=1)
+    return sorted(days)
+
+
+def _load_data(db, days, instruments):
+    """写入基准数据"""
+    exchanges = ['SHFE', 'DCE', 'CZCE', 'CFFEX', 'INE', 'GFEX']
+    db.insert_instrument_info([
+        {
+            'instrument_id': inst, 'exchange_id': exchanges[i % len(exchanges)],
+            'instrument_name': inst, 'product_id': inst[:2], 'product_class': '1',
+            'delivery_year': 2025, 'delivery_month': i % 12 + 1, 'volume_multiple': 10,
+            'price_tick': 1.0, 'create_date': '', 'open_date': '', 'expire_date': '',
+            'start_delivery_date': '', 'end_delivery_date': '', 'is_trading': 1,
+            'long_margin_ratio': 0.1, 'short_margin_ratio': 0.1,
+            'max_market_order_volume': 100, 'min_market_order_volume': 1,
+            'max_limit_order_volume': 100, 'min_limit_order_volume': 1,
+        }
+        for i, inst in enumerate(instruments)
+    ])
+
+    for day in days:
+        ticks = []
+        for inst in instruments:
+            for n in range(TICKS_PER_INSTRUMENT_DAY):
+                price = 3000 + random.random() * 100
+                ticks.append({
+                    'instrument_id': inst, 'exchange_id': 'SHFE',
+                    'update_time': f"{9 + n // 60:02d}:{n % 60:02d}:00",
+                    'last_price': price, 'pre_settlement_price': 3000, 'pre_close_price': 3000,
+                    'open_price': 3000, 'highest_price': price, 'lowest_price': price,
+                    'volume': n * 10, 'turnover': n * 10 * price, 'open_interest': 1000,
+                    'close_price': None, 'settlement_price': None,
+                    'upper_limit_price': 3300, 'lower_limit_price': 2700,
+                    'bid_price1': price - 1, 'bid_volume1': 5, 'ask_price1': price + 1,
+                    'ask_volume1': 5, 'trading_day': day,
+                })
+        db.insert_market_data(ticks)
+
+        db.insert_orders([
+            {
+                'order_time': f"{9 + n // 3600 % 6:02d}:{n // 60 % 60:02d}:{n % 60:02d}",
+                'instrument_id': random.choice(instruments), 'direction': '买入',
+                'offset_flag': '开仓', 'order_price': 3000.0, 'order_volume': 1,
+                'traded_volume': 1, 'order_status': '全部成交', 'remark': '', 'trading_day': day,
+            }
+            for n in range(ORDERS_PER_DAY)
+        ])
+
+        db.insert_positions([
+            {
+                'instrument_id': inst, 'direction': '多头', 'position_type': '总仓',
+                'volume': 1, 'available_volume': 1, 'open_price': 3000.0,
+                'position_price': 3000.0, 'close_profit': 0.0, 'position_profit': 0.0,
+                'trading_day': day,
+            }
+            for inst in instruments[:200]
+        ])
+
+
+def test_index_plan():
+    """加载基准数据并检查各查询路径的执行计划"""
+    config_file = "config.json"
+    if not os.path.exists(config_file):
+        print("配置文件不存在，请先配置config.json")
+        return
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    db_conf = config['database']
+    db = DatabaseManager(
+        host=db_conf['host'],
+        port=db_conf.get('port', 3306),
+        user=db_conf['user'],
+        password=db_conf['password'],
+        database=db_conf['database'] + '_bench',
+        bulk_load=db_conf.get('bulk_load', False)
+    )
+    if not db.connect():
+        print("数据库连接失败")
+        return
+
+    days = _trading_days(TRADING_DAYS)
+    instruments = [f"x{i:04d}" for i in range(INSTRUMENTS)]
+    if not db.query_orders(days[-1], limit=1):
+        start = time.time()
+        _load_data(db, days, instruments)
+        print(f"基准数据写入完成，耗时 {time.time() - start:.1f} 秒")
+
+    conn = db._get_connection()
+    try:
+        with conn.cursor() as cursor:
+            for table in ('daily_orders', 'daily_positions', 'market_data', 'instrument_info'):
+                cursor.execute(f"ANALYZE TABLE {table}")
+                cursor.fetchall()
+    finally:
+        conn.close()
+
+    failures = []
+    for name, plan in db.explain_query_paths().items():
+        for step in plan:
+            extra = step.get('Extra') or ''
+            ok = step.get('type') != 'ALL' and 'filesort' not in extra
+            print(f"{'✅' if ok else '❌'} {name:40s} type={step.get('type')} "
+                  f"key={step.get('key')} rows={step.get('rows')} extra={extra}")
+            if not ok:
+                failures.append(name)
+
+    db.close()
+    assert not failures, f"以下查询路径存在全表扫描或filesort: {failures}"
+
+
+if __name__ == "__main__":
+    test_index_plan()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+键集分页测试脚本
+在临时 SQLite 库上检查 query_*_page 的页边界（含跨交易日、整页结束）、数据末尾、
+iter_* 从令牌续读，以及被篡改的令牌
+"""
+
+import base64
+
+from test_support import make_orders, sqlite_db
+
+DAYS = ['20250102', '20250103']
+PER_DAY = 10
+
+
+def _all_pages(db, page_size, descending):
+    pages, token = [], None
+    while True:
+        page, token = db.query_orders_page(page_size=page_size, page_token=token,
+                                           descending=descending)
+        pages.append(page)
+        if token is None:
+            return pages
+
+
+def _key(row):
+    return (row['trading_day'], row['order_ref'])
+
+
+def test_keyset_paging():
+    """逐页读取的结果与一次读取一致，不重不漏，最后一页令牌为 None"""
+    with sqlite_db() as (db, _):
+        for day in DAYS:
+            db.insert_orders(make_orders(day, PER_DAY))
+        expected = [_key(row) for row in db.iter_orders()]
+        assert len(expected) == len(DAYS) * PER_DAY
+        assert expected == sorted(expected)
+
+        for descending in (False, True):
+            order = expected[::-1] if descending else expected
+            # 7 不整除，10 恰好一页一个交易日，20 恰好一页全部数据，50 大于数据量
+            for page_size in (7, 10, 20, 50):
+                pages = _all_pages(db, page_size, descending)
+                assert [_key(r) for page in pages for r in page] == order
+                assert all(len(page) == page_size for page in pages[:-1])
+                assert 0 < len(pages[-1]) <= page_size
+
+        # 数据末尾：整页结束时不返回指向空页的令牌
+        page, token = db.query_orders_page(page_size=len(expected), descending=False)
+        assert len(page) == len(expected) and token is None
+        assert db.query_orders_page(trading_day='20250106') == ([], None)
+
+        # iter_* 从页令牌之后续读
+        page, token = db.query_orders_page(page_size=PER_DAY + 3, descending=False)
+        rest = [_key(row) for row in db.iter_orders(page_token=token, page_size=4)]
+        assert [_key(r) for r in page] + rest == expected
+
+        # 被篡改或格式错误的令牌抛出 ValueError
+        bad_tokens = ['not-a-token', base64.urlsafe_b64encode(b'{"a": 1}').decode('ascii'),
+                      base64.urlsafe_b64encode(b'["20250102", "x"]').decode('ascii'),
+                      token[:-4]]
+        for bad in bad_tokens:
+            try:
+                db.query_orders_page(page_token=bad)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"令牌未被拒绝: {bad}")
+
+
+if __name__ == "__main__":
+    test_keyset_paging()
+    print("键集分页测试通过")
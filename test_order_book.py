@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+委托/成交簿测试脚本
+模拟登录后的查询初始化和私有流推送，检查索引、去重、初始化期间推送优先和增量落库列表
+"""
+
+from order_book import OrderBook
+
+
+def _order(ref, status='未成交还在队列中', traded=0, instrument='rb2505'):
+    return {'order_time': f"09:00:{int(ref):02d}", 'instrument_id': instrument, 'direction': '买入',
+            'offset_flag': '开仓', 'order_price': 3000.0, 'order_volume': 2,
+            'traded_volume': traded, 'order_status': status, 'remark': '',
+            'trading_day': '20250102', 'front_id': 1, 'session_id': 7, 'order_ref': str(ref),
+            'exchange_id': 'SHFE', 'order_sys_id': ''}
+
+
+def _trade(trade_id, instrument='rb2505'):
+    return {'trade_time': '09:00:30', 'instrument_id': instrument, 'direction': '买入',
+            'offset_flag': '开仓', 'price': 3000.0, 'volume': 1, 'trade_id': trade_id,
+            'trading_day': '20250102', 'exchange_id': 'SHFE', 'order_sys_id': '100'}
+
+
+def test_order_book():
+    """查询初始化后由推送维护，重复推送不产生变化，drain 只返回变化的记录"""
+    book = OrderBook()
+    events = []
+    book.add_listener(lambda kind, row: events.append(kind))
+
+    book.begin_seed()
+    assert not book.is_seeded('orders')
+    # 查询结果返回前先收到委托 2 的推送，查询结果中的旧状态不应覆盖它
+    assert book.apply_order(_order(2, status='全部成交', traded=2))
+    book.seed(orders=[_order(1), _order(2), _order(3, instrument='hc2505')],
+              trades=[_trade('  1')])
+    assert book.is_seeded('orders') and book.is_seeded('trades')
+    assert len(book.orders()) == 3
+    assert [o['order_ref'] for o in book.orders(status='全部成交')] == ['2']
+    assert [o['order_ref'] for o in book.orders(instrument_id='hc2505')] == ['3']
+
+    orders, trades = book.drain()
+    assert len(orders) == 3 and len(trades) == 1
+    assert book.drain() == ([], [])
+
+    # 推送：同一委托状态变化整行替换，索引随之更新；重复推送忽略
+    assert book.apply_order(_order(1, status='部分成交还在队列中', traded=1))
+    assert not book.apply_order(_order(1, status='部分成交还在队列中', traded=1))
+    assert book.apply_trade(_trade('2'))
+    assert not book.apply_trade(_trade('1'))
+    assert [o['order_ref'] for o in book.orders(status='未成交还在队列中')] == ['3']
+    assert len(book.trades(instrument_id='rb2505')) == 2
+
+    orders, trades = book.drain()
+    assert [o['order_ref'] for o in orders] == ['1'] and orders[0]['traded_volume'] == 1
+    assert [t['trade_id'] for t in trades] == ['2']
+    # 落库失败后重新标记为待落库
+    book.restore(orders)
+    assert book.stats()['pending_orders'] == 1
+
+    stats = book.stats()
+    assert stats['orders'] == 3 and stats['trades'] == 2
+    assert stats['unchanged'] == 1 and stats['duplicates'] == 1
+    assert events == ['order', 'order', 'trade']
+    print(stats)
+
+
+if __name__ == "__main__":
+    test_order_book()
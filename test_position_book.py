@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+持仓簿测试脚本
+用持仓查询结果初始化后逐笔应用成交，检查今/昨仓、开仓成本、平仓盈亏和核对
+"""
+
+from position_book import PositionBook
+
+
+def _trade(direction, offset, price, volume, instrument='rb2505'):
+    return {'instrument_id': instrument, 'direction': direction, 'offset_flag': offset,
+            'price': price, 'volume': volume, 'trading_day': '20250103', 'exchange_id': 'SHFE'}
+
+
+def test_position_book():
+    """开仓加今仓，平今/平昨/平仓按规则减仓，平仓按平均成本结转盈亏"""
+    book = PositionBook()
+    book.set_multiplier('rb2505', 10)
+    assert not book.is_seeded()
+    # 上期所的今仓、昨仓分两条返回，簿中合并为一条
+    book.seed([
+        {'instrument_id': 'rb2505', 'direction': '多头', 'volume': 3, 'today_volume': 0,
+         'yd_volume': 3, 'open_cost': 3 * 3000.0 * 10, 'close_profit': 0.0, 'trading_day': '20250103'},
+        {'instrument_id': 'rb2505', 'direction': '多头', 'volume': 1, 'today_volume': 1,
+         'yd_volume': 0, 'open_cost': 3100.0 * 10, 'close_profit': 0.0, 'trading_day': '20250103'},
+    ], trading_day='20250103')
+    pos = book.get_position('rb2505', '多头')
+    assert (pos['volume'], pos['today_volume'], pos['yd_volume']) == (4, 1, 3)
+    assert pos['open_price'] == 3025.0
+
+    assert book.apply_trade(_trade('买入', '开仓', 3200.0, 2))
+    assert book.apply_trade(_trade('卖出', '平今', 3300.0, 1))
+    pos = book.get_position('rb2505', '多头')
+    assert (pos['today_volume'], pos['yd_volume']) == (2, 3)
+    # 平均成本 (121000 + 64000) / 6 = 30833.33/手，平 1 手盈利 33000 - 30833.33
+    assert abs(pos['close_profit'] - (33000.0 - 185000.0 / 6)) < 1e-6
+    # 普通平仓先平昨仓，不足部分平今仓
+    assert book.apply_trade(_trade('卖出', '平仓', 3000.0, 4))
+    pos = book.get_position('rb2505', '多头')
+    assert (pos['today_volume'], pos['yd_volume']) == (1, 0)
+
+    # 空头：卖开、买平
+    book.apply_trade(_trade('卖出', '开仓', 3500.0, 2, instrument='hc2505'))
+    book.apply_trade(_trade('买入', '平今', 3400.0, 2, instrument='hc2505'))
+    assert book.get_positions(instrument_id='hc2505') == []
+    short = book.get_positions(instrument_id='hc2505', include_flat=True)[0]
+    assert short['direction'] == '空头' and short['close_profit'] == 200.0
+    assert not book.apply_trade(_trade('买入', '未知', 3400.0, 1))
+
+    # 核对：数量不一致时报告并以查询结果为准
+    mismatches = book.reconcile([
+        {'instrument_id': 'rb2505', 'direction': '多头', 'volume': 2, 'today_volume': 2,
+         'yd_volume': 0, 'open_cost': 2 * 3200.0 * 10, 'close_profit': 500.0},
+    ])
+    assert [(m['instrument_id'], m['book'], m['query']) for m in mismatches] == [
+        ('rb2505', (1, 0), (2, 0))]
+    assert [p['volume'] for p in book.get_positions()] == [2]
+    stats = book.stats()
+    assert stats['trades'] == 5 and stats['reconciles'] == 1 and stats['positions'] == 1
+    print(stats)
+
+
+if __name__ == "__main__":
+    test_position_book()
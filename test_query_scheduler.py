@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查询流控调度测试脚本
+用模拟的发送函数检查限速、优先级、流控拒绝后的重发和相同查询合并
+"""
+
+import threading
+import time
+
+from query_scheduler import QueryScheduler
+
+
+def test_query_scheduler():
+    """按优先级限速发送，-3 时退避重发，排队中的相同查询只发送一次"""
+    sent = []
+    rejected = set()
+    lock = threading.Lock()
+
+    def send(future):
+        with lock:
+            sent.append((future.kind, time.monotonic()))
+        # 第一次发送成交查询时模拟“每秒请求数超过许可数”
+        if future.kind == 'trades' and 'trades' not in rejected:
+            rejected.add('trades')
+            return -3
+        future.set_sent(len(sent))
+        future.set_done()
+        return 0
+
+    failed = []
+    scheduler = QueryScheduler(send, rate=20, burst=1, backoff=0.05, on_failed=failed.append)
+    # 先占用令牌，使后续提交全部排队
+    first = scheduler.submit('orders')
+    assert first.result(1) == []
+    futures = [scheduler.submit(kind) for kind in ('instruments', 'trades', 'accounts', 'positions')]
+    assert scheduler.submit('positions') is futures[-1]
+    assert scheduler.submit('orders', instrument_id='rb2505') is not first
+    for future in futures:
+        assert future.wait(5) and future.error is None
+
+    kinds = [kind for kind, _ in sent]
+    assert kinds[:4] == ['orders', 'accounts', 'positions', 'trades']
+    assert kinds.count('trades') == 2 and kinds.count('positions') == 1
+    assert kinds.index('instruments') > kinds.index('orders', 1)
+    gaps = [b - a for (_, a), (_, b) in zip(sent, sent[1:])]
+    assert min(gaps) >= 0.04
+
+    stats = scheduler.stats()
+    assert stats['coalesced'] == 1 and stats['throttled'] == 1 and stats['sent'] == 6
+
+    # 停止后排队中的查询立即以错误结束
+    scheduler.rate = 0.01
+    pending = [scheduler.submit('instruments', exchange_id=x) for x in ('SHFE', 'DCE', 'CZCE')]
+    scheduler.stop("已断开连接")
+    assert all(f.done() for f in pending) and len(failed) >= 2
+    assert scheduler.submit('positions').error == "查询调度已停止"
+
+    # 重新连接后恢复调度
+    scheduler.start()
+    scheduler.rate = 20
+    again = scheduler.submit('positions')
+    assert again.wait(5) and again.error is None
+    scheduler.stop()
+    print(stats)
+
+
+if __name__ == "__main__":
+    test_query_scheduler()
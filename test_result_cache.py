@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查询结果缓存测试脚本
+在临时 SQLite 库上查询已结算和当前交易日，检查内存/磁盘命中、当前交易日绕过和补写后失效
+"""
+
+import os
+
+from test_support import make_orders, sqlite_db
+
+DAYS = ['20250102', '20250103', '20250106']
+
+
+def test_result_cache():
+    """已结算交易日的结果经缓存读取，补写后失效，当前交易日不缓存"""
+    with sqlite_db() as (db, tmp):
+        for day in DAYS:
+            db.insert_orders(make_orders(day, 5))
+        expected = db.query_orders(DAYS[0])
+
+        cache_dir = os.path.join(tmp, 'cache')
+        db.enable_result_cache(cache_dir, current_trading_day=DAYS[-1])
+        assert db.query_orders(DAYS[0]) == expected
+        rows = db.query_orders(DAYS[0])
+        assert rows == expected
+        rows[0]['remark'] = 'changed'
+        assert db.query_orders(DAYS[0]) == expected
+        assert len(db.query_orders(DAYS[-1])) == 5
+        stats = db.result_cache_stats()
+        assert (stats['misses'], stats['memory_hits'], stats['bypassed']) == (1, 2, 1)
+
+        # 重新启用（内存为空）时从磁盘读取
+        db.enable_result_cache(cache_dir, current_trading_day=DAYS[-1])
+        assert db.query_orders(DAYS[0]) == expected
+        assert db.result_cache_stats()['disk_hits'] == 1
+
+        # 补写已结算交易日后缓存失效，再次查询读到新数据
+        db.insert_orders(make_orders(DAYS[0], 2, start=5))
+        assert not os.path.exists(os.path.join(cache_dir, 'daily_orders', DAYS[0]))
+        assert len(db.query_orders(DAYS[0])) == 7
+        assert db.result_cache_stats()['misses'] == 1
+        print(db.result_cache_stats())
+
+
+if __name__ == "__main__":
+    test_result_cache()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+明细表分层保留测试脚本
+在临时 SQLite 库上写入多个交易日，按保留策略移入 history 表和归档文件，
+确认按交易日查询的结果与归档前一致；分区换出部分需要 config.json 中的 MySQL
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+
+from database_manager import (create_database_manager, history_source, DatabaseManager,
+                              MARKET_DATA_COLUMNS)
+from retention_manager import RetentionManager
+from test_support import make_orders, sqlite_db
+
+DAYS = ['20250102', '20250103', '20250106', '20250107']
+
+
+def _ticks(day):
+    return [
+        dict(dict.fromkeys(MARKET_DATA_COLUMNS), instrument_id=f"x{n % 3}", exchange_id='SHFE',
+             update_time=f"09:00:{n:02d}", last_price=3000.0 + n, volume=n, trading_day=day)
+        for n in range(11)
+    ]
+
+
+def test_retention_manager():
+    """超出保留期的交易日移出明细表，查询结果不变"""
+    with sqlite_db() as (db, tmp):
+        for day in DAYS:
+            db.insert_orders(make_orders(day, 7))
+            db.insert_market_data(_ticks(day))
+        before = {day: (db.query_orders(day), db.query_market_data(day, 'x1')) for day in DAYS}
+
+        retention = RetentionManager(db, {
+            'daily_orders': {'hot_days': 2},
+            'market_data': {'hot_days': 1, 'mode': 'file'},
+        }, archive_dir=os.path.join(tmp, 'archive'), batch_size=3, pause=0)
+        assert retention.plan() == {'daily_orders': DAYS[:2], 'market_data': DAYS[:3]}
+        result = retention.run_once()
+        assert result['daily_orders'] == {DAYS[0]: 7, DAYS[1]: 7}
+        assert sum(result['market_data'].values()) == 33
+
+        assert db.get_distinct_trading_days('daily_orders', include_history=False) == DAYS[:1:-1]
+        assert db.get_distinct_trading_days('daily_orders') == DAYS[::-1]
+        assert db.history_location('daily_orders', DAYS[0]) == 'table'
+        assert db.history_location('market_data', DAYS[0]).endswith('.jsonl.gz')
+        for day in DAYS:
+            assert (db.query_orders(day), db.query_market_data(day, 'x1')) == before[day]
+
+        # 已归档完毕，再次执行无事可做
+        assert retention.run_once() == {}
+        stats = retention.stats()
+        print(stats)
+        assert stats['runs'] == 2 and stats['partitions_created'] == 0
+
+
+
+def test_archive_catalog_cache():
+    """按交易日查询复用归档目录的内存副本，登记归档后立即按新位置读取"""
+    with sqlite_db() as (db, _):
+        db.insert_orders(make_orders(DAYS[0], 7))
+        before = db.query_orders(DAYS[0])
+        cached = db._archive_catalog['daily_orders']
+        assert db.query_orders(DAYS[1]) == [] and db._archive_catalog['daily_orders'] is cached
+
+        assert db.move_to_history('daily_orders', DAYS[0], batch_size=3, pause=0) == 7
+        assert db.get_distinct_trading_days('daily_orders', include_history=False) == []
+        assert db.query_orders(DAYS[0]) == before
+        assert db._archive_catalog['daily_orders'][1] == {DAYS[0]: 'table'}
+
+        # 副本过期后重新读取
+        db.archive_catalog_ttl = 0
+        db.query_orders(DAYS[0])
+        assert db._archive_catalog['daily_orders'] is not cached
+
+
+
+def test_day_partition():
+    """只有区间内除该交易日外都是周末的 p<交易日> 分区才能整体换出"""
+    db = DatabaseManager()
+    db._get_partitions = lambda cursor, table: [
+        {'name': 'p_history', 'bound': "'20250102'"},
+        {'name': 'p20250102', 'bound': "'20250103'"},
+        {'name': 'p20250103', 'bound': "'20250104'"},
+        {'name': 'p20250106', 'bound': "'20250107'"},   # 区间含周六、周日
+        {'name': 'p20250109', 'bound': "'20250110'"},   # 区间含 7、8 日两个工作日
+        {'name': 'p_future', 'bound': 'MAXVALUE'},
+    ]
+    assert db._day_partition(None, 'market_data', '20250103') == 'p20250103'
+    assert db._day_partition(None, 'market_data', '20250106') == 'p20250106'
+    assert db._day_partition(None, 'market_data', '20250109') is None
+    assert db._day_partition(None, 'market_data', '20250101') is None
+    assert db._day_partition(None, 'daily_orders', '20250103') is None
+
+    assert history_source('market_data', 'table') == 'market_data_history'
+    assert history_source('market_data', 'table:market_data_arch_20250103') == \
+        'market_data_arch_20250103'
+    assert history_source('market_data', '/archive/market_data/20250103.jsonl.gz') is None
+    try:
+        RetentionManager(db, {}, partitions={'keep_days': 3})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("未知的分区维护参数应报错")
+
+
+def test_partition_exchange():
+    """已分区的 market_data 按日分区整体换出/删除，查询结果不变"""
+    config_file = "config.json"
+    if not os.path.exists(config_file):
+        print("配置文件不存在，请先配置config.json")
+        return
+    with open(config_file, 'r', encoding='utf-8') as f:
+        db_conf = dict(json.load(f)['database'], backend='mysql')
+    db_conf['database'] = db_conf['database'] + '_retention_test'
+    db = create_database_manager(db_conf)
+    if not db.connect():
+        print("数据库连接失败")
+        return
+    tmp = tempfile.mkdtemp()
+    try:
+        # 重建空的分区表，按今天起的三个工作日写入行情
+        conn = db._get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SHOW TABLES LIKE 'market_data_arch_%'")
+                for row in cursor.fetchall():
+                    cursor.execute(f"DROP TABLE {list(row.values())[0]}")
+                for table in ('market_data', 'market_data_history', 'archive_catalog'):
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.commit()
+        finally:
+            conn.close()
+        db.close()
+        assert db.connect()
+        days, day = [], date.today()
+        while len(days) < 3:
+            if day.weekday() < 5:
+                days.append(day.strftime('%Y%m%d'))
+            day += timedelta(days=1)
+        for day in days:
+            db.insert_market_data(_ticks(day))
+        before = {day: db.query_market_data(day, 'x1') for day in days}
+
+        retention = RetentionManager(db, {'market_data': {'hot_days': 2}},
+                                     archive_dir=os.path.join(tmp, 'archive'),
+                                     batch_size=3, pause=0)
+        assert retention.run_once() == {'market_data': {days[0]: 11}}
+        arch_table = f"market_data_arch_{days[0]}"
+        assert db.history_location('market_data', days[0]) == 'table:' + arch_table
+        assert db.explain_partitions(days[0]) != [f"p{days[0]}"]
+
+        # 换出后迟到的行情落在相邻分区，再次执行时移入同一张表
+        db.insert_market_data(_ticks(days[0])[:2])
+        assert retention.archive_day('market_data', days[0]) == 2
+        assert db.get_distinct_trading_days('market_data', include_history=False) == days[:0:-1]
+
+        # 归档为文件时导出后直接删除分区
+        retention.tables['market_data'] = {'hot_days': 1, 'mode': 'file'}
+        assert retention.run_once() == {'market_data': {days[1]: 11}}
+        assert db.history_location('market_data', days[1]).endswith('.jsonl.gz')
+        assert len(db.query_market_data(days[0], 'x1')) == len(before[days[0]]) + 1
+        assert db.query_market_data(days[1], 'x1') == before[days[1]]
+        assert db.query_market_data(days[2], 'x1') == before[days[2]]
+    finally:
+        db.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_retention_manager()
+    test_archive_catalog_cache()
+    test_day_partition()
+    test_partition_exchange()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+紧凑表结构迁移测试脚本（需要 config.json 中的 MySQL）
+在独立的测试库中按原始结构建表、每张表写入数据，迁移 COMPACT_COLUMNS 中的全部表，
+确认每张表都迁移成功（包括主键不是 id 的 market_data_latest）且数据不变
+"""
+
+import json
+import os
+
+from database_manager import create_database_manager
+from schema_migrator import COMPACT_COLUMNS, SchemaMigrator
+from test_sqlite_backend import _orders, _ticks
+
+DAY = '20250103'
+
+
+def _load(db):
+    ticks = [t for t in _ticks(DAY) if t['instrument_id'] in ('x000', 'x001')][:50]
+    assert db.insert_market_data(ticks) == len(ticks)
+    assert db.insert_orders(_orders(DAY)) == 20
+    db.insert_positions([
+        {'instrument_id': 'x000', 'direction': '空头', 'position_type': '总仓', 'volume': 2,
+         'available_volume': 2, 'open_price': 3000.0, 'position_price': 3000.0,
+         'close_profit': 0.0, 'position_profit': 0.0, 'trading_day': DAY}
+    ])
+    db.insert_instrument_info([
+        {
+            'instrument_id': inst, 'exchange_id': 'SHFE', 'instrument_name': inst,
+            'product_id': 'x', 'product_class': '1', 'delivery_year': 2025, 'delivery_month': 5,
+            'volume_multiple': 10, 'price_tick': 1.0, 'create_date': '', 'open_date': '',
+            'expire_date': '', 'start_delivery_date': '', 'end_delivery_date': '',
+            'is_trading': 1, 'long_margin_ratio': 0.1, 'short_margin_ratio': 0.1,
+            'max_market_order_volume': 100, 'min_market_order_volume': 1,
+            'max_limit_order_volume': 100, 'min_limit_order_volume': 1,
+        }
+        for inst in ('x000', 'x001')
+    ])
+
+
+def _dump(db):
+    orders = sorted((o['order_ref'], o['direction'], o['order_status'])
+                    for o in db.query_orders(DAY))
+    positions = [(p['instrument_id'], p['direction'], p['volume'])
+                 for p in db.query_positions(DAY)]
+    ticks = sorted((t['instrument_id'], t['update_time'], float(t['last_price']))
+                   for t in db.query_market_data(DAY))
+    latest = sorted((q['instrument_id'], q['update_time'], str(q['trading_day']))
+                    for q in db.query_latest_quotes(['x000', 'x001']))
+    instruments = sorted((i['instrument_id'], i['exchange_id'])
+                         for i in db.query_instrument_info())
+    return orders, positions, ticks, latest, instruments
+
+
+def test_schema_migrator():
+    """迁移全部表，小分块覆盖多块复制，迁移前后查询结果一致"""
+    config_file = "config.json"
+    if not os.path.exists(config_file):
+        print("配置文件不存在，请先配置config.json")
+        return
+    with open(config_file, 'r', encoding='utf-8') as f:
+        db_conf = dict(json.load(f)['database'], backend='mysql')
+    db_conf['database'] = db_conf['database'] + '_migrate_test'
+
+    db = create_database_manager(db_conf)
+    if not db.connect():
+        print("数据库连接失败")
+        return
+    # 删除上次迁移后的表，重新连接时按原始结构建表
+    conn = db._get_connection()
+    try:
+        with conn.cursor() as cursor:
+            for table in COMPACT_COLUMNS:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.commit()
+    finally:
+        conn.close()
+    db.close()
+    assert db.connect()
+
+    _load(db)
+    before = _dump(db)
+    report = SchemaMigrator(db, chunk_size=7).migrate()
+    assert set(report) == set(COMPACT_COLUMNS)
+    for table, result in report.items():
+        assert result['status'] == 'migrated', f"{table}: {result}"
+    assert _dump(db) == before
+
+    # 已迁移的表再次迁移时跳过
+    report = SchemaMigrator(db).migrate()
+    assert {r['status'] for r in report.values()} == {'skipped'}
+    db.close()
+
+
+if __name__ == "__main__":
+    test_schema_migrator()
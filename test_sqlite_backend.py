@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SQLite 存储后端测试脚本
+不需要 MySQL 服务：在临时目录建库，走一遍 insert_* / query_* / 流式读取，
+并与 MySQL 后端使用同一组数据输出写入耗时，便于对比两种后端
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from database_manager import create_database_manager
+from sqlite_manager import SQLiteManager
+from test_support import make_orders, sqlite_db
+
+INSTRUMENTS = 50
+TICKS_PER_INSTRUMENT = 200
+
+
+def _ticks(day):
+    rows = []
+    for i in range(INSTRUMENTS):
+        for n in range(TICKS_PER_INSTRUMENT):
+            price = 3000.0 + n
+            rows.append({
+                'instrument_id': f"x{i:03d}", 'exchange_id': 'SHFE',
+                'update_time': f"{9 + n // 3600:02d}:{n // 60 % 60:02d}:{n % 60:02d}",
+                'last_price': price, 'pre_settlement_price': 3000.0, 'pre_close_price': 3000.0,
+                'open_price': 3000.0, 'highest_price': price, 'lowest_price': 3000.0,
+                'volume': n * 10, 'turnover': n * 10 * price, 'open_interest': 1000,
+                'close_price': None, 'settlement_price': None,
+                'upper_limit_price': 3300.0, 'lower_limit_price': 2700.0,
+                'bid_price1': price - 1, 'bid_volume1': 5, 'ask_price1': price + 1,
+                'ask_volume1': 5, 'trading_day': day,
+            })
+    return rows
+
+
+def _orders(day):
+    return make_orders(day, 20, instrument_id='x000', order_status='未成交还在队列中')
+
+
+def _exercise(db):
+    """对任一后端执行同样的读写，返回写入耗时"""
+    days = ['20250102', '20250103']
+    start = time.perf_counter()
+    for day in days:
+        assert db.insert_market_data(_ticks(day)) == INSTRUMENTS * TICKS_PER_INSTRUMENT
+    elapsed = time.perf_counter() - start
+
+    # 委托按自然键去重，重复下载只更新状态
+    assert db.insert_orders(_orders(days[-1])) == 20
+    updated = _orders(days[-1])
+    for order in updated:
+        order['traded_volume'], order['order_status'] = 1, '全部成交'
+    db.insert_orders(updated)
+    orders = db.query_orders(days[-1])
+    assert len(orders) == 20
+    assert {o['order_status'] for o in orders} == {'全部成交'}
+
+    db.insert_positions([
+        {'instrument_id': 'x000', 'direction': '多头', 'position_type': '总仓', 'volume': v,
+         'available_volume': v, 'open_price': 3000.0, 'position_price': 3000.0,
+         'close_profit': 0.0, 'position_profit': 0.0, 'trading_day': days[-1]}
+        for v in (1, 2)
+    ])
+    positions = db.query_positions(days[-1])
+    assert len(positions) == 1 and positions[0]['volume'] == 2
+
+    assert db.get_distinct_trading_days('market_data') == days[::-1]
+    latest = db.query_latest_quotes(['x001'])
+    assert latest[0]['trading_day'] == days[-1]
+    assert latest[0]['update_time'] == "09:03:19"
+
+    # 夜盘属于同一交易日但早于日盘：夜盘行情写入后，日盘行情仍应覆盖最新行情
+    def night_tick(update_time, price):
+        return dict(_ticks(days[-1])[0], instrument_id='n001', update_time=update_time,
+                    last_price=price)
+    db.insert_market_data([night_tick('22:59:59', 3000.0), night_tick('09:00:00', 3010.0)])
+    assert db.query_latest_quotes(['n001'])[0]['update_time'] == '09:00:00'
+    db.insert_market_data([night_tick('14:59:00', 3020.0)])
+    db.insert_market_data([night_tick('21:30:00', 2990.0), night_tick('01:00:00', 2995.0)])
+    latest = db.query_latest_quotes(['n001'])[0]
+    assert (latest['update_time'], float(latest['last_price'])) == ('14:59:00', 3020.0)
+
+    assert sum(1 for _ in db.iter_market_data(days[0], page_size=777)) == \
+        INSTRUMENTS * TICKS_PER_INSTRUMENT
+    page, token = db.query_market_data_page(instrument_id='x002', page_size=150)
+    seen = len(page)
+    while token:
+        page, token = db.query_market_data_page(instrument_id='x002', page_size=150,
+                                                page_token=token)
+        seen += len(page)
+    assert seen == TICKS_PER_INSTRUMENT * len(days)
+
+    bar = {'instrument_id': 'x000', 'period': '1m', 'trading_day': days[-1],
+           'bar_time': datetime(2025, 1, 3, 9, 0), 'open_price': 1.0, 'high_price': 2.0,
+           'low_price': 0.5, 'close_price': 1.5, 'volume': 10, 'turnover': 100.0,
+           'open_interest': 5, 'tick_count': 3}
+    db.insert_bars([bar])
+    db.insert_bars([dict(bar, close_price=1.8)])
+    bars = db.query_bars('x000', '1m')
+    assert len(bars) == 1 and float(bars[0]['close_price']) == 1.8
+    assert bars[0]['bar_time'] == datetime(2025, 1, 3, 9, 0)
+
+    # 快照：同一周期的数据一次提交，旧快照的视图不受之后写入影响
+    first = db.write_snapshot(orders=_orders(days[-1])[:2], positions=[], trades=[],
+                              accounts=[{'account_id': 'A1', 'balance': 100.0}])
+    second = db.write_snapshot(orders=_orders(days[-1])[:3],
+                               accounts=[{'account_id': 'A1', 'balance': 90.0}])
+    assert second == first + 1
+    old, new = db.query_snapshot(first), db.query_snapshot()
+    assert len(old['orders']) == 2 and old['accounts'][0]['balance'] == 100.0
+    assert len(new['orders']) == 3 and new['accounts'][0]['balance'] == 90.0
+    assert new['snapshot']['changed_rows'] == 2
+
+    # 每日汇总随明细增量维护，与按明细重建的结果一致
+    summary = {row['instrument_id']: row for row in db.query_daily_summary(days[-1])}
+    assert summary['x000']['order_count'] == 20 and summary['x000']['filled_orders'] == 17
+    assert summary['x000']['long_volume'] == 2
+    assert float(summary['x001']['high_price']) == 3199.0 and summary['x001']['tick_count'] == 200
+    assert summary['x001']['volume'] == 1990
+    assert float(db.query_top_movers(days[-1], limit=1)[0]['change_pct']) == 6.63
+    db.rebuild_daily_summary(days[-1])
+    assert db.query_daily_summary(days[-1]) == list(summary.values())
+
+    # 快照中的持仓列表是完整结果：没有的持仓判定为已平仓，空列表平掉最后一个持仓
+    def position(instrument_id):
+        return {'instrument_id': instrument_id, 'direction': '空头', 'position_type': '总仓',
+                'volume': 3, 'available_volume': 3, 'open_price': 3000.0,
+                'position_price': 3000.0, 'close_profit': 0.0, 'position_profit': 0.0,
+                'trading_day': days[-1]}
+
+    def held():
+        return sorted(p['instrument_id'] for p in db.query_positions(days[-1])
+                      if p['instrument_id'].startswith('s'))
+    db.write_snapshot(positions=[position('s001'), position('s002')], trading_day=days[-1])
+    assert held() == ['s001', 's002']
+    db.write_snapshot(positions=[position('s001')], trading_day=days[-1])
+    assert held() == ['s001']
+    assert [p['instrument_id'] for p in db.query_snapshot()['positions']] == ['s001']
+    db.write_snapshot(positions=None, accounts=[{'account_id': 'A1', 'balance': 80.0}],
+                      trading_day=days[-1])
+    assert held() == ['s001']
+    db.write_snapshot(positions=[], trading_day=days[-1])
+    assert held() == [] and db.query_snapshot()['positions'] == []
+    return elapsed
+
+
+def test_sqlite_backend():
+    """SQLite 后端的读写、去重、分页与 MySQL 后端行为一致"""
+    with sqlite_db() as (db, _):
+        assert isinstance(db, SQLiteManager)
+        elapsed = _exercise(db)
+        print(f"SQLite 写入 {2 * INSTRUMENTS * TICKS_PER_INSTRUMENT} 条行情耗时 {elapsed:.2f} 秒")
+        plan = db.explain_query_paths()
+        for name, steps in plan.items():
+            print(f"{name:40s} {' | '.join(step['detail'] for step in steps)}")
+
+
+def test_sqlite_pool():
+    """短生命周期线程用完即归还连接，空闲连接数不超过上限，嵌套借用复用同一连接"""
+    tmp = tempfile.mkdtemp()
+    try:
+        db = SQLiteManager(os.path.join(tmp, 'ctp.db'), max_idle_connections=2)
+        assert db.connect()
+
+        def work():
+            outer = db._pool.acquire()
+            inner = db._pool.acquire()
+            assert inner._conn is outer._conn
+            inner.close()
+            db.query_orders('20250103')
+            outer.close()
+        threads = [threading.Thread(target=work) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = db._pool.stats()
+        assert stats['open'] == stats['idle'] <= 2
+        assert stats['opened'] - stats['closed'] == stats['open']
+        db.close()
+        assert db._pool.stats()['open'] == 0
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_mysql_backend():
+    """同一组数据在 MySQL 后端上的写入耗时（需要 config.json）"""
+    config_file = "config.json"
+    if not os.path.exists(config_file):
+        print("配置文件不存在，请先配置config.json")
+        return
+    with open(config_file, 'r', encoding='utf-8') as f:
+        db_conf = dict(json.load(f)['database'], backend='mysql')
+    db_conf['database'] = db_conf['database'] + '_backend_test'
+
+    db = create_database_manager(db_conf)
+    if not db.connect():
+        print("数据库连接失败")
+        return
+    conn = db._get_connection()
+    try:
+        with conn.cursor() as cursor:
+            for table in ('daily_orders', 'daily_positions', 'market_data',
+                          'market_data_latest', 'kline', 'snapshot', 'snapshot_rows',
+                          'daily_order_summary', 'daily_position_summary', 'daily_market_summary'):
+                cursor.execute(f"DELETE FROM {table}")
+        conn.commit()
+    finally:
+        conn.close()
+    elapsed = _exercise(db)
+    print(f"MySQL 写入 {2 * INSTRUMENTS * TICKS_PER_INSTRUMENT} 条行情耗时 {elapsed:.2f} 秒")
+    db.close()
+
+
+if __name__ == "__main__":
+    test_sqlite_backend()
+    test_sqlite_pool()
+    test_mysql_backend()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试脚本公用的数据与临时库
+在临时目录中创建 SQLite 库（退出时删除），以及生成带 CTP 自然键的委托
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from database_manager import create_database_manager
+
+
+def make_orders(day, count, start=0, **fields):
+    """
+    生成一个交易日的委托，报单引用依次为 start .. start + count - 1
+
+    Args:
+        day: 交易日
+        count: 委托笔数
+        start: 起始报单引用
+        fields: 覆盖每笔委托的字段
+
+    Returns:
+        委托字典列表
+    """
+    return [
+        dict({'order_time': f"09:00:{n % 60:02d}", 'instrument_id': 'rb2505', 'direction': '买入',
+              'offset_flag': '开仓', 'order_price': 3000.0, 'order_volume': 1, 'traded_volume': 0,
+              'order_status': '撤单', 'remark': '', 'trading_day': day, 'front_id': 1,
+              'session_id': 1, 'order_ref': str(n), 'exchange_id': 'SHFE', 'order_sys_id': ''},
+             **fields)
+        for n in range(start, start + count)
+    ]
+
+
+@contextmanager
+def sqlite_db(**options):
+    """
+    在临时目录中创建并连接 SQLite 库，退出时关闭连接并删除临时目录
+
+    Args:
+        options: 其他数据库配置（如 slow_query_threshold）
+
+    Yields:
+        (数据库管理器, 临时目录)
+    """
+    tmp = tempfile.mkdtemp()
+    db = None
+    try:
+        db = create_database_manager(dict({'backend': 'sqlite', 'path': os.path.join(tmp, 'ctp.db')},
+                                          **options))
+        assert db.connect()
+        yield db, tmp
+    finally:
+        if db is not None:
+            db.close()
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+行情列式归档测试脚本
+不需要数据库：在临时目录中写入行情、生成归档，再用内存映射读回，
+检查按合约排序、重复生成时的合并、跨交易日序列和中途崩溃留下的残缺暂存列
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import tick_archive
+from tick_archive import TickArchiveReader, TickArchiveWriter
+
+
+def _tick(instrument_id, n, day='20250103'):
+    return {'instrument_id': instrument_id, 'exchange_id': 'SHFE',
+            'update_time': f"09:00:{n % 60:02d}", 'update_millisec': 500,
+            'last_price': 3000.0 + n, 'volume': n, 'turnover': n * 30000.0,
+            'open_interest': 1000, 'bid_price1': 2999.0 + n, 'bid_volume1': 5,
+            'ask_price1': 3001.0 + n, 'ask_volume1': 6, 'trading_day': day}
+
+
+def test_round_trip():
+    """实时行情经暂存文件生成归档，读回时每个合约连续且保持到达顺序"""
+    tmp = tempfile.mkdtemp()
+    try:
+        writer = TickArchiveWriter(tmp, flush_rows=3)
+        for n in range(10):
+            writer.on_market_data(_tick('rb2505' if n % 2 else 'cu2505', n))
+        assert writer.finalize_day('20250103') == 10
+        assert not os.path.exists(os.path.join(tmp, '20250103', '_staging'))
+
+        reader = TickArchiveReader(tmp)
+        assert reader.trading_days() == ['20250103']
+        assert reader.instruments('20250103') == ['cu2505', 'rb2505']
+        data = reader.load('rb2505', '20250103')
+        assert data['volume'].tolist() == [1, 3, 5, 7, 9]
+        assert data['time_ms'][0] == (9 * 3600 + 1) * 1000 + 500
+        assert data['last_price'].dtype == np.float64 and data['bid_volume1'].dtype == np.int32
+        # 空值浮点为 NaN
+        assert np.isnan(data['settlement_price']).all()
+        assert reader.load('rb2505', '20250103', ['volume']).keys() == {'volume'}
+        assert reader.load('au2506', '20250103') == {}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_background_flush():
+    """缓冲满后由后台线程写入暂存文件，写入变慢时行情回调不等待"""
+    tmp = tempfile.mkdtemp()
+    try:
+        writer = TickArchiveWriter(tmp, flush_rows=2)
+        builder = writer._builder('20250103')
+        release = threading.Event()
+        append = builder.append
+
+        def slow_append(rows):
+            release.wait(5)
+            append(rows)
+        builder.append = slow_append
+
+        started = time.monotonic()
+        for n in range(7):
+            writer.on_market_data(_tick('rb2505', n))
+        assert time.monotonic() - started < 1
+        release.set()
+        writer.flush()
+        assert writer.finalize_day('20250103') == 7
+        data = TickArchiveReader(tmp).load('rb2505', '20250103')
+        assert data['volume'].tolist() == list(range(7))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_refinalize_merge():
+    """已有归档的交易日再次生成时，已归档的数据排在新数据之前"""
+    tmp = tempfile.mkdtemp()
+    try:
+        writer = TickArchiveWriter(tmp)
+        writer.append('20250103', [_tick('rb2505', n) for n in range(3)])
+        assert writer.finalize_day('20250103') == 3
+        writer.append('20250103', [_tick('cu2505', 10), _tick('rb2505', 11)])
+        assert writer.finalize_day('20250103') == 5
+        # 没有新数据时保持不变
+        assert writer.finalize_day('20250103') == 0
+
+        reader = TickArchiveReader(tmp)
+        assert reader.load('rb2505', '20250103')['volume'].tolist() == [0, 1, 2, 11]
+        assert reader.load('cu2505', '20250103')['volume'].tolist() == [10]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_interrupted_finalize():
+    """生成归档中途崩溃时读到的仍是旧版本，再次生成不重复合并"""
+    tmp = tempfile.mkdtemp()
+    save = tick_archive.np.save
+    try:
+        writer = TickArchiveWriter(tmp)
+        writer.append('20250103', [_tick('rb2505', n) for n in range(3)])
+        assert writer.finalize_day('20250103') == 3
+        writer.append('20250103', [_tick('rb2505', 3), _tick('cu2505', 4)])
+
+        # 写到第三列时崩溃
+        calls = []
+
+        def failing_save(path, values):
+            calls.append(path)
+            if len(calls) == 3:
+                raise OSError("disk full")
+            save(path, values)
+        tick_archive.np.save = failing_save
+        assert writer.finalize_day('20250103') == 0
+        tick_archive.np.save = save
+        data = TickArchiveReader(tmp).load('rb2505', '20250103')
+        assert {len(values) for values in data.values()} == {3}
+
+        # 暂存数据仍在，重新生成后只合并一次
+        staging = os.path.join(tmp, '20250103', '_staging')
+        kept = os.path.join(tmp, 'kept')
+        shutil.copytree(staging, kept)
+        assert writer.finalize_day('20250103') == 5
+        assert sorted(os.listdir(os.path.join(tmp, '20250103'))) == ['index.json', 'v2']
+
+        # 提交后、删除暂存文件前崩溃：暂存数据已合并，再次生成时直接删除
+        os.rename(kept, staging)
+        assert TickArchiveWriter(tmp).finalize_day('20250103') == 5
+        assert not os.path.exists(staging)
+        reader = TickArchiveReader(tmp)
+        assert reader.load('rb2505', '20250103')['volume'].tolist() == [0, 1, 2, 3]
+        assert reader.load('cu2505', '20250103')['volume'].tolist() == [4]
+
+        # 之后暂存的是新批次，照常合并
+        writer.append('20250103', [_tick('rb2505', 5)])
+        assert writer.finalize_day('20250103') == 6
+    finally:
+        tick_archive.np.save = save
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_series():
+    """跨交易日的序列按交易日升序拼接，并带交易日列"""
+    tmp = tempfile.mkdtemp()
+    try:
+        writer = TickArchiveWriter(tmp)
+        for day, volumes in (('20250106', [5, 6]), ('20250102', [1]), ('20250103', [2, 3])):
+            writer.append(day, [_tick('rb2505', v, day) for v in volumes])
+            writer.finalize_day(day)
+        writer.append('20250107', [_tick('cu2505', 9, '20250107')])
+        writer.finalize_day('20250107')
+
+        reader = TickArchiveReader(tmp)
+        series = reader.series('rb2505', fields=['volume'])
+        assert series['volume'].tolist() == [1, 2, 3, 5, 6]
+        assert series['trading_day'].tolist() == [20250102, 20250103, 20250103, 20250106, 20250106]
+        series = reader.series('rb2505', '20250103', '20250103')
+        assert series['volume'].tolist() == [2, 3] and len(series['last_price']) == 2
+        empty = reader.series('au2506')
+        assert len(empty['volume']) == 0 and empty['volume'].dtype == np.int64
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_truncated_staging():
+    """暂存列文件残缺（写入中途崩溃）时按最短的列生成归档，各列长度一致"""
+    tmp = tempfile.mkdtemp()
+    try:
+        writer = TickArchiveWriter(tmp)
+        writer.append('20250103', [_tick('rb2505', n) for n in range(4)])
+        path = os.path.join(tmp, '20250103', '_staging', 'last_price.bin')
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 12)
+        assert writer.finalize_day('20250103') == 2
+
+        data = TickArchiveReader(tmp).load('rb2505', '20250103')
+        assert {len(values) for values in data.values()} == {2}
+        assert data['last_price'].tolist() == [3000.0, 3001.0]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_background_flush()
+    test_refinalize_merge()
+    test_interrupted_finalize()
+    test_series()
+    test_truncated_staging()
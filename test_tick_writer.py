@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+行情异步落库测试脚本
+用内存中的模拟数据库检查 block、drop_oldest、spill 三种背压策略和计数
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+from tick_writer import POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_SPILL, TickWriter
+
+
+class _FakeDB:
+    """记录写入的批次；available 为 False 时模拟数据库不可用"""
+
+    def __init__(self):
+        self.rows = []
+        self.available = True
+        self.lock = threading.Lock()
+
+    def insert_market_data(self, batch):
+        if not self.available:
+            return 0
+        with self.lock:
+            self.rows.extend(batch)
+        return len(batch)
+
+
+def _row(n):
+    return {'instrument_id': 'rb2505', 'update_time': f"09:00:{n % 60:02d}", 'volume': n,
+            'trading_day': '20250103'}
+
+
+def test_block_policy():
+    """队列满且无人消费时等待 block_timeout 后丢弃"""
+    writer = TickWriter(_FakeDB(), queue_size=2, policy=POLICY_BLOCK, block_timeout=0.05)
+    assert writer.put(_row(0)) and writer.put(_row(1))
+    assert not writer.put(_row(2))
+    stats = writer.stats()
+    assert (stats['enqueued'], stats['dropped'], stats['queue_depth']) == (2, 1, 2)
+
+
+def test_drop_oldest_policy():
+    """队列满时丢弃最旧的记录，写入后保留最新的"""
+    db = _FakeDB()
+    writer = TickWriter(db, queue_size=3, policy=POLICY_DROP_OLDEST, flush_interval=0.05)
+    for n in range(5):
+        assert writer.put(_row(n))
+    writer.start()
+    writer.stop()
+    assert [r['volume'] for r in db.rows] == [2, 3, 4]
+    stats = writer.stats()
+    assert (stats['enqueued'], stats['dropped'], stats['written']) == (5, 2, 3)
+
+
+def test_spill_policy():
+    """队列满时写入溢出文件，溢出的记录不计入 enqueued，队列空闲后回放"""
+    tmp = tempfile.mkdtemp()
+    try:
+        db = _FakeDB()
+        writer = TickWriter(db, queue_size=2, policy=POLICY_SPILL, flush_interval=0.05,
+                            spill_dir=os.path.join(tmp, 'spill'))
+        for n in range(5):
+            assert writer.put(_row(n))
+        stats = writer.stats()
+        assert (stats['enqueued'], stats['spilled']) == (2, 3)
+
+        writer._write(writer._next_batch())
+        writer._replay_spill()
+        assert sorted(r['volume'] for r in db.rows) == [0, 1, 2, 3, 4]
+        assert writer.stats()['replayed'] == 3
+
+        # 写库失败的批次同样进入溢出文件
+        db.available = False
+        writer.put(_row(5))
+        assert not writer._write(writer._next_batch())
+        assert writer.stats()['spilled'] == 4
+        writer.stop()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_block_policy()
+    test_drop_oldest_policy()
+    test_spill_policy()
+    print("行情异步落库测试通过")
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+行情列式归档模块
+把每个交易日的行情写成按字段分列的 NumPy .npy 文件，数据按合约连续存放：
+
+    <root>/<交易日>/v<版本>/<字段>.npy   每个字段一列，同一合约的行情连续且保持到达顺序
+    <root>/<交易日>/index.json           当前版本、各合约在列中的起止位置、交易所、字段类型
+
+重新生成归档时先写出完整的新版本目录，再替换 index.json，读取方始终看到一致的一个版本。
+
+读取时用内存映射打开列文件，只有被访问的合约片段才会真正从磁盘读入，
+研究类查询可以直接跑在本地归档上，不必再扫 MySQL 的 market_data。
+"""
+
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from tick_writer import tick_to_market_row
+
+logger = logging.getLogger(__name__)
+
+# 归档字段及类型；time_ms 为 update_time + update_millisec 换算的当日毫秒数
+ARCHIVE_FIELDS = (
+    ('time_ms', 'int32'),
+    ('last_price', 'float64'),
+    ('volume', 'int64'),
+    ('turnover', 'float64'),
+    ('open_interest', 'float64'),
+    ('bid_price1', 'float64'),
+    ('bid_volume1', 'int32'),
+    ('ask_price1', 'float64'),
+    ('ask_volume1', 'int32'),
+    ('open_price', 'float64'),
+    ('highest_price', 'float64'),
+    ('lowest_price', 'float64'),
+    ('close_price', 'float64'),
+    ('settlement_price', 'float64'),
+    ('pre_settlement_price', 'float64'),
+    ('pre_close_price', 'float64'),
+    ('upper_limit_price', 'float64'),
+    ('lower_limit_price', 'float64'),
+)
+_FIELD_TYPES = dict(ARCHIVE_FIELDS)
+
+_STAGING = '_staging'
+_INST_FIELD = '_inst'
+
+
+def _time_ms(update_time, millisec=0) -> int:
+    """'HH:MM:SS' 转换为当日毫秒数，无法解析时返回 -1"""
+    try:
+        h, m, s = str(update_time).split(':')
+        return (int(h) * 3600 + int(m) * 60 + int(s)) * 1000 + int(millisec or 0)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _column_dir(day_dir: str, index: Dict[str, Any]) -> str:
+    """index.json 所指版本的列文件目录（没有版本号的早期归档直接放在交易日目录下）"""
+    version = index.get('version')
+    return os.path.join(day_dir, f"v{version}") if version else day_dir
+
+
+def _values(rows: List[Dict[str, Any]], field: str, dtype: str) -> np.ndarray:
+    """从字典列表取出一列，空值浮点记为 NaN、整数记为 0"""
+    if dtype.startswith('float'):
+        values = [np.nan if row.get(field) is None else row[field] for row in rows]
+    else:
+        values = [row.get(field) or 0 for row in rows]
+    return np.asarray(values, dtype=dtype)
+
+
+class _DayBuilder:
+    """
+    单个交易日的归档构建器
+
+    行情先按到达顺序追加到 _staging 下的原始二进制列文件，
+    finalize() 时按合约稳定排序后写出正式的 .npy 列文件。
+    每份暂存数据有一个批次号，合并后记入 index.json，同一批次不会合并两次
+    """
+
+    def __init__(self, root: str, trading_day: str):
+        self.trading_day = trading_day
+        self.day_dir = os.path.join(root, trading_day)
+        self.staging_dir = os.path.join(self.day_dir, _STAGING)
+        self._inst_path = os.path.join(self.staging_dir, 'instruments.json')
+        self._instruments: List[str] = []
+        self._exchanges: Dict[str, str] = {}
+        self._codes: Dict[str, int] = {}
+        self._batch = uuid.uuid4().hex
+        if os.path.exists(self._inst_path):
+            with open(self._inst_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self._instruments = saved['instruments']
+            self._exchanges = saved['exchanges']
+            self._codes = {inst: i for i, inst in enumerate(self._instruments)}
+            if saved.get('batch'):
+                self._batch = saved['batch']
+            else:
+                self._save_instruments()
+
+    def _code(self, instrument_id: str, exchange_id: str) -> int:
+        code = self._codes.get(instrument_id)
+        if code is None:
+            code = len(self._instruments)
+            self._instruments.append(instrument_id)
+            self._codes[instrument_id] = code
+        if exchange_id and not self._exchanges.get(instrument_id):
+            self._exchanges[instrument_id] = exchange_id
+        return code
+
+    def _save_instruments(self):
+        tmp = self._inst_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'instruments': self._instruments, 'exchanges': self._exchanges,
+                       'batch': self._batch}, f)
+        os.replace(tmp, self._inst_path)
+
+    def append(self, rows: List[Dict[str, Any]]):
+        """追加一批 market_data 格式的行情"""
+        rows = [row for row in rows if row.get('instrument_id')]
+        if not rows:
+            return
+        os.makedirs(self.staging_dir, exist_ok=True)
+        known = len(self._instruments)
+        codes = np.asarray(
+            [self._code(row['instrument_id'], row.get('exchange_id') or '') for row in rows],
+            dtype='int32')
+        # 先落合约表，保证列文件中的合约编码都能解析
+        if len(self._instruments) != known or not os.path.exists(self._inst_path):
+            self._save_instruments()
+
+        columns = {_INST_FIELD: codes}
+        columns['time_ms'] = np.asarray(
+            [_time_ms(row.get('update_time'), row.get('update_millisec')) for row in rows],
+            dtype='int32')
+        for field, dtype in ARCHIVE_FIELDS:
+            if field != 'time_ms':
+                columns[field] = _values(rows, field, dtype)
+        for field, values in columns.items():
+            with open(os.path.join(self.staging_dir, f"{field}.bin"), 'ab') as f:
+                f.write(values.tobytes())
+
+    def _staged_rows(self) -> int:
+        """各列文件中完整写入的行数（中途崩溃时以最短的列为准）"""
+        counts = []
+        for field, dtype in ((_INST_FIELD, 'int32'),) + ARCHIVE_FIELDS:
+            path = os.path.join(self.staging_dir, f"{field}.bin")
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // np.dtype(dtype).itemsize)
+        return min(counts)
+
+    def finalize(self) -> int:
+        """
+        生成正式列文件；该交易日已有归档时与新数据合并
+
+        新版本的全部列文件写入 v<版本>/ 后才替换 index.json，中途崩溃时 index.json
+        仍指向旧版本，暂存数据保留，再次调用会重新合并；替换 index.json 后、删除暂存
+        文件前崩溃时，再次调用按批次号识别出已合并的暂存数据，直接删除
+
+        Returns:
+            归档后的总行数
+        """
+        if not os.path.isdir(self.staging_dir):
+            return 0
+        existing = None
+        index_path = os.path.join(self.day_dir, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                existing = json.load(f)
+        if existing is not None and existing.get('batch') == self._batch:
+            self._finish(existing.get('version'))
+            return int(existing['rows'])
+
+        n = self._staged_rows()
+        inst = np.fromfile(os.path.join(self.staging_dir, f"{_INST_FIELD}.bin"),
+                           dtype='int32', count=n)
+
+        # 已归档的数据排在新数据之前
+        if existing is not None:
+            old_inst = np.empty(existing['rows'], dtype='int32')
+            for inst_id, item in existing['instruments'].items():
+                code = self._code(inst_id, item.get('exchange_id', ''))
+                old_inst[item['start']:item['start'] + item['count']] = code
+            inst = np.concatenate([old_inst, inst])
+
+        order = np.argsort(inst, kind='stable')
+        sorted_inst = inst[order]
+        codes, starts, counts = np.unique(sorted_inst, return_index=True, return_counts=True)
+
+        version = (existing or {}).get('version', 0) + 1
+        data_dir = os.path.join(self.day_dir, f"v{version}")
+        # 上次中途崩溃留下的同版本目录未被 index.json 引用，直接覆盖
+        shutil.rmtree(data_dir, ignore_errors=True)
+        os.makedirs(data_dir)
+        for field, dtype in ARCHIVE_FIELDS:
+            values = np.fromfile(os.path.join(self.staging_dir, f"{field}.bin"),
+                                 dtype=dtype, count=n)
+            if existing is not None:
+                old = np.load(os.path.join(_column_dir(self.day_dir, existing), f"{field}.npy"))
+                values = np.concatenate([old, values])
+            np.save(os.path.join(data_dir, f"{field}.npy"), values[order])
+
+        index = {
+            'trading_day': self.trading_day,
+            'version': version,
+            'batch': self._batch,
+            'rows': int(len(inst)),
+            'fields': {field: dtype for field, dtype in ARCHIVE_FIELDS},
+            'instruments': {
+                self._instruments[code]: {
+                    'start': int(start),
+                    'count': int(count),
+                    'exchange_id': self._exchanges.get(self._instruments[code], ''),
+                }
+                for code, start, count in zip(codes, starts, counts)
+            },
+        }
+        tmp = index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp, index_path)
+        self._finish(version)
+        logger.info(f"交易日 {self.trading_day} 行情归档完成: {len(codes)} 个合约, {len(inst)} 条")
+        return int(len(inst))
+
+    def _finish(self, version: Optional[int]):
+        """index.json 提交后删除已合并的暂存数据和不再引用的旧版本列文件"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        # 之后再暂存的数据是新的批次
+        self._batch = uuid.uuid4().hex
+        current = f"v{version}" if version else None
+        for name in os.listdir(self.day_dir):
+            path = os.path.join(self.day_dir, name)
+            if name != current and name[:1] == 'v' and name[1:].isdigit() and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif version and name.endswith('.npy'):
+                os.remove(path)
+
+
+class TickArchiveWriter:
+    """
+    行情归档写入器
+
+    实时：注册为 on_market_data 回调，行情按交易日暂存，交易日切换时自动生成上一日归档；
+    缓冲满后由后台线程写入暂存文件，行情回调中不做数组转换和磁盘写入
+        archive = TickArchiveWriter("./archive/ticks/")
+        market_api.set_callback('on_market_data', archive.on_market_data)
+    补录：从 market_data 表导出某个交易日
+        archive.export_from_db(db_manager, '20250102')
+    """
+
+    def __init__(self, root: str = "./archive/ticks/", flush_rows: int = 5000):
+        """
+        初始化归档写入器
+
+        Args:
+            root: 归档根目录
+            flush_rows: 实时行情缓冲多少条后写入暂存文件
+        """
+        self.root = root
+        self.flush_rows = max(1, int(flush_rows))
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._builders: Dict[str, _DayBuilder] = {}
+        self._current_day: Optional[str] = None
+        # 待写入暂存文件的批次 (交易日, 行情列表)；交易日为 None 时是 _drain() 的同步标记
+        self._pending: queue.Queue = queue.Queue()
+        threading.Thread(target=self._run, name='tick-archive', daemon=True).start()
+
+    def _builder(self, trading_day: str) -> _DayBuilder:
+        with self._lock:
+            builder = self._builders.get(trading_day)
+            if builder is None:
+                builder = self._builders[trading_day] = _DayBuilder(self.root, trading_day)
+        return builder
+
+    def _run(self):
+        """后台线程：按提交顺序把缓冲的批次追加到暂存文件"""
+        while True:
+            trading_day, rows = self._pending.get()
+            try:
+                if trading_day is None:
+                    rows.set()
+                else:
+                    self._builder(trading_day).append(rows)
+            except Exception as e:
+                logger.error(f"交易日 {trading_day} 行情暂存失败: {e}")
+
+    def _drain(self):
+        """等待此前提交的批次全部写入暂存文件"""
+        done = threading.Event()
+        self._pending.put((None, done))
+        done.wait()
+
+    def on_market_data(self, tick: Dict[str, Any]):
+        """可直接注册为 on_market_data 回调"""
+        row = tick_to_market_row(tick)
+        row['update_millisec'] = tick.get('update_millisec', 0)
+        day = row.get('trading_day') or ''
+        if not day:
+            return
+        finished = None
+        with self._lock:
+            if self._current_day and day != self._current_day:
+                self._flush_locked()
+                finished = self._current_day
+            self._current_day = day
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_rows:
+                self._flush_locked()
+        if finished:
+            # 交易日切换，后台生成上一交易日的归档，不阻塞行情回调
+            threading.Thread(target=self.finalize_day, args=(finished,), daemon=True).start()
+
+    def _flush_locked(self):
+        """把缓冲交给后台线程（调用方持有 _lock）"""
+        if self._buffer and self._current_day:
+            self._pending.put((self._current_day, self._buffer))
+        self._buffer = []
+
+    def flush(self):
+        """把缓冲中的实时行情写入暂存文件，返回时已写完"""
+        with self._lock:
+            self._flush_locked()
+        self._drain()
+
+    def finalize_day(self, trading_day: str) -> int:
+        """生成指定交易日的正式归档，返回归档行数"""
+        with self._lock:
+            if trading_day == self._current_day:
+                self._flush_locked()
+        # 该交易日已提交的批次写完后再生成归档
+        self._drain()
+        with self._lock:
+            builder = self._builders.pop(trading_day, None) or _DayBuilder(self.root, trading_day)
+        try:
+            return builder.finalize()
+        except Exception as e:
+            logger.error(f"交易日 {trading_day} 行情归档失败: {e}")
+            return 0
+
+    def append(self, trading_day: str, rows: Iterable[Dict[str, Any]], chunk_size: int = 50000):
+        """把 market_data 格式的行情追加到指定交易日的暂存文件"""
+        builder = self._builder(trading_day)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                builder.append(chunk)
+                chunk = []
+        builder.append(chunk)
+
+    def export_from_db(self, db_manager, trading_day: str, chunk_size: int = 50000) -> int:
+        """
+        从 market_data 表流式导出一个交易日并生成归档
+
+        Args:
+            db_manager: DatabaseManager 实例
+            trading_day: 交易日
+            chunk_size: 每批写入暂存文件的行数
+
+        Returns:
+            归档行数
+        """
+        rows = db_manager.iter_market_data(trading_day=trading_day, page_size=chunk_size)
+        self.append(trading_day, rows, chunk_size)
+        return self.finalize_day(trading_day)
+
+
+class TickArchiveReader:
+    """
+    行情归档读取器
+
+    列文件以内存映射方式打开，按合约取序列时只读取该合约所在的片段
+    """
+
+    def __init__(self, root: str = "./archive/ticks/"):
+        self.root = root
+        self._indexes: Dict[str, Dict[str, Any]] = {}
+        self._columns: Dict[tuple, np.ndarray] = {}
+
+    def trading_days(self) -> List[str]:
+        """已归档的交易日（升序）"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            d for d in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, d, 'index.json'))
+        )
+
+    def _index(self, trading_day: str) -> Optional[Dict[str, Any]]:
+        index = self._indexes.get(trading_day)
+        if index is None:
+            path = os.path.join(self.root, trading_day, 'index.json')
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                index = self._indexes[trading_day] = json.load(f)
+        return index
+
+    def _column(self, trading_day: str, field: str) -> np.ndarray:
+        index = self._index(trading_day)
+        key = (trading_day, index.get('version'), field)
+        column = self._columns.get(key)
+        if column is None:
+            path = os.path.join(_column_dir(os.path.join(self.root, trading_day), index),
+                                f"{field}.npy")
+            column = self._columns[key] = np.load(path, mmap_mode='r')
+        return column
+
+    def instruments(self, trading_day: str) -> List[str]:
+        """指定交易日已归档的合约"""
+        index = self._index(trading_day)
+        return sorted(index['instruments']) if index else []
+
+    def load(self, instrument_id: str, trading_day: str,
+             fields: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        读取单个合约单个交易日的行情
+
+        Args:
+            instrument_id: 合约代码
+            trading_day: 交易日
+            fields: 需要的字段，默认全部
+
+        Returns:
+            {字段: 只读的内存映射数组}，没有数据时返回空字典
+        """
+        index = self._index(trading_day)
+        item = index['instruments'].get(instrument_id) if index else None
+        if not item:
+            return {}
+        start, stop = item['start'], item['start'] + item['count']
+        return {field: self._column(trading_day, field)[start:stop]
+                for field in (fields or list(_FIELD_TYPES))}
+
+    def series(self, instrument_id: str, start_day: Optional[str] = None,
+               end_day: Optional[str] = None,
+               fields: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        读取单个合约跨多个交易日的行情序列
+
+        Args:
+            instrument_id: 合约代码
+            start_day: 起始交易日（含）
+            end_day: 结束交易日（含）
+            fields: 需要的字段，默认全部
+
+        Returns:
+            {字段: 数组}，另含 'trading_day' 列（int32，YYYYMMDD）
+        """
+        fields = fields or list(_FIELD_TYPES)
+        parts: Dict[str, List[np.ndarray]] = {field: [] for field in fields}
+        days = []
+        for day in self.trading_days():
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            data = self.load(instrument_id, day, fields)
+            if not data:
+                continue
+            for field in fields:
+                parts[field].append(data[field])
+            days.append(np.full(len(data[fields[0]]), int(day), dtype='int32'))
+        result = {
+            field: np.concatenate(chunks) if chunks else np.empty(0, dtype=_FIELD_TYPES[field])
+            for field, chunks in parts.items()
+        }
+        result['trading_day'] = np.concatenate(days) if days else np.empty(0, dtype='int32')
+        return result
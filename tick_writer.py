@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+行情异步落库模块
+将 CTPMdSpi.OnRtnDepthMarketData 推送的行情放入有界队列，
+由后台线程按条数或时间批量写入 market_data 表，避免阻塞CTP回调线程
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# CTP 对无效价格填充 DBL_MAX，超过该阈值视为空值
+_INVALID_PRICE = 1e300
+
+# 背压策略
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_SPILL = 'spill'
+
+
+def _clean_price(value):
+    """过滤 CTP 的无效价格"""
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if abs(value) >= _INVALID_PRICE:
+        return None
+    return value
+
+
+def tick_to_market_row(tick: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将 on_market_data 回调的行情字典转换为 market_data 表的字段
+
+    Args:
+        tick: CTPMdSpi.OnRtnDepthMarketData 生成的行情字典
+
+    Returns:
+        可直接传给 DatabaseManager.insert_market_data 的字典
+    """
+    return {
+        'instrument_id': tick.get('instrument_id', ''),
+        'exchange_id': tick.get('exchange_id', ''),
+        'update_time': tick.get('update_time', ''),
+        'last_price': _clean_price(tick.get('last_price')),
+        'pre_settlement_price': _clean_price(tick.get('pre_settlement_price')),
+        'pre_close_price': _clean_price(tick.get('pre_close_price')),
+        'open_price': _clean_price(tick.get('open_price')),
+        'highest_price': _clean_price(tick.get('highest_price', tick.get('high_price'))),
+        'lowest_price': _clean_price(tick.get('lowest_price', tick.get('low_price'))),
+        'volume': tick.get('volume'),
+        'turnover': _clean_price(tick.get('turnover')),
+        'open_interest': tick.get('open_interest'),
+        'close_price': _clean_price(tick.get('close_price')),
+        'settlement_price': _clean_price(tick.get('settlement_price')),
+        'upper_limit_price': _clean_price(tick.get('upper_limit_price')),
+        'lower_limit_price': _clean_price(tick.get('lower_limit_price')),
+        'bid_price1': _clean_price(tick.get('bid_price1')),
+        'bid_volume1': tick.get('bid_volume1'),
+        'ask_price1': _clean_price(tick.get('ask_price1')),
+        'ask_volume1': tick.get('ask_volume1'),
+        'trading_day': tick.get('trading_day', ''),
+    }
+
+
+class TickWriter:
+    """
+    行情异步批量写入器
+
+    用法：
+        writer = TickWriter(db_manager)
+        writer.start()
+        market_api.set_callback('on_market_data', writer.on_market_data)
+        ...
+        writer.stop()
+    """
+
+    def __init__(self, db_manager, batch_size: int = 2000, flush_interval: float = 0.2,
+                 queue_size: int = 100000, policy: str = POLICY_BLOCK,
+                 block_timeout: float = 1.0, spill_dir: str = "./spill/market_data/",
+                 writer_threads: int = 1):
+        """
+        初始化写入器
+
+        Args:
+            db_manager: DatabaseManager 实例
+            batch_size: 单批最大写入条数
+            flush_interval: 单批最长等待秒数
+            queue_size: 队列容量
+            policy: 队列满时的背压策略（block/drop_oldest/spill）
+            block_timeout: block 策略下的最长阻塞秒数，超时后丢弃该条
+            spill_dir: spill 策略下的溢出文件目录
+            writer_threads: 写入线程数
+        """
+        if policy not in (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_SPILL):
+            raise ValueError(f"未知的背压策略: {policy}")
+
+        self.db = db_manager
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.spill_dir = spill_dir
+        self.writer_threads = max(1, int(writer_threads))
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+
+        self._spill_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._spill_file = None
+        self._spill_path = os.path.join(spill_dir, "market_data.spill.jsonl")
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'failed': 0,
+            'max_queue_depth': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # 生产端（CTP回调线程）
+    # ------------------------------------------------------------------
+    def on_market_data(self, tick: Dict[str, Any]):
+        """可直接注册为 on_market_data 回调"""
+        self.put(tick_to_market_row(tick))
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        """
+        放入一条已转换好的 market_data 记录
+
+        Returns:
+            是否已进入队列或溢出文件（溢出的记录只计入 spilled，不计入 enqueued）
+        """
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.policy == POLICY_SPILL:
+                self._spill([row])
+                return True
+            if not self._handle_full(row):
+                return False
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+        return True
+
+    def _handle_full(self, row: Dict[str, Any]) -> bool:
+        """队列已满时按 block/drop_oldest 策略处理，返回记录是否进入队列"""
+        if self.policy == POLICY_BLOCK:
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self._incr('dropped')
+                return False
+
+        if self.policy == POLICY_DROP_OLDEST:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self._incr('dropped')
+                except queue.Empty:
+                    pass
+                try:
+                    self._queue.put_nowait(row)
+                    return True
+                except queue.Full:
+                    continue
+        return False
+
+    # ------------------------------------------------------------------
+    # 消费端（写入线程）
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动写入线程"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for i in range(self.writer_threads):
+            t = threading.Thread(target=self._run, name=f"TickWriter-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"行情写入线程已启动，共 {self.writer_threads} 个")
+
+    def stop(self, timeout: float = 10.0):
+        """停止写入线程，退出前写完队列中的剩余数据"""
+        self._stop_event.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        with self._spill_lock:
+            if self._spill_file:
+                self._spill_file.close()
+                self._spill_file = None
+        logger.info(f"行情写入线程已停止: {self.stats()}")
+
+    def _run(self):
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+            elif self.policy == POLICY_SPILL and not self._stop_event.is_set():
+                # 队列空闲时回放溢出文件
+                self._replay_spill()
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """按条数或时间凑齐一批"""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        count = self.db.insert_market_data(batch)
+        if count:
+            with self._stats_lock:
+                self._stats['written'] += len(batch)
+                self._stats['batches'] += 1
+            return True
+
+        if self.policy == POLICY_SPILL:
+            # 写库失败的批次落到溢出文件，稍后回放
+            self._spill(batch)
+        else:
+            self._incr('failed', len(batch))
+        return False
+
+    # ------------------------------------------------------------------
+    # 溢出文件
+    # ------------------------------------------------------------------
+    def _spill(self, rows: List[Dict[str, Any]]):
+        with self._spill_lock:
+            if self._spill_file is None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self._spill_file = open(self._spill_path, 'a', encoding='utf-8')
+            for row in rows:
+                self._spill_file.write(json.dumps(row, ensure_ascii=False))
+                self._spill_file.write('\n')
+            self._spill_file.flush()
+        self._incr('spilled', len(rows))
+
+    def _replay_spill(self):
+        """队列低于半满时，把溢出文件分批写回数据库"""
+        if self._queue.qsize() > self._queue.maxsize // 2:
+            return
+        # 多个写入线程时只允许一个线程回放
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        try:
+            self._replay_pending()
+        finally:
+            self._replay_lock.release()
+
+    def _replay_pending(self):
+        with self._spill_lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+            if os.path.exists(self._spill_path):
+                os.replace(self._spill_path, f"{self._spill_path}.{time.time_ns()}.replay")
+            pending = sorted(glob.glob(f"{self._spill_path}.*.replay"))
+        if not pending:
+            return
+
+        path = pending[0]
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        except Exception as e:
+            logger.error(f"读取行情溢出文件失败 {path}: {e}")
+            return
+
+        for i in range(0, len(rows), self.batch_size):
+            batch = rows[i:i + self.batch_size]
+            if not self.db.insert_market_data(batch):
+                # 数据库仍不可用，保留剩余数据等待下次回放
+                with open(path, 'w', encoding='utf-8') as f:
+                    for row in rows[i:]:
+                        f.write(json.dumps(row, ensure_ascii=False))
+                        f.write('\n')
+                return
+            self._incr('replayed', len(batch))
+        os.remove(path)
+
+    # ------------------------------------------------------------------
+    # 指标
+    # ------------------------------------------------------------------
+    def _incr(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        """返回队列深度、写入/丢弃/溢出计数"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,516 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库写入本地缓冲（spool）
+数据库不可用或写入过慢时，DatabaseManager 的 insert_* 先把数据追加到本地分段文件，
+后台回放线程在数据库恢复后按大批量写回，下载/行情线程不再因数据库阻塞或丢数据
+
+文件格式：目录下按序号命名的分段文件 00000001.seg、00000002.seg ...
+每条记录为 8 字节头（负载长度、CRC32，小端）+ UTF-8 JSON 负载 {"op", "rows"}，
+进程崩溃留下的半条记录在下次打开时按长度/校验识别并截断；
+回放进度保存在 checkpoint.json，已回放完的分段文件随即删除
+"""
+
+import glob
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymysql.err import InterfaceError, OperationalError
+
+from json_codec import json_default, json_object_hook
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<II')
+_SEGMENT_SUFFIX = '.seg'
+_CHECKPOINT = 'checkpoint.json'
+
+# 视为“数据库不可用”的错误：连接失败、连接中断、锁等待超时、连接池耗尽等，
+# 其他错误（如数据不合法）回放也不会成功，不进入缓冲
+UNAVAILABLE_ERRORS = (OperationalError, InterfaceError)
+
+
+def encode_record(op: str, rows: List[Dict[str, Any]]) -> bytes:
+    """把一次写入编码为带长度和校验的记录"""
+    payload = json.dumps({'op': op, 'rows': rows}, ensure_ascii=False,
+                         separators=(',', ':'), default=json_default).encode('utf-8')
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(path: str, offset: int = 0, limit: Optional[int] = None,
+                 max_bytes: Optional[int] = None) -> Tuple[List[Tuple[str, List[Dict[str, Any]], int]], int, bool]:
+    """
+    从分段文件的 offset 处顺序读取记录
+
+    Args:
+        path: 分段文件路径
+        offset: 起始字节位置
+        limit: 不读取超过该位置的记录，None 表示读到文件尾
+        max_bytes: 本次读取的大致字节上限（至少读一条）
+
+    Returns:
+        ([(op, rows, 记录结束位置)], 最后一条完好记录的结束位置, 是否遇到损坏/不完整的记录)
+    """
+    records = []
+    end = offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while limit is None or end < limit:
+            if max_bytes is not None and records and end - offset >= max_bytes:
+                break
+            header = f.read(_HEADER.size)
+            if not header:
+                break
+            if len(header) < _HEADER.size:
+                return records, end, True
+            length, crc = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return records, end, True
+            end += _HEADER.size + length
+            record = json.loads(payload.decode('utf-8'), object_hook=json_object_hook)
+            records.append((record['op'], record['rows'], end))
+    return records, end, False
+
+
+class WriteSpool:
+    """
+    追加写、批量 fsync 的分段缓冲文件
+
+    append() 只写入操作系统缓冲，后台线程每 fsync_interval 秒统一 fsync 一次
+    （组提交），断电时最多丢失这段时间内追加的数据
+    """
+
+    def __init__(self, directory: str = "./spool/db/", segment_bytes: int = 64 * 1024 * 1024,
+                 fsync_interval: float = 0.05):
+        """
+        初始化缓冲目录
+
+        Args:
+            directory: 缓冲目录
+            segment_bytes: 单个分段文件的大小上限，超过后切换新分段
+            fsync_interval: 批量 fsync 的间隔秒数
+        """
+        self.directory = directory
+        self.segment_bytes = max(1024, int(segment_bytes))
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment = 0
+        self._size = 0
+        self._dirty = False
+        self._read_pos = (0, 0)
+        self._stop = threading.Event()
+        self._flusher = None
+        self._stats = {'appended_records': 0, 'appended_rows': 0, 'fsyncs': 0,
+                       'truncated_bytes': 0, 'corrupt_segments': 0}
+        self._open()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:08d}{_SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        names = glob.glob(os.path.join(self.directory, f"*{_SEGMENT_SUFFIX}"))
+        return sorted(int(os.path.basename(n)[:-len(_SEGMENT_SUFFIX)]) for n in names)
+
+    def _open(self):
+        """打开缓冲目录：读取回放进度，截断最后分段的不完整记录，继续追加"""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT), 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            self._read_pos = (int(checkpoint['segment']), int(checkpoint['offset']))
+        except (OSError, ValueError, KeyError):
+            self._read_pos = (segments[0], 0) if segments else (1, 0)
+
+        if segments:
+            self._segment = segments[-1]
+            path = self._path(self._segment)
+            _, end, broken = read_records(path)
+            size = os.path.getsize(path)
+            if broken or end < size:
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+                self._stats['truncated_bytes'] += size - end
+                logger.warning(f"缓冲分段 {path} 尾部有 {size - end} 字节不完整记录，已截断")
+            self._size = end
+        else:
+            self._segment = max(1, self._read_pos[0])
+            self._size = 0
+            self._read_pos = (self._segment, 0)
+        self._file = open(self._path(self._segment), 'ab')
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="WriteSpool-fsync",
+                                         daemon=True)
+        self._flusher.start()
+
+    # ------------------------------------------------------------------
+    # 写入端
+    # ------------------------------------------------------------------
+    def append(self, op: str, rows: List[Dict[str, Any]]) -> int:
+        """
+        追加一次写入
+
+        Args:
+            op: DatabaseManager 的写入方法名
+            rows: 该方法的参数
+
+        Returns:
+            追加的行数
+        """
+        record = encode_record(op, rows)
+        with self._lock:
+            if self._size and self._size + len(record) > self.segment_bytes:
+                self._rotate_locked()
+            self._file.write(record)
+            self._file.flush()
+            self._size += len(record)
+            self._dirty = True
+            self._stats['appended_records'] += 1
+            self._stats['appended_rows'] += len(rows)
+        return len(rows)
+
+    def _rotate_locked(self):
+        self._fsync_locked()
+        self._file.close()
+        self._segment += 1
+        self._size = 0
+        self._file = open(self._path(self._segment), 'ab')
+
+    def _fsync_locked(self):
+        if self._dirty and self._file is not None:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self._stats['fsyncs'] += 1
+
+    def sync(self):
+        """立即 fsync 已追加的数据（在锁外执行，不阻塞并发追加）"""
+        with self._lock:
+            if not self._dirty or self._file is None:
+                return
+            fileno = self._file.fileno()
+            self._dirty = False
+            self._stats['fsyncs'] += 1
+        try:
+            os.fsync(fileno)
+        except OSError:
+            # 期间分段已切换关闭，切换时已 fsync
+            pass
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except (OSError, ValueError) as e:
+                logger.error(f"缓冲文件 fsync 失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 回放端
+    # ------------------------------------------------------------------
+    def pending(self) -> bool:
+        """是否还有未回放的记录"""
+        with self._lock:
+            return self._read_pos < (self._segment, self._size)
+
+    def read(self, max_bytes: int = 8 * 1024 * 1024) -> List[Tuple[str, List[Dict[str, Any]], Tuple[int, int]]]:
+        """
+        从回放进度处读取一批记录（不推进进度，回放成功后调用 ack）
+
+        Args:
+            max_bytes: 本批读取的大致字节上限
+
+        Returns:
+            [(op, rows, 该记录之后的位置)]，没有待回放记录时返回空列表
+        """
+        while True:
+            with self._lock:
+                segment, offset = self._read_pos
+                active, size = self._segment, self._size
+            if (segment, offset) >= (active, size):
+                return []
+
+            path = self._path(segment)
+            if segment == active:
+                limit = size
+            else:
+                limit = os.path.getsize(path) if os.path.exists(path) else 0
+            if offset >= limit:
+                # 旧分段已读完（或已不存在），跳到下一分段
+                self.ack((segment + 1, 0))
+                continue
+
+            records, end, broken = read_records(path, offset, limit, max_bytes)
+            if records:
+                return [(op, rows, (segment, pos)) for op, rows, pos in records]
+            if broken:
+                # 分段中间损坏时无法定位下一条记录，跳过该分段剩余数据
+                with self._lock:
+                    self._stats['corrupt_segments'] += 1
+                logger.error(f"缓冲分段 {path} 在 {end} 字节处损坏，跳过该分段剩余数据")
+                if segment == active:
+                    with self._lock:
+                        self._rotate_locked()
+                self.ack((segment + 1, 0))
+                continue
+            return []
+
+    def ack(self, position: Tuple[int, int]):
+        """
+        推进回放进度并删除已回放完的分段
+
+        Args:
+            position: read() 返回的记录位置
+        """
+        with self._lock:
+            if position <= self._read_pos:
+                return
+            self._read_pos = position
+            active = self._segment
+        tmp = os.path.join(self.directory, _CHECKPOINT + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'segment': position[0], 'offset': position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.directory, _CHECKPOINT))
+        for segment in self._segments():
+            if segment < position[0] and segment != active:
+                try:
+                    os.remove(self._path(segment))
+                except OSError:
+                    pass
+
+    def close(self):
+        """fsync 并关闭当前分段"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(2.0)
+            self._flusher = None
+        with self._lock:
+            if self._file is not None:
+                self._fsync_locked()
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回追加/fsync 计数与积压字节数"""
+        with self._lock:
+            stats = dict(self._stats)
+            read_segment, read_offset = self._read_pos
+            active, size = self._segment, self._size
+        backlog = 0
+        for segment in self._segments():
+            if segment < read_segment:
+                continue
+            length = size if segment == active else os.path.getsize(self._path(segment))
+            backlog += length - (read_offset if segment == read_segment else 0)
+        stats['backlog_bytes'] = max(0, backlog)
+        return stats
+
+
+class SpoolReplayer:
+    """
+    缓冲切换与后台回放
+
+    - 写入直连数据库时出现“不可用”类错误，或单次写入耗时超过 latency_threshold，
+      切换为缓冲模式：之后的写入只追加到缓冲文件，立即返回
+    - 后台线程把缓冲中连续的同类写入合并为大批量回放，数据库仍不可用时按
+      retry_interval 退避重试；因数据本身错误无法写入的记录记为 rejected 并跳过
+    - 缓冲回放完且距最近一次切换超过 cooldown 秒后恢复直连；
+      有积压时新写入一律进缓冲，保证同一数据按下载顺序落库
+
+    回放是“至少一次”的：进程在写库成功、记录进度之前退出时，重启后该批会再写一次
+    （委托/持仓/合约/K线为幂等 upsert，行情明细可能出现少量重复）
+    """
+
+    def __init__(self, db_manager, spool: WriteSpool, latency_threshold: float = 2.0,
+                 cooldown: float = 30.0, batch_rows: int = 20000,
+                 retry_interval: float = 5.0):
+        """
+        初始化回放器
+
+        Args:
+            db_manager: DatabaseManager 实例
+            spool: 缓冲文件
+            latency_threshold: 单次写入超过该秒数即切换为缓冲模式
+            cooldown: 切换后至少保持缓冲模式的秒数
+            batch_rows: 回放时单次合并写入的最大行数
+            retry_interval: 数据库不可用时的重试间隔秒数
+        """
+        self.db = db_manager
+        self.spool = spool
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+        self.batch_rows = max(1, int(batch_rows))
+        self.retry_interval = retry_interval
+
+        self._lock = threading.Lock()
+        # 启动时缓冲中还有上次未回放的数据，先进入缓冲模式
+        self._diverting = spool.pending()
+        self._resume_after = 0.0
+        self._failing = False
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'spooled_rows': 0, 'replayed_rows': 0, 'replay_batches': 0,
+                       'rejected_rows': 0, 'trips': 0, 'slow_writes': 0}
+
+    # ------------------------------------------------------------------
+    # 写入端（DatabaseManager 的写入方法经此调用）
+    # ------------------------------------------------------------------
+    def write(self, op: str, rows: List[Dict[str, Any]], call: Callable[[], int]) -> int:
+        """
+        直连写入或追加到缓冲
+
+        Args:
+            op: 写入方法名
+            rows: 写入的数据
+            call: 直连写入的调用
+
+        Returns:
+            写入（或缓冲）的记录数
+        """
+        with self._lock:
+            if self._diverting:
+                return self._append_locked(op, rows)
+
+        self.db._write_local.error = None
+        start = time.monotonic()
+        count = call()
+        elapsed = time.monotonic() - start
+        error = self.db._write_local.error
+        if isinstance(error, UNAVAILABLE_ERRORS):
+            with self._lock:
+                self._trip_locked(f"数据库不可用: {error}")
+                return self._append_locked(op, rows)
+        if elapsed > self.latency_threshold:
+            with self._lock:
+                self._stats['slow_writes'] += 1
+                self._trip_locked(f"{op} 写入耗时 {elapsed:.2f} 秒")
+        return count
+
+    def _append_locked(self, op: str, rows: List[Dict[str, Any]]) -> int:
+        count = self.spool.append(op, rows)
+        self._stats['spooled_rows'] += count
+        self._wakeup.set()
+        return count
+
+    def _trip_locked(self, reason: str):
+        if not self._diverting:
+            self._stats['trips'] += 1
+            logger.warning(f"{reason}，写入切换到本地缓冲 {self.spool.directory}")
+        self._diverting = True
+        self._resume_after = time.monotonic() + self.cooldown
+
+    @property
+    def diverting(self) -> bool:
+        """当前是否处于缓冲模式"""
+        with self._lock:
+            return self._diverting
+
+    # ------------------------------------------------------------------
+    # 回放线程
+    # ------------------------------------------------------------------
+    def start(self):
+        """启动回放线程"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="SpoolReplayer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """停止回放线程并 fsync 缓冲，未回放的数据留待下次启动"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.spool.close()
+        logger.info(f"缓冲回放线程已停止: {self.stats()}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.replay_pending():
+                continue
+            if self._failing:
+                # 数据库仍不可用，按重试间隔退避，不因新追加的数据提前唤醒
+                self._stop.wait(self.retry_interval)
+            else:
+                self._wakeup.wait(self.retry_interval)
+                self._wakeup.clear()
+
+    def replay_pending(self) -> bool:
+        """
+        回放一批缓冲数据
+
+        Returns:
+            是否有进展（有进展时调用方应立即继续回放）
+        """
+        records = self.spool.read()
+        if not records:
+            with self._lock:
+                if self._diverting and not self.spool.pending() \
+                        and time.monotonic() >= self._resume_after:
+                    self._diverting = False
+                    logger.info("本地缓冲已回放完毕，恢复直连写入")
+            return False
+
+        # 合并连续的同类写入
+        i = 0
+        while i < len(records):
+            op, rows, position = records[i]
+            rows = list(rows)
+            j = i + 1
+            while j < len(records) and records[j][0] == op \
+                    and len(rows) + len(records[j][1]) <= self.batch_rows:
+                rows.extend(records[j][1])
+                position = records[j][2]
+                j += 1
+            if not self._replay(op, rows):
+                return False
+            self.spool.ack(position)
+            i = j
+            if self._stop.is_set():
+                break
+        return True
+
+    def _replay(self, op: str, rows: List[Dict[str, Any]]) -> bool:
+        """回放一批，数据库不可用时返回 False"""
+        local = self.db._write_local
+        local.replaying = True
+        local.error = None
+        try:
+            getattr(self.db, op)(rows)
+        except Exception as e:
+            # 写入方法只处理数据库错误，其他异常说明数据本身有问题
+            local.error = e
+        finally:
+            local.replaying = False
+        error = local.error
+        self._failing = isinstance(error, UNAVAILABLE_ERRORS)
+        if self._failing:
+            return False
+        with self._lock:
+            if error is not None:
+                self._stats['rejected_rows'] += len(rows)
+                logger.error(f"缓冲回放 {op} {len(rows)} 条被数据库拒绝，已跳过: {error}")
+            else:
+                self._stats['replayed_rows'] += len(rows)
+                self._stats['replay_batches'] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓冲模式、缓冲/回放/拒绝计数与积压字节数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['diverting'] = self._diverting
+        stats.update(self.spool.stats())
+        return stats